@@ -1,11 +1,14 @@
 #!/usr/bin/python3
 
 from containers.notestemplate import ArtistForNotes
+from containers.logconfig import configureLogging
 
 # MAIN
 # This is used to simply append the stepartist to the song information lines in a judge notes file.
 if __name__ == "__main__":
 
+    configureLogging()
+
     # Create Template Object.
     print(">>> artistfornotes.py is used to add stepartists to judge notes files in a set. This is done after judges have "
           "passed in their notes.")
@@ -1,15 +1,22 @@
 #!/usr/bin/python3
 
 from containers.batchcontainer import BatchContainer
+from containers.notestemplate import NotesTemplate
+from containers.logconfig import configureLogging
 
 # MAIN
 # C:\pythoncode\batchApis\tests\batch
 if __name__ == "__main__":
 
+    configureLogging()
+
     # Create Batch Object with user specified directory.
     print(">>> batch.py looks through a batch set song directory and retrieves song "
           "information from it, then generates a .csv file of this information.")
+    print(">>> It can also write the template judge notes file straight away, without going through the .csv file.")
     batchPath = (input(">>> Input full path to directory of Batch Set Folder: ")).strip()
+    writeCsv = (input(">>> Write .csv file? [Y/n]: ")).strip().lower() != "n"
+    writeTemplate = (input(">>> Write template judge notes file? [y/N]: ")).strip().lower() == "y"
     batch = BatchContainer(batchPath)
 
     # Initialize search fields and list of folders in batch directory.
@@ -23,6 +30,18 @@ if __name__ == "__main__":
     batch.construct()
     batch.parseSimfiles()
     print(batch)
-    print(">>> Creating .csv file of song information.")
-    batch.createCsvSongListing()
+    if writeCsv:
+        print(">>> Creating .csv file of song information.")
+        batch.createCsvSongListing()
+
+    # The template is made from the parsed songs directly, the .csv file isn't read back.
+    if writeTemplate:
+        print(">>> Writing out Template Judge Notes File")
+        searchList = ['ARTIST', 'TITLE', 'STEPARTIST']
+        csvTable = batch.getCsvTable()
+        templateNotes = NotesTemplate(csvTable.path, searchList, csvTable=csvTable)
+        templateNotes.getFieldIndices()
+        templateNotes.getRelevantFields()
+        templateNotes.writeTemplateFile()
+        print(">>> See '/tmp/notesTemplate.log' for more output.")
     print(">>> See '/tmp/batchContainer.log' for more output.")
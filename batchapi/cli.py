@@ -0,0 +1,612 @@
+#!/usr/bin/python3
+
+"""
+Non-interactive command for every step of a batch run. Each subcommand
+does what the script of the same purpose does, with the paths given as
+arguments instead of typed in at a prompt:
+
+    cli.py batch <batchDir> [--no-csv] [--template] [--assets]   (batch.py)
+    cli.py template <csvFile>                           (mktemplatenotes.py)
+    cli.py steppers <csvFile>                           (artistfornotes.py)
+    cli.py judgenotes <notesFile>                       (judgenotes.py)
+    cli.py judgments <setDir or batchNotesDir> [--xlsx] [--lint] (judgetoexcel.py)
+    cli.py feedback <notesDir> [--output <dir>]         (stepperfeedback.py)
+    cli.py post <notesDir> [--format bbcode ...]        (forumpost.py)
+
+cli.py run goes through the whole month in one process (see pipeline.py):
+
+    cli.py run --batch-dir <dir> --set-dir <dir> --notes-dir <dir> [--stages ...] [--force]
+
+Any of the directories can be left out; only the stages they allow for are run.
+Each song folder, judge file and post fragment done is recorded in a checkpoint
+journal (.batchapi_journal.jsonl next to the state file, or --journal), so a run
+that stopped or had failures only redoes what is missing (see checkpoint.py).
+--journal does the same for batch and judgments.
+
+cli.py lint checks every judge notes file of a set, or of a folder of sets,
+for rating lines the parsers would skip and prints <file>:<line>:<column>:
+<reason> for each (see lint.py). judgments --lint does the same first and
+doesn't write anything if there were problems:
+
+    cli.py lint <setDir or batchNotesDir> [--no-stepartists]
+
+cli.py assets checks the music, banner, background and CD title each chart
+file refers to, and writes <batch>_assets.txt (see assets.py):
+
+    cli.py assets <batchDir>
+
+cli.py pack zips the song folders of every song with an average of at least
+--min-average into <batch>_release.zip; an interrupted pack continues where
+it stopped (see releasepack.py):
+
+    cli.py pack <batchDir> <notesDir> [--min-average 7] [--output <file>]
+
+cli.py schedule splits a batch into sets balanced by estimated judging time,
+gives each set judges from a roster (see scheduler.py for its format) and
+writes the song listing and judge notes template of every set:
+
+    cli.py schedule <batchDir> <roster> [--sets N | --set-size 25] [--judges-per-set 4] [--output <dir>]
+
+cli.py watch keeps the judgments, judge statistics and forum post draft of a
+folder of sets up to date as notes files arrive (see watch.py):
+
+    cli.py watch <notesDir or setDir> [--output <dir>] [--interval 2]
+
+cli.py dashboard serves the current averages, missing judges and duplicate
+songs over HTTP while judging goes on (see dashboard.py):
+
+    cli.py dashboard [--batch-dir <dir>] [--notes-dir <dir>] [--schedule <schedule.txt>] [--port 8000]
+
+cli.py ingest loads batches and judge notes into a SQLite catalog, and
+cli.py query looks things up in it (see catalog.py):
+
+    cli.py ingest <catalog.db> [--batch-dir <dir>] [--csv <file>] [--notes-dir <dir>] [--set-dir <dir>]
+    cli.py query <catalog.db> stepartist <name>
+    cli.py query <catalog.db> lineage <title> [--stepartist <name>]
+
+cli.py corpus and cli.py bench write synthetic batches of any size and time
+every stage on them (see corpus.py and benchmark.py):
+
+    cli.py corpus <dir> [--songs 1000] [--seed 0]
+    cli.py bench [--sizes 100 1000 10000] [--output results.json] [--baseline old.json]
+
+--metrics <file> writes the time spent in each stage and counters such as
+files scanned, lines parsed, bytes read and cache hits to a JSON file, and
+--profile <stage> runs a stage under cProfile or tracemalloc (see metrics.py).
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+###############
+# SUBCOMMANDS #
+###############
+
+def openJournal(args):
+    if args.journal is None:
+        return None
+    from containers.checkpoint import CheckpointJournal
+    return CheckpointJournal(args.journal)
+
+def printJournalReport(journal):
+    """
+    The journal is removed after a run without failures. Otherwise it is
+    kept for the next run with one line per unit, so a rerun only retries
+    what can change and the journal doesn't grow with every run.
+    """
+    if journal is None:
+        return 0
+    print(journal)
+    for line in journal.getReportLines():
+        print(line)
+    if journal.getFailures():
+        journal.compact()
+        return 1
+    journal.remove()
+    return 0
+
+def runBatch(args):
+    from containers.batchcontainer import BatchContainer
+    from containers.notestemplate import NotesTemplate
+    batch = BatchContainer(args.batchDir)
+    batch.journal = openJournal(args)
+    batch.setSmFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+    batch.setDwiFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+    if args.assets:
+        from containers.assets import startInspection
+        inspection = startInspection(args.batchDir)  # Runs while the simfiles are parsed
+    batch.getFolderList()
+    batch.construct()
+    batch.parseSimfiles()
+    print(batch)
+    if args.assets:
+        printAssetProblems(inspection.result())
+    if not args.noCsv:
+        batch.createCsvSongListing()
+    if args.template:
+        csvTable = batch.getCsvTable()
+        templateNotes = NotesTemplate(csvTable.path, ['ARTIST', 'TITLE', 'STEPARTIST'], csvTable=csvTable)
+        templateNotes.getFieldIndices()
+        templateNotes.getRelevantFields()
+        templateNotes.writeTemplateFile()
+    return printJournalReport(batch.journal)
+
+def printAssetProblems(inspector):
+    print(inspector)
+    for line in inspector.getReportLines():
+        print(line)
+
+def runAssets(args):
+    from containers.assets import inspectBatch
+    inspector = inspectBatch(args.batchDir)
+    printAssetProblems(inspector)
+    return 1 if inspector.problems else 0
+
+def runPack(args):
+    from containers.releasepack import ReleasePack
+    pack = ReleasePack(args.batchDir, args.notesDir, outputFile=args.output, minAverage=args.minAverage,
+                       level=args.level, maxWorkers=args.workers)
+    try:
+        built = pack.build(resume=not args.restart)
+    except KeyboardInterrupt:
+        print(">>> Interrupted, run pack again to continue from '" + pack.journalPath + "'")
+        return 130
+    print(pack)
+    for title, stepartist, setName, average in pack.unmatchedSongs:
+        print(">>> NO SONG FOLDER: {} ({}) from {}, average {:.2f}".format(title, stepartist, setName, average))
+    if not built:
+        print(">>> See '/tmp/releasePack.log' for what went wrong.")
+        return 1
+    return 0
+
+def runSchedule(args):
+    from containers.scheduler import SetScheduler
+    scheduler = SetScheduler(args.batchDir, args.roster, outputDir=args.output, numSets=args.sets,
+                             setSize=args.setSize, judgesPerSet=args.judgesPerSet)
+    if not scheduler.schedule():
+        print(">>> See '/tmp/scheduler.log' for what went wrong.")
+        return 1
+    print(scheduler)
+    for line in scheduler.getReportLines():
+        if not line.startswith("    "):  # The songs of each set are in schedule.txt
+            print(line)
+    return 1 if scheduler.conflicts else 0
+
+def runTemplate(args):
+    from containers.notestemplate import NotesTemplate
+    templateNotes = NotesTemplate(args.csvFile, ['ARTIST', 'TITLE', 'STEPARTIST'])
+    templateNotes.getFieldIndices()
+    templateNotes.getRelevantFields()
+    print(templateNotes)
+    templateNotes.writeTemplateFile()
+
+def runSteppers(args):
+    from containers.notestemplate import ArtistForNotes
+    artistAdd = ArtistForNotes(args.csvFile, ['STEPARTIST'])
+    artistAdd.maxWorkers = args.workers
+    artistAdd.getFieldIndices()
+    artistAdd.getRelevantFields()
+    artistAdd.getJudgeFilesForAdd()
+    artistAdd.getAllJudgesInSet()
+    artistAdd.getAllSteppers()
+    artistAdd.addSteppersToFile()
+    print(artistAdd)
+
+def runJudgeNotes(args):
+    from containers.judge import JudgeNotes
+    judge = JudgeNotes(args.notesFile)
+    print(judge)
+    judge.writeRatingsToSongs()
+    judge.writeRawRatings()
+
+def printLintProblems(linter):
+    print(linter)
+    for line in linter.getReportLines():
+        print(line)
+
+def runLint(args):
+    from containers.lint import NotesLinter
+    linter = NotesLinter(args.notesDir, requireStepartist=not args.noStepartists, maxWorkers=args.workers)
+    linter.lint()
+    printLintProblems(linter)
+    return 1 if linter.problems else 0
+
+def runJudgments(args):
+    from containers.judge import JudgesForExcel, BatchJudgesForExcel, isSetDirName
+    if args.lint:
+        from containers.lint import NotesLinter
+        linter = NotesLinter(args.notesDir, maxWorkers=args.workers)
+        if not linter.lint():
+            printLintProblems(linter)
+            print(">>> No judgments written; fix the lines above or leave out --lint.")
+            return 1
+    journal = openJournal(args)
+    if any(os.path.isdir(os.path.join(args.notesDir, entry)) and isSetDirName(entry)
+           for entry in os.listdir(args.notesDir)):
+        batchJudges = BatchJudgesForExcel(args.notesDir, maxWorkers=args.workers)
+        batchJudges.journal = journal
+        batchJudges.getSetDirs()
+        batchJudges.parseAllSets()
+        print(batchJudges)
+        batchJudges.createSetCSVs()
+        batchJudges.createBatchCSV()
+        if args.xlsx:
+            batchJudges.createBatchXLSX()
+    else:
+        judgeSet = JudgesForExcel(args.notesDir)
+        judgeSet.journal = journal
+        print(judgeSet)
+        judgments = judgeSet.getJudgments()
+        judgeSet.createRatingCSV(judgments)
+        if args.xlsx:
+            judgeSet.createRatingXLSX(judgments)
+    return printJournalReport(journal)
+
+def runFeedback(args):
+    from containers.feedback import StepartistFeedback
+    feedback = StepartistFeedback(args.notesDir, outputDir=args.output, maxWorkers=args.workers)
+    feedback.buildIndices()
+    print(feedback)
+    feedback.writeAllFeedback()
+
+def runPost(args):
+    from containers.format import FormatNotes
+    notesFormat = FormatNotes(args.notesDir, maxWorkers=args.workers, postFormats=args.formats)
+    notesFormat.useCache = not args.noCache
+    notesFormat.getSetJudgeInfo()
+    notesFormat.makeFormattedPost()
+
+def runPipeline(args):
+    from containers.pipeline import BatchPipeline
+    if args.batchDir is None and args.setDir is None and args.notesDir is None:
+        print(">>> run needs at least one of --batch-dir, --set-dir or --notes-dir.")
+        return 2
+    pipeline = BatchPipeline(batchDir=args.batchDir, setDir=args.setDir, notesDir=args.notesDir,
+                             stateFile=args.state, maxWorkers=args.workers, postFormats=args.formats,
+                             catalogFile=args.catalog, journalFile=args.journal)
+    pipeline.force = args.force
+    if args.stages is not None:
+        try:
+            pipeline.selectStages(args.stages)
+        except KeyError as error:
+            print(">>> " + error.args[0])
+            return 2
+    print(pipeline)
+    stageStatus = pipeline.run()
+    for name in pipeline.stages:
+        print(">>> " + name + ": " + stageStatus.get(name, 'not run'))
+    for line in pipeline.journal.getReportLines():
+        print(line)
+    print(">>> See '/tmp/pipeline.log' for more output.")
+    if 'failed' in stageStatus.values() or 'incomplete' in stageStatus.values():
+        return 1
+    return 0
+
+def runWatch(args):
+    from containers.watch import NotesWatcher
+    watcher = NotesWatcher(args.notesDir, outputDir=args.output, interval=args.interval, postFormats=args.formats)
+    print(watcher)
+
+    def printChanges(changedSets):
+        for setPath, changedFiles in sorted(changedSets.items()):
+            print(">>> Updated " + os.path.basename(setPath) + ": " + (", ".join(sorted(changedFiles)) or "removed"))
+
+    if not args.once:
+        print(">>> Watching for new notes, press Ctrl+C to stop.")
+    watcher.run(maxPolls=1 if args.once else None, onChange=printChanges)
+    print(">>> See '/tmp/watch.log' for more output.")
+
+def runDashboard(args):
+    from containers.dashboard import BatchIndex, DashboardServer
+    if args.batchDir is None and args.notesDir is None:
+        print(">>> dashboard needs --batch-dir, --notes-dir or both.")
+        return 2
+    index = BatchIndex(batchDir=args.batchDir, notesDir=args.notesDir, interval=args.interval,
+                       scheduleFile=args.scheduleFile)
+    index.refresh()
+    print(index)
+    server = DashboardServer((args.host, args.port), index)
+    index.startPolling()
+    print(">>> Serving on http://" + args.host + ":" + str(server.server_address[1]) + "/, press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.stop()
+        server.server_close()
+    print(">>> See '/tmp/dashboard.log' for more output.")
+
+def runIngest(args):
+    from containers.catalog import BatchCatalog
+    if args.batchDir is None and args.csvFile is None and args.notesDir is None and args.setDir is None:
+        print(">>> ingest needs at least one of --batch-dir, --csv, --notes-dir or --set-dir.")
+        return 2
+    with BatchCatalog(args.catalogFile) as catalog:
+        if args.batchDir is not None:
+            from containers.batchcontainer import BatchContainer
+            batch = BatchContainer(args.batchDir)
+            batch.setSmFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+            batch.setDwiFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+            batch.getFolderList()
+            batch.construct()
+            batch.parseSimfiles()
+            catalog.loadBatch(batch, args.batchName, args.date)
+        if args.csvFile is not None:
+            from containers.csvtable import BatchCsvTable
+            catalog.loadSongListing(BatchCsvTable(args.csvFile).load(), args.batchName, args.date)
+        if args.notesDir is not None:
+            from containers.judge import BatchJudgesForExcel
+            batchJudges = BatchJudgesForExcel(args.notesDir, maxWorkers=args.workers)
+            batchJudges.getSetDirs()
+            batchJudges.parseAllSets()
+            catalog.loadBatchJudgments(batchJudges, args.batchName, args.date)
+        if args.setDir is not None:
+            from containers.judge import JudgesForExcel
+            catalog.loadSet(JudgesForExcel(args.setDir), args.batchName, args.date)
+        print(catalog)
+
+def printRows(rows):
+    if not rows:
+        print(">>> Nothing found.")
+        return
+    columns = list(rows[0].keys())
+    values = [[("{:.2f}".format(row[column]) if isinstance(row[column], float) else str(row[column]))
+               for column in columns] for row in rows]
+    widths = [max(len(column), *(len(rowValues[index]) for rowValues in values))
+              for index, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for rowValues in values:
+        print("  ".join(value.ljust(width) for value, width in zip(rowValues, widths)))
+
+def runQuery(args):
+    from containers.catalog import CatalogQuery
+    if not os.path.exists(args.catalogFile):
+        print(">>> Catalog '" + args.catalogFile + "' does not exist.")
+        return 2
+    lookups = {'batches': 'getBatches', 'stepartist': 'getStepartistHistory', 'stepartist-songs': 'getStepartistSongs',
+               'judge': 'getJudgeHistory', 'judge-ratings': 'getJudgeRatings', 'song': 'getSongRatings',
+               'find': 'findSongs', 'lineage': 'getSongLineage'}
+    query = CatalogQuery(args.catalogFile)
+    try:
+        lookup = getattr(query, lookups[args.lookup])
+        if args.lookup == 'batches':
+            rows = lookup()
+        elif args.value is None:
+            print(">>> query " + args.lookup + " needs a name or title.")
+            return 2
+        elif args.lookup == 'lineage' and args.stepartist is not None:
+            rows = query.getSubmissionHistory(args.value, args.stepartist)
+        else:
+            rows = lookup(args.value)
+        printRows(rows)
+    finally:
+        query.close()
+
+def runCorpus(args):
+    from containers.corpus import SyntheticCorpus
+    corpus = SyntheticCorpus(args.corpusDir, args.songs, seed=args.seed, setSize=args.setSize,
+                             judgeCount=args.judges)
+    print(corpus)
+    corpus.write()
+    print(">>> Batch: " + corpus.getBatchDir())
+    print(">>> Set: " + corpus.getReviewDir())
+    print(">>> Notes: " + corpus.getSetsDir())
+
+def runBenchmark(args):
+    import shutil
+    import tempfile
+    from containers.benchmark import BatchBenchmark, loadResults, compareResults
+    workDir = args.workDir if args.workDir is not None else tempfile.mkdtemp(prefix="batchapi_bench_")
+    benchmark = BatchBenchmark(workDir, sizes=args.sizes, seed=args.seed, repeat=args.repeat,
+                               maxWorkers=args.workers)
+    print(benchmark)
+    try:
+        benchmark.run()
+    finally:
+        if args.workDir is None:
+            shutil.rmtree(workDir, ignore_errors=True)
+    for line in benchmark.getSummary():
+        print(line)
+    if args.output is not None:
+        benchmark.writeResults(args.output)
+        print(">>> Results written to '" + args.output + "'")
+    if args.baseline is not None:
+        regressions = compareResults(loadResults(args.baseline), benchmark.results, threshold=args.threshold)
+        for size, run, timer, baselineSeconds, seconds in regressions:
+            print(">>> SLOWER: {} songs, {} {}: {:.3f}s -> {:.3f}s".format(size, run, timer, baselineSeconds,
+                                                                          seconds))
+        if regressions:
+            return 1
+        print(">>> No stage is more than {:.0%} slower than '{}'".format(args.threshold, args.baseline))
+    return 0
+
+def getParser():
+    parser = argparse.ArgumentParser(prog="batchapi", description="Tools for running a judged batch of simfiles.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of threads to use (default: Python's choice)")
+    parser.add_argument("--metrics", default=None, help="Write stage timings and counters to this JSON file at exit")
+    parser.add_argument("--profile", action="append", default=None, metavar="STAGE",
+                        help="Profile a stage, e.g. judgeNotes.parse, or every stage starting with a prefix, "
+                             "e.g. batch; can be given more than once")
+    parser.add_argument("--profile-mode", dest="profileMode", choices=['cprofile', 'tracemalloc'], default='cprofile')
+    parser.add_argument("--profile-dir", dest="profileDir", default="/tmp",
+                        help="Folder for profile_<stage>.prof / tracemalloc_<stage>.txt, made if missing (default: /tmp)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batchParser = subparsers.add_parser("batch", help="Parse a batch folder of songs into a .csv file")
+    batchParser.add_argument("batchDir")
+    batchParser.add_argument("--no-csv", dest="noCsv", action="store_true", help="Don't write the .csv file")
+    batchParser.add_argument("--template", action="store_true", help="Also write the template judge notes file")
+    batchParser.add_argument("--assets", action="store_true", help="Also check the files each chart file refers to")
+    batchParser.add_argument("--journal", default=None, help="Checkpoint journal; song folders already in it "
+                             "are not parsed again")
+    batchParser.set_defaults(func=runBatch)
+
+    assetsParser = subparsers.add_parser("assets", help="Check the music, banner, background and CD title files "
+                                                        "of every song in a batch folder")
+    assetsParser.add_argument("batchDir")
+    assetsParser.set_defaults(func=runAssets, consoleLevel=logging.ERROR)  # Problems are printed instead
+
+    packParser = subparsers.add_parser("pack", help="Zip the song folders of the accepted songs into a release pack")
+    packParser.add_argument("batchDir")
+    packParser.add_argument("notesDir", help="Folder of set folders of notes, or a single set folder")
+    packParser.add_argument("--min-average", dest="minAverage", type=float, default=7.0,
+                            help="Lowest average rating of an accepted song (default: 7)")
+    packParser.add_argument("--output", default=None, help="Pack file (default: <batchDir>_release.zip)")
+    packParser.add_argument("--level", type=int, default=6, help="zlib level for files that get compressed")
+    packParser.add_argument("--restart", action="store_true", help="Start over instead of continuing an "
+                            "interrupted pack")
+    packParser.set_defaults(func=runPack, consoleLevel=logging.ERROR)
+
+    scheduleParser = subparsers.add_parser("schedule", help="Split a batch into sets and give each set judges "
+                                                            "from a roster")
+    scheduleParser.add_argument("batchDir")
+    scheduleParser.add_argument("roster", help="Text file with '<judge>, <number of sets>' on each line")
+    scheduleSizeGroup = scheduleParser.add_mutually_exclusive_group()
+    scheduleSizeGroup.add_argument("--sets", type=int, default=None, help="Number of sets")
+    scheduleSizeGroup.add_argument("--set-size", dest="setSize", type=int, default=25,
+                                   help="Songs per set when --sets isn't given (default: 25)")
+    scheduleParser.add_argument("--judges-per-set", dest="judgesPerSet", type=int, default=4)
+    scheduleParser.add_argument("--output", default=None, help="Folder for the set folders "
+                                "(default: <batchDir>_sets)")
+    scheduleParser.set_defaults(func=runSchedule, consoleLevel=logging.ERROR)
+
+    templateParser = subparsers.add_parser("template", help="Write the template judge notes file from a .csv file")
+    templateParser.add_argument("csvFile")
+    templateParser.set_defaults(func=runTemplate)
+
+    steppersParser = subparsers.add_parser("steppers", help="Add stepartists to the judge notes next to a .csv file")
+    steppersParser.add_argument("csvFile")
+    steppersParser.set_defaults(func=runSteppers)
+
+    judgeNotesParser = subparsers.add_parser("judgenotes", help="Write rating analytics for one judge notes file")
+    judgeNotesParser.add_argument("notesFile")
+    judgeNotesParser.set_defaults(func=runJudgeNotes)
+
+    judgmentsParser = subparsers.add_parser("judgments", help="Write judgments_<set>.csv for a set folder, or for "
+                                                              "every set in a folder of sets")
+    judgmentsParser.add_argument("notesDir")
+    judgmentsParser.add_argument("--xlsx", action="store_true", help="Also write an .xlsx workbook with a Summary "
+                                                                     "sheet and a sheet for each set")
+    judgmentsParser.add_argument("--journal", default=None, help="Checkpoint journal; judge files already in it "
+                                 "are not read again")
+    judgmentsParser.add_argument("--lint", action="store_true", help="Check the notes files first and stop if a "
+                                 "rating line would be skipped")
+    judgmentsParser.set_defaults(func=runJudgments)
+
+    lintParser = subparsers.add_parser("lint", help="Check judge notes files for rating lines the parsers would skip")
+    lintParser.add_argument("notesDir", help="Set folder, or a folder of set folders")
+    lintParser.add_argument("--no-stepartists", dest="noStepartists", action="store_true",
+                            help="Don't require a (stepartist) on rating lines, for notes before steppers is run")
+    lintParser.set_defaults(func=runLint, consoleLevel=logging.ERROR)  # Problems are printed instead
+
+    feedbackParser = subparsers.add_parser("feedback", help="Write a feedback file for each stepartist")
+    feedbackParser.add_argument("notesDir")
+    feedbackParser.add_argument("--output", default=None, help="Folder for the feedback files")
+    feedbackParser.set_defaults(func=runFeedback)
+
+    postParser = subparsers.add_parser("post", help="Combine a folder of set folders of notes into a forum post")
+    postParser.add_argument("notesDir")
+    postParser.add_argument("--format", dest="formats", action="append", default=None,
+                            help="bbcode, markdown or html; can be given more than once (default: bbcode)")
+    postParser.add_argument("--no-cache", dest="noCache", action="store_true", help="Render every judge again")
+    postParser.set_defaults(func=runPost)
+
+    runParser = subparsers.add_parser("run", help="Run every stage the given folders allow for")
+    runParser.add_argument("--batch-dir", dest="batchDir", default=None)
+    runParser.add_argument("--set-dir", dest="setDir", default=None)
+    runParser.add_argument("--notes-dir", dest="notesDir", default=None)
+    runParser.add_argument("--stages", nargs="+", default=None,
+                           help="Only run these stages and the ones they need")
+    runParser.add_argument("--force", action="store_true", help="Run stages even if their inputs are unchanged")
+    runParser.add_argument("--state", default=None, help="State file (default: .batchapi_run.json in the "
+                                                         "first folder given)")
+    runParser.add_argument("--format", dest="formats", action="append", default=None,
+                           help="Forum post format; can be given more than once (default: bbcode)")
+    runParser.add_argument("--catalog", default=None, help="Also load the batch into this SQLite catalog")
+    runParser.add_argument("--journal", default=None, help="Checkpoint journal (default: .batchapi_journal.jsonl "
+                           "next to the state file)")
+    runParser.set_defaults(func=runPipeline)
+
+    watchParser = subparsers.add_parser("watch", help="Keep judgments, judge stats and the post draft up to date "
+                                                      "while notes arrive")
+    watchParser.add_argument("notesDir")
+    watchParser.add_argument("--output", default=None, help="Folder for the judgments and ratings files "
+                                                             "(default: <notesDir>_watch for a folder of sets, "
+                                                             "the set folder itself for one set)")
+    watchParser.add_argument("--interval", type=float, default=2.0, help="Seconds between checks (default: 2)")
+    watchParser.add_argument("--format", dest="formats", action="append", default=None,
+                             help="Forum post format; can be given more than once (default: bbcode)")
+    watchParser.add_argument("--once", action="store_true", help="Check once and exit")
+    watchParser.set_defaults(func=runWatch, consoleLevel=logging.ERROR)  # Progress is printed instead
+
+    dashboardParser = subparsers.add_parser("dashboard", help="Serve averages, missing judges and duplicate songs "
+                                                              "over HTTP")
+    dashboardParser.add_argument("--batch-dir", dest="batchDir", default=None, help="Batch folder of songs")
+    dashboardParser.add_argument("--notes-dir", dest="notesDir", default=None,
+                                 help="Folder of set folders of notes, or a single set folder")
+    dashboardParser.add_argument("--schedule", dest="scheduleFile", default=None,
+                                 help="schedule.txt from 'cli.py schedule' with the judges of every set; "
+                                      "without it there is no missing judges page")
+    dashboardParser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    dashboardParser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    dashboardParser.add_argument("--interval", type=float, default=5.0,
+                                 help="Seconds between checks for changed files (default: 5)")
+    dashboardParser.set_defaults(func=runDashboard, consoleLevel=logging.ERROR)
+
+    ingestParser = subparsers.add_parser("ingest", help="Load batches and judge notes into a SQLite catalog")
+    ingestParser.add_argument("catalogFile")
+    ingestParser.add_argument("--batch-dir", dest="batchDir", default=None, help="Batch folder of songs")
+    ingestParser.add_argument("--csv", dest="csvFile", default=None, help="<batch>.csv song listing of an old batch")
+    ingestParser.add_argument("--notes-dir", dest="notesDir", default=None, help="Folder of set folders of notes")
+    ingestParser.add_argument("--set-dir", dest="setDir", default=None, help="A single set folder of notes")
+    ingestParser.add_argument("--batch-name", dest="batchName", default=None,
+                              help="Batch to load into (default: the folder or CSV file name)")
+    ingestParser.add_argument("--date", default=None, help="Batch date, YYYY-MM-DD (default: when the folder changed)")
+    ingestParser.set_defaults(func=runIngest)
+
+    queryParser = subparsers.add_parser("query", help="Look up stepartists, judges and songs in a SQLite catalog")
+    queryParser.add_argument("catalogFile")
+    queryParser.add_argument("lookup", choices=['batches', 'stepartist', 'stepartist-songs', 'judge', 'judge-ratings',
+                                                'song', 'find', 'lineage'])
+    queryParser.add_argument("value", nargs="?", default=None, help="Stepartist, judge or song title")
+    queryParser.add_argument("--stepartist", default=None,
+                             help="With lineage: the history of this stepartist's latest submission of the song")
+    queryParser.set_defaults(func=runQuery)
+
+    corpusParser = subparsers.add_parser("corpus", help="Write a synthetic batch, judge notes and sets")
+    corpusParser.add_argument("corpusDir")
+    corpusParser.add_argument("--songs", type=int, default=100)
+    corpusParser.add_argument("--seed", type=int, default=0)
+    corpusParser.add_argument("--set-size", dest="setSize", type=int, default=25)
+    corpusParser.add_argument("--judges", type=int, default=4, help="Judges for the review folder and each set")
+    corpusParser.set_defaults(func=runCorpus)
+
+    benchParser = subparsers.add_parser("bench", help="Time every stage on synthetic batches of a few sizes")
+    benchParser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    benchParser.add_argument("--seed", type=int, default=0)
+    benchParser.add_argument("--repeat", type=int, default=1, help="Runs per size; the fastest time is kept")
+    benchParser.add_argument("--work-dir", dest="workDir", default=None,
+                             help="Keep the corpora here and reuse them next time (default: a temp folder)")
+    benchParser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    benchParser.add_argument("--baseline", default=None, help="Results file from an earlier run to compare against")
+    benchParser.add_argument("--threshold", type=float, default=0.25,
+                             help="How much slower than the baseline counts as a regression (default: 0.25)")
+    benchParser.set_defaults(func=runBenchmark, consoleLevel=logging.ERROR)  # Odd files warn on purpose
+    return parser
+
+def main(argv=None):
+    args = getParser().parse_args(argv)
+    from containers.logconfig import configureLogging
+    configureLogging(consoleLevel=getattr(args, 'consoleLevel', logging.WARNING))
+    if args.metrics is not None or args.profile is not None:
+        from containers.metrics import configureMetrics
+        configureMetrics(metricsFile=args.metrics, profileStages=args.profile, profileMode=args.profileMode,
+                         profileDir=args.profileDir)
+    return args.func(args) or 0
+
+# MAIN
+if __name__ == "__main__":
+    sys.exit(main())
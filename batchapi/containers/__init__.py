@@ -0,0 +1,2 @@
+# Gives every container logger a NullHandler until configureLogging() runs.
+from . import logconfig
@@ -0,0 +1,401 @@
+#!/usr/bin/python3
+
+"""
+Checks the files a simfile refers to: #MUSIC, #BANNER, #BACKGROUND and
+#CDTITLE in an .ssc or .sm file, #FILE and #CDTITLE in a .dwi file.
+Simfile only reads the song information, so a missing or oversized banner
+used to be found by the judges in-game.
+
+Each song folder (and any folder a path like ../banner.png leads to) is
+listed once with os.scandir, and the references are looked up in that
+listing without caring about case, since StepMania on Windows doesn't.
+A reference that only matches with different case is still reported, it
+breaks on case-sensitive file systems.
+
+Image sizes are read from the first bytes of the file (the PNG IHDR
+chunk, the JPEG SOF marker, the BMP and GIF headers); no image is decoded.
+File sizes come from the folder listing.
+"""
+
+import os
+import re
+import sys
+import struct
+from .metrics import timed, count
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+assetsLogger = logging.getLogger("ASSETS")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getImageSize(imagePath):
+    """
+    Returns (format, width, height) from the header of a PNG, JPEG, BMP or
+    GIF file, or None if the file is none of these or the header is cut off.
+    """
+    with open(imagePath, 'rb') as image:
+        header = image.read(26)
+        count("assets.headersRead")
+        if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", header[16:24])
+            return 'PNG', width, height
+        if header[:6] in (b"GIF87a", b"GIF89a") and len(header) >= 10:
+            width, height = struct.unpack("<HH", header[6:10])
+            return 'GIF', width, height
+        if header.startswith(b"BM") and len(header) >= 26:
+            dibSize = struct.unpack("<I", header[14:18])[0]
+            if dibSize == 12:
+                width, height = struct.unpack("<HH", header[18:22])
+            else:
+                width, height = struct.unpack("<ii", header[18:26])
+            return 'BMP', abs(width), abs(height)  # Negative height means the rows are stored top-down
+        if header.startswith(b"\xff\xd8"):
+            return getJpegSize(image)
+    return None
+
+def getJpegSize(image):
+    """
+    Walks the JPEG markers from the start of the file to the first frame
+    (SOF) marker, skipping over every other segment without reading it.
+    """
+    image.seek(2)
+    while True:
+        byte = image.read(1)
+        while byte and byte != b"\xff":
+            byte = image.read(1)  # Garbage between segments
+        while byte == b"\xff":
+            byte = image.read(1)  # Fill bytes
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0xd8 or marker == 0x01 or 0xd0 <= marker <= 0xd7:
+            continue  # Markers without a segment
+        if marker == 0xd9 or marker == 0xda:
+            return None  # End of image or start of scan before any frame
+        segmentLength = image.read(2)
+        if len(segmentLength) < 2:
+            return None
+        length = struct.unpack(">H", segmentLength)[0]
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            frame = image.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return 'JPEG', width, height
+        image.seek(length - 2, 1)
+
+def decodeHeaderValue(value):
+    """
+    Chart files are mostly UTF-8, but older ones are in the Windows code page
+    they were written on: Shift JIS (cp932) for Japanese songs, which is
+    tried first since cp1252 would decode most of those bytes into
+    something else, then cp1252.
+    """
+    for encoding in ("utf-8", "cp932"):
+        try:
+            return value.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return value.decode("cp1252", errors="replace")
+
+# Asset fields in a chart file header (an .sm file may start with a UTF-8 BOM), and the first chart.
+assetFieldPattern = re.compile(b"^[ \t\xef\xbb\xbf]*#(MUSIC|FILE|BANNER|BACKGROUND|CDTITLE):([^;\r\n]*)",
+                               re.MULTILINE | re.IGNORECASE)
+chartStartPattern = re.compile(b"^[ \t]*#(NOTES|NOTEDATA|SINGLE|DOUBLE|COUPLE|SOLO)[:;]", re.MULTILINE | re.IGNORECASE)
+
+def readAssetFields(chartPath, blockSize=4096):
+    """
+    Returns a dictionary with <field>:<value> for the asset fields in the
+    header of a chart file. #FILE in a .dwi file is returned as MUSIC.
+    The file is read a block at a time up to the first chart, so the step
+    data itself is never read.
+    """
+    header = b""
+    with open(chartPath, 'rb') as chartFile:
+        while True:
+            block = chartFile.read(blockSize)
+            header += block
+            chartStart = chartStartPattern.search(header)
+            if chartStart is not None:
+                header = header[:chartStart.start()]
+                break
+            if len(block) < blockSize:
+                break
+    assetFields = {}
+    for fieldSearch in assetFieldPattern.finditer(header):
+        field = fieldSearch.group(1).decode("ascii").upper()
+        assetFields['MUSIC' if field == 'FILE' else field] = decodeHeaderValue(fieldSearch.group(2)).strip()
+    return assetFields
+
+def inspectBatch(batchDir, consoleLevel=None):
+    """
+    Inspects every song folder of batchDir and writes the report. Returns
+    the AssetInspector. consoleLevel configures the ASSETS logger, for when
+    this runs in the process started by startInspection().
+    """
+    if consoleLevel is not None:
+        from .logconfig import configureLogging
+        configureLogging(['ASSETS'], consoleLevel=consoleLevel)
+    inspector = AssetInspector(batchDir)
+    inspector.getFolderList()
+    inspector.inspectAll()
+    inspector.writeReport()
+    return inspector
+
+def startInspection(batchDir):
+    """
+    Starts inspectBatch() in a separate process and returns its future.
+    Reading headers and resolving names is Python code just like parsing
+    the simfiles, so in a thread the two would take turns on the GIL and
+    the batch scan would get slower; in a process both run at full speed.
+    The problems only go to the log file there, the caller reports them.
+    With a single CPU there is nothing to gain from a process, so a thread
+    is used instead.
+    """
+    if (os.cpu_count() or 1) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from .logconfig import configuredLoggers
+        consoleLevel = logging.ERROR if 'ASSETS' in configuredLoggers else None
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        inspection = executor.submit(inspectBatch, batchDir, consoleLevel)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=1)
+        inspection = executor.submit(inspectBatch, batchDir)
+    executor.shutdown(wait=False)  # The worker exits once the inspection is done
+    return inspection
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class AssetInspector():
+    """
+    Looks up the files referred to by the chart file of every song folder
+    in a batch, and reports the ones that are missing or too big.
+
+    * CLASS ATTRIBUTES *
+    - path: File path to the batch folder.
+    - name: Name of the batch.
+    - reportFile: Name of the report file written into the batch folder.
+    - assetLimits: Dictionary with <field>:{'maxBytes', 'maxWidth', 'maxHeight'};
+                   anything bigger is reported.
+    - batchSongFolders: List of files/folders in the batch folder directory.
+    - listings: Dictionary with <folder path>:{<lowercase name>:(name, size, isDir)},
+                one os.scandir per folder.
+    - songAssets: Dictionary with <song folder>:[asset dictionaries], each with
+                  'field', 'value', 'file', 'bytes', 'format', 'width' and 'height'.
+    - problems: Dictionary with <song folder>:[problem descriptions], only for
+                folders with problems.
+    """
+
+    assetLimits = {
+        'MUSIC': {'maxBytes': 20 * 1024 * 1024},
+        'BANNER': {'maxBytes': 1024 * 1024, 'maxWidth': 1024, 'maxHeight': 512},
+        'BACKGROUND': {'maxBytes': 5 * 1024 * 1024, 'maxWidth': 1920, 'maxHeight': 1080},
+        'CDTITLE': {'maxBytes': 512 * 1024, 'maxWidth': 512, 'maxHeight': 512},
+    }
+
+    def __init__(self, batchPath):
+        """
+        Constructor
+        """
+        self.path = batchPath
+        self.name = os.path.basename(os.path.normpath(batchPath))
+        self.reportFile = self.name + "_assets.txt"
+        self.batchSongFolders = []
+        self.listings = {}
+        self.songAssets = {}
+        self.problems = {}
+
+    def __str__(self):
+        return """>>> ASSET INSPECTION
+- BATCH PATH: {}
+- REPORT FILE: {}
+- SONG FOLDERS: {}
+- FOLDERS WITH PROBLEMS: {}""" \
+        .format(self.path, self.reportFile, str(len(self.songAssets)), str(len(self.problems)))
+
+    def getFolderList(self):
+        assetsLogger.info("getFolderList: Retrieving song folder listing in '%s'", self.path)
+        try:
+            self.batchSongFolders = sorted((folder for folder in os.listdir(self.path)
+                                            if os.path.isdir(os.path.join(self.path, folder))), key=str.lower)
+        except:
+            assetsLogger.warning("getFolderList: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                  str(sys.exc_info()[1])))
+
+    def getListing(self, folderPath):
+        """
+        Returns the cached listing of folderPath, listing it the first time.
+        A folder that can't be listed has an empty listing.
+        """
+        folderPath = os.path.normpath(folderPath)
+        listing = self.listings.get(folderPath)
+        if listing is None:
+            listing = {}
+            try:
+                with os.scandir(folderPath) as entries:
+                    for entry in entries:
+                        isDir = entry.is_dir()
+                        listing[entry.name.lower()] = (entry.name, 0 if isDir else entry.stat().st_size, isDir)
+                count("assets.foldersListed")
+            except OSError:
+                assetsLogger.debug("getListing: Can't list '%s'", folderPath)
+            self.listings[folderPath] = listing
+        return listing
+
+    def resolve(self, folderPath, reference):
+        """
+        Finds reference (a path relative to folderPath, with / or \\) in the
+        cached listings. Returns (full path, size, case matches), or None if
+        there is no such file.
+        """
+        currentPath = os.path.normpath(folderPath)
+        caseMatches = True
+        parts = [part for part in re.split("[/\\\\]", reference) if part not in ("", ".")]
+        for index, part in enumerate(parts):
+            if part == "..":
+                currentPath = os.path.dirname(currentPath)
+                continue
+            entry = self.getListing(currentPath).get(part.lower())
+            if entry is None:
+                return None
+            name, size, isDir = entry
+            caseMatches = caseMatches and name == part
+            currentPath = os.path.join(currentPath, name)
+            if index == len(parts) - 1:
+                return (currentPath, size, caseMatches) if not isDir else None
+            if not isDir:
+                return None
+        return None
+
+    def getChartFile(self, folderPath):
+        """
+        The chart file of a song folder BatchContainer would parse: its .ssc
+        file, else its .sm file, else its .dwi file (see simfileFormats).
+        """
+        from .simfile import simfileFormats
+        names = sorted(name for name, size, isDir in self.getListing(folderPath).values() if not isDir)
+        for extension in simfileFormats:
+            for name in names:
+                if os.path.splitext(name)[1].lower() == extension:
+                    return name
+        return None
+
+    def checkAsset(self, field, value, folderPath):
+        """
+        Returns (asset dictionary, list of problems) for one reference.
+        """
+        asset = {'field': field, 'value': value, 'file': None, 'bytes': None, 'format': None, 'width': None,
+                 'height': None}
+        problems = []
+        resolved = self.resolve(folderPath, value)
+        if resolved is None:
+            return asset, ["#" + field + " '" + value + "' not found"]
+        fullPath, size, caseMatches = resolved
+        asset['file'] = os.path.relpath(fullPath, folderPath)
+        asset['bytes'] = size
+        if not caseMatches:
+            problems.append("#" + field + " '" + value + "' only matches '" + asset['file'] +
+                            "' (case differs)")
+        limits = self.assetLimits.get(field, {})
+        if 'maxBytes' in limits and size > limits['maxBytes']:
+            problems.append("#" + field + " '" + value + "' is " + "{:.1f}".format(size / 1024 / 1024) +
+                            " MB, more than " + "{:.1f}".format(limits['maxBytes'] / 1024 / 1024) + " MB")
+        if field != 'MUSIC':
+            try:
+                imageSize = getImageSize(fullPath)
+            except OSError:
+                imageSize = None
+            if imageSize is None:
+                problems.append("#" + field + " '" + value + "' is not a PNG, JPEG, BMP or GIF image")
+            else:
+                asset['format'], asset['width'], asset['height'] = imageSize
+                if asset['width'] > limits.get('maxWidth', asset['width']) or \
+                        asset['height'] > limits.get('maxHeight', asset['height']):
+                    problems.append("#" + field + " '" + value + "' is " + str(asset['width']) + "x" +
+                                    str(asset['height']) + ", more than " + str(limits['maxWidth']) + "x" +
+                                    str(limits['maxHeight']))
+        return asset, problems
+
+    def inspectFolder(self, songFolder):
+        """
+        Returns (list of assets, list of problems) for one song folder.
+        """
+        folderPath = os.path.join(self.path, songFolder)
+        count("assets.foldersInspected")
+        chartFile = self.getChartFile(folderPath)
+        if chartFile is None:
+            return [], ["No .ssc, .sm or .dwi file"]
+        assetFields = readAssetFields(os.path.join(folderPath, chartFile))
+        assets = []
+        problems = []
+        if not assetFields.get('MUSIC'):
+            problems.append("No #MUSIC in '" + chartFile + "'")
+        for field in ('MUSIC', 'BANNER', 'BACKGROUND', 'CDTITLE'):
+            if assetFields.get(field):
+                asset, assetProblems = self.checkAsset(field, assetFields[field], folderPath)
+                assets.append(asset)
+                problems.extend(assetProblems)
+        return assets, problems
+
+    @timed("assets.inspect")
+    def inspectAll(self):
+        """
+        Inspects every song folder, one after the other; a thread pool only
+        made this slower, the work is mostly Python rather than waiting on
+        the disk.
+        """
+        if not self.batchSongFolders:
+            self.getFolderList()
+        assetsLogger.info("inspectAll: Inspecting %s song folders in '%s'", str(len(self.batchSongFolders)),
+                          self.path)
+        self.songAssets = {}
+        self.problems = {}
+        for songFolder in self.batchSongFolders:
+            try:
+                assets, problems = self.inspectFolder(songFolder)
+            except:
+                assetsLogger.warning("inspectAll: '{0}': {1}: {2}".format(songFolder, sys.exc_info()[0].__name__,
+                                                                         str(sys.exc_info()[1])))
+                assets, problems = [], ["Could not be inspected: " + str(sys.exc_info()[1])]
+            self.songAssets[songFolder] = assets
+            if problems:
+                self.problems[songFolder] = problems
+                for problem in problems:
+                    assetsLogger.warning("inspectAll: '%s': %s", songFolder, problem)
+        count("assets.problems", sum(len(problems) for problems in self.problems.values()))
+
+    def getReportLines(self):
+        lines = []
+        for songFolder in sorted(self.problems, key=str.lower):
+            lines.append(">>> " + songFolder)
+            for problem in self.problems[songFolder]:
+                lines.append("- " + problem)
+        return lines
+
+    def writeReport(self):
+        """
+        Writes the problems of each song folder, or a single line saying there
+        are none, to reportFile in the batch folder.
+        """
+        try:
+            assetsLogger.info("writeReport: Attempting to write report '%s'", self.reportFile)
+            lines = self.getReportLines()
+            if not lines:
+                lines = ["No problems found in " + str(len(self.songAssets)) + " song folders."]
+            with open(os.path.join(self.path, self.reportFile), 'w', encoding="utf-8") as report:
+                report.write("\n".join(lines) + "\n")
+            assetsLogger.info("writeReport: Successfully wrote report '%s'", self.reportFile)
+        except:
+            assetsLogger.warning("writeReport: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                str(sys.exc_info()[1])))
@@ -1,26 +1,19 @@
 #!/usr/bin/python3
 
-from containers.simfile import *
+import os
+import re
+import csv
+import sys
+from .csvtable import BatchCsvTable
+from .metrics import timed, count
 
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
 import logging
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make batchLogger logger object.
 batchLogger = logging.getLogger("BATCH")
-batchLogger.setLevel(logging.DEBUG)
-batchFileH = logging.FileHandler('/tmp/batchContainer.log')
-batchFileH.setLevel(logging.DEBUG)
-batchConsoleH = logging.StreamHandler()
-batchConsoleH.setLevel(logging.WARNING)
-batchFileH.setFormatter(dateformatter)
-batchConsoleH.setFormatter(dateformatter)
-batchLogger.addHandler(batchFileH)  # File Handler add
-batchLogger.addHandler(batchConsoleH)  # Console Handler add
 
 #####################
 # CLASS DEFINITIONS #
@@ -38,17 +31,21 @@ class BatchContainer():
     - name: Name of the batch.
     - outputFile: Name of CSV file to write.
     - batchFiles: List of files in the batch directory being searched.
-    - smFileFields: Fields to search for in an .sm file
+    - smFileFields: Fields to search for in an .sm or .ssc file
     - dwiFileFields: Fields to search for in a .dwi file
     - batchSongFolders: List of files/folders in the batch folder directory.
     - simfile_list: List of simfile objects for each song folder in batch.
     - allSongInfo: Dictionary containing information about all the simfiles
     in simfile_list (information is based on search fields).
+    - journal: CheckpointJournal recording each song folder parsed or failed
+    (see checkpoint.py), or None.
+    - songListing: (header, rows) from getSongListingRows(), kept until
+    parseSimfiles() runs again.
 
     * FUNCTIONS *
     - __str__(): Prints out information about the currently reference Batch Object
     - getBatchFileListing(): Get a file listing of the batch directory
-    - setSmFileFields(): Sets list of fields to search for in an .sm file
+    - setSmFileFields(): Sets list of fields to search for in an .sm or .ssc file
     - setDwiFileFields(): Sets list of fields to search for in a .dwi file
     - parseSongs(): Goes through every folder in the batch directory to find song information.
     - createCsvSongListing(): Writes a Comma-Separated-Values file of the song information.
@@ -66,6 +63,8 @@ class BatchContainer():
         self.batchSongFolders = []
         self.simfile_list = []
         self.allSongInfo = {}
+        self.journal = None
+        self.songListing = None
 
     def __str__(self):
         return """>>> BATCH INFORMATION
@@ -86,45 +85,59 @@ class BatchContainer():
             batchLogger.warning("getFolderList: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                  str(sys.exc_info()[1])))
 
+    @timed("batch.construct")
     def construct(self):
         # for every folder in the batch folder, instantiate Simfile objects
 
         batchLogger.info("construct: Attempting to construct simfile objects in '%s'", self.path)
         try:
+            from .simfile import simfileFormats
             for songFolder in self.batchSongFolders:
                 try:
-                    os.chdir(self.path)
+                    # One pass over the folder, keeping the first chart file of each format
                     songFolderPath = os.path.join(self.path, songFolder)
-                    folderFiles = os.listdir(songFolder)
-                    batchLogger.debug("construct: Folder Files are '%s'", str(folderFiles))
-                    for file in folderFiles:
-                        smSearch = re.search("(.*\.[sS][mM])$", file)
-                        dwiSearch = re.search("(.*\.[dD][wW][iI])$", file)
-                        if smSearch is not None:
-                            simfileToAdd = SMFile(songFolderPath, songFolder, file,
-                                                  self.smFileFields)
-                            batchLogger.debug(simfileToAdd)
-                            self.simfile_list.append(simfileToAdd) # Add .sm file simfile
-                            break
-                        if dwiSearch is not None:
-                            simfileToAdd = DWIFile(songFolderPath, songFolder, file,
-                                                   self.dwiFileFields)
+                    chartFiles = {}
+                    filesListed = 0
+                    with os.scandir(songFolderPath) as folderEntries:
+                        for entry in folderEntries:
+                            filesListed += 1
+                            extension = os.path.splitext(entry.name)[1].lower()
+                            if extension in simfileFormats and extension not in chartFiles:
+                                chartFiles[extension] = entry.name
+                    count("batch.foldersScanned")
+                    count("batch.filesListed", filesListed)
+                    batchLogger.debug("construct: Chart files are '%s'", str(chartFiles))
+                    for extension, simfileClass in simfileFormats.items():
+                        if extension in chartFiles:
+                            simfileToAdd = simfileClass(songFolderPath, songFolder, chartFiles[extension],
+                                                        self.getFormatFields(extension))
                             batchLogger.debug(simfileToAdd)
-                            self.simfile_list.append(simfileToAdd) # Add .dwi file simfile
+                            self.simfile_list.append(simfileToAdd)
                             break
-                except:
+                except NotADirectoryError:
                     continue # This means we didn't have a directory
+                except:
+                    batchLogger.warning("construct: '{0}': {1}: {2}".format(songFolder, sys.exc_info()[0].__name__,
+                                                                            str(sys.exc_info()[1])))
+                    if self.journal is not None:
+                        from .checkpoint import getErrorText, isTransientError
+                        self.journal.markFailed('folder', songFolder, None, getErrorText(), isTransientError())
             batchLogger.info("construct: Created %s simfile objects", str(len(self.simfile_list)))
         except:
             batchLogger.warning("construct: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                              str(sys.exc_info()[1])))
 
+    def getFormatFields(self, extension):
+        # .ssc files have the same header fields as .sm files
+        return self.dwiFileFields if extension == ".dwi" else self.smFileFields
+
     def setSmFields(self, fieldList):
         self.smFileFields = fieldList
 
     def setDwiFields(self, fieldList):
         self.dwiFileFields = fieldList
 
+    @timed("batch.parseSimfiles")
     def parseSimfiles(self):
         """
         NOTE: Simfile class has its own getSimInfo method. That needs to be changed here.
@@ -132,48 +145,123 @@ class BatchContainer():
         folder is the name of the folder by itself. It will be turned into the full file path
         However since not every file in the batch could be a folder, keep file cases in mind
         """
+        self.songListing = None
         if self.simfile_list is not []:
             batchLogger.info("parseSongs: Parsing batch simfiles")
             for simfileObj in self.simfile_list:
                 try:
                     songFolder = simfileObj.getSongFolderName()
                     batchLogger.debug("parseSongs: Song Folder is '%s'", songFolder)
+                    if self.journal is not None and self.resumeSimfile(simfileObj):
+                        continue
                     simfileObj.parse()
+                    count("batch.simfilesParsed")
                     self.allSongInfo[songFolder] = simfileObj.getSimInfo()
+                    if self.journal is not None:
+                        self.checkpointSimfile(simfileObj)
                 except:
                     batchLogger.warning("parseSongs: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                       str(sys.exc_info()[1])))
+                    if self.journal is not None:
+                        from .checkpoint import getErrorText, isTransientError
+                        self.journal.markFailed('folder', simfileObj.getSongFolderName(), None, getErrorText(),
+                                                isTransientError())
+
+    def getSimfileStamp(self, simfileObj):
+        from .lazy import getFileStamp
+        return [simfileObj.stepfile, getFileStamp(os.path.join(simfileObj.folderPath, simfileObj.stepfile)),
+                self.smFileFields, self.dwiFileFields]
+
+    def resumeSimfile(self, simfileObj):
+        """
+        Takes the song information of a folder from the journal if it was
+        parsed before from the same chart file, or failed to parse in a way
+        that reading it again won't change. Returns True if it was.
+        """
+        stamp = self.getSimfileStamp(simfileObj)
+        record = self.journal.getDone('folder', simfileObj.getSongFolderName(), stamp)
+        if record is None:
+            record = self.journal.getFailed('folder', simfileObj.getSongFolderName(), stamp)
+        if record is None or record['result'] is None:
+            return False
+        simfileObj.simInfo = record['result']
+        self.allSongInfo[simfileObj.getSongFolderName()] = record['result']
+        return True
+
+    def checkpointSimfile(self, simfileObj):
+        from .checkpoint import getErrorText, isTransientError
+        stamp = self.getSimfileStamp(simfileObj)
+        if simfileObj.parseError is not None:
+            self.journal.markFailed('folder', simfileObj.getSongFolderName(), stamp,
+                                    getErrorText(simfileObj.parseError), isTransientError(simfileObj.parseError),
+                                    simfileObj.getSimInfo())
+        else:
+            self.journal.markDone('folder', simfileObj.getSongFolderName(), stamp, simfileObj.getSimInfo())
+
+    def getSongListingRows(self):
+        """
+        Returns (header, rows) for the song listing: the header is [FOLDER]
+        followed by each search field in brackets, and there is one row per
+        song folder in case-insensitive order. Commas are taken out of the
+        values so the CSV file stays readable by older tools.
+
+        The rows are made once and kept in songListing, so the CSV file and
+        the table handed to the later stages share them and each empty field
+        is only warned about once.
+        """
+        if self.songListing is not None:
+            return self.songListing
+        sortedFolders = sorted(self.allSongInfo.keys(), key=str.lower)
+        sortedSongFields = sorted(self.allSongInfo[sortedFolders[0]].keys(), key=str.lower)
+
+        # First row specifies the fields in the columns.
+        header = ["[FOLDER]"]
+        for field in sortedSongFields:
+            header.append("[" + field + "]")
+
+        rows = []
+        for folder in sortedFolders:
+            songRow = [re.sub(',', '', folder)]
+            for songField in sortedSongFields:
+                fieldWithoutCommas = re.sub(',', '', self.allSongInfo[folder][songField])
+                if fieldWithoutCommas == "":
+                    batchLogger.warning("getSongListingRows: '%s' has empty field for '%s'",
+                                        folder, songField)
+                songRow.append(fieldWithoutCommas)
+            rows.append(songRow)
+        self.songListing = (header, rows)
+        return self.songListing
+
+    def getCsvTable(self):
+        """
+        Builds the same BatchCsvTable that loading the CSV file would give,
+        straight from the parsed simfiles. NotesTemplate and ArtistForNotes
+        can take this so the CSV doesn't have to be written and read back.
+        """
+        batchLogger.info("getCsvTable: Building song listing table for '%s'", self.name)
+        csvTable = BatchCsvTable(os.path.join(self.path, self.outputFile))
+        try:
+            header, rows = self.getSongListingRows()
+            csvTable.addRows([header] + rows)
+        except:
+            batchLogger.warning("getCsvTable: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                               str(sys.exc_info()[1])))
+        return csvTable
 
+    @timed("batch.writeCsv")
     def createCsvSongListing(self):
         try:
             batchLogger.info("createCsvSongListing: Attempting to write CSV File '%s'", self.outputFile)
-            os.chdir(self.path)  # Change to batch directory context
-            sortedFolders = sorted(self.allSongInfo.keys(), key=str.lower)
-            sortedSongFields = sorted(self.allSongInfo[sortedFolders[0]].keys(), key=str.lower)
-            header = "[FOLDER]"
-
-            # Create first row string in CSV file specifying the fields in the columns.
-            for field in sortedSongFields:
-                header += ",[" + field + "]"
+            header, rows = self.getSongListingRows()
 
             # Write header out to file, then write information for all parsed songs.
-            with open(self.outputFile, 'w') as batchInfo:
-                batchInfo.write(header+"\n")
-                for folder in sortedFolders:
-                    folderWithoutCommas = folder + ","
-                    folderWithoutCommas = re.sub(',', '', folderWithoutCommas)
-                    songInfoString = folderWithoutCommas
-                    for songField in sortedSongFields:
-                        fieldWithoutCommas = self.allSongInfo[folder][songField] + ","
-                        fieldWithoutCommas = re.sub(',', '', fieldWithoutCommas)
-                        if fieldWithoutCommas == "":
-                            batchLogger.warning("createCsvSongListing: '%s' has empty field for '%s'",
-                                                folder, songField)
-                        songInfoString += "," + fieldWithoutCommas
-                    batchInfo.write(songInfoString+"\n")
+            # Only values with quote characters in them end up quoted.
+            with open(os.path.join(self.path, self.outputFile), 'w', newline="") as batchInfo:
+                csvWriter = csv.writer(batchInfo, lineterminator="\n")
+                csvWriter.writerow(header)
+                csvWriter.writerows(rows)
             batchInfo.close()
             batchLogger.info("createCsvSongListing: Successfully wrote CSV File '%s'", self.outputFile)
         except:
             batchLogger.warning("createCsvSongListing: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                         str(sys.exc_info()[1])))
-
@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+
+"""
+Times every pipeline stage on synthetic corpora (see corpus.py) of a few
+sizes and keeps the numbers, so a change can be compared against the run
+before it.
+
+For each size the whole pipeline is run with force (the 'full' run), then
+once more with nothing changed (the 'noop' run, which should skip every
+stage). The timers and counters come from metrics.py; with repeat > 1 the
+fastest time of each timer is kept. Caches that would let a full run skip
+work (the stepartist manifest, the forum post cache) are removed before
+every full run.
+
+The forum post is also built on its own three ways: with one worker,
+with maxWorkers, and again with every judge's fragment cached, so the
+parallel set sections and the fragment cache can be compared directly.
+
+Results are written as JSON:
+
+    {'seed':..., 'repeat':..., 'python':..., 'platform':...,
+     'sizes': {'<songs>': {'generateSeconds':..., 'full': {<timer>:<seconds>},
+                           'noop': {<timer>:<seconds>}, 'post': {<run>:<seconds>},
+                           'counters': {...}, 'failed': [...]}}}
+
+compareResults() lists the timers that got slower than a baseline file.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+from .corpus import SyntheticCorpus
+from .metrics import metrics
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+benchmarkLogger = logging.getLogger("BENCHMARK")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def loadResults(resultsFile):
+    with open(resultsFile) as results:
+        return json.load(results)
+
+def compareResults(baseline, current, threshold=0.25, minSeconds=0.05):
+    """
+    Returns a list of (size, run, timer, baseline seconds, current seconds)
+    for every timer in both results that is more than threshold (0.25 = 25%)
+    slower than in baseline. Timers under minSeconds in both are left out,
+    they are mostly noise.
+    """
+    regressions = []
+    for size, sizeResults in sorted(current['sizes'].items(), key=lambda item: int(item[0])):
+        baselineSize = baseline.get('sizes', {}).get(size)
+        if baselineSize is None:
+            continue
+        for run in ('full', 'noop'):
+            for timer, seconds in sorted(sizeResults.get(run, {}).items()):
+                baselineSeconds = baselineSize.get(run, {}).get(timer)
+                if baselineSeconds is None or max(seconds, baselineSeconds) < minSeconds:
+                    continue
+                if seconds > baselineSeconds * (1 + threshold):
+                    regressions.append((size, run, timer, baselineSeconds, seconds))
+    return regressions
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class BatchBenchmark():
+    """
+    Runs the pipeline on a synthetic corpus of each size.
+
+    * CLASS ATTRIBUTES *
+    - path: Folder the corpora are written into. Corpora written earlier with
+            the same options are reused.
+    - sizes: List of song counts to run.
+    - seed: Seed for the corpora.
+    - repeat: Number of times each run is repeated; the fastest time is kept.
+    - maxWorkers: Number of pipeline stages to run at the same time.
+    - results: Dictionary of results, in the form written by writeResults().
+    """
+
+    def __init__(self, workDir, sizes=(100, 1000, 10000), seed=0, repeat=1, maxWorkers=None):
+        """
+        Constructor
+        """
+        import platform
+        self.path = workDir
+        self.sizes = list(sizes)
+        self.seed = seed
+        self.repeat = repeat
+        self.maxWorkers = maxWorkers
+        self.results = {'seed': seed, 'repeat': repeat, 'python': platform.python_version(),
+                        'platform': platform.platform(), 'sizes': {}}
+
+    def __str__(self):
+        return """>>> BATCH BENCHMARK
+- WORK DIR: {}
+- SIZES: {}
+- SEED: {}
+- REPEAT: {}""" \
+        .format(self.path, self.sizes, str(self.seed), str(self.repeat))
+
+    def getCorpus(self, size):
+        """
+        Returns the corpus for size and the seconds it took to write, which
+        is 0 if it was already there.
+        """
+        corpus = SyntheticCorpus(os.path.join(self.path, "songs_" + str(size)), size, seed=self.seed)
+        if corpus.isWritten():
+            benchmarkLogger.info("getCorpus: Reusing corpus in '%s'", corpus.path)
+            return corpus, 0.0
+        if os.path.exists(corpus.path):
+            shutil.rmtree(corpus.path)
+        benchmarkLogger.info("getCorpus: Writing corpus of %s songs to '%s'", str(size), corpus.path)
+        start = time.perf_counter()
+        corpus.write()
+        return corpus, time.perf_counter() - start
+
+    def getPipeline(self, corpus):
+        from .pipeline import BatchPipeline
+        return BatchPipeline(batchDir=corpus.getBatchDir(), setDir=corpus.getReviewDir(), notesDir=corpus.getSetsDir(),
+                             stateFile=os.path.join(corpus.path, ".batchapi_run.json"), maxWorkers=self.maxWorkers)
+
+    def removeCaches(self, corpus):
+        from .notestemplate import ArtistForNotes
+        for cachePath in (os.path.normpath(corpus.getReviewDir()) + ArtistForNotes.stepperManifest,
+                          os.path.join(corpus.getSetsDir(), ".forum_post_cache.json")):
+            if os.path.exists(cachePath):
+                os.remove(cachePath)
+
+    def timePipeline(self, corpus, force):
+        """
+        Runs the pipeline once. Returns (timers, counters, failed stages).
+        """
+        if force:
+            self.removeCaches(corpus)
+        pipeline = self.getPipeline(corpus)
+        pipeline.force = force
+        metrics.reset()
+        stageStatus = pipeline.run()
+        runMetrics = metrics.getMetrics()
+        timers = {timer: values['seconds'] for timer, values in runMetrics['timers'].items()}
+        timers['wall'] = runMetrics['wallSeconds']
+        failed = sorted(name for name, status in stageStatus.items() if status == 'failed')
+        return timers, runMetrics['counters'], failed
+
+    def timePost(self, corpus):
+        """
+        Builds the forum post of the corpus sets with one worker, with
+        maxWorkers, and with every fragment cached. Returns the seconds of
+        each. The post and cache are written under their own names and
+        removed after, so the pipeline's are left alone.
+        """
+        from .format import FormatNotes
+        postFile = ".benchmark_post.txt"
+        cacheFile = ".benchmark_post_cache.json"
+        postSeconds = {}
+        try:
+            for run, maxWorkers, useCache in (('oneWorker', 1, False), ('workers', self.maxWorkers, False),
+                                              ('cached', self.maxWorkers, True)):
+                if useCache:
+                    notesFormat = FormatNotes(corpus.getSetsDir(), maxWorkers=maxWorkers)
+                    notesFormat.setPostFile, notesFormat.cacheFile = postFile, cacheFile
+                    notesFormat.getSetJudgeInfo()
+                    notesFormat.makeFormattedPost()  # Fills the cache
+                start = time.perf_counter()
+                notesFormat = FormatNotes(corpus.getSetsDir(), maxWorkers=maxWorkers)
+                notesFormat.setPostFile, notesFormat.cacheFile = postFile, cacheFile
+                notesFormat.useCache = useCache
+                notesFormat.getSetJudgeInfo()
+                notesFormat.makeFormattedPost()
+                postSeconds[run] = time.perf_counter() - start
+        finally:
+            for fileName in (postFile, cacheFile):
+                if os.path.exists(os.path.join(corpus.getSetsDir(), fileName)):
+                    os.remove(os.path.join(corpus.getSetsDir(), fileName))
+        return postSeconds
+
+    def runSize(self, size):
+        benchmarkLogger.info("runSize: Benchmarking %s songs", str(size))
+        corpus, generateSeconds = self.getCorpus(size)
+        sizeResults = {'generateSeconds': round(generateSeconds, 6), 'full': {}, 'noop': {}, 'post': {},
+                       'counters': {}, 'failed': []}
+        for attempt in range(self.repeat):
+            for run, force in (('full', True), ('noop', False)):
+                timers, counters, failed = self.timePipeline(corpus, force)
+                for timer, seconds in timers.items():
+                    if timer not in sizeResults[run] or seconds < sizeResults[run][timer]:
+                        sizeResults[run][timer] = seconds
+                if force:
+                    sizeResults['counters'] = counters
+                for name in failed:
+                    if name not in sizeResults['failed']:
+                        benchmarkLogger.warning("runSize: Stage '%s' failed for %s songs", name, str(size))
+                        sizeResults['failed'].append(name)
+            for run, seconds in self.timePost(corpus).items():
+                if run not in sizeResults['post'] or seconds < sizeResults['post'][run]:
+                    sizeResults['post'][run] = seconds
+        sizeResults['full'] = dict(sorted(sizeResults['full'].items()))
+        sizeResults['noop'] = dict(sorted(sizeResults['noop'].items()))
+        self.results['sizes'][str(size)] = sizeResults
+        return sizeResults
+
+    def run(self):
+        for size in self.sizes:
+            try:
+                self.runSize(size)
+            except:
+                benchmarkLogger.warning("run: {0} songs: {1}: {2}".format(str(size), sys.exc_info()[0].__name__,
+                                                                          str(sys.exc_info()[1])))
+        return self.results
+
+    def writeResults(self, resultsFile):
+        with open(resultsFile, 'w') as resultsOut:
+            json.dump(self.results, resultsOut, indent=1, sort_keys=True)
+
+    def getSummary(self):
+        """
+        Returns the lines of a table with the full and noop seconds of each
+        pipeline stage for each size.
+        """
+        lines = []
+        for size, sizeResults in self.results['sizes'].items():
+            lines.append(">>> " + size + " SONGS (corpus written in " +
+                         "{:.2f}".format(sizeResults['generateSeconds']) + "s)")
+            for timer in sorted(sizeResults['full']):
+                if timer.startswith("pipeline.") or timer == 'wall':
+                    lines.append("- {:<22} full {:>9.3f}s   noop {:>9.3f}s".format(
+                        timer, sizeResults['full'][timer], sizeResults['noop'].get(timer, 0.0)))
+            if sizeResults['post']:
+                lines.append("- post: one worker {:.3f}s, workers {:.3f}s, cached {:.3f}s".format(
+                    sizeResults['post']['oneWorker'], sizeResults['post']['workers'], sizeResults['post']['cached']))
+            if sizeResults['failed']:
+                lines.append("- FAILED: " + ", ".join(sizeResults['failed']))
+        return lines
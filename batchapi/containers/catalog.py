@@ -0,0 +1,697 @@
+#!/usr/bin/python3
+
+"""
+There are two classes defined here:
+- BatchCatalog
+- CatalogQuery
+
+BatchCatalog loads the parsed containers into one SQLite file, so the
+history of every batch can be looked up without going through the old
+batch folders and notes folders again:
+
+- BatchContainer (or the <batch>.csv song listing) -> batches, songs, charts
+- JudgesForExcel / BatchJudgesForExcel -> sets, judges, ratings
+- JudgeNotes -> judges, ratings
+
+Each load is one transaction with executemany inserts, and loading the
+same batch, set or judge again replaces the rows from the last time.
+Ratings keep the rating text as written (e.g. '8.5', 'PASS', '*') and,
+when it is a number, its value, so averages only count numbers.
+
+Every load also updates the resubmission lineage of the songs it touched.
+A submission is one song by one stepartist in one batch, keyed by the
+song title and stepartist with case, punctuation and tags like
+[Resubmission] left out (see getTitleKey() in normalize.py), and it
+holds the average and counts of the ratings it got, including how many
+judges marked it '<' (worse than the file already queued) or '$' (better
+than it). Each submission is linked to the latest earlier submission of
+the same song by the same stepartist ('resubmission') and by each other
+stepartist ('sameSong'), so a song's history is a walk over the lineage
+table instead of a pass over every old batch. A '<' or '$' that came with
+a number (e.g. [8$]) is only counted as the number, since JudgeNotes
+keeps just the number for those.
+
+CatalogQuery has the lookups that come up while judging: a stepartist's
+average per batch over time, everything a judge gave, every rating a song
+got, the lineage of a song. The columns they filter on are indexed.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+from .metrics import timed, count
+from .normalize import getSongKey, getTitleKey, getRatingValue
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+catalogLogger = logging.getLogger("CATALOG")
+
+catalogSchema = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    batchDate TEXT,
+    path TEXT,
+    loadedAt REAL
+);
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    batchId INTEGER NOT NULL REFERENCES batches(id),
+    folder TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    stepartist TEXT,
+    UNIQUE (batchId, folder)
+);
+CREATE TABLE IF NOT EXISTS charts (
+    id INTEGER PRIMARY KEY,
+    songId INTEGER NOT NULL REFERENCES songs(id),
+    chartFile TEXT NOT NULL,
+    chartFormat TEXT
+);
+CREATE TABLE IF NOT EXISTS sets (
+    id INTEGER PRIMARY KEY,
+    batchId INTEGER NOT NULL REFERENCES batches(id),
+    name TEXT NOT NULL,
+    setNumber INTEGER,
+    path TEXT,
+    UNIQUE (batchId, name)
+);
+CREATE TABLE IF NOT EXISTS judges (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    id INTEGER PRIMARY KEY,
+    setId INTEGER NOT NULL REFERENCES sets(id),
+    judgeId INTEGER NOT NULL REFERENCES judges(id),
+    position INTEGER NOT NULL,
+    title TEXT,
+    artist TEXT,
+    stepartist TEXT,
+    rating TEXT,
+    value REAL,
+    isSpecial INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    batchId INTEGER NOT NULL REFERENCES batches(id),
+    songKey TEXT NOT NULL,
+    stepartistKey TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    stepartist TEXT,
+    average REAL,
+    ratingCount INTEGER NOT NULL DEFAULT 0,
+    worse INTEGER NOT NULL DEFAULT 0,
+    better INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (batchId, songKey, stepartistKey)
+);
+CREATE TABLE IF NOT EXISTS submissionRatings (
+    ratingId INTEGER PRIMARY KEY REFERENCES ratings(id),
+    submissionId INTEGER NOT NULL REFERENCES submissions(id)
+);
+CREATE TABLE IF NOT EXISTS lineage (
+    submissionId INTEGER NOT NULL REFERENCES submissions(id),
+    predecessorId INTEGER NOT NULL REFERENCES submissions(id),
+    relation TEXT NOT NULL,
+    PRIMARY KEY (submissionId, predecessorId)
+);
+CREATE INDEX IF NOT EXISTS songsStepartist ON songs (stepartist COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS songsTitle ON songs (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS chartsSong ON charts (songId);
+CREATE INDEX IF NOT EXISTS ratingsSetJudge ON ratings (setId, judgeId);
+CREATE INDEX IF NOT EXISTS ratingsJudge ON ratings (judgeId, setId, isSpecial, value);
+CREATE INDEX IF NOT EXISTS ratingsStepartist ON ratings (stepartist COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ratingsTitle ON ratings (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS submissionsSong ON submissions (songKey, stepartistKey);
+CREATE INDEX IF NOT EXISTS submissionRatingsSubmission ON submissionRatings (submissionId);
+CREATE INDEX IF NOT EXISTS lineagePredecessor ON lineage (predecessorId);
+"""
+
+# Raised when a table is added that has to be filled from the rows already in a catalog.
+catalogVersion = 1
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getLineageKeys(title, stepartist):
+    """
+    (song key, stepartist key) of a submission. Either is "" when unknown.
+    """
+    return getTitleKey(title or ""), getSongKey(stepartist or "")
+
+def getFolderDate(path):
+    """
+    Date a folder was last changed, used as the batch date when none is given.
+    """
+    import datetime
+    return datetime.date.fromtimestamp(os.path.getmtime(path)).isoformat()
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class BatchCatalog():
+    """
+    * CLASS ATTRIBUTES *
+    - path: Full path to the SQLite file. It is made if it doesn't exist.
+    - connection: sqlite3 connection, opened by open().
+    - batchSize: Number of rows given to each executemany call.
+    """
+
+    def __init__(self, catalogFile):
+        """
+        Constructor
+        """
+        self.path = catalogFile
+        self.connection = None
+        self.batchSize = 5000
+
+    def __str__(self):
+        return """>>> BATCH CATALOG
+- CATALOG FILE: {}
+- BATCHES: {}
+- SONGS: {}
+- RATINGS: {}""" \
+        .format(self.path, self.getCount('batches'), self.getCount('songs'), self.getCount('ratings'))
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def open(self):
+        if self.connection is None:
+            catalogLogger.info("open: Opening catalog '%s'", self.path)
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("PRAGMA foreign_keys=ON")
+            self.connection.executescript(catalogSchema)
+            # A catalog made before the lineage tables gets them filled from its rows once.
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] < catalogVersion:
+                with self.connection:
+                    self.rebuildLineage()
+                    self.connection.execute("PRAGMA user_version = " + str(catalogVersion))
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def getCount(self, table):
+        if self.connection is None:
+            return None
+        return self.connection.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+
+    def insertMany(self, statement, rows):
+        """
+        executemany in chunks of batchSize rows, so a huge load doesn't build
+        one giant list of parameters.
+        """
+        for start in range(0, len(rows), self.batchSize):
+            self.connection.executemany(statement, rows[start:start + self.batchSize])
+
+    ###########
+    # BATCHES #
+    ###########
+
+    def getBatchId(self, batchName, batchDate=None, path=None, defaultDate=None):
+        """
+        Id of the batch, added if it isn't in the catalog yet. batchDate and
+        path are only updated when given; defaultDate is only used if the
+        batch has no date yet.
+        """
+        self.connection.execute("INSERT OR IGNORE INTO batches (name) VALUES (?)", (batchName,))
+        if batchDate is not None:
+            self.connection.execute("UPDATE batches SET batchDate = ? WHERE name = ?", (batchDate, batchName))
+        elif defaultDate is not None:
+            self.connection.execute("UPDATE batches SET batchDate = COALESCE(batchDate, ?) WHERE name = ?",
+                                    (defaultDate, batchName))
+        if path is not None:
+            self.connection.execute("UPDATE batches SET path = ? WHERE name = ?", (path, batchName))
+        self.connection.execute("UPDATE batches SET loadedAt = ? WHERE name = ?", (time.time(), batchName))
+        return self.connection.execute("SELECT id FROM batches WHERE name = ?", (batchName,)).fetchone()[0]
+
+    def replaceSongs(self, batchId, songRows):
+        """
+        songRows is a list of (folder, title, artist, stepartist, chartFile).
+        chartFile can be None when only the song listing is known.
+        """
+        self.connection.execute("DELETE FROM charts WHERE songId IN (SELECT id FROM songs WHERE batchId = ?)",
+                                (batchId,))
+        self.connection.execute("DELETE FROM songs WHERE batchId = ?", (batchId,))
+        self.insertMany("INSERT INTO songs (batchId, folder, title, artist, stepartist) VALUES (?, ?, ?, ?, ?)",
+                        [(batchId, folder, title, artist, stepartist)
+                         for folder, title, artist, stepartist, chartFile in songRows])
+        songIds = dict(self.connection.execute("SELECT folder, id FROM songs WHERE batchId = ?", (batchId,)))
+        chartRows = [(songIds[folder], chartFile, os.path.splitext(chartFile)[1].lstrip(".").lower())
+                     for folder, title, artist, stepartist, chartFile in songRows if chartFile is not None]
+        self.insertMany("INSERT INTO charts (songId, chartFile, chartFormat) VALUES (?, ?, ?)", chartRows)
+        count("catalog.songsLoaded", len(songRows))
+        count("catalog.chartsLoaded", len(chartRows))
+
+    @timed("catalog.loadBatch")
+    def loadBatch(self, batch, batchName=None, batchDate=None):
+        """
+        Loads the songs of a BatchContainer after parseSimfiles().
+        """
+        batchName = batchName if batchName is not None else batch.name
+        catalogLogger.info("loadBatch: Loading %s songs of batch '%s'", str(len(batch.simfile_list)), batchName)
+        try:
+            songRows = []
+            for simfileObj in batch.simfile_list:
+                songInfo = simfileObj.getSimInfo()
+                songRows.append((simfileObj.getSongFolderName(), songInfo.get('TITLE', simfileObj.songTitle),
+                                 songInfo.get('ARTIST', ""), songInfo.get('STEPARTIST', simfileObj.stepper),
+                                 simfileObj.stepfile))
+            with self.connection:
+                batchId = self.getBatchId(batchName, batchDate, batch.path, getFolderDate(batch.path))
+                self.replaceSongs(batchId, songRows)
+                self.refreshLineage(batchId)
+        except:
+            catalogLogger.warning("loadBatch: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                               str(sys.exc_info()[1])))
+
+    @timed("catalog.loadSongListing")
+    def loadSongListing(self, csvTable, batchName=None, batchDate=None):
+        """
+        Loads the songs of a loaded BatchCsvTable, for old batches where only
+        the <batch>.csv file was kept. No charts are known then.
+        """
+        batchName = batchName if batchName is not None else os.path.splitext(os.path.basename(csvTable.path))[0]
+        catalogLogger.info("loadSongListing: Loading %s songs of batch '%s'", str(len(csvTable.rows)), batchName)
+        try:
+            songRows = []
+            for row in csvTable.rows:
+                songRows.append((csvTable.getValue(row, 'FOLDER'), csvTable.getValue(row, 'TITLE'),
+                                 csvTable.getValue(row, 'ARTIST'), csvTable.getValue(row, 'STEPARTIST'), None))
+            defaultDate = getFolderDate(csvTable.path) if os.path.exists(csvTable.path) else None
+            with self.connection:
+                batchId = self.getBatchId(batchName, batchDate, os.path.dirname(csvTable.path), defaultDate)
+                self.replaceSongs(batchId, songRows)
+                self.refreshLineage(batchId)
+        except:
+            catalogLogger.warning("loadSongListing: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                     str(sys.exc_info()[1])))
+
+    ###########
+    # RATINGS #
+    ###########
+
+    def getSetId(self, batchId, setName, setNumber=None, path=None):
+        self.connection.execute("INSERT OR IGNORE INTO sets (batchId, name) VALUES (?, ?)", (batchId, setName))
+        self.connection.execute("UPDATE sets SET setNumber = ?, path = ? WHERE batchId = ? AND name = ?",
+                                (setNumber, path, batchId, setName))
+        return self.connection.execute("SELECT id FROM sets WHERE batchId = ? AND name = ?",
+                                       (batchId, setName)).fetchone()[0]
+
+    def getJudgeId(self, judgeName):
+        self.connection.execute("INSERT OR IGNORE INTO judges (name) VALUES (?)", (judgeName,))
+        return self.connection.execute("SELECT id FROM judges WHERE name = ?", (judgeName,)).fetchone()[0]
+
+    def replaceRatings(self, setId, judgeNotes):
+        """
+        Replaces the ratings of one judge in one set with the rating records
+        of a JudgeNotes object.
+        """
+        judgeId = self.getJudgeId(judgeNotes.judgeName)
+        self.connection.execute("DELETE FROM submissionRatings WHERE ratingId IN "
+                                "(SELECT id FROM ratings WHERE setId = ? AND judgeId = ?)", (setId, judgeId))
+        self.connection.execute("DELETE FROM ratings WHERE setId = ? AND judgeId = ?", (setId, judgeId))
+        ratingRows = []
+        for position, (songInfo, rating, isSpecial) in enumerate(judgeNotes.ratingRecords):
+            title, artist, stepartist = (list(songInfo) + ["", "", ""])[:3]
+            ratingRows.append((setId, judgeId, position, title, artist, stepartist, rating,
+                               getRatingValue(rating), int(isSpecial)))
+        self.insertMany("INSERT INTO ratings (setId, judgeId, position, title, artist, stepartist, rating, value, "
+                        "isSpecial) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", ratingRows)
+        count("catalog.ratingsLoaded", len(ratingRows))
+
+    @timed("catalog.loadJudgeNotes")
+    def loadJudgeNotes(self, judgeNotes, batchName, setName=None, setNumber=None, batchDate=None):
+        """
+        Loads a single JudgeNotes file. setName defaults to the folder the
+        notes file is in.
+        """
+        setName = setName if setName is not None else os.path.basename(judgeNotes.fileDir)
+        catalogLogger.info("loadJudgeNotes: Loading '%s' into set '%s' of batch '%s'", judgeNotes.notesFile,
+                           setName, batchName)
+        try:
+            with self.connection:
+                batchId = self.getBatchId(batchName, batchDate)
+                self.replaceRatings(self.getSetId(batchId, setName, setNumber, judgeNotes.fileDir), judgeNotes)
+                self.refreshLineage(batchId)
+        except:
+            catalogLogger.warning("loadJudgeNotes: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                    str(sys.exc_info()[1])))
+
+    def addSet(self, batchId, judgeSet):
+        """
+        Adds every judge of a JudgesForExcel set. Each judge's notes are read
+        with JudgeNotes, which keeps the artist and which ratings are special.
+        """
+        from .judge import JudgeNotes
+        setId = self.getSetId(batchId, judgeSet.setName, int(judgeSet.setNumber), judgeSet.path)
+        for judgeName, notesFile in judgeSet.judgeToFileName.items():
+            judgeNotes = JudgeNotes(os.path.join(judgeSet.path, notesFile))
+            self.replaceRatings(setId, judgeNotes)
+        count("catalog.setsLoaded")
+
+    @timed("catalog.loadSet")
+    def loadSet(self, judgeSet, batchName=None, batchDate=None):
+        """
+        Loads a JudgesForExcel set. batchName defaults to the folder the set
+        folder is in.
+        """
+        if batchName is None:
+            batchName = os.path.basename(os.path.dirname(os.path.normpath(judgeSet.path)))
+        catalogLogger.info("loadSet: Loading set '%s' of batch '%s'", judgeSet.setName, batchName)
+        try:
+            with self.connection:
+                batchId = self.getBatchId(batchName, batchDate, defaultDate=getFolderDate(judgeSet.path))
+                self.addSet(batchId, judgeSet)
+                self.refreshLineage(batchId)
+        except:
+            catalogLogger.warning("loadSet: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                             str(sys.exc_info()[1])))
+
+    @timed("catalog.loadBatchJudgments")
+    def loadBatchJudgments(self, batchJudges, batchName=None, batchDate=None):
+        """
+        Loads every set of a BatchJudgesForExcel after getSetDirs(), in one
+        transaction. batchName defaults to the name of the notes folder.
+        """
+        from .judge import JudgesForExcel
+        batchName = batchName if batchName is not None else batchJudges.batchName
+        catalogLogger.info("loadBatchJudgments: Loading %s sets of batch '%s'", str(len(batchJudges.setDirs)),
+                           batchName)
+        try:
+            judgeSets = batchJudges.setJudgments
+            if not judgeSets:
+                judgeSets = [JudgesForExcel(os.path.join(batchJudges.path, setDir)) for setDir in batchJudges.setDirs]
+            with self.connection:
+                batchId = self.getBatchId(batchName, batchDate, defaultDate=getFolderDate(batchJudges.path))
+                for judgeSet in judgeSets:
+                    self.addSet(batchId, judgeSet)
+                self.refreshLineage(batchId)
+        except:
+            catalogLogger.warning("loadBatchJudgments: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                        str(sys.exc_info()[1])))
+
+    ###########
+    # LINEAGE #
+    ###########
+
+    def getBatchSubmissions(self, batchId):
+        """
+        Submissions of a batch from its song listing and its ratings. Returns
+        a dictionary with (song key, stepartist key):<submission> and a list
+        of (rating id, key of the submission it is for).
+        """
+        submissions = {}
+        stepartistKeys = {}
+        ratingKeys = []
+        for folder, title, artist, stepartist in self.connection.execute(
+                "SELECT folder, title, artist, stepartist FROM songs WHERE batchId = ?", (batchId,)):
+            songKey, stepartistKey = getLineageKeys(title or folder, stepartist)
+            if songKey and (songKey, stepartistKey) not in submissions:
+                submissions[(songKey, stepartistKey)] = {'title': title, 'artist': artist, 'stepartist': stepartist,
+                                                         'values': [], 'worse': 0, 'better': 0}
+                stepartistKeys.setdefault(songKey, []).append(stepartistKey)
+        for ratingId, title, artist, stepartist, rating, value, isSpecial in self.connection.execute("""
+                SELECT ratings.id, ratings.title, ratings.artist, ratings.stepartist, ratings.rating, ratings.value,
+                       ratings.isSpecial
+                FROM ratings JOIN sets ON sets.id = ratings.setId
+                WHERE sets.batchId = ?""", (batchId,)):
+            songKey, stepartistKey = getLineageKeys(title, stepartist)
+            if not songKey:
+                continue
+            # Notes without stepartists go to the song's only submission when it has just one.
+            if not stepartistKey and len(stepartistKeys.get(songKey, [])) == 1:
+                stepartistKey = stepartistKeys[songKey][0]
+            if (songKey, stepartistKey) not in submissions:
+                submissions[(songKey, stepartistKey)] = {'title': title, 'artist': artist, 'stepartist': stepartist,
+                                                         'values': [], 'worse': 0, 'better': 0}
+                stepartistKeys.setdefault(songKey, []).append(stepartistKey)
+            submission = submissions[(songKey, stepartistKey)]
+            if value is not None and not isSpecial:
+                submission['values'].append(value)
+            submission['worse'] += '<' in (rating or "")
+            submission['better'] += '$' in (rating or "")
+            ratingKeys.append((ratingId, (songKey, stepartistKey)))
+        return submissions, ratingKeys
+
+    @timed("catalog.refreshLineage")
+    def refreshLineage(self, batchId, relink=True):
+        """
+        Replaces the submissions of a batch and, if relink is True, links
+        every song the batch has (or had) again. Returns those song keys.
+        """
+        songKeys = {row[0] for row in self.connection.execute("SELECT songKey FROM submissions WHERE batchId = ?",
+                                                              (batchId,))}
+        self.connection.execute("DELETE FROM lineage WHERE submissionId IN (SELECT id FROM submissions WHERE batchId = ?) "
+                                "OR predecessorId IN (SELECT id FROM submissions WHERE batchId = ?)", (batchId, batchId))
+        self.connection.execute("DELETE FROM submissionRatings WHERE submissionId IN "
+                                "(SELECT id FROM submissions WHERE batchId = ?)", (batchId,))
+        self.connection.execute("DELETE FROM submissions WHERE batchId = ?", (batchId,))
+        submissions, ratingKeys = self.getBatchSubmissions(batchId)
+        submissionRows = []
+        for (songKey, stepartistKey), submission in submissions.items():
+            values = submission['values']
+            submissionRows.append((batchId, songKey, stepartistKey, submission['title'], submission['artist'],
+                                   submission['stepartist'], sum(values) / len(values) if values else None,
+                                   len(values), submission['worse'], submission['better']))
+        self.insertMany("INSERT INTO submissions (batchId, songKey, stepartistKey, title, artist, stepartist, average, "
+                        "ratingCount, worse, better) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", submissionRows)
+        submissionIds = {(songKey, stepartistKey): submissionId for submissionId, songKey, stepartistKey in
+                         self.connection.execute("SELECT id, songKey, stepartistKey FROM submissions WHERE batchId = ?",
+                                                 (batchId,))}
+        self.insertMany("INSERT INTO submissionRatings (ratingId, submissionId) VALUES (?, ?)",
+                        [(ratingId, submissionIds[key]) for ratingId, key in ratingKeys])
+        count("catalog.submissionsLoaded", len(submissionRows))
+        songKeys.update(songKey for songKey, stepartistKey in submissions)
+        if relink:
+            self.linkSongs(songKeys)
+        return songKeys
+
+    def linkSongs(self, songKeys):
+        """
+        Links every submission of the songs to the latest submission of the
+        same song by each stepartist in an earlier batch. Batches are in
+        date order, like the lookups in CatalogQuery.
+        """
+        from itertools import groupby
+        songKeys = sorted(songKeys)
+        chunkSize = 500  # Below SQLite's limit on ? parameters
+        for start in range(0, len(songKeys), chunkSize):
+            chunk = songKeys[start:start + chunkSize]
+            marks = ", ".join("?" * len(chunk))
+            self.connection.execute("DELETE FROM lineage WHERE submissionId IN "
+                                    "(SELECT id FROM submissions WHERE songKey IN (" + marks + "))", chunk)
+            rows = self.connection.execute("""
+                SELECT submissions.songKey, submissions.batchId, submissions.id, submissions.stepartistKey
+                FROM submissions JOIN batches ON batches.id = submissions.batchId
+                WHERE submissions.songKey IN (""" + marks + """)
+                ORDER BY submissions.songKey, batches.batchDate, batches.name""", chunk)
+            links = []
+            for songKey, songRows in groupby(rows, key=lambda row: row[0]):
+                latest = {}  # stepartist key:id of their latest submission so far
+                for batchId, batchRows in groupby(songRows, key=lambda row: row[1]):
+                    batchRows = list(batchRows)
+                    for _, _, submissionId, stepartistKey in batchRows:
+                        for earlierKey, predecessorId in latest.items():
+                            links.append((submissionId, predecessorId,
+                                          'resubmission' if earlierKey == stepartistKey else 'sameSong'))
+                    latest.update((stepartistKey, submissionId) for _, _, submissionId, stepartistKey in batchRows)
+            self.insertMany("INSERT INTO lineage (submissionId, predecessorId, relation) VALUES (?, ?, ?)", links)
+            count("catalog.lineageLinks", len(links))
+
+    @timed("catalog.rebuildLineage")
+    def rebuildLineage(self):
+        """
+        Fills the lineage tables from every batch in the catalog.
+        """
+        songKeys = set()
+        for (batchId,) in self.connection.execute("SELECT id FROM batches").fetchall():
+            songKeys.update(self.refreshLineage(batchId, relink=False))
+        self.linkSongs(songKeys)
+
+
+class CatalogQuery():
+    """
+    Read-only lookups on a catalog file. Every method returns a list of
+    dictionaries, one per row. Names are matched without regard to case.
+
+    * CLASS ATTRIBUTES *
+    - path: Full path to the SQLite file.
+    - connection: sqlite3 connection, opened read-only.
+    """
+
+    def __init__(self, catalogFile):
+        """
+        Constructor
+        """
+        self.path = catalogFile
+        self.connection = sqlite3.connect("file:" + catalogFile + "?mode=ro", uri=True)
+        self.connection.row_factory = sqlite3.Row
+
+    def __str__(self):
+        return """>>> CATALOG QUERY
+- CATALOG FILE: {}""" \
+        .format(self.path)
+
+    def close(self):
+        self.connection.close()
+
+    def getRows(self, statement, parameters=()):
+        return [dict(row) for row in self.connection.execute(statement, parameters)]
+
+    def getBatches(self):
+        return self.getRows("""
+            SELECT batches.name AS batch, batches.batchDate AS batchDate,
+                   (SELECT COUNT(*) FROM songs WHERE songs.batchId = batches.id) AS songs,
+                   (SELECT COUNT(*) FROM sets WHERE sets.batchId = batches.id) AS sets
+            FROM batches ORDER BY batches.batchDate, batches.name""")
+
+    def getStepartistHistory(self, stepartist):
+        """
+        A stepartist's average rating, number of ratings and number of songs
+        per batch, oldest batch first.
+        """
+        return self.getRows("""
+            SELECT batches.name AS batch, batches.batchDate AS batchDate,
+                   AVG(ratings.value) AS average, COUNT(ratings.value) AS ratings,
+                   COUNT(DISTINCT ratings.title) AS songs
+            FROM ratings
+            JOIN sets ON sets.id = ratings.setId
+            JOIN batches ON batches.id = sets.batchId
+            WHERE ratings.stepartist = ? COLLATE NOCASE AND ratings.isSpecial = 0
+            GROUP BY batches.id ORDER BY batches.batchDate, batches.name""", (stepartist,))
+
+    def getStepartistSongs(self, stepartist):
+        """
+        Every song of a stepartist with its average rating.
+        """
+        return self.getRows("""
+            SELECT batches.name AS batch, sets.name AS setName, ratings.title AS title,
+                   AVG(ratings.value) AS average, COUNT(ratings.value) AS ratings,
+                   GROUP_CONCAT(ratings.rating, ' ') AS allRatings
+            FROM ratings
+            JOIN sets ON sets.id = ratings.setId
+            JOIN batches ON batches.id = sets.batchId
+            WHERE ratings.stepartist = ? COLLATE NOCASE
+            GROUP BY sets.id, ratings.title ORDER BY batches.batchDate, sets.setNumber, ratings.title""",
+            (stepartist,))
+
+    def getJudgeHistory(self, judgeName):
+        """
+        A judge's average, number of judged ratings and number of special
+        ratings per batch, oldest batch first.
+        """
+        return self.getRows("""
+            SELECT batches.name AS batch, batches.batchDate AS batchDate,
+                   AVG(CASE WHEN ratings.isSpecial = 0 THEN ratings.value END) AS average,
+                   SUM(ratings.isSpecial = 0) AS ratings, SUM(ratings.isSpecial) AS special
+            FROM ratings
+            JOIN judges ON judges.id = ratings.judgeId
+            JOIN sets ON sets.id = ratings.setId
+            JOIN batches ON batches.id = sets.batchId
+            WHERE judges.name = ? COLLATE NOCASE
+            GROUP BY batches.id ORDER BY batches.batchDate, batches.name""", (judgeName,))
+
+    def getJudgeRatings(self, judgeName, batchName=None):
+        statement = """
+            SELECT batches.name AS batch, sets.name AS setName, ratings.title AS title,
+                   ratings.stepartist AS stepartist, ratings.rating AS rating, ratings.value AS value
+            FROM ratings
+            JOIN judges ON judges.id = ratings.judgeId
+            JOIN sets ON sets.id = ratings.setId
+            JOIN batches ON batches.id = sets.batchId
+            WHERE judges.name = ? COLLATE NOCASE"""
+        parameters = [judgeName]
+        if batchName is not None:
+            statement += " AND batches.name = ?"
+            parameters.append(batchName)
+        return self.getRows(statement + " ORDER BY batches.batchDate, sets.setNumber, ratings.position", parameters)
+
+    def getSongRatings(self, title):
+        """
+        Every rating given to a song title, in any batch (resubmissions included).
+        """
+        return self.getRows("""
+            SELECT batches.name AS batch, sets.name AS setName, ratings.stepartist AS stepartist,
+                   judges.name AS judge, ratings.rating AS rating, ratings.value AS value
+            FROM ratings
+            JOIN judges ON judges.id = ratings.judgeId
+            JOIN sets ON sets.id = ratings.setId
+            JOIN batches ON batches.id = sets.batchId
+            WHERE ratings.title = ? COLLATE NOCASE
+            ORDER BY batches.batchDate, sets.setNumber, judges.name""", (title,))
+
+    def findSongs(self, titlePart):
+        """
+        Songs from the song listings with titlePart anywhere in the title.
+        """
+        return self.getRows("""
+            SELECT batches.name AS batch, songs.folder AS folder, songs.title AS title,
+                   songs.artist AS artist, songs.stepartist AS stepartist,
+                   GROUP_CONCAT(charts.chartFile, ', ') AS charts
+            FROM songs
+            JOIN batches ON batches.id = songs.batchId
+            LEFT JOIN charts ON charts.songId = songs.id
+            WHERE songs.title LIKE ?
+            GROUP BY songs.id ORDER BY batches.batchDate, songs.folder""", ("%" + titlePart + "%",))
+
+    def getSongLineage(self, title):
+        """
+        Every submission of a song in any batch, oldest first, with the batch
+        and average of the submission by the same stepartist it followed.
+        """
+        return self.getRows("""
+            SELECT batches.name AS batch, batches.batchDate AS batchDate, submissions.title AS title,
+                   submissions.stepartist AS stepartist, submissions.average AS average,
+                   submissions.ratingCount AS ratings, submissions.worse AS worse, submissions.better AS better,
+                   previousBatches.name AS previousBatch, previous.average AS previousAverage
+            FROM submissions
+            JOIN batches ON batches.id = submissions.batchId
+            LEFT JOIN lineage ON lineage.submissionId = submissions.id AND lineage.relation = 'resubmission'
+            LEFT JOIN submissions AS previous ON previous.id = lineage.predecessorId
+            LEFT JOIN batches AS previousBatches ON previousBatches.id = previous.batchId
+            WHERE submissions.songKey = ?
+            ORDER BY batches.batchDate, batches.name, submissions.stepartist""", (getTitleKey(title),))
+
+    def getSubmissionHistory(self, title, stepartist):
+        """
+        The latest submission of a song by a stepartist and every submission
+        it follows from (by any stepartist), with all the ratings each got.
+        """
+        songKey, stepartistKey = getLineageKeys(title, stepartist)
+        return self.getRows("""
+            WITH RECURSIVE history (id) AS (
+                SELECT id FROM (SELECT submissions.id AS id
+                                FROM submissions JOIN batches ON batches.id = submissions.batchId
+                                WHERE submissions.songKey = ? AND submissions.stepartistKey = ?
+                                ORDER BY batches.batchDate DESC, batches.name DESC LIMIT 1)
+                UNION
+                SELECT lineage.predecessorId FROM lineage JOIN history ON lineage.submissionId = history.id)
+            SELECT batches.name AS batch, batches.batchDate AS batchDate, submissions.stepartist AS stepartist,
+                   submissions.average AS average, submissions.worse AS worse, submissions.better AS better,
+                   GROUP_CONCAT(ratings.rating, ' ') AS allRatings
+            FROM history
+            JOIN submissions ON submissions.id = history.id
+            JOIN batches ON batches.id = submissions.batchId
+            LEFT JOIN submissionRatings ON submissionRatings.submissionId = submissions.id
+            LEFT JOIN ratings ON ratings.id = submissionRatings.ratingId
+            GROUP BY submissions.id ORDER BY batches.batchDate, batches.name, submissions.stepartist""",
+            (songKey, stepartistKey))
@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+
+"""
+Checkpoint journal for long runs. The containers catch every error so one
+bad file doesn't stop a run, which also means a folder that couldn't be
+read (a network share going away halfway through a large batch) was only
+a warning in the log and quietly missing from the output.
+
+When a container is given a CheckpointJournal, each unit of work it
+finishes is appended to the journal as one JSON line:
+
+- 'folder': a song folder parsed by BatchContainer, keyed by folder name.
+- 'judgeFile': a judge notes file read by JudgesForExcel, keyed by path.
+- 'fragment': a judge's notes rendered by FormatNotes, keyed by
+  <format>:<notes file>.
+
+A unit is either done, with its result, or failed, with the error. Each
+record has the stamp of what the unit read (file stamp or content hash).
+A rerun with the same journal takes the result of every unit that is done
+with the same stamp and only redoes the missing, failed and changed ones.
+The last record of a unit is the one that counts, so the file is only
+ever appended to.
+
+A failure is transient when it is an OSError (a file that couldn't be
+opened or read); those are the ones a rerun can fix without the file
+changing. Any other error, like a chart file that isn't UTF-8, fails the
+same way until the file is changed, so a rerun takes it from the journal
+with getFailed() instead of reading the file again, and nothing new is
+appended for it.
+
+compact() rewrites the journal with only the last record of each unit;
+remove() deletes it once the run it was for is complete.
+"""
+
+import os
+import sys
+import json
+import stat
+import threading
+from .metrics import count
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+checkpointLogger = logging.getLogger("CHECKPOINT")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getErrorText(error=None):
+    """
+    error (the exception being handled by default) the way the containers log it.
+    """
+    error = error if error is not None else sys.exc_info()[1]
+    return "{0}: {1}".format(type(error).__name__, str(error))
+
+def isTransientError(error=None):
+    error = error if error is not None else sys.exc_info()[1]
+    return isinstance(error, OSError)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class CheckpointJournal():
+    """
+    * CLASS ATTRIBUTES *
+    - path: Full path to the journal file.
+    - records: Dictionary with (unit, key):<last record of that unit> from
+               the journal and this run.
+    - failures: Dictionary with (unit, key):(error, transient) for the units
+                that failed in this run and weren't done again since.
+    - resumedUnits: Number of units taken from the journal in this run.
+    - doneUnits: Number of units done in this run.
+    - journalFile: The journal file, opened for appending on the first record.
+    - lock: Lock around records and the journal file, since sets and stages
+            are worked on in threads.
+    """
+
+    def __init__(self, journalPath):
+        """
+        Constructor. Reads the journal if there is one.
+        """
+        self.path = journalPath
+        self.records = {}
+        self.failures = {}
+        self.resumedUnits = 0
+        self.doneUnits = 0
+        self.journalFile = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def __str__(self):
+        return """>>> CHECKPOINT JOURNAL
+- PATH: {}
+- UNITS IN JOURNAL: {}
+- RESUMED: {}
+- DONE: {}
+- FAILED: {}""" \
+        .format(self.path, str(len(self.records)), str(self.resumedUnits), str(self.doneUnits),
+                str(len(self.failures)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def load(self):
+        """
+        Reads the records of earlier runs. A line cut off by an interrupted
+        run is the last one in the file and is left out.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                        self.records[(record['unit'], record['key'])] = record
+                    except (ValueError, KeyError):
+                        checkpointLogger.info("load: Skipping a cut off line in '%s'", self.path)
+            checkpointLogger.info("load: %s units in '%s'", str(len(self.records)), self.path)
+        except FileNotFoundError:
+            checkpointLogger.info("load: No journal at '%s' yet", self.path)
+
+    def getDone(self, unit, key, stamp):
+        """
+        Returns the record of the unit if it is done and its stamp is the
+        same, or None if it has to be done (again).
+        """
+        stamp = json.loads(json.dumps(stamp))  # Tuples come back from the journal as lists
+        with self.lock:
+            record = self.records.get((unit, key))
+        if record is None or record['status'] != 'done' or record['stamp'] != stamp:
+            return None
+        with self.lock:
+            self.resumedUnits += 1
+        count("checkpoint.unitsResumed")
+        return record
+
+    def getFailed(self, unit, key, stamp):
+        """
+        Returns the record of the unit if it failed with an error that isn't
+        transient and its stamp is the same, so doing it again would only
+        fail the same way, or None. The failure is counted for this run too.
+        """
+        stamp = json.loads(json.dumps(stamp))
+        with self.lock:
+            record = self.records.get((unit, key))
+            if record is None or record['status'] != 'failed' or record.get('transient', True) or \
+                    record['stamp'] is None or record['stamp'] != stamp:
+                return None
+            self.failures[(unit, key)] = (record['error'], False)
+            self.resumedUnits += 1
+        count("checkpoint.failuresResumed")
+        return record
+
+    def write(self, record):
+        with self.lock:
+            if self.journalFile is None:
+                self.journalFile = open(self.path, 'a', encoding="utf-8")
+            self.journalFile.write(json.dumps(record) + "\n")
+            self.journalFile.flush()  # A unit is only done once it's in the file
+            self.records[(record['unit'], record['key'])] = record
+
+    def markDone(self, unit, key, stamp, result=None):
+        """
+        Records a finished unit with its result, which has to be JSON serializable.
+        """
+        self.write({'unit': unit, 'key': key, 'status': 'done', 'stamp': stamp, 'result': result})
+        with self.lock:
+            self.failures.pop((unit, key), None)
+            self.doneUnits += 1
+        count("checkpoint.unitsDone")
+
+    def markFailed(self, unit, key, stamp, error, transient=True, result=None):
+        """
+        Records a unit that failed and why; the next run does it again,
+        unless it isn't transient and the stamp is the same (see getFailed).
+        result is what the unit still gave, e.g. the song information a chart
+        file that isn't UTF-8 gets from its folder name.
+        """
+        checkpointLogger.warning("markFailed: %s '%s': %s", unit, key, error)
+        self.write({'unit': unit, 'key': key, 'status': 'failed', 'stamp': stamp, 'error': error,
+                    'transient': transient, 'result': result})
+        with self.lock:
+            self.failures[(unit, key)] = (error, transient)
+        count("checkpoint.unitsFailed")
+
+    def getFailures(self, units=None, transientOnly=False):
+        """
+        Returns a sorted list of (unit, key, error) for the units that failed
+        in this run, only for the given kinds of unit if units is given, and
+        only the transient failures if transientOnly is True.
+        """
+        with self.lock:
+            return sorted((unit, key, error) for (unit, key), (error, transient) in self.failures.items()
+                          if (units is None or unit in units) and (transient or not transientOnly))
+
+    def getReportLines(self):
+        lines = []
+        with self.lock:
+            failures = sorted(self.failures.items())
+        for (unit, key), (error, transient) in failures:
+            lines.append("- FAILED " + unit + " '" + key + "': " + error +
+                         (" (rerun to try again)" if transient else ""))
+        return lines
+
+    def close(self):
+        with self.lock:
+            if self.journalFile is not None:
+                self.journalFile.close()
+                self.journalFile = None
+
+    def compact(self):
+        """
+        Rewrites the journal with only the last record of each unit, so a
+        journal kept between runs doesn't keep growing. The new journal keeps
+        the permissions of the old one.
+        """
+        with self.lock:
+            if self.journalFile is not None:
+                self.journalFile.close()
+                self.journalFile = None
+            if not os.path.exists(self.path):
+                return
+            tempPath = os.path.join(os.path.dirname(os.path.abspath(self.path)),
+                                    ".tmp_" + os.urandom(6).hex() + ".tmp")
+            tempHandle = os.open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            try:
+                with os.fdopen(tempHandle, 'w', encoding="utf-8") as tempFile:
+                    for record in self.records.values():
+                        tempFile.write(json.dumps(record) + "\n")
+                os.chmod(tempPath, stat.S_IMODE(os.stat(self.path).st_mode))
+                os.replace(tempPath, self.path)
+            except:
+                os.remove(tempPath)
+                raise
+        checkpointLogger.info("compact: %s units in '%s'", str(len(self.records)), self.path)
+
+    def remove(self):
+        """
+        Closes and deletes the journal, once the run it was for is complete.
+        """
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,439 @@
+#!/usr/bin/python3
+
+"""
+Writes made up but realistic batches for testing and benchmarking, so the
+stages can be measured at sizes the fixtures in tests/ never reach.
+
+Everything comes from one random.Random(seed), so the same seed and size
+always give the same files. A corpus folder looks like:
+
+    <root>/<batchName>/<song folder>/...   Song folders with .ssc, .sm and/or .dwi files
+    <root>/review/<judge>_Notes<batchName>.txt
+                                            Judge notes for every song in the
+                                            order of the song listing, without
+                                            stepartists (what the steppers stage reads)
+    <root>/sets/set<n>/<judge>_NotesSet<n>.txt
+                                            Judge notes split into sets, with
+                                            stepartists (what the forum post reads)
+
+The songs have the oddities real submissions have: stepartists in (), []
+and {}, resubmissions, duplicate titles from different stepartists, commas
+in artists, several charts per file, .ssc, .sm and .dwi files in the same
+batch, multi-line #BPMS, CRLF files and files saved as cp1252 that don't
+read as UTF-8. The judge notes use every rating symbol the parsers know
+about.
+"""
+
+import os
+import sys
+import json
+import random
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+corpusLogger = logging.getLogger("CORPUS")
+
+# Word lists the names are made from.
+titleWords = ['Black', 'Moonlight', 'Green', 'Clinic', 'Party', 'Winter', 'Guardians', 'Maelstrom', 'Robo',
+              'Bunny', 'Cowbell', 'Rock', 'End', 'Day', 'Science', 'Vale', 'Destiny', 'Paranoia', 'Meal',
+              'Transmission', 'Battle', 'Goddess', 'Lawn', 'Wake', 'Zanzibar', 'Redirected', 'Final', 'Ocean',
+              'Neon', 'Static', 'Echo', 'Circuit', 'Velvet', 'Horizon', 'Ember', 'Pulse', 'Shiver', 'Lantern']
+titleExtras = ['(FFR Cut)', '(Extended Mix)', '-MiDNiGHT MiX-', 'II', 'III', '(Remix)', '~Reprise~']
+accentedWords = ['Café', 'Déjà Vu', 'Über', 'Señorita', 'Naïve', 'Fête', 'Crème']
+nameSyllables = ['ka', 'zu', 'mo', 'ri', 'xi', 'dos', 'sar', 'vy', 'lo', 'ne', 'tr', 'ix', 'po', 'ba', 'qu',
+                 'en', 'sil', 'vuh', 'choo', 'bm', 'ah', 'yo', 'shl']
+stepperBrackets = [('(', ')'), ('(', ')'), ('(', ')'), ('[', ']'), ('{', '}')]
+ratingSymbols = ['PASS', '++', '--', '!', '*', '#', '<', '$']
+commentLines = ['- Layering works, though some spots feel under-emphasized.',
+                '- Patterns are very good.',
+                '- Pad charts aren\'t exactly what we\'re looking for.',
+                '- messy+innacurate',
+                '- très bien, the ending is great',
+                '// Spread is fine overall.',
+                '-']
+noteRows = ['0000', '1000', '0100', '0010', '0001', '1001', '0110', '1100', '0011', '2000', '3000', '0M00']
+dwiSteps = ['0', '0', '0', '2', '4', '6', '8', '1', '3', '7', '9', 'A', 'B']
+difficulties = [('Beginner', 1), ('Easy', 3), ('Medium', 5), ('Hard', 8), ('Challenge', 11)]
+dwiDifficulties = [('BASIC', 3), ('ANOTHER', 7), ('MANIAC', 10), ('SMANIAC', 12)]
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SyntheticCorpus():
+    """
+    Generates a batch folder, the judge notes for it and a folder of sets.
+
+    * CLASS ATTRIBUTES *
+    - path: Root folder the corpus is written into.
+    - songCount: Number of song folders in the batch.
+    - seed: Seed for the random generator.
+    - batchName: Name of the batch folder.
+    - setSize: Number of songs per set.
+    - judgeCount: Number of judges, both for the review folder and for each set.
+    - songs: List of dictionaries describing each song, filled in by makeSongs().
+    - judges: List of judge names for the review folder.
+    - setJudges: List of judge names the judges of each set are picked from.
+    - corpusFile: File in the root folder recording the options the corpus was
+                  written with, so an existing corpus can be reused.
+    """
+
+    corpusFile = ".corpus.json"
+
+    def __init__(self, corpusDir, songCount=100, seed=0, batchName="SyntheticBatch", setSize=25, judgeCount=4):
+        """
+        Constructor
+        """
+        self.path = corpusDir
+        self.songCount = songCount
+        self.seed = seed
+        self.batchName = batchName
+        self.setSize = setSize
+        self.judgeCount = judgeCount
+        self.random = random.Random(seed)
+        self.songs = []
+        self.judges = []
+        self.setJudges = []
+
+    def __str__(self):
+        return """>>> SYNTHETIC CORPUS
+- CORPUS PATH: {}
+- SONGS: {}
+- SEED: {}
+- SET SIZE: {}
+- JUDGES: {}""" \
+        .format(self.path, str(self.songCount), str(self.seed), str(self.setSize), str(self.judgeCount))
+
+    def getBatchDir(self):
+        return os.path.join(self.path, self.batchName)
+
+    def getReviewDir(self):
+        return os.path.join(self.path, "review")
+
+    def getSetsDir(self):
+        return os.path.join(self.path, "sets")
+
+    def getOptions(self):
+        return {'songCount': self.songCount, 'seed': self.seed, 'batchName': self.batchName,
+                'setSize': self.setSize, 'judgeCount': self.judgeCount}
+
+    def isWritten(self):
+        """
+        True if the root folder already has a corpus written with the same options.
+        """
+        try:
+            with open(os.path.join(self.path, self.corpusFile)) as corpusInfo:
+                return json.load(corpusInfo) == self.getOptions()
+        except (OSError, ValueError):
+            return False
+
+    #########
+    # NAMES #
+    #########
+
+    def makeName(self):
+        name = "".join(self.random.choice(nameSyllables) for syllable in range(self.random.randint(2, 4)))
+        name = name.capitalize()
+        roll = self.random.random()
+        if roll < 0.2:
+            name += str(self.random.randint(0, 999))
+        elif roll < 0.3:
+            name += " " + self.random.choice(nameSyllables).upper()
+        elif roll < 0.35:
+            name += "_" + self.random.choice(nameSyllables).capitalize()
+        return name
+
+    def makeNames(self, count):
+        names = []
+        while len(names) < count:
+            name = self.makeName()
+            if name not in names:
+                names.append(name)
+        return names
+
+    def makeTitle(self):
+        words = [self.random.choice(titleWords) for word in range(self.random.randint(1, 3))]
+        if self.random.random() < 0.05:
+            words.insert(0, self.random.choice(accentedWords))
+        title = " ".join(words)
+        if self.random.random() < 0.1:
+            title += " " + self.random.choice(titleExtras)
+        if self.random.random() < 0.05:
+            title = "[Resubmission] " + title
+        return title
+
+    def makeArtist(self):
+        artist = self.makeName()
+        if self.random.random() < 0.1:
+            artist += ", " + self.makeName()  # Commas are taken out in the song listing
+        elif self.random.random() < 0.05:
+            artist += " feat. " + self.makeName()
+        return artist
+
+    #########
+    # SONGS #
+    #########
+
+    def makeSongs(self):
+        """
+        Decides the folder, title, artist, stepartist, chart files and encoding
+        of every song. About one song in ten shares its title and artist with
+        an earlier song, like two stepartists charting the same song.
+        """
+        steppers = self.makeNames(max(3, self.songCount // 3))
+        folders = set()
+        self.songs = []
+        while len(self.songs) < self.songCount:
+            if self.songs and self.random.random() < 0.1:
+                original = self.random.choice(self.songs)
+                title, artist = original['title'], original['artist']
+            else:
+                title, artist = self.makeTitle(), self.makeArtist()
+            stepper = self.random.choice(steppers)
+            opening, closing = self.random.choice(stepperBrackets)
+            folder = title + " " + opening + stepper + closing
+            if folder in folders or folder.lower() in folders:
+                continue
+            folders.add(folder)
+            folders.add(folder.lower())
+            roll = self.random.random()
+            chartTypes = (['sm'] if roll < 0.35 else ['ssc'] if roll < 0.55 else ['dwi'] if roll < 0.7 else
+                          ['sm', 'dwi'] if roll < 0.85 else ['ssc', 'sm'])
+            roll = self.random.random()
+            encoding = 'cp1252' if roll < 0.03 else 'crlf' if roll < 0.1 else 'utf-8'
+            self.songs.append({'folder': folder, 'title': title, 'artist': artist, 'stepper': stepper,
+                               'chartTypes': chartTypes, 'encoding': encoding,
+                               'chartName': self.random.choice([title, folder, "chart"]).replace("/", ""),
+                               'multiLineBpms': self.random.random() < 0.05})
+
+    def getListing(self):
+        """
+        Returns (title, artist, stepartist) for each song in the order of the
+        song listing, i.e. what the template and the listing CSV will contain.
+        """
+        listing = []
+        for song in sorted(self.songs, key=lambda song: song['folder'].lower()):
+            title = song['title']  # Same as the title parsed back out of the folder name
+            artist = song['artist'].replace(",", "")
+            if song['encoding'] == 'cp1252':
+                artist = "UNKNOWN"  # The parser can't read these, so the template has no artist either
+            listing.append((title.replace(",", ""), artist, song['stepper']))
+        return listing
+
+    def makeSmChart(self, stepsType, difficulty, meter):
+        measures = []
+        for measure in range(self.random.randint(8, 32)):
+            rows = self.random.choice([4, 8, 16])
+            measures.append("\n".join(self.random.choice(noteRows) for row in range(rows)))
+        return ("//---------------" + stepsType + " - ----------------\n#NOTES:\n     " + stepsType +
+                ":\n     :\n     " + difficulty + ":\n     " + str(meter) + ":\n     0,0,0,0,0:\n" +
+                "\n,\n".join(measures) + "\n;\n")
+
+    def makeSscChart(self, stepsType, difficulty, meter, stepper):
+        measures = []
+        for measure in range(self.random.randint(8, 32)):
+            rows = self.random.choice([4, 8, 16])
+            measures.append("\n".join(self.random.choice(noteRows) for row in range(rows)))
+        return ("//---------------" + stepsType + " - ----------------\n#NOTEDATA:;\n#CHARTNAME:;\n#STEPSTYPE:" +
+                stepsType + ";\n#DESCRIPTION:;\n#CHARTSTYLE:;\n#DIFFICULTY:" + difficulty + ";\n#METER:" +
+                str(meter) + ";\n#RADARVALUES:0,0,0,0,0;\n#CREDIT:" + stepper + ";\n#NOTES:\n" +
+                "\n,\n".join(measures) + "\n;\n")
+
+    def makeSmHeader(self, song):
+        """
+        Header of an .sm file, which an .ssc file has too.
+        """
+        bpm = round(self.random.uniform(80, 240), 3)
+        lines = ["#TITLE:" + song['title'] + ";",
+                 "#SUBTITLE:;",
+                 "#ARTIST:" + song['artist'] + ";",
+                 "#TITLETRANSLIT:;",
+                 "#SUBTITLETRANSLIT:;",
+                 "#ARTISTTRANSLIT:;",
+                 "#GENRE:;",
+                 "#CREDIT:" + song['stepper'] + ";",
+                 "#BANNER:;",
+                 "#BACKGROUND:;",
+                 "#CDTITLE:;",
+                 "#MUSIC:" + song['chartName'] + ".mp3;",
+                 "#OFFSET:" + str(round(self.random.uniform(-1.5, 0.2), 6)) + ";",
+                 "#SAMPLESTART:" + str(round(self.random.uniform(0, 90), 3)) + ";",
+                 "#SAMPLELENGTH:12.000;",
+                 "#SELECTABLE:YES;"]
+        if song['multiLineBpms']:
+            lines.append("#BPMS:0.000=" + str(bpm) + "\n;")
+        else:
+            lines.append("#BPMS:0.000=" + str(bpm) + ";")
+        lines.append("#STOPS:;")
+        return "\n".join(lines) + "\n"
+
+    def getCharts(self):
+        """
+        Returns a list of (stepsType, difficulty, meter) for the charts of a file.
+        """
+        charts = self.random.sample(difficulties, self.random.randint(1, 4))
+        if self.random.random() < 0.1:
+            charts.append(('Challenge', 12))  # Double chart
+            stepsTypes = ['dance-single'] * (len(charts) - 1) + ['dance-double']
+        else:
+            stepsTypes = ['dance-single'] * len(charts)
+        return [(stepsType, difficulty, meter) for stepsType, (difficulty, meter) in zip(stepsTypes, charts)]
+
+    def makeSmFile(self, song):
+        text = self.makeSmHeader(song)
+        for stepsType, difficulty, meter in self.getCharts():
+            text += self.makeSmChart(stepsType, difficulty, meter)
+        return text
+
+    def makeSscFile(self, song):
+        text = "#VERSION:0.83;\n" + self.makeSmHeader(song)
+        for stepsType, difficulty, meter in self.getCharts():
+            text += self.makeSscChart(stepsType, difficulty, meter, song['stepper'])
+        return text
+
+    def makeDwiFile(self, song):
+        lines = ["#TITLE:" + song['title'] + ";",
+                 "#ARTIST:" + song['artist'] + ";",
+                 "#FILE:" + song['chartName'] + ".mp3;",
+                 "#BPM:" + str(round(self.random.uniform(80, 240), 3)) + ";",
+                 "#GAP:" + str(self.random.randint(0, 2000)) + ";",
+                 "#SAMPLESTART:" + str(round(self.random.uniform(0, 90), 3)) + ";",
+                 "#SAMPLELENGTH:12.000;"]
+        text = "\n".join(lines) + "\n"
+        for difficulty, meter in self.random.sample(dwiDifficulties, self.random.randint(1, 3)):
+            text += "#SINGLE:" + difficulty + ":" + str(meter) + ":\n"
+            for row in range(self.random.randint(16, 64)):
+                steps = "".join(self.random.choice(dwiSteps) for step in range(8))
+                if self.random.random() < 0.1:
+                    steps = "(" + steps + ")"
+                elif self.random.random() < 0.05:
+                    steps = "{" + steps * 2 + "}"
+                text += steps + "\n"
+            text += ";\n"
+        return text
+
+    def writeChartFile(self, songPath, fileName, text, encoding):
+        if encoding == 'cp1252':
+            # Saved by an old editor: the accented title doesn't read as UTF-8.
+            text = text.replace("#TITLE:", "#TITLE:Café ", 1)
+            with open(os.path.join(songPath, fileName), 'wb') as chartFile:
+                chartFile.write(text.encode('cp1252', errors='replace'))
+        elif encoding == 'crlf':
+            with open(os.path.join(songPath, fileName), 'w', encoding='utf-8', newline="\r\n") as chartFile:
+                chartFile.write(text)
+        else:
+            with open(os.path.join(songPath, fileName), 'w', encoding='utf-8') as chartFile:
+                chartFile.write(text)
+
+    def writeBatch(self):
+        batchDir = self.getBatchDir()
+        corpusLogger.info("writeBatch: Writing %s song folders to '%s'", str(len(self.songs)), batchDir)
+        try:
+            for song in self.songs:
+                songPath = os.path.join(batchDir, song['folder'])
+                os.makedirs(songPath, exist_ok=True)
+                if 'ssc' in song['chartTypes']:
+                    self.writeChartFile(songPath, song['chartName'] + ".ssc", self.makeSscFile(song),
+                                        song['encoding'])
+                if 'sm' in song['chartTypes']:
+                    self.writeChartFile(songPath, song['chartName'] + ".sm", self.makeSmFile(song), song['encoding'])
+                if 'dwi' in song['chartTypes']:
+                    self.writeChartFile(songPath, song['chartName'] + ".dwi", self.makeDwiFile(song),
+                                        song['encoding'])
+                with open(os.path.join(songPath, song['chartName'] + ".mp3"), 'wb') as music:
+                    music.write(b"ID3" + bytes(self.random.getrandbits(8) for byte in range(61)))
+        except:
+            corpusLogger.warning("writeBatch: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                               str(sys.exc_info()[1])))
+
+    ###############
+    # JUDGE NOTES #
+    ###############
+
+    def makeRating(self):
+        roll = self.random.random()
+        if roll < 0.6:
+            return "[" + str(self.random.randint(1, 10)) + "/10]"
+        if roll < 0.75:
+            return "[" + str(self.random.randint(1, 9)) + ".5/10]"
+        symbol = self.random.choice(ratingSymbols)
+        roll = self.random.random()
+        if roll < 0.5:
+            return "[" + symbol + "]"
+        if roll < 0.75:
+            return "[" + symbol + "/10]"
+        return "[" + str(self.random.randint(1, 9)) + symbol + "/10]"
+
+    def makeComments(self):
+        comments = []
+        for comment in range(self.random.randint(1, 5)):
+            if self.random.random() < 0.3:
+                seconds = round(self.random.uniform(0, 180), 2)
+                comments.append(str(seconds) + "s: " + self.random.choice(['Jump PR is backwards.', 'note for melody',
+                                                                          'could hit up a 16th here', 'jump']))
+            else:
+                comments.append(self.random.choice(commentLines))
+        return comments
+
+    def writeNotesFile(self, notesPath, songLines):
+        """
+        songLines is a list of the rating line for each song. One judge in
+        ten saves their notes with Windows line endings.
+        """
+        lines = []
+        for songLine in songLines:
+            lines.append(self.makeRating() + " " + songLine)
+            lines.extend(self.makeComments())
+            lines.append("")
+        newline = "\r\n" if self.random.random() < 0.1 else "\n"
+        with open(notesPath, 'w', encoding='utf-8', newline=newline) as notesFile:
+            notesFile.write("\n".join(lines) + "\n")
+
+    def writeReviewNotes(self):
+        reviewDir = self.getReviewDir()
+        corpusLogger.info("writeReviewNotes: Writing %s judge notes files to '%s'", str(len(self.judges)),
+                          reviewDir)
+        try:
+            os.makedirs(reviewDir, exist_ok=True)
+            songLines = [title + " {" + artist + "}" for title, artist, stepper in self.getListing()]
+            for judge in self.judges:
+                self.writeNotesFile(os.path.join(reviewDir, judge + "_Notes" + self.batchName + ".txt"), songLines)
+        except:
+            corpusLogger.warning("writeReviewNotes: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                     str(sys.exc_info()[1])))
+
+    def writeSets(self):
+        setsDir = self.getSetsDir()
+        corpusLogger.info("writeSets: Writing sets of %s songs to '%s'", str(self.setSize), setsDir)
+        try:
+            listing = self.getListing()
+            for setIndex, start in enumerate(range(0, len(listing), self.setSize)):
+                setName = "set" + str(setIndex + 1)
+                setPath = os.path.join(setsDir, setName)
+                os.makedirs(setPath, exist_ok=True)
+                songLines = [title + " {" + artist + "} (" + stepper + ")"
+                             for title, artist, stepper in listing[start:start + self.setSize]]
+                for judge in self.random.sample(self.setJudges, min(self.judgeCount, len(self.setJudges))):
+                    self.writeNotesFile(os.path.join(setPath, judge + "_Notes" + setName.capitalize() + ".txt"),
+                                        songLines)
+        except:
+            corpusLogger.warning("writeSets: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                              str(sys.exc_info()[1])))
+
+    def write(self):
+        """
+        Writes the whole corpus. The root folder should be empty or missing.
+        """
+        corpusLogger.info("write: Writing corpus of %s songs with seed %s", str(self.songCount), str(self.seed))
+        self.makeSongs()
+        self.setJudges = self.makeNames(self.judgeCount * 2)
+        self.judges = self.setJudges[:self.judgeCount]
+        self.writeBatch()
+        self.writeReviewNotes()
+        self.writeSets()
+        with open(os.path.join(self.path, self.corpusFile), 'w') as corpusInfo:
+            json.dump(self.getOptions(), corpusInfo, indent=1, sort_keys=True)
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+
+import os
+import csv
+import sys
+import mmap
+import locale
+from .metrics import timed, count
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+csvTableLogger = logging.getLogger("CSVTABLE")
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class BatchCsvTable():
+    """
+    The CSV file generated from batch.py, parsed once with the csv module
+    (so quoted fields with commas in them are kept whole) into a table that
+    can be looked up by column name. NotesTemplate and ArtistForNotes take
+    one of these instead of each opening and splitting the CSV themselves.
+
+    * CLASS ATTRIBUTES *
+    - path: Absolute file path to the CSV file.
+    - header: List of column names with the brackets stripped, e.g. FOLDER, TITLE.
+    - fieldToIndex: Dictionary with a 'field':index mapping
+    - rows: List of rows, each a list of stripped values in column order.
+    - mmapThreshold: Files at least this many bytes are read through a memory map.
+    """
+
+    def __init__(self, csvPath):
+        """
+        Constructor
+        """
+        self.path = csvPath
+        self.header = []
+        self.fieldToIndex = {}
+        self.rows = []
+        self.mmapThreshold = 64 * 1024 * 1024
+        self.encoding = locale.getpreferredencoding(False)  # Same encoding batch.py writes with
+
+    def __str__(self):
+        return """>>> BATCH CSV TABLE
+- CSV FILE PATH: {}
+- FIELDS: {}
+- ROWS: {}""" \
+        .format(self.path, self.header, str(len(self.rows)))
+
+    def iterMappedLines(self, mappedFile):
+        for line in iter(mappedFile.readline, b""):
+            yield line.decode(self.encoding)
+
+    def readRows(self, lineSource):
+        """
+        The column header is the row starting with [FOLDER]; every other
+        non-empty row is a song.
+        """
+        self.addRows(csv.reader(lineSource))
+
+    def addRows(self, parsedRows):
+        """
+        Adds already split rows, e.g. straight from BatchContainer.
+        """
+        for row in parsedRows:
+            if not row:
+                continue
+            if not self.header and row[0].strip() == "[FOLDER]":
+                self.header = [field.strip().strip("[]") for field in row]
+                self.fieldToIndex = {field: index for index, field in enumerate(self.header)}
+                continue
+            self.rows.append([value.strip() for value in row])
+
+    @timed("csvTable.load")
+    def load(self):
+        csvTableLogger.info("load: Loading CSV File '%s'", self.path)
+        try:
+            self.header = []
+            self.fieldToIndex = {}
+            self.rows = []
+            fileSize = os.path.getsize(self.path)
+            count("csvTable.bytesRead", fileSize)
+            if fileSize >= self.mmapThreshold:
+                csvTableLogger.debug("load: Memory mapping '%s'", self.path)
+                with open(self.path, 'rb') as fileCSV:
+                    with mmap.mmap(fileCSV.fileno(), 0, access=mmap.ACCESS_READ) as mappedCSV:
+                        self.readRows(self.iterMappedLines(mappedCSV))
+            else:
+                with open(self.path, newline="", encoding=self.encoding) as fileCSV:
+                    self.readRows(fileCSV)
+            count("csvTable.rowsParsed", len(self.rows))
+            csvTableLogger.info("load: Loaded %s rows with fields %s", str(len(self.rows)), str(self.header))
+        except:
+            csvTableLogger.warning("load: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                           str(sys.exc_info()[1])))
+        return self
+
+    def getValue(self, row, field):
+        """
+        Value of field in row, or a null string if the row is too short.
+        """
+        index = self.fieldToIndex[field]
+        if index < len(row):
+            return row[index]
+        return ""
+
+    def getColumn(self, field):
+        return [self.getValue(row, field) for row in self.rows]
@@ -0,0 +1,515 @@
+#!/usr/bin/python3
+
+"""
+Read-only dashboard for organizers during judging: the current song and
+judge averages, which judges are still missing from each set and which
+songs were submitted more than once, served over HTTP on the local machine.
+
+BatchIndex loads the batch folder (through BatchContainer) and the folder
+of sets (through JudgesForExcel and JudgeNotes) once and keeps everything
+in memory. Every page is rendered into bytes with an ETag when the index
+changes, so a request is only a dictionary lookup; nothing is parsed or
+rendered per request, and a client that sends If-None-Match with the
+current ETag gets a 304 without a body.
+
+A background thread polls the folders every interval seconds, the same
+way NotesWatcher does in watch.py. Only the song folders whose chart file
+changed are parsed again, and only the sets whose notes files changed are
+summarized again; JudgesForExcel.ratingCache and the JudgeNotes kept per
+notes file mean only the changed judges are read. The pages built from
+what changed are then rendered again and swapped in as a whole, so readers
+never see half an update.
+
+    /                       HTML page with all of the below
+    /api/summary.json       Counts and when the index last changed
+    /api/songs.json         Every song in the batch folder
+    /api/sets.json          Songs, ratings and averages of every set
+    /api/judges.json        Average and number of ratings of every judge
+    /api/missing.json       Judges of each set's schedule with no notes file yet
+    /api/duplicates.json    Songs in more than one song folder
+
+Sets normally have different judges, so which judges a set is missing can
+only be told from the judges it was given: the schedule.txt written by the
+scheduler (see scheduler.py). Without a schedule there is no missing page.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .metrics import timed, count
+from .normalize import getSongKey, getRatingValue
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+dashboardLogger = logging.getLogger("DASHBOARD")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getSongSnapshot(batchDir, chartFiles):
+    """
+    Returns a dictionary with <song folder>:(folder stamp, chart file stamp)
+    for the song folders in batchDir. chartFiles is <song folder>:<chart file>
+    for the folders parsed so far; a new folder has no chart file stamp yet.
+    """
+    from .lazy import getFileStamp
+    snapshot = {}
+    with os.scandir(batchDir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                chartFile = chartFiles.get(entry.name)
+                chartStamp = getFileStamp(os.path.join(entry.path, chartFile)) if chartFile is not None else None
+                snapshot[entry.name] = (entry.stat().st_mtime_ns, chartStamp)
+    return snapshot
+
+def makeView(body, contentType):
+    """
+    Returns (ETag, body, content type) for a rendered page. The ETag only
+    depends on the body, so a page that renders the same keeps its ETag.
+    """
+    import hashlib
+    return '"' + hashlib.sha1(body).hexdigest() + '"', body, contentType
+
+def makeJsonView(value):
+    return makeView(json.dumps(value, indent=1).encode("utf-8"), "application/json; charset=utf-8")
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class BatchIndex():
+    """
+    * CLASS ATTRIBUTES *
+    - batchDir: Batch folder of song folders, or None.
+    - notesDir: Folder of set folders of judge notes (or a single set folder), or None.
+    - interval: Seconds between polls of the folders.
+    - scheduleFile: schedule.txt from SetScheduler with the judges of every set, or None.
+    - setRoster: Dictionary with <set name>:<list of judges> read from scheduleFile.
+    - batch: BatchContainer holding the parsed songs; allSongInfo is kept up
+             to date folder by folder.
+    - chartFiles: Dictionary with <song folder>:<chart file>
+    - songSnapshot: Dictionary from getSongSnapshot() at the last poll.
+    - watcher: NotesWatcher used to poll the set folders; it writes nothing here.
+    - judgeSets: Dictionary with <set path>:JudgesForExcel, kept between polls.
+    - judgeNotes: Dictionary with <notes file path>:JudgeNotes, kept between
+                  polls; a JudgeNotes only parses its file again when it changed.
+    - setSummaries: Dictionary with <set path>:<summary from summarizeSet()>
+    - views: Dictionary with <URL path>:(ETag, body, content type). Replaced
+             as a whole after each change, never changed in place.
+    - version: Number of times the index changed.
+    - updatedAt: Time of the last change, as an ISO 8601 string.
+    - stopEvent: Set by stop() to end the polling thread.
+    """
+
+    def __init__(self, batchDir=None, notesDir=None, interval=5.0, scheduleFile=None):
+        """
+        Constructor
+        """
+        self.batchDir = batchDir
+        self.notesDir = notesDir
+        self.interval = interval
+        self.scheduleFile = scheduleFile
+        self.setRoster = {}
+        if scheduleFile is not None:
+            from .scheduler import readSchedule
+            self.setRoster = readSchedule(scheduleFile)
+        self.batch = None
+        self.chartFiles = {}
+        self.songSnapshot = {}
+        self.watcher = None
+        self.judgeSets = {}
+        self.judgeNotes = {}
+        self.setSummaries = {}
+        self.views = {}
+        self.version = 0
+        self.updatedAt = None
+        self.stopEvent = threading.Event()
+
+    def __str__(self):
+        return """>>> BATCH INDEX
+- BATCH DIR: {}
+- NOTES DIR: {}
+- SONGS: {}
+- SETS: {}
+- VERSION: {}""" \
+        .format(self.batchDir, self.notesDir, str(len(self.batch.allSongInfo) if self.batch is not None else 0),
+                str(len(self.setSummaries)), str(self.version))
+
+    ####################################
+    # Keeping the index up to date
+    ####################################
+
+    @timed("dashboard.refreshSongs")
+    def refreshSongs(self):
+        """
+        Parses the song folders that are new or whose chart file changed,
+        and drops the ones that are gone. Returns True if anything changed.
+        """
+        from .batchcontainer import BatchContainer
+        if self.batch is None:
+            self.batch = BatchContainer(self.batchDir)
+            self.batch.setSmFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+            self.batch.setDwiFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        snapshot = getSongSnapshot(self.batchDir, self.chartFiles)
+        changedFolders = [folder for folder in snapshot if snapshot[folder] != self.songSnapshot.get(folder)]
+        removedFolders = [folder for folder in self.songSnapshot if folder not in snapshot]
+        if not changedFolders and not removedFolders:
+            return False
+        dashboardLogger.info("refreshSongs: %s song folders changed, %s removed", str(len(changedFolders)),
+                             str(len(removedFolders)))
+        for folder in changedFolders + removedFolders:
+            self.batch.allSongInfo.pop(folder, None)
+            self.chartFiles.pop(folder, None)
+
+        # BatchContainer only goes through the folders in batchSongFolders.
+        self.batch.batchSongFolders = changedFolders
+        self.batch.simfile_list = []
+        self.batch.construct()
+        self.batch.parseSimfiles()
+        for simfileObj in self.batch.simfile_list:
+            self.chartFiles[simfileObj.getSongFolderName()] = simfileObj.stepfile
+        count("dashboard.songFoldersParsed", len(self.batch.simfile_list))
+
+        # Take the stamps again now that the chart files of the new folders are known.
+        self.songSnapshot = getSongSnapshot(self.batchDir, self.chartFiles)
+        return True
+
+    def summarizeSet(self, judgeSet):
+        """
+        Returns the songs, ratings and judge statistics of a set as a
+        dictionary ready for JSON.
+        """
+        from .judge import JudgeNotes
+        judgeToRating = judgeSet.judgeToRating
+        songs = []
+        for songIndex, (songTitle, stepper) in enumerate(judgeSet.setSongs):
+            ratings = {}
+            for judgeName in judgeSet.judgeNames:
+                judgeRatings = judgeToRating.get(judgeName) or []
+                ratings[judgeName] = judgeRatings[songIndex] if songIndex < len(judgeRatings) else None
+            values = [getRatingValue(rating) for rating in ratings.values()]
+            values = [value for value in values if value is not None]
+            songs.append({'title': songTitle, 'stepartist': stepper, 'ratings': ratings,
+                          'average': round(sum(values) / len(values), 3) if values else None})
+        judgeStats = {}
+        for judgeName, notesFile in judgeSet.judgeToFileName.items():
+            notesPath = os.path.join(judgeSet.path, notesFile)
+            judgeNotes = self.judgeNotes.get(notesPath)
+            if judgeNotes is None:
+                judgeNotes = JudgeNotes(notesPath)
+                self.judgeNotes[notesPath] = judgeNotes
+            judgeStats[judgeName] = {'notesFile': notesFile, 'judged': judgeNotes.numJudgedFiles,
+                                     'special': judgeNotes.numSpecialFiles, 'ratingSum': judgeNotes.getRatingSum(),
+                                     'average': round(judgeNotes.average, 3)}
+        return {'set': judgeSet.setName, 'setNumber': judgeSet.setNumber, 'path': judgeSet.path,
+                'judges': list(judgeSet.judgeNames), 'songs': songs, 'judgeStats': judgeStats}
+
+    @timed("dashboard.refreshSets")
+    def refreshSets(self):
+        """
+        Summarizes the sets whose notes files changed and drops the ones that
+        are gone. Returns True if anything changed.
+        """
+        from .watch import NotesWatcher
+        from .judge import JudgesForExcel
+        if self.watcher is None:
+            self.watcher = NotesWatcher(self.notesDir)
+        changedSets = self.watcher.poll()
+        for setPath, changedFiles in sorted(changedSets.items()):
+            for notesPath in [notesPath for notesPath in self.judgeNotes
+                              if os.path.dirname(notesPath) == setPath and
+                              os.path.basename(notesPath) in changedFiles]:
+                del self.judgeNotes[notesPath]  # Read again below if the file is still there
+            if setPath not in self.watcher.snapshots:
+                self.judgeSets.pop(setPath, None)
+                self.setSummaries.pop(setPath, None)
+                continue
+            dashboardLogger.info("refreshSets: '%s' changed: %s", setPath, str(sorted(changedFiles)))
+            try:
+                judgeSet = self.judgeSets.get(setPath)
+                if judgeSet is None:
+                    judgeSet = JudgesForExcel(setPath)
+                    self.judgeSets[setPath] = judgeSet
+                self.setSummaries[setPath] = self.summarizeSet(judgeSet)
+                count("dashboard.setsSummarized")
+            except:
+                dashboardLogger.warning("refreshSets: '{0}': {1}: {2}".format(setPath, sys.exc_info()[0].__name__,
+                                                                             str(sys.exc_info()[1])))
+        return bool(changedSets)
+
+    def refresh(self):
+        """
+        Brings the index up to date with the folders. Returns True if the
+        pages were rendered again.
+        """
+        songsChanged = False
+        setsChanged = False
+        if self.batchDir is not None:
+            try:
+                songsChanged = self.refreshSongs()
+            except:
+                dashboardLogger.warning("refresh: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                   str(sys.exc_info()[1])))
+        if self.notesDir is not None:
+            try:
+                setsChanged = self.refreshSets()
+            except:
+                dashboardLogger.warning("refresh: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                   str(sys.exc_info()[1])))
+        if songsChanged or setsChanged or not self.views:
+            self.version += 1
+            self.updatedAt = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self.views = self.renderViews(songsChanged or not self.views, setsChanged or not self.views)
+            return True
+        return False
+
+    def pollForever(self):
+        while not self.stopEvent.wait(self.interval):
+            self.refresh()
+
+    def startPolling(self):
+        """
+        Polls the folders in a daemon thread until stop() is called.
+        """
+        pollThread = threading.Thread(target=self.pollForever, name="dashboard-poll", daemon=True)
+        pollThread.start()
+        return pollThread
+
+    def stop(self):
+        self.stopEvent.set()
+
+    ####################################
+    # What the pages show
+    ####################################
+
+    def getSongs(self):
+        songs = []
+        if self.batch is None:
+            return songs
+        for folder in sorted(self.batch.allSongInfo, key=str.lower):
+            songInfo = self.batch.allSongInfo[folder]
+            songs.append({'folder': folder, 'title': songInfo.get('TITLE', ""), 'artist': songInfo.get('ARTIST', ""),
+                          'stepartist': songInfo.get('STEPARTIST', ""), 'chartFile': self.chartFiles.get(folder)})
+        return songs
+
+    def getSets(self):
+        return [self.setSummaries[setPath] for setPath in sorted(self.setSummaries, key=str.lower)]
+
+    def getJudges(self):
+        """
+        Average of every judge over all the sets they judged.
+        """
+        judges = {}
+        for setSummary in self.getSets():
+            for judgeName, judgeStats in setSummary['judgeStats'].items():
+                judge = judges.setdefault(judgeName, {'judge': judgeName, 'sets': [], 'judged': 0, 'special': 0,
+                                                      'ratingSum': 0})
+                judge['sets'].append(setSummary['set'])
+                judge['judged'] += judgeStats['judged']
+                judge['special'] += judgeStats['special']
+                judge['ratingSum'] += judgeStats['ratingSum']
+        for judge in judges.values():
+            judge['average'] = round(judge['ratingSum'] / judge['judged'], 3) if judge['judged'] else None
+            del judge['ratingSum']
+        return [judges[judgeName] for judgeName in sorted(judges, key=str.lower)]
+
+    def getMissing(self):
+        """
+        For each set in the schedule, the judges it was given who have no
+        notes file in it yet. Names are compared like song titles, so
+        'dossarlx odi' finds 'DossarLX ODI'. Returns None without a schedule.
+        """
+        if self.scheduleFile is None:
+            return None
+        setSummaries = {setSummary['set']: setSummary for setSummary in self.getSets()}
+        missing = []
+        for setName in sorted(self.setRoster, key=str.lower):
+            setSummary = setSummaries.get(setName)
+            judgeKeys = {getSongKey(judgeName) for judgeName in setSummary['judges']} if setSummary else set()
+            missing.append({'set': setName, 'judges': len(judgeKeys),
+                            'missing': [judgeName for judgeName in self.setRoster[setName]
+                                        if getSongKey(judgeName) not in judgeKeys]})
+        return missing
+
+    def getDuplicates(self):
+        """
+        Songs whose title shows up in more than one song folder of the batch,
+        or in more than one place in the sets when there is no batch folder.
+        """
+        places = {}
+        if self.batch is not None:
+            for song in self.getSongs():
+                places.setdefault(getSongKey(song['title']), []).append(
+                    {'title': song['title'], 'stepartist': song['stepartist'], 'folder': song['folder']})
+        else:
+            for setSummary in self.getSets():
+                for song in setSummary['songs']:
+                    places.setdefault(getSongKey(song['title']), []).append(
+                        {'title': song['title'], 'stepartist': song['stepartist'], 'set': setSummary['set']})
+        return [{'song': songPlaces[0]['title'], 'count': len(songPlaces), 'entries': songPlaces}
+                for songKey, songPlaces in sorted(places.items()) if len(songPlaces) > 1]
+
+    def getSummary(self, songs, sets, judges, missing, duplicates):
+        return {'batchDir': self.batchDir, 'notesDir': self.notesDir, 'version': self.version,
+                'updatedAt': self.updatedAt, 'songs': len(songs), 'sets': len(sets), 'judges': len(judges),
+                'ratings': sum(len(song['ratings']) for setSummary in sets for song in setSummary['songs']),
+                'setsMissingJudges': (sum(1 for setMissing in missing if setMissing['missing'])
+                                      if missing is not None else None),
+                'duplicateSongs': len(duplicates)}
+
+    @timed("dashboard.render")
+    def renderViews(self, songsChanged=True, setsChanged=True):
+        """
+        Renders the pages into a new views dictionary. The JSON pages that
+        only show songs or only show sets are taken from the current views
+        when those did not change; the summary and HTML page show both.
+        """
+        songs = self.getSongs()
+        sets = self.getSets()
+        judges = self.getJudges()
+        missing = self.getMissing()
+        duplicates = self.getDuplicates()
+        summary = self.getSummary(songs, sets, judges, missing, duplicates)
+        views = dict(self.views)
+        views['/api/summary.json'] = makeJsonView(summary)
+        if songsChanged:
+            views['/api/songs.json'] = makeJsonView(songs)
+        if setsChanged:
+            views['/api/sets.json'] = makeJsonView(sets)
+            views['/api/judges.json'] = makeJsonView(judges)
+            if missing is not None:
+                views['/api/missing.json'] = makeJsonView(missing)
+        if songsChanged or setsChanged:
+            views['/api/duplicates.json'] = makeJsonView(duplicates)
+        page = self.renderHtml(summary, songs, sets, judges, missing, duplicates)
+        views['/'] = makeView(page.encode("utf-8"), "text/html; charset=utf-8")
+        views['/index.html'] = views['/']
+        dashboardLogger.info("renderViews: Rendered version %s", str(self.version))
+        return views
+
+    def renderTable(self, columns, rows):
+        from .posttemplate import escapeHtml
+        lines = ["<table>", "<tr>" + "".join("<th>" + escapeHtml(column) + "</th>" for column in columns) + "</tr>"]
+        for row in rows:
+            cells = [("{:.2f}".format(value) if isinstance(value, float) else ("" if value is None else str(value)))
+                     for value in row]
+            lines.append("<tr>" + "".join("<td>" + escapeHtml(cell) + "</td>" for cell in cells) + "</tr>")
+        lines.append("</table>")
+        return "\n".join(lines)
+
+    def renderHtml(self, summary, songs, sets, judges, missing, duplicates):
+        from .posttemplate import escapeHtml
+        parts = ["<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>Batch dashboard</title>\n"
+                 "<style>body{font-family:sans-serif} table{border-collapse:collapse;margin-bottom:1em} "
+                 "td,th{border:1px solid #999;padding:2px 6px;text-align:left}</style></head>\n<body>",
+                 "<h1>Batch dashboard</h1>",
+                 "<p>Version " + str(summary['version']) + ", updated " + escapeHtml(str(summary['updatedAt'])) +
+                 ". " + str(summary['songs']) + " songs, " + str(summary['sets']) + " sets, " +
+                 str(summary['judges']) + " judges.</p>"]
+        parts.append("<h2>Judges</h2>")
+        parts.append(self.renderTable(["Judge", "Sets", "Judged", "Special", "Average"],
+                                      [[judge['judge'], ", ".join(judge['sets']), judge['judged'], judge['special'],
+                                        judge['average']] for judge in judges]))
+        if missing is not None:
+            parts.append("<h2>Missing judges</h2>")
+            parts.append(self.renderTable(["Set", "Judges", "Missing"],
+                                          [[setMissing['set'], setMissing['judges'],
+                                            ", ".join(setMissing['missing'])] for setMissing in missing]))
+        parts.append("<h2>Duplicate songs</h2>")
+        parts.append(self.renderTable(["Song", "Count", "Where"],
+                                      [[duplicate['song'], duplicate['count'],
+                                        "; ".join(entry.get('folder', entry.get('set', "")) + " (" +
+                                                  entry['stepartist'] + ")" for entry in duplicate['entries'])]
+                                       for duplicate in duplicates]))
+        for setSummary in sets:
+            parts.append("<h2>" + escapeHtml(setSummary['set']) + "</h2>")
+            parts.append(self.renderTable(["Song", "Stepartist"] + setSummary['judges'] + ["Average"],
+                                          [[song['title'], song['stepartist']] +
+                                           [song['ratings'][judgeName] for judgeName in setSummary['judges']] +
+                                           [song['average']] for song in setSummary['songs']]))
+        if songs:
+            parts.append("<h2>Songs</h2>")
+            parts.append(self.renderTable(["Folder", "Title", "Artist", "Stepartist"],
+                                          [[song['folder'], song['title'], song['artist'], song['stepartist']]
+                                           for song in songs]))
+        parts.append("</body>\n</html>\n")
+        return "\n".join(parts)
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """
+    Serves the pages of server.index. Only looks up the rendered page, so
+    any number of these can run at once while the index refreshes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "batchapi-dashboard"
+
+    def isNotModified(self, etag):
+        ifNoneMatch = self.headers.get("If-None-Match")
+        if ifNoneMatch is None:
+            return False
+        clientTags = [tag.strip() for tag in ifNoneMatch.split(",")]
+        return "*" in clientTags or etag in clientTags or "W/" + etag in clientTags
+
+    def sendPage(self, withBody):
+        from urllib.parse import urlsplit
+        count("dashboard.requests")
+        view = self.server.index.views.get(urlsplit(self.path).path)
+        if view is None:
+            body = b"Not found\n"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if withBody:
+                self.wfile.write(body)
+            return
+        etag, body, contentType = view
+        if self.isNotModified(etag):
+            count("dashboard.notModified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")  # Always check the ETag, pages change while judging
+        self.end_headers()
+        if withBody:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.sendPage(True)
+
+    def do_HEAD(self):
+        self.sendPage(False)
+
+    def log_message(self, format, *args):
+        dashboardLogger.debug("%s: %s", self.address_string(), format % args)
+
+
+class DashboardServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer with the BatchIndex its handlers serve from.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, index):
+        """
+        Constructor
+        """
+        self.index = index
+        ThreadingHTTPServer.__init__(self, address, DashboardHandler)
@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+
+"""
+There are two classes defined here:
+- NotesSectionIndex
+- StepartistFeedback
+
+NotesSectionIndex records where each song block starts and ends in a judge notes file.
+StepartistFeedback uses those indices to put together a feedback file for each stepartist.
+"""
+
+import os
+import re
+import sys
+import mmap
+import codecs
+from .metrics import timed, count
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+feedbackLogger = logging.getLogger("FEEDBACK")
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class NotesSectionIndex():
+    """
+    Byte offset index of the song blocks in one judge notes file.
+    A song block is the rating line plus every line after it up to
+    the next line starting with '['.
+
+    * CLASS ATTRIBUTES *
+    - path: Full file path to the judge notes file.
+    - notesFile: Name of the judge notes file itself.
+    - judgeName: Judge name parsed from the notes file name.
+    - sections: List of tuples in the form of (start,end,songTitle,stepArtist)
+                where start and end are byte offsets into the file.
+    """
+
+    def __init__(self, notesPath):
+        """
+        Constructor
+        """
+        self.path = notesPath
+        self.notesFile = os.path.basename(os.path.normpath(notesPath))
+        self.judgeName = ""
+        self.sections = []
+
+    def __str__(self):
+        return """>>> NOTES SECTION INDEX
+- JUDGE NOTES FILE PATH: {}
+- JUDGE NAME: {}
+- SECTIONS: {}""" \
+        .format(self.path, self.judgeName, str(len(self.sections)))
+
+    def getJudgeName(self):
+        """
+        File must be in format of <JudgeName>_Notes -- anything else can come after
+        """
+        judgeParse = re.search("^(.*)_Notes", self.notesFile)
+        if judgeParse is not None:
+            self.judgeName = str(judgeParse.group(1))
+        else:
+            feedbackLogger.warning("getJudgeName: '%s' is not in correct format", self.notesFile)
+
+    def getSongWithStepartist(self, ratingLine):
+        """
+        Returns (<songTitle>,<stepArtist>) from a rating line. Stepartist is
+        a null string if the line doesn't have one.
+        """
+        withStepartist = re.search("^\[(.*?)\](.*)\{(.*)\}[\s]*\((.*)\)$", ratingLine)
+        if withStepartist is not None:
+            return withStepartist.group(2).strip(), withStepartist.group(4).strip()
+        noStepartist = re.search("^\[(.*?)\](.*)\{(.*)\}$", ratingLine)
+        if noStepartist is not None:
+            return noStepartist.group(2).strip(), ""
+        return ratingLine, ""
+
+    def buildIndex(self):
+        """
+        Single pass over the raw bytes of the notes file. Only the rating
+        lines are decoded; comment lines are just counted past.
+        """
+        feedbackLogger.info("buildIndex: Indexing song blocks in '%s'", self.notesFile)
+        try:
+            self.getJudgeName()
+            sections = []
+            openSection = None  # (start, songTitle, stepArtist) of the block being read
+            offset = 0
+            with open(self.path, 'rb') as notesFile:
+                for line in notesFile:
+                    if offset == 0 and line.startswith(codecs.BOM_UTF8):
+                        offset = len(codecs.BOM_UTF8)
+                        line = line[len(codecs.BOM_UTF8):]
+                    if line.startswith(b'['):
+                        if openSection is not None:
+                            sections.append((openSection[0], offset) + openSection[1:])
+                        songTitle, stepArtist = self.getSongWithStepartist(
+                            line.decode("utf-8", errors="replace").strip())
+                        openSection = (offset, songTitle, stepArtist)
+                    offset += len(line)
+            if openSection is not None:
+                sections.append((openSection[0], offset) + openSection[1:])
+            count("feedback.filesIndexed")
+            count("feedback.bytesRead", offset)
+            self.sections = sections
+            feedbackLogger.debug("buildIndex: Found %s song blocks", str(len(self.sections)))
+        except:
+            feedbackLogger.warning("buildIndex: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                 str(sys.exc_info()[1])))
+
+
+class StepartistFeedback():
+    """
+    This class is used to gather every judge's comments on each stepartist's
+    files into one feedback file per stepartist. It works on a directory of
+    judge notes files, or on a directory of set folders with notes files in
+    them. The notes should already have stepartists added (artistfornotes.py).
+
+    * CLASS ATTRIBUTES *
+    - path: Full file path to the notes directory.
+    - outputDir: Directory the feedback_<stepartist>.txt files are written to,
+                 <notes directory>_feedback by default. It sits next to the
+                 notes directory, so it is never taken for a set folder.
+    - indices: List of NotesSectionIndex objects, one per judge notes file.
+    - stepperToSections: Dictionary with <stepArtist>:[(index,start,end,songTitle),...]
+    - maxWorkers: Number of stepartist files to assemble at the same time.
+    """
+
+    def __init__(self, notesDir, outputDir=None, maxWorkers=None):
+        """
+        Constructor
+        """
+        self.path = notesDir
+        self.outputDir = outputDir if outputDir is not None else os.path.normpath(notesDir) + "_feedback"
+        self.indices = []
+        self.stepperToSections = {}
+        self.maxWorkers = maxWorkers
+        self.mappedFiles = {}
+
+    def __str__(self):
+        return """>>> STEPARTIST FEEDBACK INFORMATION
+- NOTES PATH: {}
+- OUTPUT DIR: {}
+- JUDGE FILES: {}
+- STEPARTISTS: {}""" \
+        .format(self.path, self.outputDir, str(len(self.indices)), str(len(self.stepperToSections)))
+
+    def getNotesFiles(self):
+        """
+        Judge notes files directly in the notes directory and in its set folders.
+        A notes file with a _steppers.txt copy is left out for the copy, which
+        has the stepartists the index needs.
+        """
+        from .judge import isSetDirName, getPreferredNotesFiles
+        notesFiles = []
+        entries = sorted(os.listdir(self.path), key=str.lower)
+        for entry in getPreferredNotesFiles(entries):
+            entryPath = os.path.join(self.path, entry)
+            if os.path.isdir(entryPath):
+                if not isSetDirName(entry):
+                    continue
+                for setFile in getPreferredNotesFiles(sorted(os.listdir(entryPath), key=str.lower)):
+                    if re.search("_Notes.*\.txt$", setFile) is not None:
+                        notesFiles.append(os.path.join(entryPath, setFile))
+            elif re.search("_Notes.*\.txt$", entry) is not None:
+                notesFiles.append(entryPath)
+        return notesFiles
+
+    @timed("feedback.buildIndices")
+    def buildIndices(self):
+        """
+        Indexes every judge notes file, then maps each stepartist to the
+        song blocks written about their files.
+        """
+        feedbackLogger.info("buildIndices: Indexing judge notes in '%s'", self.path)
+        try:
+            self.indices = []
+            for notesPath in self.getNotesFiles():
+                sectionIndex = NotesSectionIndex(notesPath)
+                sectionIndex.buildIndex()
+                self.indices.append(sectionIndex)
+
+            self.stepperToSections = {}
+            for sectionIndex in self.indices:
+                for start, end, songTitle, stepArtist in sectionIndex.sections:
+                    if stepArtist == "":
+                        feedbackLogger.warning("buildIndices: '%s' in '%s' has no stepartist", songTitle,
+                                               sectionIndex.notesFile)
+                        continue
+                    if stepArtist not in self.stepperToSections:
+                        self.stepperToSections[stepArtist] = []
+                    self.stepperToSections[stepArtist].append((sectionIndex, start, end, songTitle))
+        except:
+            feedbackLogger.warning("buildIndices: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                   str(sys.exc_info()[1])))
+
+    def mapFiles(self):
+        """
+        Memory maps every indexed notes file once, so the song blocks can be
+        sliced out directly by all the workers.
+        """
+        for sectionIndex in self.indices:
+            if not sectionIndex.sections:
+                continue  # Empty files can't be mapped and have nothing to slice
+            with open(sectionIndex.path, 'rb') as notesFile:
+                self.mappedFiles[sectionIndex.path] = mmap.mmap(notesFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def closeFiles(self):
+        for mappedFile in self.mappedFiles.values():
+            mappedFile.close()
+        self.mappedFiles = {}
+
+    def getFeedbackFileName(self, stepArtist):
+        return "feedback_" + re.sub('[\\\\/:*?"<>|]', '_', stepArtist) + ".txt"
+
+    def writeStepperFeedback(self, stepArtist):
+        """
+        Slices the song blocks for stepArtist out of the mapped notes files
+        and writes them out, grouped by song and then by judge.
+        """
+        try:
+            songToBlocks = {}
+            songOrder = []
+            for sectionIndex, start, end, songTitle in self.stepperToSections[stepArtist]:
+                if songTitle not in songToBlocks:
+                    songToBlocks[songTitle] = []
+                    songOrder.append(songTitle)
+                block = self.mappedFiles[sectionIndex.path][start:end]
+                songToBlocks[songTitle].append((sectionIndex.judgeName, block))
+
+            fileName = self.getFeedbackFileName(stepArtist)
+            with open(os.path.join(self.outputDir, fileName), 'wb') as feedbackFile:
+                feedbackFile.write(("=== FEEDBACK FOR: " + stepArtist + " ===\n").encode("utf-8"))
+                for songTitle in songOrder:
+                    feedbackFile.write(("\n### " + songTitle + " ###\n").encode("utf-8"))
+                    for judgeName, block in songToBlocks[songTitle]:
+                        feedbackFile.write(("\n--- JUDGE: " + judgeName + " ---\n").encode("utf-8"))
+                        feedbackFile.write(block.rstrip() + b"\n")
+            feedbackLogger.debug("writeStepperFeedback: Wrote '%s'", fileName)
+            return fileName
+        except:
+            feedbackLogger.warning("writeStepperFeedback: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                           str(sys.exc_info()[1])))
+
+    @timed("feedback.writeAll")
+    def writeAllFeedback(self):
+        """
+        Writes the feedback file for every stepartist in parallel.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        feedbackLogger.info("writeAllFeedback: Writing feedback for %s stepartists",
+                            str(len(self.stepperToSections)))
+        try:
+            os.makedirs(self.outputDir, exist_ok=True)
+            self.mapFiles()
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                writtenFiles = list(executor.map(self.writeStepperFeedback,
+                                                 sorted(self.stepperToSections.keys(), key=str.lower)))
+            count("feedback.filesWritten", len([fileName for fileName in writtenFiles if fileName is not None]))
+            feedbackLogger.info("writeAllFeedback: Wrote %s feedback files to '%s'", str(len(writtenFiles)),
+                                self.outputDir)
+        except:
+            feedbackLogger.warning("writeAllFeedback: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                       str(sys.exc_info()[1])))
+        finally:
+            self.closeFiles()
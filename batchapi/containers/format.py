@@ -2,27 +2,19 @@
 
 import os
 import re
+import io
 import sys
+import json
+from .posttemplate import compilePostTemplates
+from .metrics import timed, count
 
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
 import logging
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make formatNotesLogger logger object.
 formatNotesLogger = logging.getLogger("FORMATNOTES")
-formatNotesLogger.setLevel(logging.DEBUG)
-formatNotesFileH = logging.FileHandler('/tmp/formatNotes.log')
-formatNotesFileH.setLevel(logging.DEBUG)
-formatNotesConsoleH = logging.StreamHandler()
-formatNotesConsoleH.setLevel(logging.WARNING)
-formatNotesFileH.setFormatter(dateformatter)
-formatNotesConsoleH.setFormatter(dateformatter)
-formatNotesLogger.addHandler(formatNotesFileH)  # File Handler add
-formatNotesLogger.addHandler(formatNotesConsoleH)  # Console Handler add
 
 def getSetNumber(setName):
     """
@@ -30,7 +22,7 @@ def getSetNumber(setName):
     """
     formatNotesLogger.info("getSetNumber: Retrieving Set Number")
     try:
-        setNumSearch = re.search(".*([\d]+)$", setName)
+        setNumSearch = re.search(".*?([\d]+)$", setName)
         if setNumSearch is not None:
             setNum = str(setNumSearch.group(1))
             formatNotesLogger.debug("getSetNumber: Set Number is '%s'", setNum)
@@ -42,6 +34,9 @@ def getSetNumber(setName):
         formatNotesLogger.warning("getSetNumber: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                   str(sys.exc_info()[1])))
 
+# Song lines get bolded in the post.
+songLinePattern = re.compile("^\[.*\].*\{.*\}[\s]*\(.*\)$")
+
 #####################
 # CLASS DEFINITIONS #
 #####################
@@ -53,20 +48,54 @@ class FormatNotes():
 
     * CLASS ATTRIBUTES *
     - path: Full file path to the set.
-    - setName: Name of the set folder.
+    - setDirs: Set folders in the notes directory, sorted by set number.
     - setNumber: The Set Number of the Batch Group. Note this is a string.
-    - setPostFile: Output file of formatted forum post.
+    - setPostFile: Output file of formatted forum post. Formats other than
+                   bbcode use the same name with their own extension.
+    - postFormats: Names of the post templates to render (see posttemplate.py).
+    - setInfo: Dictionary with <setNumber>:<list of judges> mappings.
+    - setFiles: Dictionary with <setNumber>:<list of judge notes file paths>,
+                ordered the same as the judges in setInfo.
+    - maxWorkers: Number of sets to read and format at the same time.
+    - cacheFile: File in the notes directory keeping the rendered fragment of
+                 every judge notes file, keyed by a hash of the file contents.
+                 Reruns only re-render the judges whose notes changed.
+    - useCache: Set to False to ignore the cache file and render everything.
+    - journal: CheckpointJournal recording each fragment rendered, or each
+               notes file that couldn't be read (see checkpoint.py), or None.
     """
 
-    def __init__(self, notesDir):
+    def __init__(self, notesDir, maxWorkers=None, postFormats=None):
         """
         Constructor
         """
         self.path = notesDir
-        self.setDirs = os.listdir(self.path) # Gives a list of the set folders containing notes
+        self.setDirs = self.getSetDirs() # Gives a list of the set folders containing notes
         self.setPostFile = "forum_post.txt"
         self.setNums = [] # List storing numbers of the sets as strings, not integers.
         self.setInfo = {} # Dictionary storing set numbers and judge lists for each set
+        self.setFiles = {} # Dictionary storing set numbers and the judge files for each set
+        self.maxWorkers = maxWorkers
+        self.postFormats = postFormats if postFormats is not None else ['bbcode']
+        self.cacheFile = ".forum_post_cache.json"
+        self.useCache = True
+        self.fragmentCache = {} # <format>:{<notes file>:{'hash':..., 'judge':..., 'fragment':...}}
+        self.renderedFragments = 0
+        self.reusedFragments = 0
+        self.journal = None
+
+    def getSetDirs(self):
+        """
+        Only folders whose name ends in a set number count as sets, so the
+        forum post from an earlier run is skipped. Sorted by set number, then
+        name, so the post is always in the same order.
+        """
+        from .judge import isSetDirName
+        setDirs = []
+        for setDir in os.listdir(self.path):
+            if os.path.isdir(os.path.join(self.path, setDir)) and isSetDirName(setDir):
+                setDirs.append(setDir)
+        return sorted(setDirs, key=lambda setDir: (int(getSetNumber(setDir)), setDir.lower()))
 
     def getJudgeName(self, notesFileName):
         """
@@ -88,13 +117,21 @@ class FormatNotes():
             formatNotesLogger.warning("getJudgeName: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                       str(sys.exc_info()[1])))
 
+    @timed("formatNotes.listSets")
     def getSetJudgeInfo(self):
         """
         Goes through the set folders, parses set number from folder name,
         and then gets the judge name for each notes text file in those folders.
         So basically for each set directory get set number and judges for those sets.
         Set folders should be in the form of set<number>, so e.g. set1 set2
+
+        Each judge is stored next to the file it came from, so the post
+        never depends on two directory listings coming back in the same order.
+        Only judge notes files (<JudgeName>_Notes....txt or <JudgeName>_Format....txt)
+        count; the judgments and the song listing kept in a set folder don't.
+        A notes file with a _steppers.txt copy is left out for the copy.
         """
+        from .judge import isJudgeNotesFile, getPreferredNotesFiles
         formatNotesLogger.info("getSetJudgeInfo: Getting Set and Judge Info")
         try:
             for setDir in self.setDirs:
@@ -103,81 +140,199 @@ class FormatNotes():
                 setNumber = getSetNumber(setDir) # Retrieve set number from folder name
                 self.setNums.append(setNumber) # Add the set number to the list of set numbers.
 
-                # Change working directory to this set folder.
-                fullSetDir = os.path.join(self.path, setDir)
-                os.chdir(fullSetDir) # Go into the set folder
-
                 # List all the judge notes file in the set directory, then get judges from text files.
-                notesFiles = os.listdir(fullSetDir)
+                fullSetDir = os.path.join(self.path, setDir)
+                notesFiles = getPreferredNotesFiles(sorted(os.listdir(fullSetDir), key=str.lower))
                 setJudgeList = []
+                setFileList = []
                 for notesFile in notesFiles:
+                    if not isJudgeNotesFile(notesFile) and re.search("_Format.*\.txt$", notesFile) is None:
+                        continue
                     judge = self.getJudgeName(notesFile)
                     setJudgeList.append(judge) # Add judge to the set's judge list
+                    setFileList.append(os.path.join(fullSetDir, notesFile))
                 self.setInfo[setNumber] = setJudgeList # Make the set number entry to this judge list
+                self.setFiles[setNumber] = setFileList
         except:
             formatNotesLogger.warning("getSetJudgeInfo: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                          str(sys.exc_info()[1])))
 
+    def getPostFileName(self, postTemplate):
+        if postTemplate.name == 'bbcode':
+            return self.setPostFile
+        return os.path.splitext(self.setPostFile)[0] + postTemplate.extension
+
+    def loadFragmentCache(self):
+        self.fragmentCache = {}
+        if not self.useCache:
+            return
+        try:
+            with open(os.path.join(self.path, self.cacheFile)) as cache:
+                self.fragmentCache = json.load(cache)
+            formatNotesLogger.info("loadFragmentCache: Loaded '%s'", self.cacheFile)
+        except FileNotFoundError:
+            formatNotesLogger.info("loadFragmentCache: No fragment cache yet, rendering everything")
+        except:
+            formatNotesLogger.warning("loadFragmentCache: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                           str(sys.exc_info()[1])))
+
+    def saveFragmentCache(self, newCache):
+        """
+        Only fragments of notes files that are still in the post are kept.
+        Formats that weren't rendered this run keep their fragments, since
+        they are checked against the file hash before use anyway.
+        """
+        for postFormat, fragments in self.fragmentCache.items():
+            if postFormat not in newCache:
+                newCache[postFormat] = fragments
+        self.fragmentCache = newCache
+        if not self.useCache:
+            return
+        try:
+            with open(os.path.join(self.path, self.cacheFile), 'w') as cache:
+                json.dump(newCache, cache)
+        except:
+            formatNotesLogger.warning("saveFragmentCache: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                           str(sys.exc_info()[1])))
+
+    def getCachedFragment(self, postFormat, cacheKey, judge, contentHash):
+        cached = self.fragmentCache.get(postFormat, {}).get(cacheKey)
+        if cached is not None and cached['hash'] == contentHash and cached['judge'] == judge:
+            return cached['fragment']
+        if self.journal is not None and self.useCache:
+            record = self.journal.getDone('fragment', postFormat + ":" + cacheKey, [judge, contentHash])
+            if record is not None:
+                self.fragmentCache.setdefault(postFormat, {})[cacheKey] = {'hash': contentHash, 'judge': judge,
+                                                                          'fragment': record['result']}
+                return record['result']
+        return None
+
+    @timed("formatNotes.readSet")
+    def readSetSection(self, setNum):
+        """
+        Reads every judge notes file of one set. Returns a list of
+        (judge, cacheKey, contentHash, lines) where lines is a list of
+        (line, isSongLine). lines is None when every format already has
+        a cached fragment for this exact file content.
+        """
+        import hashlib
+        judgeSections = []
+        for judge, fileToOpen in zip(self.setInfo[setNum], self.setFiles[setNum]):
+            cacheKey = os.path.relpath(fileToOpen, self.path)
+            try:
+                with open(fileToOpen, 'rb') as judgeFile:
+                    rawNotes = judgeFile.read()
+            except:
+                if self.journal is not None:
+                    from .checkpoint import getErrorText, isTransientError
+                    for postFormat in self.postFormats:
+                        self.journal.markFailed('fragment', postFormat + ":" + cacheKey, None, getErrorText(),
+                                                isTransientError())
+                raise
+            count("formatNotes.filesRead")
+            count("formatNotes.bytesRead", len(rawNotes))
+            contentHash = hashlib.sha1(rawNotes).hexdigest()
+            lines = None
+            for postFormat in self.postFormats:
+                if self.getCachedFragment(postFormat, cacheKey, judge, contentHash) is None:
+                    lines = []
+                    for line in io.TextIOWrapper(io.BytesIO(rawNotes)).readlines():
+                        line = line.strip()
+                        lines.append((line, songLinePattern.search(line) is not None))
+                    count("formatNotes.linesParsed", len(lines))
+                    break
+            judgeSections.append((judge, cacheKey, contentHash, lines))
+        return judgeSections
+
+    @timed("formatNotes.render")
+    def renderPosts(self, postTemplates, setSections):
+        """
+        Goes over the parsed sets once and adds every piece to each of the
+        compiled templates. A judge's notes are only rendered for formats
+        that don't have a cached fragment for the same file content; cached
+        fragments are spliced in as they are. Returns the new fragment cache.
+        """
+        alphabet = "abcdefghijklmnopqrstuvwxyz"
+        newCache = {postTemplate.name: {} for postTemplate in postTemplates}
+        self.renderedFragments = 0
+        self.reusedFragments = 0
+
+        # The top outline of the post. This also includes the order of the judges.
+        setCounter = 1 # Sets will be listed with numbers
+        for setNum in self.setNums:
+            judgesInSet = self.setInfo[setNum]
+            for postTemplate in postTemplates:
+                postTemplate.addOutlineSet(setCounter, setNum)
+            for judgeCounter, judge in enumerate(judgesInSet): # Judges will be listed with alphabet indices
+                for postTemplate in postTemplates:
+                    postTemplate.addOutlineJudge(alphabet[judgeCounter], judge)
+            setCounter += 1
+        for postTemplate in postTemplates:
+            postTemplate.addOutlineEnd()
+
+        # Now the sets and the notes for them.
+        for setNum, judgeSections in zip(self.setNums, setSections):
+            for postTemplate in postTemplates:
+                postTemplate.addSetHeader(setNum)
+            for judge, cacheKey, contentHash, lines in judgeSections:
+                toRender = []
+                for postTemplate in postTemplates:
+                    fragment = self.getCachedFragment(postTemplate.name, cacheKey, judge, contentHash)
+                    if fragment is None:
+                        toRender.append(postTemplate)
+                        postTemplate.startFragment()
+                        postTemplate.addJudgeHeader(judge)
+                    else:
+                        postTemplate.addFragment(fragment)
+                        newCache[postTemplate.name][cacheKey] = {'hash': contentHash, 'judge': judge,
+                                                                 'fragment': fragment}
+                        self.reusedFragments += 1
+                if toRender:
+                    for line, isSongLine in lines:
+                        for postTemplate in toRender:
+                            postTemplate.addLine(line, isSongLine)
+                    for postTemplate in toRender:
+                        fragment = postTemplate.endFragment()
+                        newCache[postTemplate.name][cacheKey] = {'hash': contentHash, 'judge': judge,
+                                                                 'fragment': fragment}
+                        self.renderedFragments += 1
+                        if self.journal is not None:
+                            self.journal.markDone('fragment', postTemplate.name + ":" + cacheKey,
+                                                  [judge, contentHash], fragment)
+        count("formatNotes.cacheHits", self.reusedFragments)
+        count("formatNotes.cacheMisses", self.renderedFragments)
+        return newCache
+
+    @timed("formatNotes.makePost")
     def makeFormattedPost(self):
         """
         Puts the outline at the top of the post of the set numbers and judges, then
         appends the judge notes for each set. The Batch (e.g. July/August) will be put
         manually after the .txt file from this script is generated to prevent convoluted code.
+
+        The sets are read in parallel, then rendered in set order to every
+        format in postFormats and each post is written out at once. Judges
+        whose notes haven't changed since the last run reuse their cached fragment.
         """
+        from concurrent.futures import ThreadPoolExecutor
         formatNotesLogger.info("makeFormattedPost: Attempting to create formatted post.")
         try:
-            os.chdir(self.path)
-            with open(self.setPostFile, 'w') as post:
-
-                # Write the top outline of the post. This also includes the order of the judges.
-                alphabet = "abcdefghijklmnopqrstuvwxyz"
-                setCounter = 1 # Sets will be listed with numbers
-                for setNum in self.setNums:
-                    judgeCounter = 0 # Judges will be listed with alphabet indices
-                    judgesInSet = self.setInfo[setNum]
-                    post.write("[b][size=4]{0}.) SET {1}[/size][/b]\n".format(setCounter,setNum))
-                    for judge in judgesInSet:
-                        letterForList = alphabet[judgeCounter]
-                        post.write("[b]{0}.) {1}[/b]\n".format(letterForList,judge))
-                        judgeCounter += 1
-                    setCounter += 1
-                post.write("\n") # This deals with spacing in the first Set posted.
-
-                # Now time to write the sets and the notes for them.
-                setDirCounter = 0 # For use in determining set directory to change to.
-                for setNum in self.setNums:
-
-                    # Change working directory to this set folder.
-                    fullSetDir = os.path.join(self.path, self.setDirs[setDirCounter])
-                    os.chdir(fullSetDir) # Go into the set folder
-                    notesFiles = os.listdir(fullSetDir) # List all judge notes files in set.
-
-                    # Write judge notes info
-                    post.write("[b][size=7]SET {0}[/size][/b]".format(setNum))
-                    judgeList = self.setInfo[setNum] # Retrieve judge list for the set
-                    judgeCounter = 0 # For use in determining judge notes file to use
-                    for judge in judgeList:
-                        post.write("\n\n[b][size=4]=== JUDGE: {0} ===[/size][/b]\n".format(judge))
-                        fileToOpen = notesFiles[judgeCounter]
-                        with open(fileToOpen) as judgeFile:
-                            for line in judgeFile:
-                                line = line.strip()
-                                songLine = re.search("^\[.*\].*\{.*\}[\s]*\(.*\)$", line)
-                                if songLine is not None:
-                                    lineToFormat = songLine.group(0)
-                                    formattedLine = "[b]" + lineToFormat + "[/b]" 
-                                    post.write("\n"+formattedLine)
-                                else:
-                                    post.write("\n"+line)
-                        judgeFile.close()
-                        judgeCounter += 1
-                    setDirCounter += 1
-                        
-            post.close()
-            formatNotesLogger.info("printFormattedPost: Successfully wrote '%s'", self.setPostFile)
+            postTemplates = compilePostTemplates(self.postFormats)
+            self.loadFragmentCache()
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                setSections = list(executor.map(self.readSetSection, self.setNums))
+            newCache = self.renderPosts(postTemplates, setSections)
+            formatNotesLogger.info("makeFormattedPost: Rendered %s judge fragments, reused %s cached",
+                                   str(self.renderedFragments), str(self.reusedFragments))
+            for postTemplate in postTemplates:
+                postFile = self.getPostFileName(postTemplate)
+                with open(os.path.join(self.path, postFile), 'w') as post:
+                    post.write(postTemplate.getPost())
+                post.close()
+                formatNotesLogger.info("printFormattedPost: Successfully wrote '%s'", postFile)
+            self.saveFragmentCache(newCache)
         except:
             formatNotesLogger.warning("makeFormattedPost: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                            str(sys.exc_info()[1])))
             formatNotesLogger.warning("Are you sure the directory only has the set folders with "
                                       "the notes files?")
-
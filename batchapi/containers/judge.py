@@ -4,38 +4,68 @@ import os
 import re
 import sys
 import codecs
+from .lazy import lazyproperty, getFileStamp
+from .metrics import timed, count
 
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
 import logging
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make judgeNotesLogger logger object.
 judgeNotesLogger = logging.getLogger("JUDGENOTES")
-judgeNotesLogger.setLevel(logging.DEBUG)
-judgeNotesFileH = logging.FileHandler('/tmp/judgeNotes.log')
-judgeNotesFileH.setLevel(logging.DEBUG)
-judgeNotesConsoleH = logging.StreamHandler()
-judgeNotesConsoleH.setLevel(logging.WARNING)
-judgeNotesFileH.setFormatter(dateformatter)
-judgeNotesConsoleH.setFormatter(dateformatter)
-judgeNotesLogger.addHandler(judgeNotesFileH)  # File Handler add
-judgeNotesLogger.addHandler(judgeNotesConsoleH)  # Console Handler add
-
-# Make judgesExcelLogger logger object.
 judgesExcelLogger = logging.getLogger("JUDGESFOREXCEL")
-judgesExcelLogger.setLevel(logging.DEBUG)
-judgesExcelLoggerFileH = logging.FileHandler('/tmp/judgesExcelLogger.log')
-judgesExcelLoggerFileH.setLevel(logging.DEBUG)
-judgesExcelLoggerConsoleH = logging.StreamHandler()
-judgesExcelLoggerConsoleH.setLevel(logging.WARNING)
-judgesExcelLoggerFileH.setFormatter(dateformatter)
-judgesExcelLoggerConsoleH.setFormatter(dateformatter)
-judgesExcelLogger.addHandler(judgesExcelLoggerFileH)  # File Handler add
-judgesExcelLogger.addHandler(judgesExcelLoggerConsoleH)  # Console Handler add
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def isSetDirName(folderName):
+    """
+    Whether a folder in a folder of sets is a set: its name ends in the set
+    number (set1, Set 12). Any other folder, like feedback files someone put
+    there, is left out.
+    """
+    return re.search("[\d]+$", folderName.strip()) is not None
+
+def isJudgeNotesFile(fileName):
+    return re.search("_Notes.*\.txt$", fileName) is not None
+
+def getPreferredNotesFiles(fileNames):
+    """
+    Leaves out every notes file that has a <name>_steppers.txt copy from
+    ArtistForNotes next to it, so the copy with the stepartists is read
+    instead of both. Keeps the order of fileNames.
+    """
+    fileNameSet = set(fileNames)
+    return [fileName for fileName in fileNames
+            if not (fileName.endswith(".txt") and fileName[:-len(".txt")] + "_steppers.txt" in fileNameSet)]
+
+def getRatingCell(rating):
+    """
+    A rating from getSimpleRating as a spreadsheet cell: a number for ratings
+    like '8' or '8.5', the text itself for special ratings like 'PASS' or '*',
+    and None for a missing rating.
+    """
+    if rating is None:
+        return None
+    if re.search("^[\d]+(\.[\d]+)?$", rating) is not None:
+        number = float(rating)
+        return int(number) if number.is_integer() else number
+    return rating
+
+def writeSummarySheet(workbook, judgeSets, setSnapshots=None):
+    """
+    Adds the Summary sheet to an XlsxWriter: one row per song of every set
+    with the average of its numeric ratings and the special ratings it got.
+    setSnapshots is the getJudgments() of each set, if already taken.
+    """
+    workbook.addSheet("Summary", columnWidths=[40, 20, 6, 9, 9, 20])
+    workbook.writeRow(["Song", "Stepartist", "Set", "Average", "Ratings", "Special"], bold=True)
+    setSnapshots = setSnapshots if setSnapshots is not None else [None] * len(judgeSets)
+    for judgeSet, judgments in zip(judgeSets, setSnapshots):
+        for row in judgeSet.getSummaryRows(judgments):
+            workbook.writeRow(row)
 
 #####################
 # CLASS DEFINITIONS #
@@ -43,10 +73,19 @@ judgesExcelLogger.addHandler(judgesExcelLoggerConsoleH)  # Console Handler add
 
 class JudgeNotes():
     """
+    Everything except path, notesFile and fileDir is computed lazily on
+    first access and cached; only what is read gets parsed, so reading
+    just the average never builds the ratings-to-songs maps. The cached
+    values are dropped when the notes file changes on disk, so every read
+    of a value computed from the file still stats the notes file; loops
+    that read the same values many times should read them once first.
+
     * CLASS ATTRIBUTES *
     - path: Full file path to the judge notes file.
     - notesFile: Name of the judge notes file itself.
     - fileDir: Directory of the judge notes file.
+    - outputDir: Directory the ratingsToSongs/ratingsRaw files are written to,
+                 fileDir unless changed.
     - average: Average Rating of the Judge.
     - judgedSongList: The titles of all the songs judged in notes file.
                       ([TITLE,ARTIST,STEPARTIST],rating)
@@ -63,22 +102,14 @@ class JudgeNotes():
 
     def __init__(self, judgeNotesFile):
         """
-        Constructor
+        Constructor. Everything derived from the notes file is a lazyproperty,
+        so it is only parsed when something is read and parsed again if the
+        file changes on disk.
         """
         self.path = judgeNotesFile
         self.notesFile = os.path.basename(os.path.normpath(judgeNotesFile))
         self.fileDir = os.path.abspath(os.path.join(os.path.dirname( self.path ), '.'))
-        self.judgeName = ""
-        self.average = 0
-        self.judgedSongList = []
-        self.specialSongList = []
-        self.numJudgedFiles = 0
-        self.numSpecialFiles = 0
-        self.numTotalFiles = 0
-        self.ratingsToSongs = {}
-        self.ratingsRaw = {}
-        self.specialRatingsToSongs = {}
-        self.specialRatingsRaw = {}
+        self.outputDir = self.fileDir
 
     def __str__(self):
         return """>>> JUDGE NOTES INFORMATION
@@ -93,50 +124,164 @@ class JudgeNotes():
         .format(self.path, self.notesFile, self.fileDir, self.judgeName, self.average, self.numJudgedFiles,
                 self.numSpecialFiles, self.numTotalFiles)
 
-    def getJudgeRatings(self):
+    def getNotesFilePath(self):
+        return os.path.join(self.fileDir, self.notesFile)
+
+    @lazyproperty
+    def judgeName(self):
         """
-        Looks through the file user specified for what judge gave.
-        This is also used for checks if multiple stepartists submitted
-        the same song.
+        Parses judge name from input judge notes file.
+        e.g DossarLX ODI from DossarLX ODI_Notes_MayBatch.txt
+        File must be in format of <JudgeName>_Notes -- anything else can come after
+        """
+        judgeNotesLogger.info("judgeName: Retrieving Judge Name from Notes File '%s'", self.notesFile)
+        judgeParse = re.search("^(.*)_Notes", self.notesFile)
+        if judgeParse is not None:
+            judgeName = str(judgeParse.group(1))
+            judgeNotesLogger.debug("judgeName: Judge is '%s'", judgeName)
+            return judgeName
+        judgeNotesLogger.warning("judgeName: Judge Notes File is not in correct format")
+        return ""
+
+    @lazyproperty(watch=lambda self: [self.getNotesFilePath()])
+    @timed("judgeNotes.parse")
+    def ratingRecords(self):
+        """
+        Every parsed rating line of the notes file, in file order, as
+        ([TITLE,ARTIST,STEPARTIST],rating,isSpecial)
         """
-        judgeNotesLogger.info("getJudgeRatings: Parsing Judge Notes File")
+        judgeNotesLogger.info("ratingRecords: Parsing Judge Notes File")
         try:
-            os.chdir(self.fileDir)  # Change to batch directory context
-            with open(self.notesFile, encoding="utf-8-sig") as judgeFile:
-                for line in judgeFile:
-                    if line.startswith('['):
-                        self.getRatingWithInfo(line)
-            judgeFile.close()
-            self.numJudgedFiles = len(self.judgedSongList)
+            return list(self.iterRatings())
         except:
-            judgeNotesLogger.warning("getJudgeRatings: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                        str(sys.exc_info()[1])))
+            judgeNotesLogger.warning("ratingRecords: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                      str(sys.exc_info()[1])))
+            return []
+
+    @lazyproperty
+    def judgedSongList(self):
+        return [(songInfo, rating) for songInfo, rating, isSpecial in self.ratingRecords if not isSpecial]
+
+    @lazyproperty
+    def specialSongList(self):
+        return [(songInfo, rating) for songInfo, rating, isSpecial in self.ratingRecords if isSpecial]
+
+    @lazyproperty
+    def numJudgedFiles(self):
+        return len(self.judgedSongList)
+
+    @lazyproperty
+    def numSpecialFiles(self):
+        return len(self.specialSongList)
+
+    @lazyproperty
+    def numTotalFiles(self):
+        return self.numJudgedFiles + self.numSpecialFiles
+
+    @lazyproperty
+    def average(self):
+        """
+        Average rating the judge gave over the judged (non-special) files.
+        """
+        judgeNotesLogger.info("average: Retrieving Judge Average from '%s'", self.notesFile)
+        ratingSum = self.getRatingSum()
+        if self.numJudgedFiles == 0:
+            judgeNotesLogger.warning("average: No judged ratings in '%s'", self.notesFile)
+            return 0
+        average = ratingSum / self.numJudgedFiles
+        judgeNotesLogger.debug("average: '%s' / '%s' = '%s'", str(ratingSum),
+                               str(self.numJudgedFiles), str(average))
+        return average
+
+    @lazyproperty
+    def ratingsToSongs(self):
+        """
+        Each tuple in judgedSongList looks like this:
+        ([TITLE,ARTIST,STEPARTIST],rating)
+
+        Each dictionary entry in ratingsToSongs looks like this:
+        'rating':[[TITLE,ARTIST,STEPARTIST],[TITLE,ARTIST,STEPARTIST],...]
+
+        Basically we're reversing the way this is stored.
+        """
+        judgeNotesLogger.info("ratingsToSongs: Generating Dictionary for Ratings --> Songs")
+        return self.groupSongsByRating(self.judgedSongList)
+
+    @lazyproperty
+    def specialRatingsToSongs(self):
+        judgeNotesLogger.info("specialRatingsToSongs: Generating Dictionary for Special Ratings --> Songs")
+        return self.groupSongsByRating(self.specialSongList)
+
+    @lazyproperty
+    def ratingsRaw(self):
+        """
+        Each dictionary entry in ratingsRaw looks like this:
+        'rating':<integer/number of files with rating>
+        """
+        judgeNotesLogger.info("ratingsRaw: Retrieving Raw Ratings from '%s'", self.notesFile)
+        return {rating: len(songs) for rating, songs in self.ratingsToSongs.items()}
+
+    @lazyproperty
+    def specialRatingsRaw(self):
+        judgeNotesLogger.info("specialRatingsRaw: Retrieving Raw Ratings from '%s'", self.notesFile)
+        return {rating: len(songs) for rating, songs in self.specialRatingsToSongs.items()}
+
+    def groupSongsByRating(self, songList):
+        ratingsToSongs = {}
+        for songInfo, rating in songList:
+            if rating not in ratingsToSongs:
+                ratingsToSongs[rating] = [songInfo]
+            else:
+                ratingsToSongs[rating].append(songInfo)
+        return ratingsToSongs
+
+    #############################################################
+    # Older scripts call these in order; they just read the value
+    #############################################################
+
+    def getJudgeRatings(self):
+        return self.judgedSongList
 
     def getNumSpecialFiles(self):
-        self.numSpecialFiles = len(self.specialSongList)
+        return self.numSpecialFiles
 
     def getNumTotalFiles(self):
-        self.numTotalFiles = self.numJudgedFiles + self.numSpecialFiles
+        return self.numTotalFiles
 
     def getJudgeName(self):
+        return self.judgeName
+
+    def getJudgeAverage(self):
+        return self.average
+
+    def getRatingsToSongs(self):
+        return self.ratingsToSongs
+
+    def getSpecialRatingsToSongs(self):
+        return self.specialRatingsToSongs
+
+    def getRawRatings(self):
+        return self.ratingsRaw
+
+    def getRawSpecialRatings(self):
+        return self.specialRatingsRaw
+
+    def getRatingWithInfo(self, ratingLine):
         """
-        Parses judge name from input judge notes file.
-        e.g DossarLX ODI from DossarLX ODI_Notes_MayBatch.txt
-        File must be in format of <JudgeName>_Notes -- anything else can come after
+        Parses ratingLine with parseRatingLine and adds the result to
+        judgedSongList or specialSongList. The list is assigned rather than
+        appended to, so the counts, average and maps computed from it are
+        thrown away and computed again on the next read.
         """
-        judgeNotesLogger.info("getJudgeName: Retrieving Judge Name from Notes File '%s'", self.notesFile)
-        try:
-            judgeParse = re.search("^(.*)_Notes", self.notesFile)
-            if judgeParse is not None:
-                self.judgeName = str(judgeParse.group(1))
-                judgeNotesLogger.debug("getJudgeName: Judge is '%s'", self.judgeName)
+        parsedRating = self.parseRatingLine(ratingLine)
+        if parsedRating is not None:
+            songInfo, rating, isSpecial = parsedRating
+            if isSpecial:
+                self.specialSongList = self.specialSongList + [(songInfo, rating)]
             else:
-                judgeNotesLogger.warning("getJudgeName: Judge Notes File is not in correct format")
-        except:
-            judgeNotesLogger.warning("getJudgeName: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                     str(sys.exc_info()[1])))
+                self.judgedSongList = self.judgedSongList + [(songInfo, rating)]
 
-    def getRatingWithInfo(self, ratingLine):
+    def parseRatingLine(self, ratingLine):
         """
         ratingLine is the line with the rating and song information in judge notes.
         Format: [Rating] Song Name {Song Artist} (Stepper)
@@ -144,9 +289,10 @@ class JudgeNotes():
         Example: [7.5/10] Moonearth {DJ Sharpnel} (Tyler)
                  [6/10] valedict {void}
 
-        Returns a tuple in the form of ([TITLE,ARTIST,STEPARTIST],rating)
+        Returns a tuple in the form of ([TITLE,ARTIST,STEPARTIST],rating,isSpecial)
         Note if there's no stepartist, a null string will be in stepartist field
-        Example Return: (["Dysnomia", "Reizoko Cj", "Nick Skyline"], 5.5)
+        Example Return: (["Dysnomia", "Reizoko Cj", "Nick Skyline"], 5.5, False)
+        None is returned if the line could not be parsed.
 
         EXCEPTIONS
         Other 'ratings' to consider are:
@@ -179,77 +325,89 @@ class JudgeNotes():
         try:
             # Retrieve song information from line.
             if ratingStepartist is not None:
-                judgeNotesLogger.debug("getRatingWithInfo: '" + ratingStepartist.group(2).strip() + "' Found rating with stepartist")
+                judgeNotesLogger.debug("parseRatingLine: '" + ratingStepartist.group(2).strip() + "' Found rating with stepartist")
                 # ratingStepartist.group(0) # Full match
                 rating = ratingStepartist.group(1)  # Rating number itself
                 songInfo = [ratingStepartist.group(2).strip(),  # Song Title
                             ratingStepartist.group(3).strip(),  # Song Artist
                             ratingStepartist.group(4).strip()]  # Stepartist
-                tupleToAdd = (songInfo, rating)
-                self.judgedSongList.append(tupleToAdd)
-                return
+                return songInfo, rating, False
             elif ratingNoStepartist is not None:
-                judgeNotesLogger.debug("getRatingWithInfo: '" + ratingNoStepartist.group(2).strip() + "' Found rating without stepartist")
+                judgeNotesLogger.debug("parseRatingLine: '" + ratingNoStepartist.group(2).strip() + "' Found rating without stepartist")
                 # ratingNoStepartist.group(0) # Full Match
                 rating = ratingNoStepartist.group(1)  # Rating number itself
                 songInfo = [ratingNoStepartist.group(2).strip(),  # Song Title
                             ratingNoStepartist.group(3).strip(),  # Song Artist
                             ""]  # Stepartist placeholder, used for compatibility
-                tupleToAdd = (songInfo, rating)
-                self.judgedSongList.append(tupleToAdd)
-                return
+                return songInfo, rating, False
             elif passRating is not None:
-                specialTuple = self.handleSpecialRating(passRating.group(1).strip(), ratingLine)
-                self.specialSongList.append(specialTuple)
-                return
+                songInfo, rating = self.handleSpecialRating(passRating.group(1).strip(), ratingLine)
+                return songInfo, rating, True
             elif plus is not None:
-                specialTuple = self.handleSpecialRating(plus.group(1).strip(), ratingLine)
-                self.judgedSongList.append(specialTuple)  # A '++' is a 10/10
-                return
+                songInfo, rating = self.handleSpecialRating(plus.group(1).strip(), ratingLine)
+                return songInfo, rating, False  # A '++' is a 10/10
             elif negative is not None:
-                specialTuple = self.handleSpecialRating(negative.group(1).strip(), ratingLine)
-                self.judgedSongList.append(specialTuple)  # A '--' is a 0/10
-                return
+                songInfo, rating = self.handleSpecialRating(negative.group(1).strip(), ratingLine)
+                return songInfo, rating, False  # A '--' is a 0/10
             elif bang is not None:
-                specialTuple = self.handleSpecialRating(bang.group(1).strip(), ratingLine)
-                self.judgedSongList.append(specialTuple)  # A '!' is a 0/10
-                return
-            elif star is not None:
-                specialTuple = self.handleSpecialRating(star.group(1).strip(), ratingLine)
-                numeric = re.search("[\d]+", specialTuple[1])
-                if numeric is not None:
-                    self.judgedSongList.append(specialTuple)
-                else:
-                    self.specialSongList.append(specialTuple)
-                return
-            elif pound is not None:
-                specialTuple = self.handleSpecialRating(pound.group(1).strip(), ratingLine)
-                numeric = re.search("[\d]+", specialTuple[1])
-                if numeric is not None:
-                    self.judgedSongList.append(specialTuple)
-                else:
-                    self.specialSongList.append(specialTuple)
-                return
-            elif arrow is not None:
-                specialTuple = self.handleSpecialRating(arrow.group(1).strip(), ratingLine)
-                numeric = re.search("[\d]+", specialTuple[1])
-                if numeric is not None:
-                    self.judgedSongList.append(specialTuple)
-                else:
-                    self.specialSongList.append(specialTuple)
-                return
-            elif dollar is not None:
-                specialTuple = self.handleSpecialRating(dollar.group(1).strip(), ratingLine)
-                numeric = re.search("[\d]+", specialTuple[1])
-                if numeric is not None:
-                    self.judgedSongList.append(specialTuple)
-                else:
-                    self.specialSongList.append(specialTuple)
-                return            
-        
+                songInfo, rating = self.handleSpecialRating(bang.group(1).strip(), ratingLine)
+                return songInfo, rating, False  # A '!' is a 0/10
+            else:
+                # The remaining symbols only count as judged ratings when a number came with them.
+                for symbolSearch in (star, pound, arrow, dollar):
+                    if symbolSearch is not None:
+                        songInfo, rating = self.handleSpecialRating(symbolSearch.group(1).strip(), ratingLine)
+                        numeric = re.search("[\d]+", rating)
+                        return songInfo, rating, numeric is None
+
+        except:
+            judgeNotesLogger.warning("parseRatingLine: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                        str(sys.exc_info()[1])))
+        return None
+
+    def iterRatings(self):
+        """
+        Generator that reads the notes file one line at a time and yields
+        each parsed rating line as ([TITLE,ARTIST,STEPARTIST],rating,isSpecial).
+        Nothing is stored on the object, so this works in constant memory
+        no matter how big the notes file is (e.g. a whole season concatenated).
+        """
+        judgeNotesLogger.info("iterRatings: Streaming ratings from '%s'", self.notesFile)
+        linesRead = 0
+        ratingLines = 0
+        unparsedLines = 0
+        try:
+            with open(os.path.join(self.fileDir, self.notesFile), encoding="utf-8-sig") as judgeFile:
+                count("judgeNotes.filesRead")
+                count("judgeNotes.bytesRead", os.fstat(judgeFile.fileno()).st_size)
+                for line in judgeFile:
+                    linesRead += 1
+                    if line.startswith('['):
+                        ratingLines += 1
+                        parsedRating = self.parseRatingLine(line)
+                        if parsedRating is not None:
+                            yield parsedRating
+                        else:
+                            unparsedLines += 1
+        finally:
+            count("judgeNotes.linesRead", linesRead)
+            count("judgeNotes.ratingLines", ratingLines)
+            count("judgeNotes.unparsedRatingLines", unparsedLines)
+
+    def getStreamingStats(self):
+        """
+        Runs iterRatings through a RatingStats object and returns it.
+        Use this instead of getJudgeRatings when only the numbers are needed.
+        """
+        judgeNotesLogger.info("getStreamingStats: Computing online statistics for '%s'", self.notesFile)
+        stats = RatingStats()
+        try:
+            for songInfo, rating, isSpecial in self.iterRatings():
+                stats.add(rating, isSpecial)
         except:
-            judgeNotesLogger.warning("getRatingWithInfo: {0}: {1}".format(sys.exc_info()[0].__name__,
+            judgeNotesLogger.warning("getStreamingStats: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                           str(sys.exc_info()[1])))
+        return stats
 
     def handleSpecialRating(self, symbol, lineToParse):
         """
@@ -269,8 +427,8 @@ class JudgeNotes():
         try:
             songInfo = []
             rating = None
-            ratingStepartist = re.search("^\[([\d]*\.?[\d]?)\\"+symbol+"[10/]*\](.*)\{(.*)\}[\s]*\((.*)\)$", lineToParse)
-            ratingNoStepartist = re.search("^\[([\d]*\.?[\d]?)\\"+symbol+"[10/]*\](.*)\{(.*)\}$", lineToParse)
+            ratingStepartist = re.search("^\[([\d]*\.?[\d]?)"+re.escape(symbol)+"[10/]*\](.*)\{(.*)\}[\s]*\((.*)\)$", lineToParse)
+            ratingNoStepartist = re.search("^\[([\d]*\.?[\d]?)"+re.escape(symbol)+"[10/]*\](.*)\{(.*)\}$", lineToParse)
             if ratingStepartist is not None:
                 judgeNotesLogger.debug("handleSpecialRating: Found rating with stepartist on special "
                                        "rating '%s'", symbol)
@@ -289,7 +447,7 @@ class JudgeNotes():
                 rating = str(ratingNoStepartist.group(1).strip())  # Subrating
                 
             # ++ is a guaranteed 10, and -- and ! are guaranteed 0.
-            if rating is "":
+            if rating == "":
                 rating = symbol
                 
             if symbol == "++":
@@ -343,55 +501,6 @@ class JudgeNotes():
             ratingSum += float(ratingTuple[1]) # Get sum of all judge's ratings in the notes file.
         return ratingSum
 
-    def getJudgeAverage(self):
-        """
-        Figures out the average rating a judge gave.
-        Requires judgedSongList to have already been created.
-        """
-
-        try:
-            judgeNotesLogger.info("getJudgeAverage: Retrieving Judge Average from '%s'", self.notesFile)
-            ratingSum = self.getRatingSum()
-            self.average = ratingSum / self.numJudgedFiles
-            judgeNotesLogger.debug("getJudgeAverage: '%s' / '%s' = '%s'", str(ratingSum),
-                                   str(self.numJudgedFiles), str(self.average))
-        except:
-            judgeNotesLogger.warning("getJudgeAverage: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                        str(sys.exc_info()[1])))
-
-    def getRawRatings(self):
-        """
-        Retrieving raw number of songs for each rating.
-        This is done after ratingsToSongs has been created.
-
-        Each dictionary entry in ratingsToSongs looks like this:
-        'rating':[[TITLE,ARTIST,STEPARTIST],[TITLE,ARTIST,STEPARTIST],...]
-
-        Each dictionary entry in ratingsRaw looks like this:
-        'rating':<integer/number of files with rating>
-        """
-
-        try:
-            judgeNotesLogger.info("getRawRatings: Retrieving Raw Ratings from '%s'", self.notesFile)
-            for rating in self.ratingsToSongs.keys():
-                numOfSongsWithRating = len(self.ratingsToSongs[rating])
-                self.ratingsRaw[rating] = numOfSongsWithRating
-
-        except:
-            judgeNotesLogger.warning("getRawRatings: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                      str(sys.exc_info()[1])))
-
-    def getRawSpecialRatings(self):
-        try:
-            judgeNotesLogger.info("getRawSpecialRatings: Retrieving Raw Ratings from '%s'", self.notesFile)
-            for rating in self.specialRatingsToSongs.keys():
-                numOfSongsWithRating = len(self.specialRatingsToSongs[rating])
-                self.specialRatingsRaw[rating] = numOfSongsWithRating
-
-        except:
-            judgeNotesLogger.warning("getRawSpecialRatings: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                             str(sys.exc_info()[1])))        
-
     def printRawRatings(self):
         """
         Print out just a simple listing of how many songs got a certain rating.
@@ -420,44 +529,6 @@ class JudgeNotes():
                                                                         str(sys.exc_info()[1])))
 
 
-    def getRatingsToSongs(self):
-        """
-        Each tuple in judgedSongList looks like this:
-        ([TITLE,ARTIST,STEPARTIST],rating)
-
-        Each dictionary entry in ratingsToSongs looks like this:
-        'rating':[[TITLE,ARTIST,STEPARTIST],[TITLE,ARTIST,STEPARTIST],...]
-
-        Basically we're reversing the way this is stored.
-        Done after judgedSongList has been created.
-        """
-        judgeNotesLogger.info("getRatingsToSongs: Generating Dictionary for Ratings --> Songs")
-        try:
-            for ratingTuple in self.judgedSongList:
-                keyForDict = ratingTuple[1]
-                songInfo = ratingTuple[0]
-                if keyForDict not in self.ratingsToSongs:
-                    self.ratingsToSongs[keyForDict] = [songInfo]
-                else:
-                    self.ratingsToSongs[keyForDict].append(songInfo)
-        except:
-            judgeNotesLogger.warning("getRatingsToSongs: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                          str(sys.exc_info()[1])))
-
-    def getSpecialRatingsToSongs(self):
-        judgeNotesLogger.info("getSpecialRatingsToSongs: Generating Dictionary for Special Ratings --> Songs")
-        try:
-            for ratingTuple in self.specialSongList:
-                keyForDict = ratingTuple[1]
-                songInfo = ratingTuple[0]
-                if keyForDict not in self.specialRatingsToSongs:
-                    self.specialRatingsToSongs[keyForDict] = [songInfo]
-                else:
-                    self.specialRatingsToSongs[keyForDict].append(songInfo)
-        except:
-            judgeNotesLogger.warning("getSpecialRatingsToSongs: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                                 str(sys.exc_info()[1])))
-        
     def printRatingsToSongs(self):
         """
         Print out the songs that fell under the parsed ratings.
@@ -497,16 +568,16 @@ class JudgeNotes():
             judgeNotesLogger.warning("printRatingsToSongs: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                             str(sys.exc_info()[1])))
 
+    @timed("judgeNotes.write")
     def writeRawRatings(self):
         """
         Write out number of songs that got each rating parsed.
         """
         judgeNotesLogger.info("writeRawRatings: Writing file containing songs for each rating")
         try:
-            os.chdir(self.fileDir)
             sortedRatings = sorted(self.ratingsRaw.keys(), key=float)
             fileName = "ratingsRaw_" + self.judgeName + ".txt"
-            with open(fileName, 'w') as outFile:
+            with open(os.path.join(self.outputDir, fileName), 'w') as outFile:
 
                 # Write out normal raw ratings first.
                 for rating in sortedRatings:
@@ -530,16 +601,16 @@ class JudgeNotes():
             judgeNotesLogger.warning("writeRawRatings: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                         str(sys.exc_info()[1])))
 
+    @timed("judgeNotes.write")
     def writeRatingsToSongs(self):
         """
         Write out songs for each rating out to file.
         """
         judgeNotesLogger.info("writeRatingsToSongs: Writing file containing songs for each rating")
         try:
-            os.chdir(self.fileDir)
             sortedRatings = sorted(self.ratingsToSongs.keys(), key=float)
             fileName = "ratingsToSongs_" + self.judgeName + ".txt"
-            with open(fileName, 'w') as outFile:
+            with open(os.path.join(self.outputDir, fileName), 'w') as outFile:
 
                 # Write out the normal ratings first.
                 for rating in sortedRatings:
@@ -571,8 +642,93 @@ class JudgeNotes():
                                                                             str(sys.exc_info()[1])))
 
 
+class RatingStats():
+    """
+    Running totals over a stream of judge ratings, updated one rating at
+    a time so no list of ratings has to be kept around.
+
+    * CLASS ATTRIBUTES *
+    - count: Number of judged (numeric) ratings seen.
+    - ratingSum: Sum of judged ratings.
+    - mean: Running mean of judged ratings.
+    - m2: Sum of squared differences from the mean (Welford's method).
+    - histogram: Dictionary with 'rating':<number of files with rating>
+    - specialCount: Number of special ratings seen.
+    - specialHistogram: Same as histogram but for special ratings.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.count = 0
+        self.ratingSum = 0
+        self.mean = 0
+        self.m2 = 0
+        self.histogram = {}
+        self.specialCount = 0
+        self.specialHistogram = {}
+
+    def __str__(self):
+        return """>>> RATING STATISTICS
+- JUDGED RATINGS: {}
+- SPECIAL RATINGS: {}
+- TOTAL: {}
+- AVERAGE: {}
+- VARIANCE: {}""" \
+        .format(self.count, self.specialCount, round(self.ratingSum, 1), round(self.mean, 2),
+                round(self.getVariance(), 2))
+
+    def add(self, rating, isSpecial=False):
+        """
+        Adds one rating. Judged ratings update the sum, mean and variance,
+        special ratings are only counted.
+        """
+        if isSpecial:
+            self.specialCount += 1
+            self.specialHistogram[rating] = self.specialHistogram.get(rating, 0) + 1
+            return
+        value = float(rating)
+        self.count += 1
+        self.ratingSum += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.histogram[rating] = self.histogram.get(rating, 0) + 1
+
+    def getVariance(self):
+        """
+        Population variance of the judged ratings seen so far.
+        """
+        if self.count == 0:
+            return 0
+        return self.m2 / self.count
+
+    def merge(self, other):
+        """
+        Combines the totals of another RatingStats object into this one,
+        e.g. to get statistics for several judges without re-reading files.
+        """
+        if other.count > 0:
+            total = self.count + other.count
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.count * other.count / total
+            self.mean += delta * other.count / total
+            self.count = total
+            self.ratingSum += other.ratingSum
+        for rating, num in other.histogram.items():
+            self.histogram[rating] = self.histogram.get(rating, 0) + num
+        self.specialCount += other.specialCount
+        for rating, num in other.specialHistogram.items():
+            self.specialHistogram[rating] = self.specialHistogram.get(rating, 0) + num
+
+
 class JudgesForExcel():
     """
+    Like JudgeNotes, everything derived from the set folder is computed
+    lazily on first access and recomputed when the folder or a judge
+    notes file changes.
+
     * CLASS ATTRIBUTES *
     - path: Full file path to the set.
     - setName: Name of the set.
@@ -580,11 +736,20 @@ class JudgesForExcel():
     - notesFiles: List of Judge Notes filenames.
     - judgeNames: List of Judges that did this set.
     - judgeToFileName: Dictionary with <judgeName>:<judgeNotesFile> mappings
+    - setCSV: Name of the judgments CSV file.
+    - setXLSX: Name of the judgments .xlsx workbook.
     - setSongs: List of tuples in the format (<songTitle>,<stepArtist>)
                 This is also an ordered list so it's easy to use with judgeToRating
     - judgeToRating: Dictionary with entries of the format <judgeName>:<listOfRatings>
                     Since setSongs is ordered the same as listOfRatings,
                     nothing complex has to be done here
+    - outputDir: Directory the judgments CSV file is written to, the set folder
+                 unless changed.
+    - ratingCache: Dictionary with <notes file path>:(file stamp, listOfRatings),
+                   so when judgeToRating is recomputed after one judge's file
+                   changes, the other judges' files aren't read again.
+    - journal: CheckpointJournal recording each judge file read or failed
+               (see checkpoint.py), or None.
 
     * FUNCTIONS *
     - __str__():
@@ -592,19 +757,17 @@ class JudgesForExcel():
 
     def __init__(self, notesDir):
         """
-        Constructor
+        Constructor. The listing, judges, songs and ratings are lazyproperty
+        values, read on first use and read again when the set folder or a
+        judge notes file changes.
         """
         self.path = notesDir
         self.setName = str(os.path.basename(os.path.normpath(self.path)).strip())
-        self.setNumber = "0"
         self.setCSV = "judgments_" + self.setName + ".csv"
-        self.notesFiles = []
-        self.judgeNames = []
-        self.judgeToFileName = {}
-        self.setSongs = []
-        self.judgeToRating = {}
-
-        # Rating information stuff
+        self.setXLSX = "judgments_" + self.setName + ".xlsx"
+        self.outputDir = self.path
+        self.ratingCache = {}
+        self.journal = None
 
     def __str__(self):
         return """>>> JUDGE TO EXCEL INFORMATION
@@ -614,68 +777,139 @@ class JudgesForExcel():
 - JUDGE NAMES: {}""" \
         .format(self.path, self.setName, self.notesFiles, self.judgeNames)
 
-    def getSetNumber(self):
-        judgesExcelLogger.info("getSetNumber: Retrieving Set Number")
+    def getJudgeFilePaths(self):
+        return [os.path.join(self.path, notesFile) for notesFile in self.judgeToFileName.values()]
+
+    @lazyproperty
+    def setNumber(self):
+        judgesExcelLogger.info("setNumber: Retrieving Set Number")
+        setNumSearch = re.search(".*?([\d]+)$", self.setName)
+        if setNumSearch is not None:
+            judgesExcelLogger.debug("setNumber: Set Number is '%s'", setNumSearch.group(1))
+            return setNumSearch.group(1)
+        judgesExcelLogger.warning("setNumber: Set Name is not in correct format")
+        return "0"
+
+    @lazyproperty(watch=lambda self: [self.path])
+    def notesFiles(self):
+        judgesExcelLogger.info("notesFiles: Attempting to get list of judge notes files "
+                               "for this set '%s'", self.path)
         try:
-            setNumSearch = re.search(".*([\d]+)$", self.setName)
-            if setNumSearch is not None:
-                self.setNumber = setNumSearch.group(1)
-                judgesExcelLogger.debug("getSetNumber: Set Number is '%s'", self.setNumber)
-            else:
-                judgesExcelLogger.warning("getSetNumber: Set Name is not in correct format")
+            return sorted(os.listdir(self.path), key=str.lower)
         except:
-            judgesExcelLogger.warning("getSetNumber: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                      str(sys.exc_info()[1])))
+            judgesExcelLogger.warning("notesFiles: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                    str(sys.exc_info()[1])))
+            return []
 
-    def getJudgeName(self, notesFileName):
+    @lazyproperty
+    def judgeToFileName(self):
         """
-        Parses judge name from input judge notes file.
-        e.g DossarLX ODI from DossarLX ODI_Notes_MayBatch.txt
-        File must be in format of <JudgeName>_Notes -- anything else can come after
+        Goes through every judge notes file in the set folder specified.
+        getJudgeName gets the judge name from each and maps the judge.
+        When a judge has both X_NotesSetN.txt and X_NotesSetN_steppers.txt,
+        the _steppers.txt file is used.
         """
-        judgesExcelLogger.info("getJudgeName: Retrieving Judge Name from Notes File '%s'", notesFileName)
+        judgesExcelLogger.info("judgeToFileName: Retrieving all judges in Set")
+        judgeToFileName = {}
+        for judgeNotesFile in getPreferredNotesFiles(self.notesFiles):
+            judgeName = self.getJudgeName(judgeNotesFile)
+            if judgeName is not None:
+                judgeToFileName[judgeName] = judgeNotesFile # Record judge to file name mapping
+        return judgeToFileName
+
+    @lazyproperty
+    def judgeNames(self):
+        return list(self.judgeToFileName.keys())
+
+    @lazyproperty(watch=lambda self: self.getJudgeFilePaths()[:1])
+    @timed("judgesForExcel.setSongs")
+    def setSongs(self):
+        """
+        Since all the judges should be using templates, all the song
+        names should be in order honestly. Just go with first one
+        """
+        judgesExcelLogger.info("setSongs: Attempting to get ordered song list "
+                               "of set '%s'", self.setName)
+        setSongs = []
         try:
-            judgeParse = re.search("^(.*)_Notes", notesFileName)
-            if judgeParse is not None:
-                judgeName = str(judgeParse.group(1))
-                self.judgeNames.append(judgeName)
-                self.judgeToFileName[judgeName] = notesFileName # Record judge to file name mapping
-                judgesExcelLogger.info("getJudgeName: Judge is '%s'", judgeName)
-            else:
-                judgesExcelLogger.warning("getJudgeName: Judge Notes File is not in correct format")
+            firstNotesFile = os.path.join(self.path, self.judgeToFileName[self.judgeNames[0]])
+            with open(firstNotesFile, encoding="utf-8-sig") as judgeFile:
+                for line in judgeFile:
+                    if line.startswith('['):
+                        songWithStepartist = self.getSongWithStepartist(line)
+                        if songWithStepartist is not None:
+                            setSongs.append(songWithStepartist)
+            judgeFile.close()
         except:
-            judgesExcelLogger.warning("getJudgeName: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                      str(sys.exc_info()[1])))
+            judgesExcelLogger.warning("setSongs: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                  str(sys.exc_info()[1])))
+        return setSongs
+
+    @lazyproperty(watch=lambda self: self.getJudgeFilePaths())
+    @timed("judgesForExcel.ratings")
+    def judgeToRating(self):
+        """
+        Retrieves the ratings from each judge in the set.
+        """
+        judgesExcelLogger.info("judgeToRating: Attempting to get ratings from all judges "
+                               "for set '%s'", self.setName)
+        judgeToRating = {}
+        for judgeName in self.judgeNames:
+            judgeToRating[judgeName] = self.getRatingsFromJudge(judgeName)
+        return judgeToRating
+
+    #############################################################
+    # Older scripts call these in order; they just read the value
+    #############################################################
+
+    def getSetNumber(self):
+        return self.setNumber
+
+    def getSetFileListing(self):
+        return self.notesFiles
 
     def getAllJudgesInSet(self):
+        return self.judgeNames
+
+    def getOrderedSongList(self):
+        return self.setSongs
+
+    def getAllJudgeRatings(self):
+        return self.judgeToRating
+
+    def getJudgments(self):
         """
-        Goes through every judge notes file in the set folder specified.
-        getJudgeName gets the judge name from each and maps the judge.
+        The set number, judges, songs and ratings read once, as a dictionary.
+        Every read of a watched value stats the files it watches, and writing
+        an output into the set folder changes the folder's stamp, which makes
+        the listing and everything after it compute again. The writers below
+        work from one of these instead of reading the properties.
         """
-        judgesExcelLogger.info("getAllJudgesInSet: Retrieving all judges in Set")
-        try:
-            os.chdir(self.path)
-            for judgeNotesFile in self.notesFiles:
-                self.getJudgeName(judgeNotesFile)  # getJudgeName also appends to judge name list
-        except:
-            judgesExcelLogger.warning("getAllJudgesInSet: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                           str(sys.exc_info()[1])))
+        return {'setNumber': self.setNumber, 'judgeNames': list(self.judgeNames),
+                'setSongs': list(self.setSongs), 'judgeToRating': dict(self.judgeToRating)}
 
     def printJudgeNames(self):
         judgesExcelLogger.info("printJudgeNames:\n" + str(self.judgeNames))
 
-    def getSetFileListing(self):
-        judgesExcelLogger.info("getSetFileListing: Attempting to get list of judge notes files "
-                               "for this set '%s'", self.path)
-        try:
-            self.notesFiles = os.listdir(self.path)
-        except:
-            judgesExcelLogger.warning("getSetFileListing: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                           str(sys.exc_info()[1])))
-
     def printSetFileListing(self):
         judgesExcelLogger.info("printSetFileListing:\n" + str(self.notesFiles))
 
+    def getJudgeName(self, notesFileName):
+        """
+        Parses judge name from input judge notes file.
+        e.g DossarLX ODI from DossarLX ODI_Notes_MayBatch.txt
+        File must be in format of <JudgeName>_Notes -- anything else can come after
+        Returns None if the file name is not in this format.
+        """
+        judgesExcelLogger.info("getJudgeName: Retrieving Judge Name from Notes File '%s'", notesFileName)
+        judgeParse = re.search("^(.*)_Notes", notesFileName)
+        if judgeParse is not None:
+            judgeName = str(judgeParse.group(1))
+            judgesExcelLogger.info("getJudgeName: Judge is '%s'", judgeName)
+            return judgeName
+        judgesExcelLogger.warning("getJudgeName: Judge Notes File is not in correct format")
+        return None
+
     ########################################################
     # We are just getting order song list from template here
     ########################################################
@@ -685,6 +919,7 @@ class JudgesForExcel():
         Parses Song Title from a rating line in the judge notes file.
         Note song artist will exist in submitted notes for all files,
         so the ratingNoStepartist case does not have to be considered here.
+        Returns (<songTitle>,<stepArtist>), or None if the line doesn't match.
         """
         
         try:
@@ -695,37 +930,18 @@ class JudgesForExcel():
             if ratingStepartist is not None:
                 songTitle = ratingStepartist.group(2).strip()
                 stepper = ratingStepartist.group(4).strip()
-                tupleToAdd = (songTitle, stepper)
                 judgesExcelLogger.debug("getSongWithStepartist: Found Song Title '%s'", songTitle)
-                self.setSongs.append(tupleToAdd)  # Song Title with Stepartist, Tuple
+                return songTitle, stepper  # Song Title with Stepartist, Tuple
             elif otherRatingStepartist is not None:
                 songTitle = otherRatingStepartist.group(2).strip()
                 stepper = otherRatingStepartist.group(4).strip()
-                tupleToAdd = (songTitle, stepper)
                 judgesExcelLogger.debug("getSongWithStepartist: Found Song Title '%s'", songTitle)
-                self.setSongs.append(tupleToAdd)  # Song Title with Stepartist, Tuple
+                return songTitle, stepper  # Song Title with Stepartist, Tuple
         except:
             judgesExcelLogger.warning("getSongTitle: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                       str(sys.exc_info()[1])))
+        return None
 
-    def getOrderedSongList(self):
-        """
-        Since all the judges should be using templates, all the song
-        names should be in order honestly. Just go with first one
-        """
-        judgesExcelLogger.info("getOrderedSongList: Attempting to get ordered song list "
-                               "of set '%s'", self.setName)
-        try:
-            os.chdir(self.path) # Change to set's directory context
-            with open(self.notesFiles[0], encoding="utf-8-sig") as judgeFile:
-                for line in judgeFile:
-                    if line.startswith('['):
-                        self.getSongWithStepartist(line)
-            judgeFile.close()
-        except:
-            judgesExcelLogger.warning("getOrderedSongList: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                            str(sys.exc_info()[1])))
-        
     def getSimpleRating(self,ratingLine):
         """
         This only returns a parsed rating.
@@ -756,25 +972,25 @@ class JudgesForExcel():
                 return "0"  # A '!' is a 0/10
             elif star is not None:
                 rating = str(star.group(1).strip())
-                if rating is not "":
+                if rating != "":
                     return rating
                 else:
                     return star.group(2).strip()
             elif pound is not None:
                 rating = str(pound.group(1).strip())
-                if rating is not "":
+                if rating != "":
                     return rating
                 else:
                     return pound.group(2).strip()
             elif arrow is not None:
                 rating = str(arrow.group(1).strip())
-                if rating is not "":
+                if rating != "":
                     return rating
                 else:
                     return arrow.group(2).strip()
             elif dollar is not None:
                 rating = str(dollar.group(1).strip())
-                if rating is not "":
+                if rating != "":
                     return rating
                 else:
                     return dollar.group(2).strip()
@@ -788,65 +1004,86 @@ class JudgesForExcel():
         as a lookup to find the judge's notes file.
 
         Goes through a judge's file, parses the ratings, and
-        saves it into judgeToRating. A list of ratings is saved
-        as the value, the judge's name is the key.
+        returns them as a list for judgeToRating, where the
+        judge's name is the key.
         """
 
         judgesExcelLogger.info("getRatingsFromJudge: Attempting to get ratings from Judge '%s'", judge)
         try:
-            fileToUse = self.judgeToFileName[judge]
-            os.chdir(self.path)  # Change to set's directory context
+            fileToUse = os.path.join(self.path, self.judgeToFileName[judge])
+            fileStamp = getFileStamp(fileToUse)
+            cachedRatings = self.ratingCache.get(fileToUse)
+            if fileStamp is not None and cachedRatings is not None and cachedRatings[0] == fileStamp:
+                count("judgesForExcel.cacheHits")
+                return list(cachedRatings[1])
+            if self.journal is not None:
+                record = self.journal.getDone('judgeFile', fileToUse, fileStamp)
+                if record is not None:
+                    self.ratingCache[fileToUse] = (fileStamp, list(record['result']))
+                    return list(record['result'])
+                if self.journal.getFailed('judgeFile', fileToUse, fileStamp) is not None:
+                    judgesExcelLogger.warning("getRatingsFromJudge: '%s' failed before and hasn't changed",
+                                              fileToUse)
+                    return None
             judgeRatings = []
+            linesRead = 0
             with open(fileToUse, encoding="utf-8-sig") as judgeFile:
+                count("judgesForExcel.bytesRead", os.fstat(judgeFile.fileno()).st_size)
                 for line in judgeFile:
+                    linesRead += 1
                     if line.startswith('['):
                         parsedRating = self.getSimpleRating(line)
                         judgeRatings.append(parsedRating)
             judgeFile.close()
+            count("judgesForExcel.filesRead")
+            count("judgesForExcel.linesRead", linesRead)
+            count("judgesForExcel.ratingsRead", len(judgeRatings))
+            self.ratingCache[fileToUse] = (fileStamp, list(judgeRatings))
+            if self.journal is not None:
+                self.journal.markDone('judgeFile', fileToUse, fileStamp, judgeRatings)
             # print(judgeRatings)
             return judgeRatings
         except:
             judgesExcelLogger.warning("getRatingsFromJudge: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                              str(sys.exc_info()[1])))
-
-    def getAllJudgeRatings(self):
-        """
-        Retrieves the ratings from each judge in the set.
-        """
-
-        judgesExcelLogger.info("getAllJudgeRatings: Attempting to get ratings from all judges "
-                          "for set '%s'", self.setName)
-        try:
-            for judgeName in self.judgeNames:
-                self.judgeToRating[judgeName] = self.getRatingsFromJudge(judgeName)
-        except:
-            judgesExcelLogger.warning("getAllJudgeRatings: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                            str(sys.exc_info()[1])))
-
-    def createRatingCSV(self):
+            if self.journal is not None:
+                from .checkpoint import getErrorText, isTransientError
+                failedPath = os.path.join(self.path, self.judgeToFileName.get(judge, judge))
+                self.journal.markFailed('judgeFile', failedPath, getFileStamp(failedPath), getErrorText(),
+                                        isTransientError())
+
+    @timed("judgesForExcel.writeCsv")
+    def createRatingCSV(self, judgments=None):
         """
         Create a CSV file with the judge ratings and song names in order.
+        judgments is from getJudgments(), read here if not given. A judge
+        whose file couldn't be read gets empty fields, like in the XLSX file.
         """
 
         judgesExcelLogger.info("createRatingCSV: Generating CSV file of ratings")
         try:
-            os.chdir(self.path)  # Change to set's directory context
+            judgments = judgments if judgments is not None else self.getJudgments()
+            judgeNames = judgments['judgeNames']
+            judgeToRating = judgments['judgeToRating']
+            setSongs = judgments['setSongs']
+            setNumber = judgments['setNumber']
 
             # Set up the header
             header = "Song,Stepartist,Set"
-            for judgeName in self.judgeNames:
+            for judgeName in judgeNames:
                 header += "," + judgeName
             header += ",supp"
             # print(header)
 
-            with open(self.setCSV, 'w') as setRatings:
+            with open(os.path.join(self.outputDir, self.setCSV), 'w') as setRatings:
                 setRatings.write(header+"\n")
                 # Set up the judges for printing out. Remember this has tuples
                 songcounter = 0
-                for song in self.setSongs:
-                    lineToWrite = song[0] + "," + song[1] + "," + self.setNumber
-                    for judgeName in self.judgeNames:
-                        lineToWrite += "," + (self.judgeToRating[judgeName])[songcounter]
+                for song in setSongs:
+                    lineToWrite = song[0] + "," + song[1] + "," + setNumber
+                    for judgeName in judgeNames:
+                        judgeRatings = judgeToRating.get(judgeName) or []
+                        lineToWrite += "," + (judgeRatings[songcounter] if songcounter < len(judgeRatings) else "")
                     setRatings.write(lineToWrite+"\n")
                     songcounter += 1
             setRatings.close()
@@ -854,3 +1091,213 @@ class JudgesForExcel():
         except:
             judgesExcelLogger.warning("createRatingCSV: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                          str(sys.exc_info()[1])))
+
+    def getRatingRows(self, judgeNames=None, judgments=None):
+        """
+        Yields the rows of the set's sheet one at a time: the header, then
+        each song with its rating from every judge in judgeNames (the judges
+        of this set by default) as spreadsheet cells. Same columns as the CSV.
+        """
+        judgments = judgments if judgments is not None else self.getJudgments()
+        judgeNames = judgeNames if judgeNames is not None else judgments['judgeNames']
+        judgeToRating = judgments['judgeToRating']
+        setNumber = getRatingCell(judgments['setNumber'])
+        yield ["Song", "Stepartist", "Set"] + list(judgeNames) + ["supp"]
+        for songIndex, song in enumerate(judgments['setSongs']):
+            row = [song[0], song[1], setNumber]
+            for judgeName in judgeNames:
+                judgeRatings = judgeToRating.get(judgeName) or []
+                row.append(getRatingCell(judgeRatings[songIndex]) if songIndex < len(judgeRatings) else None)
+            yield row
+
+    def getSummaryRows(self, judgments=None):
+        """
+        Yields [song, stepartist, set, average, number of numeric ratings,
+        special ratings] for each song of the set.
+        """
+        ratingRows = self.getRatingRows(judgments=judgments)
+        next(ratingRows)  # Header
+        for row in ratingRows:
+            cells = [cell for cell in row[3:] if cell is not None]
+            numbers = [cell for cell in cells if isinstance(cell, (int, float))]
+            special = " ".join(cell for cell in cells if not isinstance(cell, (int, float)))
+            average = round(sum(numbers) / len(numbers), 3) if numbers else None
+            yield [row[0], row[1], row[2], average, len(numbers), special or None]
+
+    def writeSheet(self, workbook, judgeNames=None, judgments=None):
+        workbook.addSheet(self.setName, columnWidths=[40, 20, 6])
+        ratingRows = self.getRatingRows(judgeNames, judgments)
+        workbook.writeRow(next(ratingRows), bold=True)
+        for row in ratingRows:
+            workbook.writeRow(row)
+
+    @timed("judgesForExcel.writeXlsx")
+    def createRatingXLSX(self, judgments=None):
+        """
+        Writes the judgments as an .xlsx workbook with a Summary sheet and a
+        sheet for the set. Ratings are numeric cells, special ratings text,
+        and titles with commas in them stay in one cell.
+        """
+        from .xlsx import XlsxWriter
+        judgesExcelLogger.info("createRatingXLSX: Generating workbook of ratings")
+        try:
+            judgments = judgments if judgments is not None else self.getJudgments()
+            with XlsxWriter(os.path.join(self.outputDir, self.setXLSX)) as workbook:
+                writeSummarySheet(workbook, [self], [judgments])
+                self.writeSheet(workbook, judgments=judgments)
+            judgesExcelLogger.info("createRatingXLSX: Successfully wrote workbook '%s'", self.setXLSX)
+        except:
+            judgesExcelLogger.warning("createRatingXLSX: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                          str(sys.exc_info()[1])))
+
+
+class BatchJudgesForExcel():
+    """
+    This class is used to run JudgesForExcel over every set folder in a
+    batch notes directory at once, instead of once per set. Each set is
+    parsed a single time and those parsed JudgesForExcel objects are used
+    for both the per-set CSV files and the merged CSV file.
+
+    * CLASS ATTRIBUTES *
+    - path: Full file path to the directory containing the set folders.
+    - batchName: Name of the batch notes directory.
+    - batchCSV: Output file of merged judgments for all sets.
+    - batchXLSX: Output workbook with a Summary sheet and a sheet for each set.
+    - setDirs: Sorted list of set folder names in the batch notes directory.
+    - setJudgments: List of parsed JudgesForExcel objects, ordered like setDirs.
+    - setSnapshots: getJudgments() of each parsed set, ordered like setDirs.
+                    Every output is written from these, so writing the set
+                    CSV files doesn't make the merged outputs read the sets again.
+    - judgeNames: Every judge in the batch, in order of first appearance.
+    - maxWorkers: Number of sets to parse at the same time.
+    - journal: CheckpointJournal handed to every set (see checkpoint.py), or None.
+    """
+
+    def __init__(self, notesDir, maxWorkers=None):
+        """
+        Constructor
+        """
+        self.path = notesDir
+        self.batchName = str(os.path.basename(os.path.normpath(self.path)).strip())
+        self.batchCSV = "judgments_" + self.batchName + ".csv"
+        self.batchXLSX = "judgments_" + self.batchName + ".xlsx"
+        self.setDirs = []
+        self.setJudgments = []
+        self.setSnapshots = []
+        self.judgeNames = []
+        self.maxWorkers = maxWorkers
+        self.journal = None
+
+    def __str__(self):
+        return """>>> BATCH JUDGE TO EXCEL INFORMATION
+- NOTES PATH: {}
+- BATCH NAME: {}
+- OUTPUT FILE: {}
+- SET FOLDERS: {}
+- JUDGE NAMES: {}""" \
+        .format(self.path, self.batchName, self.batchCSV, self.setDirs, self.judgeNames)
+
+    def getSetDirs(self):
+        """
+        Lists the set folders in the batch notes directory. Anything that is not
+        a folder (e.g. a merged judgments CSV from an earlier run) or whose name
+        doesn't end in a set number is skipped.
+        """
+        judgesExcelLogger.info("getSetDirs: Retrieving set folders in '%s'", self.path)
+        try:
+            setDirs = []
+            for setDir in os.listdir(self.path):
+                if os.path.isdir(os.path.join(self.path, setDir)) and isSetDirName(setDir):
+                    setDirs.append(setDir)
+            self.setDirs = sorted(setDirs, key=str.lower)
+        except:
+            judgesExcelLogger.warning("getSetDirs: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                    str(sys.exc_info()[1])))
+
+    def parseSet(self, setDir):
+        """
+        Reads the songs and ratings of a single set folder and returns
+        the JudgesForExcel object with its getJudgments().
+        """
+        judgeSet = JudgesForExcel(os.path.join(self.path, setDir))
+        judgeSet.journal = self.journal
+        return judgeSet, judgeSet.getJudgments()
+
+    @timed("judgesForExcel.parseAllSets")
+    def parseAllSets(self):
+        """
+        Parses every set folder concurrently. Results keep the order of setDirs.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        judgesExcelLogger.info("parseAllSets: Parsing %s sets in '%s'", str(len(self.setDirs)), self.path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                parsedSets = list(executor.map(self.parseSet, self.setDirs))
+            self.setJudgments = [judgeSet for judgeSet, judgments in parsedSets]
+            self.setSnapshots = [judgments for judgeSet, judgments in parsedSets]
+            for judgments in self.setSnapshots:
+                for judgeName in judgments['judgeNames']:
+                    if judgeName not in self.judgeNames:
+                        self.judgeNames.append(judgeName)
+        except:
+            judgesExcelLogger.warning("parseAllSets: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                      str(sys.exc_info()[1])))
+
+    def createSetCSVs(self):
+        """
+        Writes the judgments_<setname>.csv file for each parsed set.
+        """
+        for judgeSet, judgments in zip(self.setJudgments, self.setSnapshots):
+            judgeSet.createRatingCSV(judgments)
+
+    @timed("judgesForExcel.writeBatchCsv")
+    def createBatchCSV(self):
+        """
+        Create one CSV file with the songs of every set. Judges that did not
+        judge a set get an empty cell for that set's songs.
+        """
+        judgesExcelLogger.info("createBatchCSV: Generating merged CSV file of ratings")
+        try:
+            header = "Song,Stepartist,Set"
+            for judgeName in self.judgeNames:
+                header += "," + judgeName
+            header += ",supp"
+
+            with open(os.path.join(self.path, self.batchCSV), 'w') as batchRatings:
+                batchRatings.write(header+"\n")
+                for judgments in self.setSnapshots:
+                    judgeToRating = judgments['judgeToRating']
+                    songcounter = 0
+                    for song in judgments['setSongs']:
+                        lineToWrite = song[0] + "," + song[1] + "," + judgments['setNumber']
+                        for judgeName in self.judgeNames:
+                            if judgeName in judgeToRating:
+                                lineToWrite += "," + (judgeToRating[judgeName])[songcounter]
+                            else:
+                                lineToWrite += ","
+                        batchRatings.write(lineToWrite+"\n")
+                        songcounter += 1
+            batchRatings.close()
+            judgesExcelLogger.info("createBatchCSV: Successfully wrote CSV File '%s'", self.batchCSV)
+        except:
+            judgesExcelLogger.warning("createBatchCSV: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                        str(sys.exc_info()[1])))
+
+    @timed("judgesForExcel.writeBatchXlsx")
+    def createBatchXLSX(self):
+        """
+        Writes one .xlsx workbook for the batch: a Summary sheet with every
+        song of every set, then a sheet for each set with its own judges.
+        Rows go into the file as they are made.
+        """
+        from .xlsx import XlsxWriter
+        judgesExcelLogger.info("createBatchXLSX: Generating workbook of ratings")
+        try:
+            with XlsxWriter(os.path.join(self.path, self.batchXLSX)) as workbook:
+                writeSummarySheet(workbook, self.setJudgments, self.setSnapshots)
+                for judgeSet, judgments in zip(self.setJudgments, self.setSnapshots):
+                    judgeSet.writeSheet(workbook, judgments=judgments)
+            judgesExcelLogger.info("createBatchXLSX: Successfully wrote workbook '%s'", self.batchXLSX)
+        except:
+            judgesExcelLogger.warning("createBatchXLSX: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                         str(sys.exc_info()[1])))
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+"""
+lazyproperty is used for values on the containers that are derived from
+other values or from files on disk. A value is computed the first time it
+is read and cached on the object after that.
+
+While a lazyproperty is being computed, any other lazyproperty it reads is
+recorded as a dependency. Properties created with watch=<function> also
+remember the modification stamp of the files the function returns; when
+one of those files changes, that property and everything computed from it
+is thrown away and recomputed on the next read. Values that never read a
+watched property (e.g. a judge name parsed from a file name) stay cached.
+
+Checking costs an os.stat() of every watched file behind a value on every
+read of it, so a cached read is cheap but not free; code that reads the
+same values in a loop should read them once before the loop.
+"""
+
+import os
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getFileStamp(path):
+    """
+    Returns (modification time, size) for path, or None if it can't be read.
+    """
+    try:
+        fileStat = os.stat(path)
+        return fileStat.st_mtime_ns, fileStat.st_size
+    except OSError:
+        return None
+
+def getLazyState(obj):
+    """
+    Returns the LazyState stored on obj, making one if needed.
+    """
+    state = obj.__dict__.get('_lazyState')
+    if state is None:
+        state = LazyState()
+        obj.__dict__['_lazyState'] = state
+    return state
+
+def invalidate(obj, name=None):
+    """
+    Throws away the cached value of property name on obj along with every
+    value that was computed from it. If name is None everything is thrown away.
+    """
+    state = getLazyState(obj)
+    if name is None:
+        state.__init__()
+    else:
+        state.invalidate(name)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class LazyState():
+    """
+    Bookkeeping for the lazyproperty values of a single object.
+
+    * CLASS ATTRIBUTES *
+    - cache: Dictionary with 'property':value mappings.
+    - dependents: Dictionary with 'property':{properties computed from it}
+    - roots: Dictionary with 'property':{watched properties it depends on}
+    - stamps: Dictionary with 'watched property':{path:file stamp}
+    - stack: Properties currently being computed, innermost last.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.cache = {}
+        self.dependents = {}
+        self.roots = {}
+        self.stamps = {}
+        self.stack = []
+
+    def invalidate(self, name):
+        self.cache.pop(name, None)
+        self.roots.pop(name, None)
+        self.stamps.pop(name, None)
+        for dependent in self.dependents.pop(name, ()):
+            self.invalidate(dependent)
+
+    def isStale(self, name):
+        """
+        Checks the watched files name depends on. Any watched property whose
+        files changed is invalidated, which also invalidates name.
+        """
+        for root in list(self.roots.get(name, ())):
+            for path, stamp in self.stamps.get(root, {}).items():
+                if getFileStamp(path) != stamp:
+                    self.invalidate(root)
+                    return True
+        return False
+
+
+class lazyproperty():
+    """
+    Descriptor for a lazily computed, cached value. Can be used as
+    @lazyproperty or @lazyproperty(watch=<function returning list of paths>).
+    Assigning to the property replaces the cached value and invalidates
+    everything that was computed from it.
+    """
+
+    def __init__(self, func=None, watch=None):
+        self.func = func
+        self.watch = watch
+        self.name = func.__name__ if func is not None else None
+        self.__doc__ = func.__doc__ if func is not None else None
+
+    def __call__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        state = getLazyState(obj)
+        if self.name not in state.cache or state.isStale(self.name):
+            state.stack.append(self.name)
+            try:
+                if self.watch is not None:
+                    state.stamps[self.name] = {path: getFileStamp(path) for path in self.watch(obj)}
+                    state.roots.setdefault(self.name, set()).add(self.name)
+                value = self.func(obj)
+            finally:
+                state.stack.pop()
+            state.cache[self.name] = value
+
+        # Whatever is being computed right now depends on this value.
+        if state.stack:
+            parent = state.stack[-1]
+            state.dependents.setdefault(self.name, set()).add(parent)
+            state.roots.setdefault(parent, set()).update(state.roots.get(self.name, ()))
+        return state.cache[self.name]
+
+    def __set__(self, obj, value):
+        state = getLazyState(obj)
+        state.invalidate(self.name)
+        state.cache[self.name] = value
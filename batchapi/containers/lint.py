@@ -0,0 +1,306 @@
+#!/usr/bin/python3
+
+"""
+Checks judge notes files before their ratings are read. A rating line the
+parsers don't understand (a missing /10, a { or ( that is never closed, a
+symbol they don't know) used to be skipped without a word, which left the
+song out of the counts and averages, or moved every rating after it onto
+the wrong song in the judgments.
+
+Each notes file is read once. A line in the usual format is checked with
+a single regular expression; only the lines that fail it are looked at
+again to find the column and the reason. Rating lines are the lines
+starting with [, like the parsers read them, plus lines that would be
+rating lines if not for a leading space or a missing [.
+
+A rating line looks like:
+
+    [7.5/10] Song Title {Song Artist} (Stepartist)
+
+A title can have {...} in it as well; the last {...} is the artist, the
+way the parsers read it.
+
+The rating is a number from 0 to 10 with at most one decimal and /10, or
+one of the symbols PASS, ++, --, !, *, #, < and $, optionally with a
+number before it and /10 after it. The (Stepartist) is required in the
+set folders the judgments are made from (see ArtistForNotes).
+
+Since the judgments match ratings to songs by their position, every file
+of a set is also compared with the first one (the file JudgesForExcel
+takes the song list from): the same number of ratings, for the same songs.
+
+The files of every judge are checked at the same time in a thread pool.
+"""
+
+import os
+import re
+import sys
+from .metrics import timed, count
+from .normalize import getSongKey
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+lintLogger = logging.getLogger("LINT")
+
+##############
+# LINE RULES #
+##############
+
+ratingSymbols = ['PASS', '++', '--', '!', '*', '#', '<', '$']
+
+symbolPattern = "|".join(re.escape(symbol) for symbol in ratingSymbols)
+
+# A rating line in the usual format: rating, title, {artist} and an optional (stepartist).
+# Like the parsers, the last {...} is the artist; the title can have {...} in it too.
+ratingLinePattern = re.compile("^\\[(?:([\\d]+(?:\\.[\\d])?)/10|((?:[\\d]+(?:\\.[\\d])?)?)(?:" + symbolPattern +
+                               ")(?:/10)?)\\]((?:[^{}]|\\{[^{}]*\\})*)\\{([^{}]*)\\}[\\s]*(\\((?:[^()]|\\([^()]*\\))*\\))?[\\s]*$")
+
+# A line that was meant to be a rating line but isn't read as one.
+strayRatingPattern = re.compile("^(?:[\\s]+\\[|[\\d]+(?:\\.[\\d]+)?/10[\\s]*\\])")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getRatingProblem(ratingText):
+    """
+    Reason the text between [ and ] isn't a rating, or None if it is one.
+    """
+    ratingText = ratingText.strip()
+    if ratingText == "":
+        return "empty rating"
+    numericSearch = re.search("^([\\d]+(?:\\.[\\d]+)?)(?:/([\\d]*))?$", ratingText)
+    if numericSearch is not None:
+        if numericSearch.group(2) is None:
+            return "missing /10 after the rating"
+        if numericSearch.group(2) != "10":
+            return "rating is out of " + (numericSearch.group(2) or "nothing") + " instead of /10"
+        if re.search("\\.[\\d]{2,}$", numericSearch.group(1)) is not None:
+            return "rating can only have one decimal"
+        if float(numericSearch.group(1)) > 10:
+            return "rating " + numericSearch.group(1) + " is over 10"
+        return None
+    symbolSearch = re.search("^((?:[\\d]+(?:\\.[\\d])?)?)(.*?)(/10)?$", ratingText)
+    if symbolSearch.group(2) not in ratingSymbols:
+        return "unknown rating symbol '" + symbolSearch.group(2) + "'"
+    if symbolSearch.group(1) != "" and float(symbolSearch.group(1)) > 10:
+        return "rating " + symbolSearch.group(1) + " is over 10"
+    return None
+
+def findUnbalanced(text, opening, closing, offset):
+    """
+    (column, reason) for the first opening or closing character in text
+    that has no partner, or None. offset is the column of text[0].
+    """
+    openColumns = []
+    for index, character in enumerate(text):
+        if character == opening:
+            openColumns.append(offset + index)
+        elif character == closing:
+            if not openColumns:
+                return offset + index, "'" + closing + "' has no '" + opening + "'"
+            openColumns.pop()
+    if openColumns:
+        return openColumns[0], "'" + opening + "' is never closed"
+    return None
+
+def getLineProblem(line, requireStepartist=True):
+    """
+    (column, reason) for a rating line that isn't in the usual format, or
+    None if it is. Columns start at 1.
+    """
+    line = line.rstrip("\r\n")
+    ratingSearch = ratingLinePattern.search(line)
+    if ratingSearch is not None:
+        rating = ratingSearch.group(1) or ratingSearch.group(2)
+        if rating and float(rating) > 10:
+            return 2, "rating " + rating + " is over 10"
+        if requireStepartist and ratingSearch.group(5) is None:
+            return len(line.rstrip()) + 1, "no (stepartist) after the {artist}"
+        return None
+
+    if not line.startswith("["):
+        if line.lstrip().startswith("["):
+            return 1, "space before the rating, so the line isn't read"
+        return 1, "missing '[' before the rating"
+    ratingEnd = line.find("]")
+    if ratingEnd == -1:
+        return 1, "'[' is never closed"
+    ratingProblem = getRatingProblem(line[1:ratingEnd])
+    if ratingProblem is not None:
+        return 2, ratingProblem
+
+    # Song Title {Song Artist} (Stepartist)
+    songText = line[ratingEnd + 1:]
+    songColumn = ratingEnd + 2
+    if "{" not in songText and "}" not in songText:
+        return len(line.rstrip()) + 1, "no {artist} after the song title"
+    braceProblem = findUnbalanced(songText, "{", "}", songColumn)
+    if braceProblem is not None:
+        return braceProblem
+    artistEnd = songText.rindex("}")
+    stepperText = songText[artistEnd + 1:]
+    stepperColumn = songColumn + artistEnd + 1
+    if stepperText.strip() == "":
+        return len(line.rstrip()) + 1, "no (stepartist) after the {artist}"
+    stepperStart = len(stepperText) - len(stepperText.lstrip())
+    if stepperText[stepperStart] != "(":
+        return stepperColumn + stepperStart, "text after the {artist} that isn't a (stepartist)"
+    parenthesisProblem = findUnbalanced(stepperText, "(", ")", stepperColumn)
+    if parenthesisProblem is not None:
+        return parenthesisProblem
+    depth = 0
+    for index in range(stepperStart, len(stepperText)):
+        depth += {"(": 1, ")": -1}.get(stepperText[index], 0)
+        if depth == 0:
+            break
+    afterStepper = stepperText[index + 1:]
+    if afterStepper.strip() != "":
+        return (stepperColumn + index + 1 + len(afterStepper) - len(afterStepper.lstrip()),
+                "text after the (stepartist)")
+    return 1, "not in the usual rating line format"
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class NotesLinter():
+    """
+    * CLASS ATTRIBUTES *
+    - path: A set folder, or a folder of set folders.
+    - setDirs: Full paths of the set folders checked.
+    - requireStepartist: Whether rating lines need a (stepartist).
+    - maxWorkers: Number of notes files to check at the same time.
+    - filesChecked: Number of notes files checked.
+    - problems: Sorted list of (file path, line, column, reason).
+    """
+
+    def __init__(self, notesDir, requireStepartist=True, maxWorkers=None):
+        """
+        Constructor
+        """
+        self.path = notesDir
+        self.setDirs = []
+        self.requireStepartist = requireStepartist
+        self.maxWorkers = maxWorkers
+        self.filesChecked = 0
+        self.problems = []
+
+    def __str__(self):
+        return """>>> JUDGE NOTES LINT
+- NOTES PATH: {}
+- SETS: {}
+- FILES CHECKED: {}
+- PROBLEMS: {}""" \
+        .format(self.path, str(len(self.setDirs)), str(self.filesChecked), str(len(self.problems)))
+
+    def getSetDirs(self):
+        """
+        The set folders in path if it has any (a folder of sets), else path itself.
+        """
+        from .judge import isSetDirName
+        setDirs = sorted((os.path.join(self.path, entry) for entry in os.listdir(self.path)
+                          if os.path.isdir(os.path.join(self.path, entry)) and isSetDirName(entry)), key=str.lower)
+        self.setDirs = setDirs or [self.path]
+
+    def getNotesFiles(self, setDir):
+        """
+        The judge notes files of a set, in the order JudgesForExcel reads them.
+        """
+        from .judge import JudgesForExcel
+        judgeSet = JudgesForExcel(setDir)
+        return [os.path.join(setDir, notesFile) for notesFile in judgeSet.judgeToFileName.values()]
+
+    def lintFile(self, notesPath):
+        """
+        Reads one notes file. Returns (problems, songs), with songs a list of
+        (line, title key) for the rating lines in the usual format, used to
+        compare the files of a set.
+        """
+        problems = []
+        songs = []
+        linesRead = 0
+        with open(notesPath, encoding="utf-8-sig") as notesFile:
+            for lineNumber, line in enumerate(notesFile, 1):
+                linesRead += 1
+                if not line.startswith("[") and strayRatingPattern.search(line) is None:
+                    continue
+                lineProblem = getLineProblem(line, self.requireStepartist)
+                if lineProblem is not None:
+                    problems.append((notesPath, lineNumber, lineProblem[0], lineProblem[1]))
+                    songs.append((lineNumber, None))
+                else:
+                    songs.append((lineNumber, getSongKey(ratingLinePattern.search(line.rstrip("\r\n")).group(3))))
+        count("lint.linesRead", linesRead)
+        return problems, songs
+
+    def lintFileSafely(self, notesPath):
+        try:
+            return self.lintFile(notesPath)
+        except:
+            lintLogger.warning("lintFile: '{0}': {1}: {2}".format(notesPath, sys.exc_info()[0].__name__,
+                                                                 str(sys.exc_info()[1])))
+            return [(notesPath, 0, 0, "can't be read: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                       str(sys.exc_info()[1])))], None
+
+    def compareSongs(self, firstPath, firstSongs, notesPath, songs):
+        """
+        Problems where a file doesn't have the same songs in the same order
+        as the first file of its set. Only the first difference is reported.
+        """
+        firstName = os.path.basename(firstPath)
+        for position, ((firstLine, firstKey), (lineNumber, songKey)) in enumerate(zip(firstSongs, songs), 1):
+            if firstKey is not None and songKey is not None and firstKey != songKey:
+                return [(notesPath, lineNumber, 1, "rating " + str(position) + " is for a different song than "
+                         "line " + str(firstLine) + " of '" + firstName + "' (ratings are matched by position)")]
+        if len(songs) != len(firstSongs):
+            lineNumber = songs[-1][0] if songs else 1
+            return [(notesPath, lineNumber, 1, str(len(songs)) + " ratings, but '" + firstName + "' has " +
+                     str(len(firstSongs)))]
+        return []
+
+    @timed("lint.run")
+    def lint(self):
+        """
+        Checks every notes file of every set. Returns True if there were no problems.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        lintLogger.info("lint: Checking judge notes in '%s'", self.path)
+        self.problems = []
+        try:
+            self.getSetDirs()
+            setFiles = [self.getNotesFiles(setDir) for setDir in self.setDirs]
+            allFiles = [notesPath for notesFiles in setFiles for notesPath in notesFiles]
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                fileResults = dict(zip(allFiles, executor.map(self.lintFileSafely, allFiles)))
+            self.filesChecked = len(allFiles)
+            for notesFiles in setFiles:
+                for notesPath in notesFiles:
+                    self.problems.extend(fileResults[notesPath][0])
+                firstSongs = fileResults[notesFiles[0]][1] if notesFiles else None
+                if firstSongs is None:
+                    continue
+                for notesPath in notesFiles[1:]:
+                    songs = fileResults[notesPath][1]
+                    if songs is not None:
+                        self.problems.extend(self.compareSongs(notesFiles[0], firstSongs, notesPath, songs))
+        except:
+            lintLogger.warning("lint: {0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
+            self.problems.append((self.path, 0, 0, "can't be checked: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                                       str(sys.exc_info()[1]))))
+        self.problems.sort()
+        count("lint.filesChecked", self.filesChecked)
+        count("lint.problems", len(self.problems))
+        lintLogger.info("lint: %s problems in %s files", str(len(self.problems)), str(self.filesChecked))
+        return not self.problems
+
+    def getReportLines(self):
+        """
+        One line per problem, <file>:<line>:<column>: <reason>.
+        """
+        return ["{0}:{1}:{2}: {3}".format(notesPath, str(lineNumber), str(column), reason)
+                for notesPath, lineNumber, column, reason in self.problems]
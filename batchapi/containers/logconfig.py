@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+"""
+Log handlers for the containers.
+
+Importing a container module only gets its logger; nothing is opened
+and no handlers are added, so the containers can be imported as a library
+without touching /tmp. The scripts call configureLogging() when they
+start, which gives every logger the same /tmp/<name>.log file and console
+output it always had. The log files are opened on the first record.
+
+Until then each logger has a NullHandler (added when the containers
+package is imported), so a program using the containers without calling
+configureLogging() doesn't get their warnings on stderr through Python's
+last resort handler. Records still reach the handlers of the root logger
+if the program sets any up.
+
+For the same reason, modules only needed by one method (thread pools,
+hashlib, tempfile, the container modules in pipeline.py) are imported
+inside that method rather than at the top of the file.
+"""
+
+import logging
+
+# Logger name to the log file it writes to.
+logFiles = {
+    'BATCH': '/tmp/batchContainer.log',
+    'SIMFILE': '/tmp/simfile.log',
+    'CSVTABLE': '/tmp/csvTable.log',
+    'NOTESTEMPLATE': '/tmp/notesTemplate.log',
+    'ARTISTFORNOTES': '/tmp/artistToNotes.log',
+    'JUDGENOTES': '/tmp/judgeNotes.log',
+    'JUDGESFOREXCEL': '/tmp/judgesExcelLogger.log',
+    'FEEDBACK': '/tmp/feedback.log',
+    'FORMATNOTES': '/tmp/formatNotes.log',
+    'PIPELINE': '/tmp/pipeline.log',
+    'CATALOG': '/tmp/catalog.log',
+    'ASSETS': '/tmp/assets.log',
+    'WATCH': '/tmp/watch.log',
+    'DASHBOARD': '/tmp/dashboard.log',
+    'CORPUS': '/tmp/corpus.log',
+    'BENCHMARK': '/tmp/benchmark.log',
+    'PACK': '/tmp/releasePack.log',
+    'CHECKPOINT': '/tmp/checkpoint.log',
+    'SCHEDULER': '/tmp/scheduler.log',
+    'LINT': '/tmp/notesLint.log',
+}
+
+configuredLoggers = set()
+
+for loggerName in logFiles:
+    logging.getLogger(loggerName).addHandler(logging.NullHandler())
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def configureLogging(names=None, consoleLevel=logging.WARNING):
+    """
+    Adds the file handler (DEBUG) and console handler (consoleLevel) to each
+    logger in names, or to every logger in logFiles. Loggers that were already
+    configured are left alone, so this can be called more than once.
+    """
+    # Date formatting will be the same for all loggers
+    dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
+    for name in (names if names is not None else logFiles.keys()):
+        if name in configuredLoggers:
+            continue
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.DEBUG)
+        fileH = logging.FileHandler(logFiles[name], delay=True)
+        fileH.setLevel(logging.DEBUG)
+        consoleH = logging.StreamHandler()
+        consoleH.setLevel(consoleLevel)
+        fileH.setFormatter(dateformatter)
+        consoleH.setFormatter(dateformatter)
+        logger.addHandler(fileH)  # File Handler add
+        logger.addHandler(consoleH)  # Console Handler add
+        configuredLoggers.add(name)
@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+
+"""
+Timers and counters for the containers.
+
+The slow parts of a run are wrapped with @timed("<stage>") (or a
+"with stageTimer(...)" block) and the work they do is counted with
+count("<counter>", n), e.g. files scanned, lines parsed, bytes read and
+cache hits. Both are cheap enough to always be on; they only add to a
+dictionary.
+
+configureMetrics() is the opt-in part: it can write everything to a
+JSON file when the process exits, and it can wrap any timed stage in
+cProfile or tracemalloc. Stage names look like "batch.construct" or
+"judgeNotes.parse"; profiling "judgeNotes" matches every stage starting
+with "judgeNotes.".
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def count(name, amount=1):
+    metrics.count(name, amount)
+
+def timed(stage):
+    """
+    Decorator that times every call of the function under stage.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.stageTimer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def stageTimer(stage):
+    return metrics.stageTimer(stage)
+
+def configureMetrics(metricsFile=None, profileStages=None, profileMode="cprofile", profileDir="/tmp"):
+    """
+    metricsFile: JSON file the timers and counters are written to at exit.
+    profileStages: Stage names (or prefixes) to run under the profiler.
+    profileMode: 'cprofile' writes profile_<stage>.prof (read it with pstats);
+                 'tracemalloc' records the peak memory of the stage and writes
+                 tracemalloc_<stage>.txt with the biggest allocations.
+                 Tracing is started here and stopped at exit, since it is
+                 for the whole process and stages can run at the same time.
+    """
+    if profileMode not in ('cprofile', 'tracemalloc'):
+        raise ValueError("profileMode has to be 'cprofile' or 'tracemalloc', not '" + str(profileMode) + "'")
+    metrics.profileStages = list(profileStages) if profileStages is not None else []
+    metrics.profileMode = profileMode
+    if profileMode == 'tracemalloc' and metrics.profileStages:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            metrics.startedTracing = True
+    metrics.profileDir = profileDir
+    metrics.metricsFile = metricsFile
+    if not metrics.writeAtExit:
+        atexit.register(metrics.writeAll)
+        metrics.writeAtExit = True
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class StageTimer():
+    """
+    Context manager recording the time of one call of a stage, and
+    profiling it if the stage was asked for in configureMetrics().
+    """
+
+    def __init__(self, owner, stage):
+        """
+        Constructor
+        """
+        self.owner = owner
+        self.stage = stage
+        self.profiling = False
+        self.profiler = None
+
+    def __enter__(self):
+        # Only the outermost profiled stage of a thread is profiled; the
+        # stages inside it show up in its profile anyway.
+        local = self.owner.local
+        if self.owner.profileStages and not getattr(local, 'profiling', False) and \
+                self.owner.isProfiled(self.stage):
+            self.profiling = True
+            local.profiling = True
+            if self.owner.profileMode == 'cprofile':
+                self.profiler = self.owner.getProfiler(self.stage)
+                self.profiler.enable()
+            else:
+                self.owner.startTrace()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        seconds = time.perf_counter() - self.start
+        peakBytes = None
+        if self.profiling:
+            self.owner.local.profiling = False
+            if self.profiler is not None:
+                self.profiler.disable()
+            else:
+                peakBytes = self.owner.stopTrace(self.stage)
+        self.owner.addTime(self.stage, seconds, peakBytes)
+        return False
+
+
+class Metrics():
+    """
+    Holds the timers and counters of the process. Use the module level
+    metrics object (or the functions above) rather than making another one.
+
+    * CLASS ATTRIBUTES *
+    - timers: Dictionary with <stage>:{'calls':n,'seconds':s} and 'peakBytes'
+              for stages profiled with tracemalloc (for stages that ran at
+              the same time, the peak of all of them).
+    - counters: Dictionary with <counter>:<number>
+    - metricsFile: JSON file written at exit, or None.
+    - profileStages: Stage names or prefixes to profile.
+    - profileMode: 'cprofile' or 'tracemalloc'.
+    - profileDir: Directory the profiler output is written to.
+    - tracedStages: Number of stages being traced with tracemalloc right now.
+    - startedTracing: Whether configureMetrics() started tracemalloc.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.timers = {}
+        self.counters = {}
+        self.metricsFile = None
+        self.profileStages = []
+        self.profileMode = 'cprofile'
+        self.profileDir = "/tmp"
+        self.profilers = {}
+        self.snapshots = {}
+        self.tracedStages = 0
+        self.startedTracing = False
+        self.startTime = time.perf_counter()
+        self.writeAtExit = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __str__(self):
+        return """>>> METRICS
+- TIMERS: {}
+- COUNTERS: {}""" \
+        .format(str(len(self.timers)), str(len(self.counters)))
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def addTime(self, stage, seconds, peakBytes=None):
+        with self.lock:
+            timer = self.timers.get(stage)
+            if timer is None:
+                timer = {'calls': 0, 'seconds': 0.0}
+                self.timers[stage] = timer
+            timer['calls'] += 1
+            timer['seconds'] += seconds
+            if peakBytes is not None:
+                timer['peakBytes'] = max(timer.get('peakBytes', 0), peakBytes)
+
+    def stageTimer(self, stage):
+        return StageTimer(self, stage)
+
+    def isProfiled(self, stage):
+        for profileStage in self.profileStages:
+            if stage == profileStage or stage.startswith(profileStage + "."):
+                return True
+        return False
+
+    def getProfiler(self, stage):
+        """
+        A new profiler for every call, since stages can run on several
+        threads at once. They are added together in writeProfiles().
+        """
+        import cProfile
+        profiler = cProfile.Profile()
+        with self.lock:
+            self.profilers.setdefault(stage, []).append(profiler)
+        return profiler
+
+    def startTrace(self):
+        """
+        The peak is only reset when no other stage is being traced, so the
+        peak of stages running at the same time covers all of them.
+        """
+        import tracemalloc
+        with self.lock:
+            if self.tracedStages == 0 and tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            self.tracedStages += 1
+
+    def stopTrace(self, stage):
+        """
+        Keeps a snapshot of the stage and returns its peak memory, or None
+        if tracemalloc isn't tracing (it was stopped by someone else).
+        """
+        import tracemalloc
+        with self.lock:
+            self.tracedStages -= 1
+            if not tracemalloc.is_tracing():
+                return None
+            peakBytes = tracemalloc.get_traced_memory()[1]
+        try:
+            snapshot = tracemalloc.take_snapshot()
+        except RuntimeError:
+            return peakBytes
+        with self.lock:
+            self.snapshots[stage] = snapshot
+        return peakBytes
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.profilers = {}
+            self.snapshots = {}
+            self.startTime = time.perf_counter()
+
+    def getMetrics(self):
+        with self.lock:
+            return {
+                'command': sys.argv,
+                'wallSeconds': round(time.perf_counter() - self.startTime, 6),
+                'timers': {stage: dict(timer, seconds=round(timer['seconds'], 6))
+                           for stage, timer in sorted(self.timers.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def writeMetrics(self):
+        if self.metricsFile is None:
+            return
+        with open(self.metricsFile, 'w') as metricsOut:
+            json.dump(self.getMetrics(), metricsOut, indent=1)
+
+    def writeAll(self):
+        self.writeMetrics()
+        self.writeProfiles()
+        if self.startedTracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    def writeProfiles(self):
+        import pstats
+        if self.profilers or self.snapshots:
+            os.makedirs(self.profileDir, exist_ok=True)
+        for stage, profilers in self.profilers.items():
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(os.path.join(self.profileDir, "profile_" + stage + ".prof"))
+        for stage, snapshot in self.snapshots.items():
+            with open(os.path.join(self.profileDir, "tracemalloc_" + stage + ".txt"), 'w') as statsOut:
+                for stat in snapshot.statistics('lineno')[:25]:
+                    statsOut.write(str(stat) + "\n")
+
+
+metrics = Metrics()
@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+
+"""
+How titles, names and ratings are compared across the containers. The
+dashboard, lint, release pack, scheduler and catalog all match songs and
+people written slightly differently in different places (folder names,
+chart files, judge notes), so they all use these.
+"""
+
+import re
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getSongKey(title):
+    """
+    Title used to find the same song in different folders: lowercase with
+    only letters and digits, so 'asdfmovie 6 song' and 'asdfmovie6 song' match.
+    Also used for stepartist and judge names.
+    """
+    return re.sub("[\W_]+", "", title.lower())
+
+def getTitleKey(title):
+    """
+    getSongKey() of the title without leading tags like [Resubmission];
+    the judgments lose the tag on songs with a special rating.
+    """
+    return getSongKey(re.sub("^(\\[[^\\]]*\\]\\s*)+", "", title))
+
+def getRatingValue(rating):
+    """
+    The number in a rating from JudgeNotes, e.g. 8.5 for '8.5', or None for
+    ratings without one such as 'PASS' or '*'.
+    """
+    if rating is None:
+        return None
+    numeric = re.search("^([\d]+\.?[\d]*)", str(rating).strip())
+    if numeric is not None:
+        return float(numeric.group(1))
+    return None
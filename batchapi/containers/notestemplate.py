@@ -9,41 +9,23 @@ NotesTemplate is used for creating the judge notes file template.
 ArtistForNotes is used for adding stepartists to judge notes files.
 """
 
+import io
 import re
 import os
 import sys
+import json
+import stat
+from .csvtable import BatchCsvTable
+from .metrics import timed, count
 
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
 import logging
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make notesTemplateLogger logger object.
 notesTemplateLogger = logging.getLogger("NOTESTEMPLATE")
-notesTemplateLogger.setLevel(logging.DEBUG)
-notesTemplateFileH = logging.FileHandler('/tmp/notesTemplate.log')
-notesTemplateFileH.setLevel(logging.DEBUG)
-notesTemplateConsoleH = logging.StreamHandler()
-notesTemplateConsoleH.setLevel(logging.WARNING)
-notesTemplateFileH.setFormatter(dateformatter)
-notesTemplateConsoleH.setFormatter(dateformatter)
-notesTemplateLogger.addHandler(notesTemplateFileH)  # File Handler add
-notesTemplateLogger.addHandler(notesTemplateConsoleH)  # Console Handler add
-
-# Make artistToNotesLogger logger object.
 artistToNotesLogger = logging.getLogger("ARTISTFORNOTES")
-artistToNotesLogger.setLevel(logging.DEBUG)
-artistToNotesFileH = logging.FileHandler('/tmp/artistToNotes.log')
-artistToNotesFileH.setLevel(logging.DEBUG)
-artistToNotesConsoleH = logging.StreamHandler()
-artistToNotesConsoleH.setLevel(logging.WARNING)
-artistToNotesFileH.setFormatter(dateformatter)
-artistToNotesConsoleH.setFormatter(dateformatter)
-artistToNotesLogger.addHandler(artistToNotesFileH)  # File Handler add
-artistToNotesLogger.addHandler(artistToNotesConsoleH)  # Console Handler add
 
 #####################
 # CLASS DEFINITIONS #
@@ -67,16 +49,20 @@ class NotesTemplate():
     - titleIndex: Column position index of song title in CSV file.
     - stepperIndex: Column position index of stepartist in CSV file.
     - artistIndex: Column position index of song artist in CSV file.
+    - csvTable: BatchCsvTable with the parsed CSV file. It can be passed in so
+                the CSV is only parsed once for several templates/artist adds;
+                otherwise it is loaded the first time it's needed.
 
     * FUNCTIONS *
     - dumpInfo(): Prints out information about currently referenced NotesTemplate Object
     """
 
-    def __init__(self, csvPath, searchList):
+    def __init__(self, csvPath, searchList, csvTable=None):
         """
         Constructor
         """
         self.path = csvPath
+        self.csvTable = csvTable
         self.fileDir = os.path.abspath(os.path.join(os.path.dirname(self.path), '.'))
         self.csvFile = os.path.basename(os.path.normpath(self.path))
         self.batchName = str((os.path.basename(os.path.normpath(self.path))).split(".csv")[0])
@@ -116,22 +102,34 @@ class NotesTemplate():
 
         notesTemplateLogger.info("getFieldIndices: Parsing CSV File's Column Header to get field indices")
         try:
-            os.chdir(self.fileDir)  # Change to csv file directory context
-            with open(self.csvFile) as fileCSV:
-                for line in fileCSV:
-                    if line.startswith('[FOLDER]'):
-                        break
-            fileCSV.close()
-            rawFieldList = line.strip().split(",")
-            counter = 0  # Fields start at index 0
-            for field in rawFieldList:
-                rawField = field.strip("[]\s")
-                self.fieldToIndex[rawField] = counter
-                counter += 1  # Indicate the index for the next field
+            self.fieldToIndex = dict(self.getCsvTable().fieldToIndex)
         except:
             notesTemplateLogger.warning("getFieldIndices: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                            str(sys.exc_info()[1])))
 
+    def getCsvTable(self):
+        if self.csvTable is None:
+            self.csvTable = BatchCsvTable(self.path).load()
+        return self.csvTable
+
+    def getRowValue(self, row, index):
+        if index < len(row):
+            return row[index]
+        return ""
+
+    def getTemplateEntries(self):
+        """
+        Yields the template text for each song in the CSV file, in order.
+        """
+        for row in self.getCsvTable().rows:
+            songTitle = self.getRowValue(row, self.titleIndex)
+            songArtist = self.getRowValue(row, self.artistIndex)
+            if songTitle == "":
+                songTitle = row[0]  # First CSV column is ALWAYS folder name
+            if songArtist == "":
+                songArtist = "UNKNOWN"  # this is a way of indicating files where artist names weren't parsed
+            yield "[/10] " + songTitle + " {" + songArtist + "}\n-\n-\n"
+
     def getRelevantFields(self):
         """
         Get relevant indices for the fields we're searching for.
@@ -171,27 +169,14 @@ class NotesTemplate():
 
         notesTemplateLogger.info("printTemplate: Testing parsing for writing file")
         try:
-            os.chdir(self.fileDir)  # Change to csv file directory context
-            with open(self.csvFile) as fileCSV:
-                print("")
-                for line in fileCSV:
-                    if line.startswith('[FOLDER]'):
-                        continue
-                    lineValues = line.split(",")  # CSV file separates fields by commas
-                    songTitle = lineValues[self.titleIndex].strip()
-                    songArtist = lineValues[self.artistIndex].strip()
-                    stepArtist = lineValues[self.stepperIndex].strip()
-                    if songTitle == "":
-                        songTitle = lineValues[0].strip()  # First CSV column is ALWAYS folder name
-                    if songArtist == "":
-                        songArtist = "UNKNOWN"  # this is a way of indicating files where artist names weren't parsed
-                    stringToPrint = "[/10] " + songTitle + " {" + songArtist + "}\n-\n-\n"
-                    print(stringToPrint)
-            fileCSV.close()
+            print("")
+            for stringToPrint in self.getTemplateEntries():
+                print(stringToPrint)
         except:
             notesTemplateLogger.warning("printTemplate: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                          str(sys.exc_info()[1])))
 
+    @timed("notesTemplate.write")
     def writeTemplateFile(self):
         """
         Basically printTemplate except this is used to actually write out
@@ -200,23 +185,9 @@ class NotesTemplate():
 
         notesTemplateLogger.info("writeTemplateFile: Writing Template File '%s'", self.outputFile)
         try:
-            os.chdir(self.fileDir)  # Change to csv file directory context
-            with open(self.outputFile, 'w') as template:
-                with open(self.csvFile) as fileCSV:
-                    for line in fileCSV:
-                        if line.startswith('[FOLDER]'):
-                            continue
-                        lineValues = line.split(",")  # CSV file separates fields by commas
-                        songTitle = lineValues[self.titleIndex].strip()
-                        songArtist = lineValues[self.artistIndex].strip()
-                        stepArtist = lineValues[self.stepperIndex].strip()
-                        if songTitle == "":
-                            songTitle = lineValues[0].strip()  # First CSV column is ALWAYS folder name
-                        if songArtist == "":
-                            songArtist = "UNKNOWN"  # this is a way of indicating files where artist names weren't parsed
-                        lineToWrite = "[/10] " + songTitle + " {" + songArtist + "}\n-\n-\n\n"
-                        template.write(lineToWrite)
-            fileCSV.close()
+            with open(os.path.join(self.fileDir, self.outputFile), 'w') as template:
+                for lineToWrite in self.getTemplateEntries():
+                    template.write(lineToWrite + "\n")
             template.close()
             notesTemplateLogger.info("writeTemplateFile: Successfully wrote file '%s'", self.outputFile)
 
@@ -230,14 +201,23 @@ class ArtistForNotes(NotesTemplate):
     """
     This class uses the .csv file generated from batch.py as an
     ordered list of stepartists to add to the judge notes files.
+    Like NotesTemplate it can share an already loaded BatchCsvTable.
 
     Inherits from NotesTemplate, so no init statement here.
     Notable attributes for this application:
 
     - listOfSteppers: Ordered list of stepartists from CSV file.
     - judgeFiles: List of judge files to append stepartist to.
+    - stepperManifest: Ending of the file next to the set directory that records
+                       which judge files were already done (see addSteppersToFile),
+                       e.g. set1_steppers_manifest.json for set1. It is kept out of
+                       the set directory, where every file is taken for judge notes.
+    - maxWorkers: Number of judge files to write at the same time.
     """
 
+    stepperManifest = "_steppers_manifest.json"
+    maxWorkers = None
+
     def getAllSteppers(self):
         """
         Retrieve ordered list of song artists from CSV file.
@@ -245,16 +225,7 @@ class ArtistForNotes(NotesTemplate):
 
         artistToNotesLogger.info("getAllSteppers: Retrieving ordered list of stepartists from CSV File")
         try:
-            stepperList = []
-            with open(self.csvFile) as fileCSV:
-                for line in fileCSV:
-                    if line.startswith('[FOLDER]'):
-                        continue
-                    lineValues = line.split(",")  # CSV file separates fields by commas
-                    stepArtist = lineValues[self.stepperIndex].strip()
-                    stepperList.append(stepArtist)
-            fileCSV.close()
-            self.listOfSteppers = stepperList
+            self.listOfSteppers = [self.getRowValue(row, self.stepperIndex) for row in self.getCsvTable().rows]
         except:
             artistToNotesLogger.warning("getAllSteppers: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                           str(sys.exc_info()[1])))
@@ -263,14 +234,14 @@ class ArtistForNotes(NotesTemplate):
         """
         Get all judge notes file names in set directory. This is assuming
         the judge notes files do not have any stepartists added to them
-        yet.
+        yet. Files written by addSteppersToFile are skipped.
         """
         artistToNotesLogger.info("getJudgeFilesForAdd: Determining Judge Files to add stepartist to")
         try:
             notesFiles = []
             allFiles = os.listdir(self.fileDir)  # Retrieve a list of files from the set directory
             for file in allFiles:
-                if file.endswith(".txt"):
+                if file.endswith(".txt") and not file.endswith("_steppers.txt"):
                     notesFiles.append(file)
             self.judgeFiles = notesFiles
 
@@ -307,7 +278,6 @@ class ArtistForNotes(NotesTemplate):
         try:
             self.judgeNames = []
             self.judgeToFileName = {}
-            os.chdir(self.fileDir)
             for judgeNotesFile in self.judgeFiles:
                 self.getJudgeName(judgeNotesFile) # getJudgeName also appends to judge name list
         except:
@@ -327,28 +297,107 @@ class ArtistForNotes(NotesTemplate):
             artistToNotesLogger.warning("addStepArtistToLine: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                                str(sys.exc_info()[1])))
 
-    def addSteppersToFile(self):
+    def getStepperOutputFile(self, judgeNotesFile):
+        return (judgeNotesFile.split(".txt")[0]) + "_steppers.txt"
+
+    def getStepperManifestPath(self):
+        return os.path.normpath(self.fileDir) + self.stepperManifest
+
+    def loadStepperManifest(self):
+        """
+        The manifest records, for each judge notes file, the hash of its
+        contents and of the stepartist list when its _steppers.txt was written.
+        """
+        try:
+            with open(self.getStepperManifestPath()) as manifest:
+                return json.load(manifest)
+        except FileNotFoundError:
+            return {}
+        except:
+            artistToNotesLogger.warning("loadStepperManifest: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                               str(sys.exc_info()[1])))
+            return {}
 
+    def writeAtomically(self, filePath, text):
+        """
+        Writes to a temp file in the same directory and renames it over filePath,
+        so filePath is either the old file or the whole new one, never half of it.
+        The temp file doesn't end in .txt, so one left behind by a crash is never
+        taken for a judge notes file. It is made with the permissions open() would
+        give a new file, or those of the file it replaces, not mkstemp's 0600.
+        """
+        tempPath = os.path.join(os.path.dirname(filePath), ".tmp_" + os.urandom(6).hex() + ".tmp")
+        tempHandle = os.open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(tempHandle, 'w') as tempFile:
+                tempFile.write(text)
+            if os.path.exists(filePath):
+                os.chmod(tempPath, stat.S_IMODE(os.stat(filePath).st_mode))
+            os.replace(tempPath, filePath)
+        except:
+            os.remove(tempPath)
+            raise
+
+    def addSteppersToOneFile(self, judgeNotesFile, manifestEntry, steppersHash):
+        """
+        Writes the _steppers.txt file for one judge notes file. Returns the new
+        manifest entry, or None if it failed. Nothing is written if the notes
+        and stepartist list are the same as last time and the output still exists.
+        """
+        import hashlib
+        try:
+            outFile = self.getStepperOutputFile(judgeNotesFile)
+            with open(os.path.join(self.fileDir, judgeNotesFile), 'rb') as judgeFile:
+                rawNotes = judgeFile.read()
+            count("artistForNotes.bytesRead", len(rawNotes))
+            entry = {'notesHash': hashlib.sha1(rawNotes).hexdigest(), 'steppersHash': steppersHash,
+                     'outputFile': outFile}
+            if manifestEntry == entry and os.path.exists(os.path.join(self.fileDir, outFile)):
+                artistToNotesLogger.info("addSteppersToOneFile: '%s' is up to date", outFile)
+                count("artistForNotes.filesUpToDate")
+                return entry
+
+            artistToNotesLogger.info("addSteppersToOneFile: Writing New Judge File '%s'", outFile)
+            stepperAddedLines = []
+            fileCounter = 0  # Needed for ordered list of stepartists
+            for line in io.TextIOWrapper(io.BytesIO(rawNotes)):
+                if line.startswith('['):
+                    lineToReplace = self.addStepArtistToLine(line.strip(), fileCounter)
+                    stepperAddedLines.append(lineToReplace+"\n")
+                    fileCounter += 1
+                else:
+                    stepperAddedLines.append(line)
+            self.writeAtomically(os.path.join(self.fileDir, outFile), "".join(stepperAddedLines))
+            count("artistForNotes.filesWritten")
+            count("artistForNotes.linesParsed", len(stepperAddedLines))
+            return entry
+        except:
+            artistToNotesLogger.warning("addSteppersToOneFile: '{0}': {1}: {2}".format(judgeNotesFile,
+                                        sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
+            return None
+
+    @timed("artistForNotes.addSteppers")
+    def addSteppersToFile(self):
+        """
+        Writes the _steppers.txt file for every judge file at the same time.
+        Files that were already done with the same notes and stepartists are
+        skipped, so a rerun after one late judge only writes that judge's file.
+        """
+        import hashlib
+        from concurrent.futures import ThreadPoolExecutor
         artistToNotesLogger.info("addSteppersToFile: Writing new files with stepartists added to Notes.")
         try:
-            os.chdir(self.fileDir)
-            for judgeNotesFile in self.judgeFiles:
-                outFile = (judgeNotesFile.split(".txt")[0]) + "_steppers.txt"
-                artistToNotesLogger.info("addSteppersToFile: Writing New Judge File '%s'", outFile)
-                with open(outFile, 'w') as stepperAddedFile:
-                    fileCounter = 0  # Needed for ordered list of stepartists
-                    with open(judgeNotesFile) as judgeFile:
-                        for line in judgeFile:
-                            if line.startswith('['):
-                                lineToReplace = self.addStepArtistToLine(line.strip(), fileCounter)
-                                stepperAddedFile.write(lineToReplace+"\n")
-                                fileCounter += 1
-                            else:
-                                stepperAddedFile.write(line)
-                judgeFile.close()
-                stepperAddedFile.close()
-            
+            manifest = self.loadStepperManifest()
+            steppersHash = hashlib.sha1("\n".join(self.listOfSteppers).encode("utf-8")).hexdigest()
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                newEntries = list(executor.map(lambda judgeNotesFile: self.addSteppersToOneFile(
+                    judgeNotesFile, manifest.get(judgeNotesFile), steppersHash), self.judgeFiles))
+            for judgeNotesFile, entry in zip(self.judgeFiles, newEntries):
+                if entry is not None:
+                    manifest[judgeNotesFile] = entry
+                else:
+                    manifest.pop(judgeNotesFile, None)  # Failed files are redone next time
+            self.writeAtomically(self.getStepperManifestPath(), json.dumps(manifest, indent=1, sort_keys=True))
         except:
             artistToNotesLogger.warning("addSteppersToFile: {0}: {1}".format(sys.exc_info()[0].__name__,
                                                                              str(sys.exc_info()[1])))
-
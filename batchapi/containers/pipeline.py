@@ -0,0 +1,498 @@
+#!/usr/bin/python3
+
+"""
+There are two classes defined here:
+- PipelineStage
+- BatchPipeline
+
+A PipelineStage is one step of a monthly run (song listing, template,
+stepartists, judgments, feedback, forum post). BatchPipeline runs the
+stages as a dependency graph in a single process: a stage starts as soon
+as every stage it depends on is done, independent stages run at the same
+time, and the parsed objects a stage returns are handed to the stages
+after it instead of being written out and read back.
+
+Every stage has a fingerprint made from its options, the files it reads
+and the fingerprints of the stages before it. Fingerprints are kept in a
+state file; a stage whose fingerprint hasn't changed and whose output
+files are still there is skipped, and its result is loaded from those
+output files if a later stage needs it.
+
+The listing, judgments and post stages also record every song folder,
+judge file and fragment in a checkpoint journal (see checkpoint.py). A
+stage with a unit that couldn't be read is incomplete: it runs again next
+time, and only the failed and changed units are redone.
+"""
+
+import os
+import sys
+import json
+from .lazy import getFileStamp
+from .judge import isJudgeNotesFile
+from .metrics import stageTimer, count
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+pipelineLogger = logging.getLogger("PIPELINE")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getTreeStamps(path, fileFilter=None, subdirsOnly=False):
+    """
+    Returns a sorted list of [relative path, file stamp] for the files under
+    path. With subdirsOnly, files directly in path are left out (e.g. the
+    CSV file written into a batch folder). fileFilter is a function taking a
+    file name and returning whether it counts.
+    """
+    stamps = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        if subdirsOnly and root == path:
+            continue
+        for file in sorted(files):
+            if fileFilter is None or fileFilter(file):
+                fullPath = os.path.join(root, file)
+                stamps.append([os.path.relpath(fullPath, path), getFileStamp(fullPath)])
+    return stamps
+
+def getDirStamps(path, fileFilter=None):
+    """
+    Like getTreeStamps, but only for the files directly in path.
+    """
+    stamps = []
+    for file in sorted(os.listdir(path)):
+        fullPath = os.path.join(path, file)
+        if os.path.isfile(fullPath) and (fileFilter is None or fileFilter(file)):
+            stamps.append([file, getFileStamp(fullPath)])
+    return stamps
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class PipelineStage():
+    """
+    One step of the pipeline.
+
+    * CLASS ATTRIBUTES *
+    - name: Name of the stage, also used with --stages on the command line.
+    - requires: Names of the stages that have to be done before this one.
+    - run: Function taking the dictionary of <stage name>:<result> of the
+           stages done so far and returning this stage's result.
+    - inputs: Function returning something JSON serializable that changes
+              whenever the files or options the stage reads change.
+    - outputs: Function returning the paths of the files the stage writes.
+    - load: Function taking the results dictionary and returning the result
+            from the output files, for when the stage is skipped. None if
+            later stages don't need the result.
+    - units: Kinds of unit the stage records in the checkpoint journal (see
+             checkpoint.py). If one of them couldn't be read (a transient
+             failure), the stage is incomplete.
+    """
+
+    def __init__(self, name, requires, run, inputs, outputs, load=None, units=None):
+        """
+        Constructor
+        """
+        self.name = name
+        self.requires = requires
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.load = load
+        self.units = units if units is not None else []
+
+    def __str__(self):
+        return """>>> PIPELINE STAGE
+- NAME: {}
+- REQUIRES: {}""" \
+        .format(self.name, self.requires)
+
+
+class BatchPipeline():
+    """
+    Runs the stages of a monthly batch run that the given directories
+    allow for:
+
+    - listing: Parses the batch folder and writes <batch>.csv   (batchDir)
+    - assets: Checks the files the chart files refer to         (batchDir)
+    - template: Writes the template judge notes file            (batchDir)
+    - steppers: Adds stepartists to the judge notes in setDir   (batchDir, setDir)
+    - judgments: Writes judgments_<set>.csv for setDir          (setDir)
+    - feedback: Writes a feedback file for each stepartist      (setDir)
+    - post: Writes the forum post for the sets in notesDir      (notesDir)
+    - catalog: Loads the songs and ratings into catalogFile     (catalogFile and batchDir or notesDir)
+
+    The song listing is parsed once and handed to template and steppers.
+    assets needs nothing, so it runs while the listing is parsed.
+    judgments and feedback wait for steppers if it runs, since they read
+    the judge notes with stepartists added.
+
+    * CLASS ATTRIBUTES *
+    - batchDir: Full path to the batch folder of songs, or None.
+    - setDir: Full path to the set folder with the judge notes, or None.
+    - notesDir: Full path to the folder of set folders for the forum post, or None.
+    - stateFile: JSON file with the fingerprint of each stage from the last run.
+    - journalFile: Checkpoint journal of the run (see checkpoint.py). It is
+                   removed once a run has no transient failures and no failed
+                   stages; until then each run picks up the units done before.
+    - journal: The CheckpointJournal while run() goes on.
+    - force: Set to True to run every stage even if its inputs are unchanged.
+    - maxWorkers: Number of stages to run at the same time.
+    - postFormats: Post templates for the forum post (see posttemplate.py).
+    - catalogFile: SQLite catalog to load the batch into (see catalog.py), or None.
+    - stages: Dictionary with <stage name>:PipelineStage for every stage that can run.
+    - stageStatus: Dictionary with <stage name>:'ran', 'skipped', 'incomplete' or
+                   'failed' after run(). An incomplete stage ran but some of its
+                   units couldn't be read; it and the stages after it run again
+                   next time.
+    """
+
+    def __init__(self, batchDir=None, setDir=None, notesDir=None, stateFile=None, maxWorkers=None,
+                 postFormats=None, catalogFile=None, journalFile=None):
+        """
+        Constructor
+        """
+        self.batchDir = batchDir
+        self.setDir = setDir
+        self.notesDir = notesDir
+        if stateFile is None:
+            stateDir = [path for path in (batchDir, setDir, notesDir) if path is not None][0]
+            stateFile = os.path.join(stateDir, ".batchapi_run.json")
+        self.stateFile = stateFile
+        if journalFile is None:
+            journalFile = os.path.join(os.path.dirname(stateFile), ".batchapi_journal.jsonl")
+        self.journalFile = journalFile
+        self.journal = None
+        self.force = False
+        self.maxWorkers = maxWorkers
+        self.postFormats = postFormats
+        self.catalogFile = catalogFile
+        self.listingBatch = None
+        self.stages = {}
+        self.stageStatus = {}
+        self.stageResults = {}
+        self.fingerprints = {}
+        self.addStages()
+
+    def __str__(self):
+        return """>>> BATCH PIPELINE
+- BATCH DIR: {}
+- SET DIR: {}
+- NOTES DIR: {}
+- STATE FILE: {}
+- STAGES: {}""" \
+        .format(self.batchDir, self.setDir, self.notesDir, self.stateFile, list(self.stages.keys()))
+
+    ##########
+    # STAGES #
+    ##########
+
+    def getCsvPath(self):
+        batchDir = os.path.normpath(self.batchDir)
+        return os.path.join(batchDir, os.path.basename(batchDir) + ".csv")
+
+    def runListing(self, results):
+        from .batchcontainer import BatchContainer
+        batch = BatchContainer(self.batchDir)
+        batch.setSmFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        batch.setDwiFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        batch.journal = self.journal
+        batch.getFolderList()
+        batch.construct()
+        batch.parseSimfiles()
+        batch.createCsvSongListing()
+        self.listingBatch = batch  # Kept for the catalog, which also wants the chart files
+        return batch.getCsvTable()
+
+    def runAssets(self, results):
+        """
+        The inspection runs in its own process (see assets.startInspection),
+        so it doesn't slow down the listing stage running next to it.
+        """
+        from .assets import startInspection
+        inspector = startInspection(self.batchDir).result()
+        if inspector.problems:
+            pipelineLogger.warning("runAssets: %s song folders have asset problems, see '%s'",
+                                   str(len(inspector.problems)), self.getAssetsReportPath())
+        return inspector
+
+    def getAssetsReportPath(self):
+        batchDir = os.path.normpath(self.batchDir)
+        return os.path.join(batchDir, os.path.basename(batchDir) + "_assets.txt")
+
+    def loadListing(self, results):
+        from .csvtable import BatchCsvTable
+        return BatchCsvTable(self.getCsvPath()).load()
+
+    def getTemplate(self, results):
+        from .notestemplate import NotesTemplate
+        csvTable = results['listing']
+        templateNotes = NotesTemplate(csvTable.path, ['ARTIST', 'TITLE', 'STEPARTIST'], csvTable=csvTable)
+        templateNotes.getFieldIndices()
+        templateNotes.getRelevantFields()
+        return templateNotes
+
+    def runTemplate(self, results):
+        self.getTemplate(results).writeTemplateFile()
+
+    def getTemplatePath(self):
+        return os.path.join(self.batchDir, "template_" + os.path.basename(os.path.normpath(self.batchDir)) + ".txt")
+
+    def runSteppers(self, results):
+        """
+        The CSV file doesn't have to be copied into the set folder; the
+        listing parsed by the listing stage is used directly.
+        """
+        from .notestemplate import ArtistForNotes
+        csvTable = results['listing']
+        artistAdd = ArtistForNotes(os.path.join(self.setDir, os.path.basename(csvTable.path)), ['STEPARTIST'],
+                                   csvTable=csvTable)
+        artistAdd.getFieldIndices()
+        artistAdd.getRelevantFields()
+        artistAdd.getJudgeFilesForAdd()
+        artistAdd.getAllJudgesInSet()
+        artistAdd.getAllSteppers()
+        artistAdd.addSteppersToFile()
+        return artistAdd
+
+    def getStepperPaths(self):
+        return [os.path.join(self.setDir, fileName) for fileName in os.listdir(self.setDir)
+                if fileName.endswith("_steppers.txt")]
+
+    def runJudgments(self, results):
+        from .judge import JudgesForExcel
+        judgeSet = JudgesForExcel(self.setDir)
+        judgeSet.journal = self.journal
+        judgeSet.createRatingCSV()
+        return judgeSet
+
+    def runFeedback(self, results):
+        from .feedback import StepartistFeedback
+        feedback = StepartistFeedback(self.setDir)
+        feedback.buildIndices()
+        feedback.writeAllFeedback()
+        return feedback
+
+    def runPost(self, results):
+        from .format import FormatNotes
+        notesFormat = FormatNotes(self.notesDir, postFormats=self.postFormats)
+        notesFormat.journal = self.journal
+        notesFormat.getSetJudgeInfo()
+        notesFormat.makeFormattedPost()
+        return notesFormat
+
+    def getPostPaths(self):
+        from .format import FormatNotes
+        from .posttemplate import compilePostTemplates
+        notesFormat = FormatNotes(self.notesDir, postFormats=self.postFormats)
+        return [os.path.join(self.notesDir, notesFormat.getPostFileName(postTemplate))
+                for postTemplate in compilePostTemplates(notesFormat.postFormats)]
+
+    def runCatalog(self, results):
+        """
+        The songs go in under the batch folder's name, and so do the sets in
+        notesDir when there is a batch folder; otherwise the sets go in under
+        the name of notesDir.
+        """
+        from .catalog import BatchCatalog
+        from .judge import BatchJudgesForExcel
+        batchName = os.path.basename(os.path.normpath(self.batchDir)) if self.batchDir is not None else None
+        with BatchCatalog(self.catalogFile) as catalog:
+            if self.listingBatch is not None:
+                catalog.loadBatch(self.listingBatch, batchName)
+            elif 'listing' in results:
+                catalog.loadSongListing(results['listing'], batchName)
+            if self.notesDir is not None:
+                batchJudges = BatchJudgesForExcel(self.notesDir)
+                batchJudges.getSetDirs()
+                catalog.loadBatchJudgments(batchJudges, batchName)
+
+    def addStages(self):
+        """
+        Adds the stages the given directories allow for.
+        """
+        if self.batchDir is not None:
+            self.addStage(PipelineStage(
+                'listing', [], self.runListing,
+                lambda: getTreeStamps(self.batchDir, subdirsOnly=True),
+                lambda: [self.getCsvPath()], load=self.loadListing, units=['folder']))
+            self.addStage(PipelineStage(
+                'assets', [], self.runAssets,
+                lambda: getTreeStamps(self.batchDir, subdirsOnly=True),
+                lambda: [self.getAssetsReportPath()]))
+            self.addStage(PipelineStage(
+                'template', ['listing'], self.runTemplate,
+                lambda: [],
+                lambda: [self.getTemplatePath()]))
+        if self.setDir is not None:
+            if self.batchDir is not None:
+                self.addStage(PipelineStage(
+                    'steppers', ['listing'], self.runSteppers,
+                    lambda: getDirStamps(self.setDir, fileFilter=lambda file: file.endswith(".txt") and not
+                                          file.endswith("_steppers.txt")),
+                    self.getStepperPaths))
+            setRequires = ['steppers'] if 'steppers' in self.stages else []
+            self.addStage(PipelineStage(
+                'judgments', setRequires, self.runJudgments,
+                lambda: getDirStamps(self.setDir, fileFilter=isJudgeNotesFile),
+                lambda: [os.path.join(self.setDir, "judgments_" + os.path.basename(os.path.normpath(self.setDir))
+                                      + ".csv")], units=['judgeFile']))
+            self.addStage(PipelineStage(
+                'feedback', setRequires, self.runFeedback,
+                lambda: getDirStamps(self.setDir, fileFilter=isJudgeNotesFile),
+                lambda: [os.path.normpath(self.setDir) + "_feedback"]))
+        if self.notesDir is not None:
+            self.addStage(PipelineStage(
+                'post', [], self.runPost,
+                lambda: [self.postFormats, getTreeStamps(self.notesDir, subdirsOnly=True)],
+                self.getPostPaths, units=['fragment']))
+        if self.catalogFile is not None and (self.batchDir is not None or self.notesDir is not None):
+            self.addStage(PipelineStage(
+                'catalog', ['listing'] if self.batchDir is not None else [], self.runCatalog,
+                lambda: [os.path.abspath(self.catalogFile),
+                         getTreeStamps(self.notesDir, subdirsOnly=True) if self.notesDir is not None else []],
+                lambda: [self.catalogFile]))
+
+    def addStage(self, stage):
+        self.stages[stage.name] = stage
+
+    def selectStages(self, names):
+        """
+        Keeps only the named stages and the stages they depend on.
+        """
+        selected = set()
+        toVisit = list(names)
+        while toVisit:
+            name = toVisit.pop()
+            if name not in self.stages:
+                raise KeyError("Stage '" + name + "' can't run with the given directories")
+            if name not in selected:
+                selected.add(name)
+                toVisit.extend(self.stages[name].requires)
+        self.stages = {name: stage for name, stage in self.stages.items() if name in selected}
+
+    #########
+    # STATE #
+    #########
+
+    def loadState(self):
+        try:
+            with open(self.stateFile) as state:
+                return json.load(state)
+        except FileNotFoundError:
+            return {}
+        except:
+            pipelineLogger.warning("loadState: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                str(sys.exc_info()[1])))
+            return {}
+
+    def saveState(self, state):
+        try:
+            with open(self.stateFile, 'w') as stateOut:
+                json.dump(state, stateOut, indent=1, sort_keys=True)
+        except:
+            pipelineLogger.warning("saveState: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                str(sys.exc_info()[1])))
+
+    def getFingerprint(self, stage):
+        """
+        Hash of the stage's inputs along with the fingerprints of the stages it
+        depends on, so a change upstream also reruns everything after it.
+        """
+        import hashlib
+        upstream = [self.fingerprints[name] for name in sorted(stage.requires)]
+        fingerprintSource = json.dumps([stage.name, stage.inputs(), upstream], sort_keys=True)
+        return hashlib.sha1(fingerprintSource.encode("utf-8")).hexdigest()
+
+    def isUpToDate(self, stage, state):
+        if self.force or state.get(stage.name) != self.fingerprints[stage.name]:
+            return False
+        return all(os.path.exists(path) for path in stage.outputs())
+
+    #######
+    # RUN #
+    #######
+
+    def runStage(self, stage, state):
+        """
+        Runs or skips one stage. Returns (status, result).
+        """
+        with stageTimer("pipeline." + stage.name):
+            self.fingerprints[stage.name] = self.getFingerprint(stage)
+            if self.isUpToDate(stage, state):
+                pipelineLogger.info("runStage: '%s' is up to date, skipping", stage.name)
+                count("pipeline.stagesSkipped")
+                result = stage.load(self.stageResults) if stage.load is not None else None
+                return 'skipped', result
+            pipelineLogger.info("runStage: Running '%s'", stage.name)
+            count("pipeline.stagesRan")
+            result = stage.run(self.stageResults)
+            if stage.units and self.journal.getFailures(stage.units, transientOnly=True):
+                pipelineLogger.warning("runStage: '%s' has units that couldn't be read, it runs again next time",
+                                       stage.name)
+                return 'incomplete', result
+            return 'ran', result
+
+    def run(self):
+        """
+        Runs every stage once all the stages it requires are done. A stage
+        that fails stops the stages after it; the others still run. Only
+        stages that are complete, after complete stages, keep their
+        fingerprint in the state file.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        from .checkpoint import CheckpointJournal
+        pipelineLogger.info("run: Running stages %s", str(list(self.stages.keys())))
+        if self.force and os.path.exists(self.journalFile):
+            os.remove(self.journalFile)
+        self.journal = CheckpointJournal(self.journalFile)
+        state = self.loadState()
+        newState = dict(state)
+        self.stageStatus = {}
+        self.stageResults = {}
+        waiting = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            while waiting or running:
+                for name, stage in list(waiting.items()):
+                    if any(self.stageStatus.get(required) == 'failed' for required in stage.requires):
+                        pipelineLogger.warning("run: Not running '%s', a stage it needs failed", name)
+                        self.stageStatus[name] = 'failed'
+                        del waiting[name]
+                    elif all(required in self.stageStatus for required in stage.requires):
+                        running[executor.submit(self.runStage, stage, state)] = name
+                        del waiting[name]
+                if not running:
+                    continue
+                done, notDone = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status, result = future.result()
+                        self.stageStatus[name] = status
+                        self.stageResults[name] = result
+                        if status == 'incomplete' or any(required not in newState
+                                                         for required in self.stages[name].requires):
+                            newState.pop(name, None)
+                        else:
+                            newState[name] = self.fingerprints[name]
+                    except:
+                        pipelineLogger.warning("run: '{0}': {1}: {2}".format(name, sys.exc_info()[0].__name__,
+                                                                             str(sys.exc_info()[1])))
+                        self.stageStatus[name] = 'failed'
+                        newState.pop(name, None)
+        self.saveState(newState)
+        if self.journal.getFailures(transientOnly=True) or 'failed' in self.stageStatus.values():
+            self.journal.compact()
+            pipelineLogger.info("run: Keeping '%s' for the next run", self.journalFile)
+        else:
+            self.journal.remove()
+        pipelineLogger.info("run: Stage results %s", str(self.stageStatus))
+        return self.stageStatus
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+"""
+Output templates for the forum post made by FormatNotes.
+
+A template spec is a dictionary of format strings, one for each piece
+of the post. compilePostTemplates() turns the specs that were asked for
+into PostTemplate objects once per run; FormatNotes then goes over the
+parsed sets, judges and lines a single time and hands each piece to
+every compiled template.
+
+New formats can be added with registerPostTemplate().
+"""
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def escapeMarkdown(text):
+    """
+    Escapes the characters Discord would otherwise treat as formatting.
+    """
+    for character in "\\*_~`|":
+        text = text.replace(character, "\\" + character)
+    return text
+
+def escapeHtml(text):
+    import html
+    return html.escape(text)
+
+def registerPostTemplate(name, spec):
+    """
+    Adds (or replaces) a template spec under name. See BBCODE_TEMPLATE for
+    the keys a spec needs; 'escape' is optional.
+    """
+    postTemplateSpecs[name] = spec
+
+def compilePostTemplates(names):
+    """
+    Returns a list of compiled PostTemplate objects for the template names.
+    """
+    return [PostTemplate(name, postTemplateSpecs[name]) for name in names]
+
+#############
+# TEMPLATES #
+#############
+
+# Each string gets the values noted next to it through str.format.
+BBCODE_TEMPLATE = {
+    'extension': ".txt",
+    'postStart': "",
+    'outlineSet': "[b][size=4]{0}.) SET {1}[/size][/b]\n",  # set counter, set number
+    'outlineJudge': "[b]{0}.) {1}[/b]\n",  # judge letter, judge name
+    'outlineEnd': "\n",  # This deals with spacing in the first Set posted.
+    'setHeader': "[b][size=7]SET {0}[/size][/b]",  # set number
+    'judgeHeader': "\n\n[b][size=4]=== JUDGE: {0} ===[/size][/b]\n",  # judge name
+    'songLine': "\n[b]{0}[/b]",  # line
+    'notesLine': "\n{0}",  # line
+    'postEnd': "",
+}
+
+MARKDOWN_TEMPLATE = {
+    'extension': ".md",
+    'postStart': "",
+    'outlineSet': "**{0}.) SET {1}**\n",
+    'outlineJudge': "**{0}.) {1}**\n",
+    'outlineEnd': "\n",
+    'setHeader': "\n# SET {0}",
+    'judgeHeader': "\n\n## === JUDGE: {0} ===\n",
+    'songLine': "\n**{0}**",
+    'notesLine': "\n{0}",
+    'postEnd': "\n",
+    'escape': escapeMarkdown,
+}
+
+HTML_TEMPLATE = {
+    'extension': ".html",
+    'postStart': "<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"></head>\n<body>\n",
+    'outlineSet': "<p><b>{0}.) SET {1}</b></p>\n",
+    'outlineJudge': "<p><b>{0}.) {1}</b></p>\n",
+    'outlineEnd': "\n",
+    'setHeader': "<h1>SET {0}</h1>\n",
+    'judgeHeader': "<h2>=== JUDGE: {0} ===</h2>\n",
+    'songLine': "<b>{0}</b><br>\n",
+    'notesLine': "{0}<br>\n",
+    'postEnd': "</body>\n</html>\n",
+    'escape': escapeHtml,
+}
+
+postTemplateSpecs = {
+    'bbcode': BBCODE_TEMPLATE,
+    'markdown': MARKDOWN_TEMPLATE,
+    'html': HTML_TEMPLATE,
+}
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class PostTemplate():
+    """
+    A compiled output template. The format strings of the spec are bound
+    once here, and every piece of the post is appended to the parts list,
+    which is only joined when the post is finished.
+
+    * CLASS ATTRIBUTES *
+    - name: Name the template was registered under.
+    - extension: File extension of the post written with this template.
+    - parts: List of rendered strings making up the post so far.
+    """
+
+    def __init__(self, name, spec):
+        """
+        Constructor
+        """
+        self.name = name
+        self.extension = spec['extension']
+        self.escape = spec.get('escape', None)
+        self.postStart = spec['postStart']
+        self.postEnd = spec['postEnd']
+        self.outlineEnd = spec['outlineEnd']
+        self.formatOutlineSet = spec['outlineSet'].format
+        self.formatOutlineJudge = spec['outlineJudge'].format
+        self.formatSetHeader = spec['setHeader'].format
+        self.formatJudgeHeader = spec['judgeHeader'].format
+        self.formatSongLine = spec['songLine'].format
+        self.formatNotesLine = spec['notesLine'].format
+        self.parts = [self.postStart]
+        self.fragmentStart = 1
+
+    def __str__(self):
+        return """>>> POST TEMPLATE
+- NAME: {}
+- EXTENSION: {}""" \
+        .format(self.name, self.extension)
+
+    def text(self, value):
+        if self.escape is None:
+            return value
+        return self.escape(value)
+
+    def addOutlineSet(self, setCounter, setNum):
+        self.parts.append(self.formatOutlineSet(setCounter, self.text(setNum)))
+
+    def addOutlineJudge(self, judgeLetter, judge):
+        self.parts.append(self.formatOutlineJudge(judgeLetter, self.text(judge)))
+
+    def addOutlineEnd(self):
+        self.parts.append(self.outlineEnd)
+
+    def addSetHeader(self, setNum):
+        self.parts.append(self.formatSetHeader(self.text(setNum)))
+
+    def addJudgeHeader(self, judge):
+        self.parts.append(self.formatJudgeHeader(self.text(judge)))
+
+    def addLine(self, line, isSongLine):
+        if isSongLine:
+            self.parts.append(self.formatSongLine(self.text(line)))
+        else:
+            self.parts.append(self.formatNotesLine(self.text(line)))
+
+    def addFragment(self, fragment):
+        """
+        Adds an already rendered piece of the post, e.g. from a cache.
+        """
+        self.parts.append(fragment)
+
+    def startFragment(self):
+        """
+        Marks the start of a piece of the post that endFragment() will return.
+        """
+        self.fragmentStart = len(self.parts)
+
+    def endFragment(self):
+        """
+        Returns everything added since startFragment() as one string.
+        """
+        fragment = "".join(self.parts[self.fragmentStart:])
+        self.parts[self.fragmentStart:] = [fragment]
+        return fragment
+
+    def getPost(self):
+        return "".join(self.parts) + self.postEnd
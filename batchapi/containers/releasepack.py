@@ -0,0 +1,448 @@
+#!/usr/bin/python3
+
+"""
+Builds the release pack of a batch: one .zip file with the song folders
+of the accepted songs, which used to be zipped by hand after judging.
+
+The accepted songs come from the judgments of the sets (JudgesForExcel,
+the same numbers as the judgments CSV files): every song whose average of
+numeric ratings is at least minAverage. They are matched to their song
+folders through the titles and stepartists BatchContainer reads from the
+chart files.
+
+The pack is written in one pass, in a fixed order (song folders, then the
+files in each, without caring about case), so the same folders always give
+the same bytes no matter how many threads were used:
+
+- Audio, images, video and archives are already compressed. They are
+  stored as they are and copied straight into the pack.
+- Everything else (chart files, lyrics, .wav files) is compressed with
+  zlib in a thread pool, a few files ahead of the one being written;
+  zlib releases the GIL, so this uses every CPU. A file that doesn't get
+  smaller is stored instead.
+
+The pack is written to <pack>.zip.part and each finished member is
+appended to <pack>.zip.journal. If the build is interrupted, the next
+build keeps the members in the journal whose source file didn't change
+and continues after them. Once the central directory is written, the
+.part file is renamed to the pack and the journal removed.
+
+zipfile can't take data that was compressed somewhere else, so the zip
+records are written here with struct (ZIP64 records for files and packs
+over 4 GB).
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+from .metrics import timed, count
+from .normalize import getTitleKey
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+packLogger = logging.getLogger("PACK")
+
+##############
+# ZIP FORMAT #
+##############
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_END_LOCATOR = struct.Struct("<IIQI")
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_MARGIN = 1 << 24  # Deflate can make incompressible data a little bigger
+UTF8_FLAG = 0x800
+STORED = 0
+DEFLATED = 8
+
+# Extensions of files that are already compressed and are stored as they are.
+storedExtensions = {'.mp3', '.ogg', '.oga', '.opus', '.m4a', '.aac', '.wma', '.flac',
+                    '.png', '.jpg', '.jpeg', '.gif', '.webp',
+                    '.avi', '.mp4', '.m4v', '.mpg', '.mpeg', '.mkv', '.webm', '.wmv', '.flv',
+                    '.zip', '.7z', '.rar', '.gz'}
+
+# Files the file manager leaves behind that don't go into the pack.
+skippedFiles = {'thumbs.db', 'desktop.ini', '.ds_store'}
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getDosDateTime(modifiedTime):
+    """
+    Returns (time, date) in MS-DOS format for a modification time in
+    seconds. Zip files can't hold dates before 1980.
+    """
+    year, month, day, hour, minute, second = time.localtime(modifiedTime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def getZip64Extra(*values):
+    return struct.pack("<HH", 0x0001, 8 * len(values)) + b"".join(struct.pack("<Q", value) for value in values)
+
+def compressMember(sourcePath, level):
+    """
+    Reads and compresses one file for the pack. Returns (method, crc,
+    file size, data); data is the raw file when compressing doesn't help.
+    """
+    with open(sourcePath, 'rb') as sourceFile:
+        raw = sourceFile.read()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(raw) + compressor.flush()
+    count("pack.bytesRead", len(raw))
+    if len(compressed) < len(raw):
+        return DEFLATED, zlib.crc32(raw), len(raw), compressed
+    return STORED, zlib.crc32(raw), len(raw), raw
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class ReleasePack():
+    """
+    * CLASS ATTRIBUTES *
+    - batchPath: Full path to the batch folder of songs.
+    - notesPath: Full path to a folder of set folders of notes, or to one set.
+    - path: Full path to the .zip file to write.
+    - packName: Name of the pack; the song folders go in a folder of this name.
+    - partPath: File the pack is written to until it is finished.
+    - journalPath: File listing the members already in partPath.
+    - minAverage: Lowest average rating of an accepted song.
+    - level: zlib compression level for the files that are compressed.
+    - maxWorkers: Number of files to compress at the same time.
+    - bufferLimit: Files to compress that are bigger than this many bytes
+                   are compressed while they are written instead of in the
+                   thread pool, so they are never held in memory whole.
+    - acceptedSongs: List of (title, stepartist, set, average) of the accepted songs.
+    - songFolders: List of song folder names going into the pack, in pack order.
+    - unmatchedSongs: Accepted songs without a song folder in the batch.
+    - members: List of the files going into the pack, as dictionaries.
+    - resumedMembers: Number of members kept from an interrupted build.
+    """
+
+    def __init__(self, batchDir, notesDir, outputFile=None, minAverage=7.0, level=6, maxWorkers=None):
+        """
+        Constructor. The pack goes next to the batch folder by default,
+        as <batch>_release.zip.
+        """
+        self.batchPath = os.path.normpath(batchDir)
+        self.notesPath = os.path.normpath(notesDir)
+        if outputFile is None:
+            outputFile = self.batchPath + "_release.zip"
+        self.path = outputFile
+        self.packName = os.path.splitext(os.path.basename(outputFile))[0]
+        self.partPath = self.path + ".part"
+        self.journalPath = self.path + ".journal"
+        self.minAverage = minAverage
+        self.level = level
+        self.maxWorkers = maxWorkers if maxWorkers is not None else min(32, (os.cpu_count() or 1) + 4)
+        self.bufferLimit = 16 * 1024 * 1024
+        self.acceptedSongs = []
+        self.songFolders = []
+        self.unmatchedSongs = []
+        self.members = []
+        self.resumedMembers = 0
+
+    def __str__(self):
+        return """>>> RELEASE PACK
+- BATCH PATH: {}
+- NOTES PATH: {}
+- PACK FILE: {}
+- MINIMUM AVERAGE: {}
+- ACCEPTED SONGS: {}
+- SONG FOLDERS: {}
+- UNMATCHED SONGS: {}
+- FILES: {}
+- RESUMED FILES: {}""" \
+        .format(self.batchPath, self.notesPath, self.path, str(self.minAverage), str(len(self.acceptedSongs)),
+                str(len(self.songFolders)), str(len(self.unmatchedSongs)), str(len(self.members)),
+                str(self.resumedMembers))
+
+    def getJudgeSets(self):
+        from .judge import JudgesForExcel, BatchJudgesForExcel, isSetDirName
+        with os.scandir(self.notesPath) as entries:
+            hasSetDirs = any(entry.is_dir() and isSetDirName(entry.name) for entry in entries)
+        if not hasSetDirs:
+            return [JudgesForExcel(self.notesPath)]
+        batchJudges = BatchJudgesForExcel(self.notesPath, maxWorkers=self.maxWorkers)
+        batchJudges.getSetDirs()
+        batchJudges.parseAllSets()
+        return batchJudges.setJudgments
+
+    @timed("pack.getAcceptedSongs")
+    def getAcceptedSongs(self):
+        """
+        Fills acceptedSongs with every song of the sets whose average is at
+        least minAverage, in set order.
+        """
+        packLogger.info("getAcceptedSongs: Reading judgments in '%s'", self.notesPath)
+        self.acceptedSongs = []
+        for judgeSet in self.getJudgeSets():
+            for title, stepartist, setNumber, average, numRatings, special in judgeSet.getSummaryRows():
+                if average is not None and average >= self.minAverage:
+                    self.acceptedSongs.append((title, stepartist, judgeSet.setName, average))
+        packLogger.info("getAcceptedSongs: %s songs have an average of at least %s", str(len(self.acceptedSongs)),
+                        str(self.minAverage))
+
+    @timed("pack.getSongFolders")
+    def getSongFolders(self):
+        """
+        Finds the song folder of each accepted song. A song matches the
+        folder with the same title and stepartist, or the only folder with
+        that title; titles are compared with getTitleKey(), so the commas
+        the song listing takes out don't matter.
+        """
+        from .batchcontainer import BatchContainer
+        batch = BatchContainer(self.batchPath)
+        batch.setSmFields(['TITLE', 'STEPARTIST'])
+        batch.setDwiFields(['TITLE', 'STEPARTIST'])
+        batch.getFolderList()
+        batch.construct()
+        batch.parseSimfiles()
+        byTitleAndStepartist = {}
+        byTitle = {}
+        for folder, songInfo in batch.allSongInfo.items():
+            titleKey = getTitleKey(songInfo.get('TITLE', ""))
+            byTitleAndStepartist[(titleKey, songInfo.get('STEPARTIST', "").strip().lower())] = folder
+            byTitle.setdefault(titleKey, []).append(folder)
+        songFolders = set()
+        self.unmatchedSongs = []
+        for title, stepartist, setName, average in self.acceptedSongs:
+            titleKey = getTitleKey(title)
+            folder = byTitleAndStepartist.get((titleKey, stepartist.strip().lower()))
+            if folder is None and len(byTitle.get(titleKey, [])) == 1:
+                folder = byTitle[titleKey][0]
+            if folder is None:
+                packLogger.warning("getSongFolders: No song folder for '%s' (%s) from %s", title, stepartist,
+                                   setName)
+                self.unmatchedSongs.append((title, stepartist, setName, average))
+            else:
+                songFolders.add(folder)
+        self.songFolders = sorted(songFolders, key=lambda folder: (folder.lower(), folder))
+
+    def getMembers(self):
+        """
+        Lists the files of the song folders in pack order, with the stat
+        each was listed with so a resumed build can tell it didn't change.
+        """
+        self.members = []
+        for folder in self.songFolders:
+            folderPath = os.path.join(self.batchPath, folder)
+            for dirPath, dirNames, fileNames in os.walk(folderPath):
+                dirNames.sort(key=lambda name: (name.lower(), name))
+                for fileName in sorted(fileNames, key=lambda name: (name.lower(), name)):
+                    if fileName.lower() in skippedFiles:
+                        continue
+                    sourcePath = os.path.join(dirPath, fileName)
+                    sourceStat = os.stat(sourcePath)
+                    relativePath = os.path.relpath(sourcePath, self.batchPath).replace(os.sep, "/")
+                    self.members.append({'name': self.packName + "/" + relativePath, 'source': sourcePath,
+                                         'stamp': [sourceStat.st_mtime_ns, sourceStat.st_size],
+                                         'modified': sourceStat.st_mtime,
+                                         'store': os.path.splitext(fileName)[1].lower() in storedExtensions})
+        packLogger.info("getMembers: %s files in %s song folders", str(len(self.members)), str(len(self.songFolders)))
+
+    def readJournal(self):
+        """
+        Returns the member records of an interrupted build that can be kept:
+        the ones in the journal, in order, up to the first one whose file
+        changed or isn't the next file in the pack any more.
+        """
+        if not os.path.exists(self.journalPath) or not os.path.exists(self.partPath):
+            return []
+        keptRecords = []
+        try:
+            with open(self.journalPath, encoding="utf-8") as journal:
+                if json.loads(journal.readline()) != {'pack': self.packName, 'level': self.level}:
+                    return []
+                partSize = os.path.getsize(self.partPath)
+                for line, member in zip(journal, self.members):
+                    record = json.loads(line)
+                    if record['name'] != member['name'] or record['stamp'] != member['stamp'] or \
+                            record['end'] > partSize:
+                        break
+                    keptRecords.append(record)
+        except (ValueError, KeyError):
+            packLogger.info("readJournal: The end of '%s' is cut off", self.journalPath)
+        return keptRecords
+
+    def writeLocalHeader(self, packFile, member, method, crc, compressSize, fileSize, zip64):
+        dosTime, dosDate = getDosDateTime(member['modified'])
+        name = member['name'].encode("utf-8")
+        extra = getZip64Extra(fileSize, compressSize) if zip64 else b""
+        packFile.write(LOCAL_HEADER.pack(0x04034b50, 45 if zip64 else 20, UTF8_FLAG, method, dosTime, dosDate, crc,
+                                         ZIP64_LIMIT if zip64 else compressSize, ZIP64_LIMIT if zip64 else fileSize,
+                                         len(name), len(extra)))
+        packFile.write(name)
+        packFile.write(extra)
+        return {'name': member['name'], 'stamp': member['stamp'], 'method': method, 'dosTime': dosTime,
+                'dosDate': dosDate, 'zip64': zip64}
+
+    def writeBuffered(self, packFile, member, compressed):
+        """
+        Writes a member compressed in the thread pool.
+        """
+        method, crc, fileSize, data = compressed
+        offset = packFile.tell()
+        record = self.writeLocalHeader(packFile, member, method, crc, len(data), fileSize,
+                                       fileSize >= ZIP64_LIMIT or len(data) >= ZIP64_LIMIT)
+        packFile.write(data)
+        count("pack.membersDeflated" if method == DEFLATED else "pack.membersStored")
+        record.update({'offset': offset, 'crc': crc, 'compressSize': len(data), 'fileSize': fileSize})
+        return record
+
+    def writeStreamed(self, packFile, member):
+        """
+        Copies a member into the pack in blocks, compressing it on the way
+        unless it is stored, then goes back to fill in the CRC and sizes.
+        """
+        method = STORED if member['store'] else DEFLATED
+        zip64 = member['stamp'][1] >= ZIP64_LIMIT - ZIP64_MARGIN
+        offset = packFile.tell()
+        record = self.writeLocalHeader(packFile, member, method, 0, 0, 0, zip64)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) if method == DEFLATED else None
+        crc = 0
+        fileSize = 0
+        compressSize = 0
+        with open(member['source'], 'rb') as sourceFile:
+            while True:
+                block = sourceFile.read(1024 * 1024)
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+                fileSize += len(block)
+                if compressor is not None:
+                    block = compressor.compress(block)
+                packFile.write(block)
+                compressSize += len(block)
+            if compressor is not None:
+                block = compressor.flush()
+                packFile.write(block)
+                compressSize += len(block)
+        count("pack.bytesRead", fileSize)
+        count("pack.membersDeflated" if method == DEFLATED else "pack.membersStored")
+        if not zip64 and (fileSize >= ZIP64_LIMIT or compressSize >= ZIP64_LIMIT):
+            raise ValueError("'" + member['source'] + "' grew past 4 GB while it was packed")
+        end = packFile.tell()
+        packFile.seek(offset)
+        self.writeLocalHeader(packFile, member, method, crc, compressSize, fileSize, zip64)
+        packFile.seek(end)
+        record.update({'offset': offset, 'crc': crc, 'compressSize': compressSize, 'fileSize': fileSize})
+        return record
+
+    def writeCentralDirectory(self, packFile, records):
+        start = packFile.tell()
+        for record in records:
+            name = record['name'].encode("utf-8")
+            zip64Values = [value for value in (record['fileSize'], record['compressSize'], record['offset'])
+                           if value >= ZIP64_LIMIT]
+            zip64Values = [record['fileSize'], record['compressSize'], record['offset']] if zip64Values else []
+            extra = getZip64Extra(*zip64Values) if zip64Values else b""
+            version = 45 if zip64Values or record['zip64'] else 20
+            packFile.write(CENTRAL_HEADER.pack(0x02014b50, version, version, UTF8_FLAG, record['method'],
+                                               record['dosTime'], record['dosDate'], record['crc'],
+                                               min(record['compressSize'], ZIP64_LIMIT),
+                                               min(record['fileSize'], ZIP64_LIMIT), len(name), len(extra), 0, 0,
+                                               0, 0, min(record['offset'], ZIP64_LIMIT)))
+            packFile.write(name)
+            packFile.write(extra)
+        end = packFile.tell()
+        size = end - start
+        if len(records) >= 0xFFFF or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            packFile.write(ZIP64_END_RECORD.pack(0x06064b50, 44, 45, 45, 0, 0, len(records), len(records), size,
+                                                 start))
+            packFile.write(ZIP64_END_LOCATOR.pack(0x07064b50, 0, end, 1))
+        packFile.write(END_RECORD.pack(0x06054b50, 0, 0, min(len(records), 0xFFFF), min(len(records), 0xFFFF),
+                                       min(size, ZIP64_LIMIT), min(start, ZIP64_LIMIT), 0))
+
+    @timed("pack.write")
+    def writePack(self, resume=True):
+        """
+        Writes the members into the pack, continuing an interrupted build
+        when resume is True. The files to compress are handed to the thread
+        pool a few members ahead of the one being written.
+        """
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        records = self.readJournal() if resume else []
+        self.resumedMembers = len(records)
+        count("pack.membersResumed", len(records))
+        if records:
+            packLogger.info("writePack: Resuming after %s files", str(len(records)))
+            packFile = open(self.partPath, 'r+b')
+            packFile.truncate(records[-1]['end'])
+        else:
+            packFile = open(self.partPath, 'wb')
+        journal = open(self.journalPath, 'w', encoding="utf-8")
+        journal.write(json.dumps({'pack': self.packName, 'level': self.level}) + "\n")
+        for record in records:
+            journal.write(json.dumps(record) + "\n")
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        remaining = iter(self.members[len(records):])
+        pending = deque()
+
+        def submitNext():
+            member = next(remaining, None)
+            if member is None:
+                return
+            if member['store'] or member['stamp'][1] > self.bufferLimit:
+                pending.append((member, None))
+            else:
+                pending.append((member, executor.submit(compressMember, member['source'], self.level)))
+
+        try:
+            packFile.seek(0, os.SEEK_END)
+            for _ in range(2 * self.maxWorkers):
+                submitNext()
+            while pending:
+                member, compression = pending.popleft()
+                submitNext()
+                if compression is None:
+                    record = self.writeStreamed(packFile, member)
+                else:
+                    record = self.writeBuffered(packFile, member, compression.result())
+                record['end'] = packFile.tell()
+                packFile.flush()  # The member is in the file before the journal says so
+                journal.write(json.dumps(record) + "\n")
+                journal.flush()
+                records.append(record)
+            self.writeCentralDirectory(packFile, records)
+            count("pack.bytesWritten", packFile.tell())
+        finally:
+            executor.shutdown(cancel_futures=True)
+            packFile.close()
+            journal.close()
+        os.replace(self.partPath, self.path)
+        os.remove(self.journalPath)
+
+    @timed("pack.build")
+    def build(self, resume=True):
+        """
+        Finds the accepted songs and their folders, and writes the pack.
+        Returns True if the pack was written.
+        """
+        packLogger.info("build: Building release pack '%s'", self.path)
+        try:
+            self.getAcceptedSongs()
+            self.getSongFolders()
+            self.getMembers()
+            self.writePack(resume=resume)
+            packLogger.info("build: Successfully wrote release pack '%s'", self.path)
+            return True
+        except KeyboardInterrupt:
+            packLogger.info("build: Interrupted, the next build continues from '%s'", self.journalPath)
+            raise
+        except:
+            packLogger.warning("build: {0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
+            return False
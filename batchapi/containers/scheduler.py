@@ -0,0 +1,423 @@
+#!/usr/bin/python3
+
+"""
+Splits a batch into sets (set1, set2, ...) and gives each set its judges,
+which used to be done by hand before judging could start.
+
+The roster is a text file with one judge per line and, after a comma, how
+many sets that judge can take (1 if left out). Lines starting with # are
+comments:
+
+    DossarLX ODI, 2
+    Silvuh, 1
+
+Every song is given an estimated judging time: the length of its longest
+chart, worked out from the chart file (measures and #BPMS for .ssc and
+.sm, steps and #BPM for .dwi, see readCharts() in simfile.py), plus
+songOverhead seconds for writing the notes. A chart that can't be read
+gets the median of the others.
+
+Judges are given to the sets first, those with the most sets left to take
+first. Submissions of the same song (same title without leading tags like
+[Resubmission], see getTitleKey() in normalize.py) are kept together as
+one group, and the groups are placed longest first, each in the set with
+the least judging time so far that has none of its stepartists as a judge.
+A group that can't avoid its own stepartist is placed anyway and reported
+as a conflict.
+
+Each set gets a folder with the song listing of its songs (<set>.csv, the
+same columns as the batch CSV file) and the judge notes template from
+NotesTemplate (template_<set>.txt), and schedule.txt lists every set.
+"""
+
+import os
+import re
+import sys
+import csv
+import math
+import heapq
+from .metrics import timed, count
+from .normalize import getSongKey, getTitleKey
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+schedulerLogger = logging.getLogger("SCHEDULER")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def readChartText(chartPath):
+    # latin-1 never fails, and only the ASCII parts of the chart are needed
+    with open(chartPath, 'rb') as chartFile:
+        return chartFile.read().decode('latin-1')
+
+def getFirstBpm(bpmText):
+    """
+    First BPM of a #BPMS (beat=bpm,...) or #BPM value, or None.
+    """
+    try:
+        bpm = float(bpmText.split(",")[0].split("=")[-1])
+    except ValueError:
+        return None
+    return bpm if bpm > 0 else None
+
+def getDwiBeats(steps):
+    """
+    Beats in the steps of one .dwi chart. A step is an eighth note, or a
+    16th, 24th, 64th or 192nd inside (), [], {} or `'. A hold (4!4) or a
+    jump written as <...> is one step.
+    """
+    steps = re.sub("\s+", "", steps)
+    steps = re.sub("!.", "", steps)
+    steps = re.sub("<[^>]*>", "0", steps)
+    beats = 0
+    for pattern, stepBeats in (("\(([^)]*)\)", 1 / 4), ("\[([^\]]*)\]", 1 / 6), ("\{([^}]*)\}", 1 / 16),
+                               ("`([^']*)'", 1 / 48)):
+        beats += sum(len(group) for group in re.findall(pattern, steps)) * stepBeats
+        steps = re.sub(pattern, "", steps)
+    return beats + len(steps) / 2
+
+def getChartSeconds(chartPath):
+    """
+    Estimated length of the song in seconds from its chart file: the
+    longest chart at its first BPM (from the chart's own #BPMS in an .ssc
+    file, else the header's #BPMS or #BPM). A measure of an .ssc or .sm
+    chart is 4 beats. Returns None if it can't be worked out.
+    """
+    from .simfile import DWIFile, getSimfileClass
+    try:
+        header, charts = getSimfileClass(chartPath).readCharts(readChartText(chartPath))
+        count("scheduler.chartsRead")
+        seconds = 0
+        for chart in charts:
+            bpm = getFirstBpm(chart.get('BPMS', header.get('BPMS', header.get('BPM', ""))))
+            if bpm is None:
+                continue
+            if chart['STEPSTYPE'] in DWIFile.chartTags:
+                # Doubles and couples have the steps of each pad after a colon
+                beats = max(getDwiBeats(padSteps) for padSteps in chart['NOTES'].split(":"))
+            else:
+                beats = 4 * (chart['NOTES'].count(",") + 1)
+            seconds = max(seconds, beats * 60 / bpm)
+        return seconds or None
+    except:
+        schedulerLogger.warning("getChartSeconds: '{0}': {1}: {2}".format(chartPath, sys.exc_info()[0].__name__,
+                                                                         str(sys.exc_info()[1])))
+        return None
+
+def getPersonKeys(names):
+    """
+    Keys of the people in a stepartist or judge name. Stepartists that
+    stepped a song together are written as '0 & kjwkjw', 'A, B' or 'A + B'.
+    """
+    keys = set()
+    for name in re.split("\s*[&,+/]\s*|\s+and\s+", names):
+        key = getSongKey(name)
+        if key != "":
+            keys.add(key)
+    return keys
+
+def readSchedule(schedulePath):
+    """
+    Returns a dictionary with <set name>:<list of judges> from a schedule.txt
+    written by SetScheduler.writeSchedule(), the judges each set should have.
+    """
+    setJudges = {}
+    with open(schedulePath, encoding="utf-8") as scheduleFile:
+        for line in scheduleFile:
+            setSearch = re.search("^(\S+): [0-9]+ songs, .*, judges: (.*)$", line.rstrip("\n"))
+            if setSearch is None:
+                continue
+            judges = setSearch.group(2).strip()
+            setJudges[setSearch.group(1)] = [] if judges == "NONE" else [judge.strip() for judge in judges.split(", ")]
+    return setJudges
+
+def formatSeconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0}:{1:02d}:{2:02d}".format(hours, minutes, seconds)
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class SetScheduler():
+    """
+    * CLASS ATTRIBUTES *
+    - batchDir: Batch folder of song folders.
+    - rosterFile: Roster of judges and how many sets each can take.
+    - outputDir: Folder the set folders are written to (default: <batch>_sets
+                 next to the batch folder).
+    - numSets: Number of sets, or None to make sets of about setSize songs.
+    - setSize: Songs per set when numSets isn't given.
+    - judgesPerSet: Judges each set should get.
+    - songOverhead: Seconds added to every song for writing its notes.
+    - roster: List of (judge, sets the judge can take) in roster order.
+    - header: Song listing header from BatchContainer.getSongListingRows().
+    - songs: List of dictionaries with folder, title, stepartist, seconds
+             and listing row for every song in the batch.
+    - groups: List of lists of songs, the submissions of the same song.
+    - sets: List of dictionaries with name, judges, judgeKeys, songs and
+            seconds for every set.
+    - conflicts: List of (set name, song folder, judge) for the songs that
+                 had to go to a set their own stepartist judges.
+    - unestimated: Folders whose chart length couldn't be worked out.
+    """
+
+    songOverhead = 60
+
+    def __init__(self, batchDir, rosterFile, outputDir=None, numSets=None, setSize=25, judgesPerSet=4):
+        """
+        Constructor
+        """
+        self.batchDir = batchDir
+        self.rosterFile = rosterFile
+        batchName = os.path.basename(os.path.normpath(batchDir))
+        self.outputDir = outputDir or os.path.join(os.path.dirname(os.path.abspath(batchDir)), batchName + "_sets")
+        self.numSets = numSets
+        self.setSize = setSize
+        self.judgesPerSet = judgesPerSet
+        self.roster = []
+        self.header = []
+        self.songs = []
+        self.groups = []
+        self.sets = []
+        self.conflicts = []
+        self.unestimated = []
+
+    def __str__(self):
+        setSeconds = [scheduledSet['seconds'] for scheduledSet in self.sets] or [0]
+        return """>>> SET SCHEDULE
+- BATCH: {}
+- OUTPUT: {}
+- JUDGES: {}
+- SONGS: {}
+- SETS: {}
+- JUDGING TIME PER SET: {} to {}
+- CONFLICTS: {}""" \
+        .format(self.batchDir, self.outputDir, str(len(self.roster)), str(len(self.songs)), str(len(self.sets)),
+                formatSeconds(min(setSeconds)), formatSeconds(max(setSeconds)), str(len(self.conflicts)))
+
+    def loadRoster(self):
+        schedulerLogger.info("loadRoster: Reading roster '%s'", self.rosterFile)
+        self.roster = []
+        with open(self.rosterFile, encoding="utf-8") as rosterFile:
+            for line in rosterFile:
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                judge, capacity = line, 1
+                capacitySearch = re.search("^(.*),\s*([0-9]+)$", line)
+                if capacitySearch is not None:
+                    judge, capacity = capacitySearch.group(1).strip(), int(capacitySearch.group(2))
+                self.roster.append((judge, capacity))
+        schedulerLogger.info("loadRoster: %s judges can take %s sets", str(len(self.roster)),
+                             str(sum(capacity for judge, capacity in self.roster)))
+
+    @timed("scheduler.loadBatch")
+    def loadBatch(self):
+        """
+        Parses the batch with BatchContainer and estimates the judging time
+        of every song from its chart file.
+        """
+        from .batchcontainer import BatchContainer
+        batch = BatchContainer(self.batchDir)
+        batch.setSmFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        batch.setDwiFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        batch.getFolderList()
+        batch.construct()
+        batch.parseSimfiles()
+        self.songs = []
+        if not batch.allSongInfo:
+            schedulerLogger.warning("loadBatch: No songs in '%s'", self.batchDir)
+            return
+        self.header, rows = batch.getSongListingRows()
+        folderToRow = {row[0]: row for row in rows}
+        for simfileObj in batch.simfile_list:
+            songInfo = batch.allSongInfo.get(simfileObj.folder)
+            if songInfo is None:
+                continue
+            self.songs.append({'folder': simfileObj.folder,
+                               'title': songInfo.get('TITLE', simfileObj.songTitle),
+                               'stepartist': songInfo.get('STEPARTIST', simfileObj.stepper),
+                               'seconds': getChartSeconds(os.path.join(simfileObj.folderPath, simfileObj.stepfile)),
+                               'row': folderToRow[re.sub(',', '', simfileObj.folder)]})
+        self.songs.sort(key=lambda song: song['folder'].lower())
+
+        knownSeconds = sorted(song['seconds'] for song in self.songs if song['seconds'] is not None)
+        medianSeconds = knownSeconds[len(knownSeconds) // 2] if knownSeconds else 120
+        self.unestimated = []
+        for song in self.songs:
+            if song['seconds'] is None:
+                self.unestimated.append(song['folder'])
+                song['seconds'] = medianSeconds
+            song['seconds'] += self.songOverhead
+        schedulerLogger.info("loadBatch: %s songs, %s without a chart length", str(len(self.songs)),
+                             str(len(self.unestimated)))
+
+    def getGroups(self):
+        """
+        Groups the submissions of the same song; each group goes to one set.
+        """
+        titleToGroup = {}
+        for song in self.songs:
+            titleToGroup.setdefault(getTitleKey(song['title']) or song['folder'], []).append(song)
+        self.groups = list(titleToGroup.values())
+        schedulerLogger.info("getGroups: %s songs in %s groups", str(len(self.songs)), str(len(self.groups)))
+
+    def getSetCount(self):
+        if self.numSets is not None:
+            return max(1, self.numSets)
+        return max(1, math.ceil(len(self.songs) / max(1, self.setSize)))
+
+    def assignJudges(self):
+        """
+        Gives every set up to judgesPerSet judges, taking the judges with
+        the most sets left first (then the ones with the fewest sets so
+        far, then roster order), so the roster is spread over all sets.
+        """
+        self.sets = [{'name': "set" + str(setNumber), 'judges': [], 'judgeKeys': set(), 'songs': [], 'seconds': 0}
+                     for setNumber in range(1, self.getSetCount() + 1)]
+        setsLeft = {judge: capacity for judge, capacity in self.roster}
+        setsTaken = {judge: 0 for judge, capacity in self.roster}
+        rosterOrder = {judge: index for index, (judge, capacity) in enumerate(self.roster)}
+        for scheduledSet in self.sets:
+            available = sorted((judge for judge in setsLeft if setsLeft[judge] > 0),
+                               key=lambda judge: (-setsLeft[judge], setsTaken[judge], rosterOrder[judge]))
+            for judge in available[:self.judgesPerSet]:
+                setsLeft[judge] -= 1
+                setsTaken[judge] += 1
+                scheduledSet['judges'].append(judge)
+                scheduledSet['judgeKeys'] |= getPersonKeys(judge)
+            if len(scheduledSet['judges']) < self.judgesPerSet:
+                schedulerLogger.warning("assignJudges: '%s' only has %s of %s judges", scheduledSet['name'],
+                                        str(len(scheduledSet['judges'])), str(self.judgesPerSet))
+
+    @timed("scheduler.assignSongs")
+    def assignSongs(self):
+        """
+        Places the groups longest first, each in the set with the least
+        judging time that none of its stepartists judges. Groups whose
+        stepartists judge some of the sets go before the others, fewest
+        sets to choose from first, so they aren't left with a set that is
+        already full. The sets are kept in a heap by (judging time, songs,
+        set number); sets skipped for a group are pushed back afterwards.
+        """
+        self.conflicts = []
+        judgeKeyToSets = {}
+        for setIndex, scheduledSet in enumerate(self.sets):
+            for judgeKey in scheduledSet['judgeKeys']:
+                judgeKeyToSets.setdefault(judgeKey, set()).add(setIndex)
+        groupOrder = []
+        for group in self.groups:
+            stepperKeys = set()
+            for song in group:
+                stepperKeys |= getPersonKeys(song['stepartist'])
+            blockedSets = set()
+            for stepperKey in stepperKeys & judgeKeyToSets.keys():
+                blockedSets |= judgeKeyToSets[stepperKey]
+            groupOrder.append((len(self.sets) - len(blockedSets) if blockedSets else len(self.sets) + 1,
+                               -sum(song['seconds'] for song in group), group[0]['folder'].lower(),
+                               stepperKeys, group))
+        groupOrder.sort(key=lambda groupEntry: groupEntry[:3])
+
+        setHeap = [(0, 0, setIndex) for setIndex in range(len(self.sets))]
+        for allowedSets, negativeSeconds, firstFolder, stepperKeys, group in groupOrder:
+            skipped = []
+            chosen = None
+            while setHeap:
+                entry = heapq.heappop(setHeap)
+                if not (self.sets[entry[2]]['judgeKeys'] & stepperKeys):
+                    chosen = entry
+                    break
+                skipped.append(entry)
+            if chosen is None:
+                chosen = skipped.pop(0)  # Every set has one of the stepartists judging
+                scheduledSet = self.sets[chosen[2]]
+                for song in group:
+                    for judge in scheduledSet['judges']:
+                        if getPersonKeys(judge) & getPersonKeys(song['stepartist']):
+                            self.conflicts.append((scheduledSet['name'], song['folder'], judge))
+                            schedulerLogger.warning("assignSongs: '%s' is judged by its stepartist '%s' in '%s'",
+                                                    song['folder'], judge, scheduledSet['name'])
+            for entry in skipped:
+                heapq.heappush(setHeap, entry)
+            scheduledSet = self.sets[chosen[2]]
+            scheduledSet['songs'].extend(group)
+            scheduledSet['seconds'] += sum(song['seconds'] for song in group)
+            heapq.heappush(setHeap, (scheduledSet['seconds'], len(scheduledSet['songs']), chosen[2]))
+            count("scheduler.groupsPlaced")
+        for scheduledSet in self.sets:
+            scheduledSet['songs'].sort(key=lambda song: song['folder'].lower())
+
+    def writeSet(self, scheduledSet):
+        """
+        Writes <set>/<set>.csv with the listing rows of the set's songs and
+        <set>/template_<set>.txt from it with NotesTemplate.
+        """
+        from .csvtable import BatchCsvTable
+        from .notestemplate import NotesTemplate
+        setDir = os.path.join(self.outputDir, scheduledSet['name'])
+        os.makedirs(setDir, exist_ok=True)
+        csvPath = os.path.join(setDir, scheduledSet['name'] + ".csv")
+        rows = [song['row'] for song in scheduledSet['songs']]
+        with open(csvPath, 'w', newline="") as setCsv:
+            csvWriter = csv.writer(setCsv, lineterminator="\n")
+            csvWriter.writerow(self.header)
+            csvWriter.writerows(rows)
+        csvTable = BatchCsvTable(csvPath)
+        csvTable.addRows([self.header] + rows)
+        templateNotes = NotesTemplate(csvPath, ['ARTIST', 'TITLE', 'STEPARTIST'], csvTable=csvTable)
+        templateNotes.getFieldIndices()
+        templateNotes.getRelevantFields()
+        templateNotes.writeTemplateFile()
+
+    def getReportLines(self):
+        lines = []
+        for scheduledSet in self.sets:
+            lines.append("{0}: {1} songs, {2} judging time, judges: {3}".format(
+                scheduledSet['name'], str(len(scheduledSet['songs'])), formatSeconds(scheduledSet['seconds']),
+                ", ".join(scheduledSet['judges']) or "NONE"))
+            for song in scheduledSet['songs']:
+                lines.append("    " + song['folder'] + " [" + formatSeconds(song['seconds']) + "]")
+        for setName, folder, judge in self.conflicts:
+            lines.append("- CONFLICT " + setName + ": '" + folder + "' is judged by its stepartist " + judge)
+        for folder in self.unestimated:
+            lines.append("- NO CHART LENGTH '" + folder + "': median used")
+        return lines
+
+    def writeSchedule(self):
+        schedulePath = os.path.join(self.outputDir, "schedule.txt")
+        with open(schedulePath, 'w', encoding="utf-8") as scheduleFile:
+            scheduleFile.write(str(self) + "\n\n")
+            for line in self.getReportLines():
+                scheduleFile.write(line + "\n")
+        schedulerLogger.info("writeSchedule: Wrote '%s'", schedulePath)
+
+    @timed("scheduler.schedule")
+    def schedule(self):
+        """
+        Reads the roster and the batch, splits the batch into sets and
+        writes the set folders. Returns False if something went wrong.
+        """
+        schedulerLogger.info("schedule: Splitting '%s' into sets in '%s'", self.batchDir, self.outputDir)
+        try:
+            self.loadRoster()
+            self.loadBatch()
+            self.getGroups()
+            self.assignJudges()
+            self.assignSongs()
+            os.makedirs(self.outputDir, exist_ok=True)
+            for scheduledSet in self.sets:
+                self.writeSet(scheduledSet)
+            self.writeSchedule()
+            return True
+        except:
+            schedulerLogger.warning("schedule: {0}: {1}".format(sys.exc_info()[0].__name__,
+                                                                str(sys.exc_info()[1])))
+            return False
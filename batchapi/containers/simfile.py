@@ -3,27 +3,15 @@
 import os
 import re
 import sys
-from abc import abstractmethod
+from .metrics import count
 
 ###########
 # LOGGERS #
 ###########
 
-# Date formatting will be the same for all loggers
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
 import logging
-dateformatter = logging.Formatter('[%(asctime)s] %(name)s: %(levelname)s: %(message)s')
-
-# Make simfileLogger logger object.
 simfileLogger = logging.getLogger("SIMFILE")
-simfileLogger.setLevel(logging.DEBUG)
-simfileFileH = logging.FileHandler('/tmp/simfile.log')
-simfileFileH.setLevel(logging.DEBUG)
-simfileConsoleH = logging.StreamHandler()
-simfileConsoleH.setLevel(logging.WARNING)
-simfileFileH.setFormatter(dateformatter)
-simfileConsoleH.setFormatter(dateformatter)
-simfileLogger.addHandler(simfileFileH)  # File Handler add
-simfileLogger.addHandler(simfileConsoleH)  # Console Handler add
 
 ########################
 # FUNCTION DEFINITIONS #
@@ -75,6 +63,20 @@ def getStepArtistFromFolder(folder):
 
     return stepArtist
 
+# MSD tags (#TAG:value;), the format .sm, .ssc and .dwi files share. A value
+# can span lines and ends at ; or, when the ; is missing, at a line starting
+# with the next tag. // starts a comment that runs to the end of the line.
+commentPattern = re.compile("//[^\n]*")
+tagPattern = re.compile("#([^:;#\n]*):((?:[^;\n]|\n(?![ \t\ufeff]*#))*);?")
+
+def iterMsdTags(text):
+    """
+    Yields (TAG, value) for every tag in the text of a chart file, in order.
+    Tag names are upper case; values are as written.
+    """
+    for tagSearch in tagPattern.finditer(commentPattern.sub("", text)):
+        yield tagSearch.group(1).strip().upper(), tagSearch.group(2)
+
 #####################
 # CLASS DEFINITIONS #
 #####################
@@ -85,10 +87,14 @@ class Simfile():
     in the batch folder, including the folder and its path, the chart
     file to parse for information, search fields to look for in the chart
     file. simInfo is a dictionary containing information about these
-    fields after parse() is used; note that parse() here is an
-    overridden function and we only want to use SMFile and DWIFile.
+    fields after parse() is used. Simfile itself isn't used; SSCFile,
+    SMFile and DWIFile each say which tags start their charts, and give
+    the charts of a file with readCharts().
     """
-    
+
+    formatName = None
+    chartTags = ()  # The header ends at the first of these tags
+
     def __init__(self, pathToSongFolder, songFolderName, chartFile, searchFields=[]):
         self.folderPath = pathToSongFolder
         self.folder = songFolderName
@@ -97,6 +103,7 @@ class Simfile():
         self.songTitle = getSongTitleFromFolder(self.folder)
         self.stepper = getStepArtistFromFolder(self.folder)
         self.simInfo = {} # Dictionary storing results from search field parsing
+        self.parseError = None # The exception raised while reading the chart file, if any
 
     def getSongFolderName(self):
         return self.folder
@@ -114,39 +121,44 @@ class Simfile():
 - SONG INFO: {}""" \
         .format(self.folderPath, self.folder, self.stepfile, self.fields, self.songTitle,
                 self.stepper, self.simInfo)
- 
-    @abstractmethod
-    def parse(self):
-        pass
 
-class SMFile(Simfile):
+    def readHeader(self, blockSize=4096):
+        """
+        Text of the chart file up to the first chart, read a block at a
+        time so the step data itself is never read.
+        """
+        chartStartPattern = re.compile("#(?:" + "|".join(self.chartTags) + ")[ \t]*:", re.IGNORECASE)
+        header = ""
+        with open(os.path.join(self.folderPath, self.stepfile)) as chartFile:
+            while True:
+                block = chartFile.read(blockSize)
+                header += block
+                chartStart = chartStartPattern.search(header)
+                if chartStart is not None:
+                    header = header[:chartStart.start()]
+                    break
+                if len(block) < blockSize:
+                    break
+        count("simfile.headerLinesRead", header.count("\n") + 1)
+        return header
+
     def parse(self):
 
-        simfileLogger.debug("parse: Attempting to parse .sm file '%s'", self.stepfile)
-        os.chdir(self.folderPath)  # Change to song folder's context in the batch
+        simfileLogger.debug("parse: Attempting to parse .%s file '%s'", self.formatName, self.stepfile)
         songFieldInfo = {}
         try:
-            # group(1) here refers to the captured field.
-            with open(self.stepfile) as smFile:
-                for line in smFile:
-                    if line.startswith('#'):
-                        for field in self.fields:
-                            if field is "TITLE":
-                                continue  # We're getting title and stepartist from folder
-                            if field is "STEPARTIST":
-                                continue
-                            else:
-                                fieldSearch = re.search("^#"+field+":(.*);$", line)
-                                if fieldSearch is not None:
-                                    songFieldInfo[field] = fieldSearch.group(1)
-                    else:
-                        break  # No more hashtags means we're done with the song info at the top
+            for tag, value in iterMsdTags(self.readHeader()):
+                if tag == "TITLE" or tag == "STEPARTIST":
+                    continue  # We're getting title and stepartist from folder
+                if tag in self.fields:
+                    songFieldInfo[tag] = value
         except:
             simfileLogger.warning("parse: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                              str(sys.exc_info()[1])))
+                                                           str(sys.exc_info()[1])))
+            self.parseError = sys.exc_info()[1]
             if 'ARTIST' in self.fields:
                 songFieldInfo['ARTIST'] = ""
-                
+
         if 'TITLE' in self.fields:
             songFieldInfo['TITLE'] = self.songTitle
         if 'STEPARTIST' in self.fields:
@@ -154,40 +166,99 @@ class SMFile(Simfile):
 
         simfileLogger.debug("parse: '%s'", songFieldInfo)
         self.simInfo = songFieldInfo
- 
+
+class SSCFile(Simfile):
+    """
+    StepMania 5 chart file. The header is the same as in an .sm file; each
+    chart starts with #NOTEDATA:; and has its own tags (#STEPSTYPE,
+    #DIFFICULTY, #METER, #CREDIT, #NOTES and sometimes its own #BPMS).
+    """
+
+    formatName = "ssc"
+    chartTags = ('NOTEDATA',)
+
+    @staticmethod
+    def readCharts(chartText):
+        """
+        Returns (header, charts): a dictionary with TAG:value for the header
+        and a list with one of those for each chart.
+        """
+        header = {}
+        charts = []
+        for tag, value in iterMsdTags(chartText):
+            if tag == 'NOTEDATA':
+                charts.append({})
+            elif charts:
+                charts[-1][tag] = value
+            else:
+                header[tag] = value
+        return header, charts
+
+class SMFile(Simfile):
+    """
+    StepMania 3.9 chart file. Each chart is one #NOTES tag with the fields
+    of the chart before the note data, separated by colons.
+    """
+
+    formatName = "sm"
+    chartTags = ('NOTES',)
+    chartFields = ('STEPSTYPE', 'DESCRIPTION', 'DIFFICULTY', 'METER', 'RADARVALUES', 'NOTES')
+
+    @staticmethod
+    def readCharts(chartText):
+        """
+        Same as SSCFile.readCharts(), with the #NOTES fields as the chart tags.
+        """
+        header = {}
+        charts = []
+        for tag, value in iterMsdTags(chartText):
+            if tag == 'NOTES':
+                chartValues = value.split(":", len(SMFile.chartFields) - 1)
+                if len(chartValues) == len(SMFile.chartFields):
+                    charts.append({field: chartValue.strip() if field != 'NOTES' else chartValue
+                                   for field, chartValue in zip(SMFile.chartFields, chartValues)})
+            else:
+                header[tag] = value
+        return header, charts
+
 class DWIFile(Simfile):
-    def parse(self):
-    
-        simfileLogger.debug("parse: Attempting to parse .dwi file '%s'", self.stepfile)
-        os.chdir(self.folderPath)  # Change to song folder's context in the batch
-        songFieldInfo = {}
-        try:
-            # group(1) here refers to the captured field.
-            with open(self.stepfile) as dwiFile:
-                for line in dwiFile:
-                    if line.startswith('#'):
-                        for field in self.fields:
-                            if field is "TITLE":
-                                continue  # We're getting title and stepartist from folder
-                            if field is "STEPARTIST":
-                                continue
-                            else:
-                                fieldSearch = re.search("^#"+field+":(.*);$", line)
-                                if fieldSearch is not None:
-                                    songFieldInfo[field] = fieldSearch.group(1)
-                    else:
-                        break  # No more hashtags means we're done with the song info at the top
-        except:
-            simfileLogger.warning("parse: {0}: {1}".format(sys.exc_info()[0].__name__,
-                                                                              str(sys.exc_info()[1])))
-            if 'ARTIST' in self.fields:
-                songFieldInfo['ARTIST'] = ""
+    """
+    Dance With Intensity chart file. Each chart is a #SINGLE, #DOUBLE,
+    #COUPLE or #SOLO tag with the difficulty, meter and steps; doubles and
+    couples have the steps of each pad separated by a colon.
+    """
 
-        if 'TITLE' in self.fields:
-            songFieldInfo['TITLE'] = self.songTitle
-        if 'STEPARTIST' in self.fields:
-            songFieldInfo['STEPARTIST'] = self.stepper
+    formatName = "dwi"
+    chartTags = ('SINGLE', 'DOUBLE', 'COUPLE', 'SOLO')
 
-        simfileLogger.debug("parse: '%s'", songFieldInfo)
-        self.simInfo = songFieldInfo
+    @staticmethod
+    def readCharts(chartText):
+        """
+        Same as SSCFile.readCharts(), with the tag as STEPSTYPE.
+        """
+        header = {}
+        charts = []
+        for tag, value in iterMsdTags(chartText):
+            if tag in DWIFile.chartTags:
+                chartValues = value.split(":", 2)
+                if len(chartValues) == 3:
+                    charts.append({'STEPSTYPE': tag, 'DIFFICULTY': chartValues[0].strip(),
+                                   'METER': chartValues[1].strip(), 'NOTES': chartValues[2]})
+            else:
+                header[tag] = value
+        return header, charts
+
+# Chart file extension to the Simfile class that parses it. When a song
+# folder has more than one kind of chart file, the first one here is used,
+# so the richest format wins.
+simfileFormats = {
+    '.ssc': SSCFile,
+    '.sm': SMFile,
+    '.dwi': DWIFile,
+}
 
+def getSimfileClass(fileName):
+    """
+    The Simfile class for a chart file name, or None if it isn't one.
+    """
+    return simfileFormats.get(os.path.splitext(fileName)[1].lower())
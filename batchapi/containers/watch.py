@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+"""
+Watch mode for judging week: keeps the judgments and judge statistics of
+the sets up to date while judges drop their notes into the set folders,
+instead of rerunning judgetoexcel.py and judgenotes.py by hand.
+
+NotesWatcher polls the set folders. Each poll is one os.scandir per
+folder, comparing (modification time, size) of the judge notes files
+against the last poll, so nothing is read while nothing changes and the
+process sleeps between polls. When a set changes:
+
+- judgments_<set>.csv is written again. JudgesForExcel only reads the
+  judge files whose stamp changed (see JudgesForExcel.ratingCache).
+- ratingsToSongs_<judge>.txt and ratingsRaw_<judge>.txt are written for
+  the new or changed judge files only.
+- The forum post draft is written again when watching a folder of sets.
+  FormatNotes keeps its fragment cache, so only changed judges are rendered.
+
+When watching a folder of sets, the CSV and ratings files go to
+<outputDir>/<set name>/ rather than into the set folders, because the
+forum post takes every file in a set folder. When watching a single set
+they go into the set folder, like the scripts write them, unless an
+outputDir is given.
+"""
+
+import os
+import sys
+import time
+from .judge import isSetDirName, isJudgeNotesFile
+from .metrics import timed, count
+
+###########
+# LOGGERS #
+###########
+
+# Handlers are added by configureLogging() in logconfig.py when a script starts.
+import logging
+watchLogger = logging.getLogger("WATCH")
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getNotesSnapshot(setPath):
+    """
+    Returns a dictionary with <notes file name>:(modification time, size)
+    for the judge notes files directly in setPath, from a single os.scandir.
+    """
+    snapshot = {}
+    with os.scandir(setPath) as entries:
+        for entry in entries:
+            if isJudgeNotesFile(entry.name) and entry.is_file():
+                entryStat = entry.stat()
+                snapshot[entry.name] = (entryStat.st_mtime_ns, entryStat.st_size)
+    return snapshot
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class NotesWatcher():
+    """
+    * CLASS ATTRIBUTES *
+    - path: Full path to a folder of set folders, or to a single set folder.
+    - outputDir: Folder the judgments and ratings files are written into,
+                 one subfolder per set. <path>_watch by default for a folder
+                 of sets; None writes into the set folder itself.
+    - interval: Seconds to sleep between polls.
+    - postFormats: Post templates for the forum post draft (see posttemplate.py).
+    - isBatch: True if path is a folder of set folders; only then is the
+               forum post draft written.
+    - snapshots: Dictionary with <set path>:<snapshot from getNotesSnapshot>
+    - judgeSets: Dictionary with <set path>:JudgesForExcel, kept between polls.
+    - polls: Number of polls so far.
+    - updates: Number of set updates so far.
+    """
+
+    def __init__(self, notesDir, outputDir=None, interval=2.0, postFormats=None):
+        """
+        Constructor
+        """
+        self.path = os.path.normpath(notesDir)
+        self.interval = interval
+        self.postFormats = postFormats
+        self.isBatch = self.hasSetDirs()
+        if outputDir is None and self.isBatch:
+            outputDir = self.path + "_watch"
+        self.outputDir = outputDir
+        self.snapshots = {}
+        self.judgeSets = {}
+        self.polls = 0
+        self.updates = 0
+
+    def __str__(self):
+        return """>>> NOTES WATCHER
+- NOTES PATH: {}
+- OUTPUT DIR: {}
+- INTERVAL: {}
+- FOLDER OF SETS: {}
+- POLLS: {}
+- UPDATES: {}""" \
+        .format(self.path, self.outputDir, str(self.interval), str(self.isBatch), str(self.polls),
+                str(self.updates))
+
+    def hasSetDirs(self):
+        with os.scandir(self.path) as entries:
+            return any(entry.is_dir() and isSetDirName(entry.name) for entry in entries)
+
+    def getSetPaths(self):
+        if not self.isBatch:
+            return [self.path]
+        with os.scandir(self.path) as entries:
+            return sorted((entry.path for entry in entries if entry.is_dir() and isSetDirName(entry.name)),
+                          key=str.lower)
+
+    def poll(self):
+        """
+        Takes a new snapshot of every set folder. Returns a dictionary with
+        <set path>:<set of changed notes file names> for the sets where a
+        notes file was added, changed or removed.
+        """
+        self.polls += 1
+        changedSets = {}
+        setPaths = self.getSetPaths()
+        for setPath in setPaths:
+            try:
+                snapshot = getNotesSnapshot(setPath)
+            except OSError:
+                watchLogger.warning("poll: {0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
+                continue
+            lastSnapshot = self.snapshots.get(setPath)
+            if snapshot != lastSnapshot:
+                lastSnapshot = lastSnapshot if lastSnapshot is not None else {}
+                changedSets[setPath] = {fileName for fileName in set(snapshot) | set(lastSnapshot)
+                                        if snapshot.get(fileName) != lastSnapshot.get(fileName)}
+                self.snapshots[setPath] = snapshot
+        for setPath in list(self.snapshots):
+            if setPath not in setPaths:
+                watchLogger.info("poll: Set folder '%s' is gone", setPath)
+                del self.snapshots[setPath]
+                self.judgeSets.pop(setPath, None)
+                changedSets[setPath] = set()
+        return changedSets
+
+    def getSetOutputDir(self, setPath):
+        if self.outputDir is None:
+            return setPath
+        setOutputDir = os.path.join(self.outputDir, os.path.basename(setPath))
+        os.makedirs(setOutputDir, exist_ok=True)
+        return setOutputDir
+
+    @timed("watch.updateSet")
+    def updateSet(self, setPath, changedFiles):
+        """
+        Writes the judgments CSV of the set, and the ratings files of every
+        judge whose notes file is in changedFiles.
+        """
+        from .judge import JudgesForExcel, JudgeNotes
+        if setPath not in self.snapshots:
+            return
+        watchLogger.info("updateSet: '%s' changed: %s", setPath, str(sorted(changedFiles)))
+        judgeSet = self.judgeSets.get(setPath)
+        if judgeSet is None:
+            judgeSet = JudgesForExcel(setPath)
+            self.judgeSets[setPath] = judgeSet
+        judgeSet.outputDir = self.getSetOutputDir(setPath)
+        if judgeSet.judgeNames:
+            judgeSet.createRatingCSV()
+        for judgeName, notesFile in judgeSet.judgeToFileName.items():
+            if notesFile in changedFiles:
+                judgeNotes = JudgeNotes(os.path.join(setPath, notesFile))
+                judgeNotes.outputDir = judgeSet.outputDir
+                judgeNotes.writeRatingsToSongs()
+                judgeNotes.writeRawRatings()
+                count("watch.judgeFilesUpdated")
+        self.updates += 1
+
+    @timed("watch.updatePost")
+    def updatePost(self):
+        from .format import FormatNotes
+        notesFormat = FormatNotes(self.path, postFormats=self.postFormats)
+        notesFormat.getSetJudgeInfo()
+        notesFormat.makeFormattedPost()
+        watchLogger.info("updatePost: Rendered %s judges, reused %s", str(notesFormat.renderedFragments),
+                         str(notesFormat.reusedFragments))
+
+    def check(self):
+        """
+        One poll, and the updates for whatever changed. Returns the changed sets.
+        """
+        changedSets = self.poll()
+        for setPath, changedFiles in sorted(changedSets.items()):
+            try:
+                self.updateSet(setPath, changedFiles)
+            except:
+                watchLogger.warning("check: '{0}': {1}: {2}".format(setPath, sys.exc_info()[0].__name__,
+                                                                     str(sys.exc_info()[1])))
+        if changedSets and self.isBatch:
+            try:
+                self.updatePost()
+            except:
+                watchLogger.warning("check: {0}: {1}".format(sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
+        return changedSets
+
+    def run(self, maxPolls=None, onChange=None):
+        """
+        Polls until interrupted (or maxPolls polls), sleeping interval seconds
+        in between. onChange is called with the changed sets after each update.
+        """
+        watchLogger.info("run: Watching '%s' every %s seconds", self.path, str(self.interval))
+        try:
+            while maxPolls is None or self.polls < maxPolls:
+                changedSets = self.check()
+                if changedSets and onChange is not None:
+                    onChange(changedSets)
+                if maxPolls is None or self.polls < maxPolls:
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            watchLogger.info("run: Stopped after %s polls", str(self.polls))
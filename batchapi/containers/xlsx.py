@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+
+"""
+Writes .xlsx workbooks without any package outside the standard library.
+
+An .xlsx file is a zip file of XML parts. XlsxWriter opens the part of
+each sheet as a compressed stream inside the zip file and writes every
+row to it as soon as it is given, so the memory used doesn't grow with
+the size of the workbook; only the sheet names are kept until close().
+
+Numbers (int and float) are written as numeric cells and everything else
+as inline text, so a rating like 8.5 can be summed in Excel while a PASS
+or * stays as it is. Inline text avoids the shared strings table, which
+would have to be kept in memory for the whole workbook.
+"""
+
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+#############
+# XML PARTS #
+#############
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+CONTENT_TYPES_XML = (
+    XML_DECLARATION +
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{0}</Types>')
+
+SHEET_CONTENT_TYPE = ('<Override PartName="/xl/worksheets/sheet{0}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+
+ROOT_RELS_XML = (
+    XML_DECLARATION +
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>')
+
+WORKBOOK_XML = (
+    XML_DECLARATION +
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{0}</sheets></workbook>')
+
+WORKBOOK_SHEET = '<sheet name="{0}" sheetId="{1}" r:id="rId{1}"/>'
+
+WORKBOOK_RELS_XML = (
+    XML_DECLARATION +
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{0}<Relationship Id="rId{1}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>')
+
+SHEET_RELATIONSHIP = ('<Relationship Id="rId{0}" '
+                      'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                      'Target="worksheets/sheet{0}.xml"/>')
+
+SHEET_START_XML = (XML_DECLARATION +
+                   '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">')
+
+# Style 0 is the default, style 1 is bold for header rows.
+STYLES_XML = (
+    XML_DECLARATION +
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '</styleSheet>')
+
+########################
+# FUNCTION DEFINITIONS #
+########################
+
+def getColumnName(columnIndex):
+    """
+    Column letters for a 0-based column index: 0 is A, 25 is Z, 26 is AA.
+    """
+    columnName = ""
+    columnIndex += 1
+    while columnIndex > 0:
+        columnIndex, remainder = divmod(columnIndex - 1, 26)
+        columnName = chr(65 + remainder) + columnName
+    return columnName
+
+def getSheetName(name, usedNames):
+    """
+    Excel sheet names are at most 31 characters, can't contain []:*?/\\ and
+    have to be unique within the workbook (ignoring case).
+    """
+    sheetName = re.sub("[\[\]:*?/\\\\]", "_", name).strip("'")[:31] or "Sheet"
+    baseName = sheetName
+    number = 2
+    while sheetName.lower() in usedNames:
+        suffix = " (" + str(number) + ")"
+        sheetName = baseName[:31 - len(suffix)] + suffix
+        number += 1
+    return sheetName
+
+def escapeCellText(text):
+    # Control characters other than tab and newline are not allowed in XML 1.0.
+    return escape(re.sub("[\x00-\x08\x0b\x0c\x0e-\x1f]", "", text))
+
+#####################
+# CLASS DEFINITIONS #
+#####################
+
+class XlsxWriter():
+    """
+    Streaming writer for a workbook of simple sheets. Use addSheet() to
+    start a sheet, writeRow() for each of its rows, and close() (or a with
+    block) to finish the file. Sheets are written one after the other.
+
+    * CLASS ATTRIBUTES *
+    - path: Full path to the .xlsx file.
+    - zipFile: The open zip file.
+    - sheetNames: Names of the sheets added so far, in order.
+    - sheetStream: Text stream of the sheet being written, or None.
+    - rowNumber: Number of rows written to the current sheet.
+    """
+
+    def __init__(self, xlsxPath):
+        """
+        Constructor. Opens the file for writing.
+        """
+        self.path = xlsxPath
+        self.zipFile = zipfile.ZipFile(xlsxPath, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.sheetNames = []
+        self.sheetStream = None
+        self.rowNumber = 0
+
+    def __str__(self):
+        return """>>> XLSX WRITER
+- PATH: {}
+- SHEETS: {}""" \
+        .format(self.path, self.sheetNames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def addSheet(self, name, columnWidths=None):
+        """
+        Finishes the current sheet and starts a new one. columnWidths is an
+        optional list of widths (in characters) for the first columns.
+        Returns the name the sheet got.
+        """
+        self.endSheet()
+        sheetName = getSheetName(name, {usedName.lower() for usedName in self.sheetNames})
+        self.sheetNames.append(sheetName)
+        sheetPart = "xl/worksheets/sheet" + str(len(self.sheetNames)) + ".xml"
+        self.sheetStream = io.TextIOWrapper(self.zipFile.open(sheetPart, 'w'), encoding="utf-8",
+                                            write_through=False)
+        self.sheetStream.write(SHEET_START_XML)
+        if columnWidths:
+            self.sheetStream.write("<cols>")
+            for columnIndex, width in enumerate(columnWidths):
+                self.sheetStream.write('<col min="{0}" max="{0}" width="{1}" customWidth="1"/>'
+                                       .format(columnIndex + 1, width))
+            self.sheetStream.write("</cols>")
+        self.sheetStream.write("<sheetData>")
+        self.rowNumber = 0
+        return sheetName
+
+    def writeRow(self, values, bold=False):
+        """
+        Writes one row. int and float values become numeric cells, None an
+        empty cell, and anything else a text cell. bold is for header rows.
+        """
+        self.rowNumber += 1
+        rowNumber = str(self.rowNumber)
+        style = ' s="1"' if bold else ""
+        cells = []
+        for columnIndex, value in enumerate(values):
+            if value is None:
+                continue
+            cellRef = getColumnName(columnIndex) + rowNumber
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                cells.append('<c r="' + cellRef + '"' + style + '><v>' + repr(value) + '</v></c>')
+            else:
+                text = escapeCellText(str(value))
+                space = ' xml:space="preserve"' if text != text.strip() else ""
+                cells.append('<c r="' + cellRef + '"' + style + ' t="inlineStr"><is><t' + space + '>' + text +
+                             '</t></is></c>')
+        self.sheetStream.write('<row r="' + rowNumber + '">' + "".join(cells) + '</row>')
+
+    def endSheet(self):
+        if self.sheetStream is not None:
+            self.sheetStream.write("</sheetData></worksheet>")
+            self.sheetStream.close()
+            self.sheetStream = None
+
+    def writeWorkbookParts(self):
+        """
+        Writes the parts that list the sheets. A workbook needs at least one
+        sheet, so an empty one is added if none were.
+        """
+        if not self.sheetNames:
+            self.addSheet("Sheet1")
+            self.endSheet()
+        sheetNumbers = range(1, len(self.sheetNames) + 1)
+        self.zipFile.writestr("[Content_Types].xml", CONTENT_TYPES_XML.format(
+            "".join(SHEET_CONTENT_TYPE.format(number) for number in sheetNumbers)))
+        self.zipFile.writestr("_rels/.rels", ROOT_RELS_XML)
+        self.zipFile.writestr("xl/workbook.xml", WORKBOOK_XML.format(
+            "".join(WORKBOOK_SHEET.format(escape(sheetName, {'"': "&quot;"}), number)
+                    for number, sheetName in zip(sheetNumbers, self.sheetNames))))
+        self.zipFile.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS_XML.format(
+            "".join(SHEET_RELATIONSHIP.format(number) for number in sheetNumbers), len(self.sheetNames) + 1))
+        self.zipFile.writestr("xl/styles.xml", STYLES_XML)
+
+    def close(self):
+        if self.zipFile is None:
+            return
+        try:
+            self.endSheet()
+            self.writeWorkbookParts()
+        finally:
+            self.zipFile.close()
+            self.zipFile = None
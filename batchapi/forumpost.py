@@ -1,13 +1,21 @@
 #!/usr/bin/python3
 
-from containers.format import *
+from containers.format import FormatNotes
+from containers.logconfig import configureLogging
 
 # MAIN
 if __name__ == "__main__":
 
+    configureLogging()
+
     print(">>> format.py takes a set of judge notes and combines them into a forum post.")
     notesPath = (input(">>> Input full path to directory with sets folders for judge notes: ")).strip()
-    notesFormat = FormatNotes(notesPath)
+    postFormats = (input(">>> Input post formats separated by commas (bbcode, markdown, html) "
+                         "or leave empty for bbcode: ")).strip()
+    if postFormats == "":
+        notesFormat = FormatNotes(notesPath)
+    else:
+        notesFormat = FormatNotes(notesPath, postFormats=[name.strip() for name in postFormats.split(",")])
 
     # Get the judges and all set info.
     notesFormat.getSetJudgeInfo()
@@ -1,32 +1,26 @@
 #!/usr/bin/python3
 
 from containers.judge import JudgeNotes
+from containers.logconfig import configureLogging
 
 # MAIN
 if __name__ == "__main__":
 
+    configureLogging()
+
     print(">>> judgenotes.py is used to get some analytics out of a judge's notes concerning normal ratings and special "
           "ratings.")
     print(">>> This should not be run until after judges have passed in their notes.")
     judgeNotesFilePath = (input(">>> Input full path of Judge Notes File: ")).strip()
     judge = JudgeNotes(judgeNotesFilePath)
-    judge.getJudgeName()
-
-    judge.getJudgeRatings()
-    judge.getNumSpecialFiles()
-    judge.getNumTotalFiles()
-    # judge.printJudgeRatings()
-    judge.getJudgeAverage()
 
-    judge.getRatingsToSongs()
-    judge.getSpecialRatingsToSongs()
+    # Ratings, averages and the ratings to songs maps are parsed when first needed.
     print(judge)
+    # judge.printJudgeRatings()
     # judge.printRatingsToSongs()
     print(">>> Writing Ratings To Songs File.")
     judge.writeRatingsToSongs()
-    
-    judge.getRawRatings()
-    judge.getRawSpecialRatings()
+
     # judge.printRawRatings()
     print(">>> Writing Raw Ratings File.")
     judge.writeRawRatings()
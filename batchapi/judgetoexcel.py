@@ -1,33 +1,71 @@
 #!/usr/bin/python3
 
-from containers.judge import JudgesForExcel
+import os
+from containers.judge import JudgesForExcel, BatchJudgesForExcel, isSetDirName
+from containers.lint import NotesLinter
+from containers.logconfig import configureLogging
 
 # MAIN
 if __name__ == "__main__":
+    configureLogging()
     print(">>> judgetoexcel.py is used to make a .csv file that contains judge ratings (judgments_<setname>.csv)")
     print(">>> It is assumed you have already ran artistfornotes.py to add in the stepartists (the files had _steppers "
           "appended to the file name). If you are specifying a set directory with judge notes that don't have the "
           "stepartists in them, you will get unexpected behavior.")
+    print(">>> A judgments_<setname>.xlsx workbook is written too, with the ratings as numbers and a Summary sheet.")
+    print(">>> If you specify a directory containing set folders instead, every set is done at once and a merged "
+          "judgments_<batchname>.csv is written along with the file for each set.")
     notesDirPath = (input(">>> Input full path of Set directory with Judge Notes: ")).strip()
-    judgeSet = JudgesForExcel(notesDirPath)
 
-    # Get Judge Notes Files First along with Set Number
-    judgeSet.getSetFileListing()
-    judgeSet.printSetFileListing()
-    judgeSet.getSetNumber()
+    # Check every notes file first so a typo is caught before anything is written.
+    linter = NotesLinter(notesDirPath)
+    if not linter.lint():
+        print(linter)
+        for line in linter.getReportLines():
+            print(line)
+        if (input(">>> Write the judgments anyway? [y/N]: ")).strip().lower() != "y":
+            raise SystemExit(1)
 
-    # Get Judge Names
-    judgeSet.getAllJudgesInSet()
-    judgeSet.printJudgeNames()
+    # A directory holding set folders means batch mode.
+    batchMode = any(os.path.isdir(os.path.join(notesDirPath, entry)) and isSetDirName(entry)
+                    for entry in os.listdir(notesDirPath))
+    if batchMode:
+        batchJudges = BatchJudgesForExcel(notesDirPath)
+        batchJudges.getSetDirs()
 
-    # Parse ordered song list from judge notes.
-    judgeSet.getOrderedSongList()
+        # Parse every set, then write the set files and the merged file from the same parsed judges.
+        print(">>> Parsing all sets.")
+        batchJudges.parseAllSets()
+        print(batchJudges)
+        print(">>> Creating CSV files.")
+        batchJudges.createSetCSVs()
+        batchJudges.createBatchCSV()
+        print(">>> Creating .xlsx workbook.")
+        batchJudges.createBatchXLSX()
+        print(">>> See '/tmp/judgesExcelLogger.log' for more output.")
+    else:
+        judgeSet = JudgesForExcel(notesDirPath)
 
-    # Now get all the judge ratings
-    judgeSet.getAllJudgeRatings()
-    print(judgeSet)
+        # Get Judge Notes Files First along with Set Number
+        judgeSet.getSetFileListing()
+        judgeSet.printSetFileListing()
+        judgeSet.getSetNumber()
 
-    # Test printing out CSV file
-    print(">>> Creating CSV file.")
-    judgeSet.createRatingCSV()
-    print(">>> See '/tmp/judgesExcelLogger.log' for more output.")
+        # Get Judge Names
+        judgeSet.getAllJudgesInSet()
+        judgeSet.printJudgeNames()
+
+        # Parse ordered song list from judge notes.
+        judgeSet.getOrderedSongList()
+
+        # Now get all the judge ratings
+        judgeSet.getAllJudgeRatings()
+        print(judgeSet)
+
+        # Test printing out CSV file
+        print(">>> Creating CSV file.")
+        judgments = judgeSet.getJudgments()
+        judgeSet.createRatingCSV(judgments)
+        print(">>> Creating .xlsx workbook.")
+        judgeSet.createRatingXLSX(judgments)
+        print(">>> See '/tmp/judgesExcelLogger.log' for more output.")
@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 
 from containers.notestemplate import NotesTemplate
+from containers.logconfig import configureLogging
 
 # MAIN
 if __name__ == "__main__":
     
+    configureLogging()
+
     # Create Template Object.
     print(">>> notestemplate.py is used to generate a template judge notes file from the .csv file generated in batch.py")
     print(">>> It is assumed here you already have run batch.py to make this .csv file.")
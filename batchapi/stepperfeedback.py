@@ -0,0 +1,23 @@
+#!/usr/bin/python3
+
+from containers.feedback import StepartistFeedback
+from containers.logconfig import configureLogging
+
+# MAIN
+if __name__ == "__main__":
+
+    configureLogging()
+
+    print(">>> stepperfeedback.py puts every judge's comments on a stepartist's files into one feedback file per "
+          "stepartist (feedback_<stepartist>.txt).")
+    print(">>> It is assumed you have already ran artistfornotes.py so the judge notes have the stepartists in them.")
+    notesPath = (input(">>> Input full path to a set directory, or a directory with set folders of judge notes: ")).strip()
+    feedback = StepartistFeedback(notesPath)
+
+    # Index the song blocks of every judge file, then write out the feedback files.
+    print(">>> Indexing judge notes files.")
+    feedback.buildIndices()
+    print(feedback)
+    print(">>> Writing feedback files.")
+    feedback.writeAllFeedback()
+    print(">>> See '/tmp/feedback.log' for more output.")
@@ -0,0 +1,244 @@
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.simfile import SSCFile, SMFile, DWIFile, getSimfileClass
+from containers.corpus import SyntheticCorpus
+from containers.releasepack import ReleasePack
+from containers.batchcontainer import BatchContainer
+from containers.checkpoint import CheckpointJournal
+from containers.assets import readAssetFields
+
+batchDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch")
+
+sscText = """#VERSION:0.83;
+#TITLE:Song;
+#ARTIST:Artist;
+#BPMS:0.000=120.000
+,64.000=240.000;
+// A comment #NOTEDATA:;
+#NOTEDATA:;
+#STEPSTYPE:dance-single;
+#CREDIT:Stepper;
+#DIFFICULTY:Hard;
+#METER:9;
+#NOTES:
+0000
+1000
+;
+#NOTEDATA:;
+#STEPSTYPE:dance-double;
+#DIFFICULTY:Easy;
+#METER:3;
+#NOTES:
+00000000
+;
+"""
+
+smText = """#TITLE:Song;
+#ARTIST:Artist;
+#BPMS:0.000=150.000;
+#NOTES:
+     dance-single:
+     Stepper:
+     Challenge:
+     12:
+     0.1,0.2,0.3,0.4,0.5:
+0000
+1000
+;
+#NOTES:
+     dance-single:
+     Broken:
+     Easy:
+;
+"""
+
+dwiText = """#TITLE:Song;
+#ARTIST:Artist;
+#BPM:140;
+#SINGLE:MANIAC:10:0802080208;
+#DOUBLE:BASIC:4:08000800:00080008;
+"""
+
+
+class TestReadCharts(unittest.TestCase):
+
+    def testSscChartsAndHeader(self):
+        header, charts = SSCFile.readCharts(sscText)
+        self.assertEqual(header['TITLE'], "Song")
+        self.assertEqual(header['BPMS'], "0.000=120.000\n,64.000=240.000")
+        self.assertEqual(len(charts), 2)
+        self.assertEqual((charts[0]['STEPSTYPE'], charts[0]['CREDIT'], charts[0]['METER']),
+                         ("dance-single", "Stepper", "9"))
+        self.assertEqual(charts[0]['NOTES'].split(), ["0000", "1000"])
+        self.assertEqual((charts[1]['STEPSTYPE'], charts[1]['DIFFICULTY']), ("dance-double", "Easy"))
+
+    def testSmChartsSkipIncompleteNotes(self):
+        header, charts = SMFile.readCharts(smText)
+        self.assertEqual(header['BPMS'], "0.000=150.000")
+        self.assertEqual(len(charts), 1)
+        self.assertEqual((charts[0]['STEPSTYPE'], charts[0]['DESCRIPTION'], charts[0]['DIFFICULTY'],
+                          charts[0]['METER']), ("dance-single", "Stepper", "Challenge", "12"))
+        self.assertEqual(charts[0]['NOTES'].split(), ["0000", "1000"])
+
+    def testDwiCharts(self):
+        header, charts = DWIFile.readCharts(dwiText)
+        self.assertEqual(header['BPM'], "140")
+        self.assertEqual([(chart['STEPSTYPE'], chart['DIFFICULTY'], chart['METER']) for chart in charts],
+                         [("SINGLE", "MANIAC", "10"), ("DOUBLE", "BASIC", "4")])
+        self.assertEqual(charts[1]['NOTES'], "08000800:00080008")
+
+    def testSimfileClassFromExtension(self):
+        self.assertIs(getSimfileClass("song.SSC"), SSCFile)
+        self.assertIs(getSimfileClass("song.sm"), SMFile)
+        self.assertIs(getSimfileClass("song.dwi"), DWIFile)
+        self.assertIsNone(getSimfileClass("song.ogg"))
+
+
+class TestAssetFields(unittest.TestCase):
+
+    def testShiftJisReferencesAreDecoded(self):
+        songPath = os.path.join(batchDir, "Eirin's Clinic That People Queue Up For (MrPopadopalis25)")
+        for chartFile in ["blank.sm", "blank.dwi"]:
+            self.assertEqual(readAssetFields(os.path.join(songPath, chartFile))['MUSIC'],
+                             "行列のできるえーりん診療所.mp3")
+
+
+class TestBatchJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.journalPath = os.path.join(self.tempDir, "journal.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def parseBatch(self):
+        batch = BatchContainer(batchDir)
+        batch.setSmFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        batch.setDwiFields(['TITLE', 'ARTIST', 'STEPARTIST'])
+        with CheckpointJournal(self.journalPath) as journal:
+            batch.journal = journal
+            batch.getFolderList()
+            batch.construct()
+            batch.parseSimfiles()
+            journal.compact()
+        return batch, journal
+
+    def testUnchangedFailuresAreNotParsedAgain(self):
+        firstBatch, firstJournal = self.parseBatch()
+        failures = firstJournal.getFailures()
+        self.assertGreater(len(failures), 0)  # The charts saved as cp932
+        self.assertFalse(any(firstJournal.failures[(unit, key)][1] for unit, key, error in failures))
+        with open(self.journalPath) as journalFile:
+            journalLines = journalFile.readlines()
+
+        rerunBatch, rerunJournal = self.parseBatch()
+        self.assertEqual(rerunJournal.doneUnits, 0)
+        self.assertEqual(rerunJournal.resumedUnits, len(firstBatch.allSongInfo))
+        self.assertEqual(rerunJournal.getFailures(), failures)
+        self.assertEqual(rerunBatch.allSongInfo, firstBatch.allSongInfo)
+        with open(self.journalPath) as journalFile:
+            self.assertEqual(journalFile.readlines(), journalLines)
+
+    def testCompactKeepsThePermissions(self):
+        self.parseBatch()
+        os.chmod(self.journalPath, 0o640)
+        self.parseBatch()
+        self.assertEqual(os.stat(self.journalPath).st_mode & 0o777, 0o640)
+
+
+class InterruptedPack(ReleasePack):
+    """
+    Stops the build as if Ctrl+C was pressed after stopAfter members were
+    compressed in the thread pool; members copied as they are don't count.
+    """
+
+    stopAfter = 5
+
+    def writeBuffered(self, packFile, member, compressed):
+        if self.stopAfter == 0:
+            raise KeyboardInterrupt()
+        self.stopAfter -= 1
+        return ReleasePack.writeBuffered(self, packFile, member, compressed)
+
+
+class TestReleasePack(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        cls.corpus = SyntheticCorpus(os.path.join(cls.tempDir, "corpus"), songCount=30, setSize=10, judgeCount=3)
+        cls.corpus.write()
+        songPath = os.path.join(cls.corpus.getBatchDir(), sorted(os.listdir(cls.corpus.getBatchDir()))[0])
+        with open(os.path.join(songPath, "song.ogg"), 'wb') as audioFile:
+            audioFile.write(os.urandom(50000))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def getPack(self, packClass=ReleasePack, maxWorkers=4):
+        return packClass(self.corpus.getBatchDir(), self.corpus.getSetsDir(),
+                         outputFile=os.path.join(self.tempDir, "pack.zip"), minAverage=0, maxWorkers=maxWorkers)
+
+    def buildPack(self, packClass=ReleasePack, maxWorkers=4):
+        pack = self.getPack(packClass, maxWorkers)
+        self.assertTrue(pack.build())
+        with open(pack.path, 'rb') as packFile:
+            data = packFile.read()
+        os.remove(pack.path)
+        return pack, data
+
+    def testPackHoldsTheSongFolders(self):
+        pack, data = self.buildPack()
+        self.assertGreater(len(pack.songFolders), 0)
+        zipPath = os.path.join(self.tempDir, "check.zip")
+        with open(zipPath, 'wb') as zipFile:
+            zipFile.write(data)
+        with zipfile.ZipFile(zipPath) as packZip:
+            self.assertIsNone(packZip.testzip())
+            self.assertEqual(packZip.namelist(), [member['name'] for member in pack.members])
+        os.remove(zipPath)
+
+    def testSameBytesWithAnyNumberOfWorkers(self):
+        self.assertEqual(self.buildPack(maxWorkers=1)[1], self.buildPack(maxWorkers=8)[1])
+
+    def testResumedPackIsByteIdentical(self):
+        pack, expected = self.buildPack()
+        interrupted = self.getPack(InterruptedPack)
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted.build()
+        self.assertFalse(os.path.exists(interrupted.path))
+        self.assertTrue(os.path.exists(interrupted.partPath))
+        self.assertTrue(os.path.exists(interrupted.journalPath))
+
+        resumed = self.getPack()
+        self.assertTrue(resumed.build())
+        self.assertGreaterEqual(resumed.resumedMembers, 5)
+        self.assertLess(resumed.resumedMembers, len(resumed.members))
+        self.assertFalse(os.path.exists(resumed.partPath))
+        self.assertFalse(os.path.exists(resumed.journalPath))
+        with open(resumed.path, 'rb') as packFile:
+            self.assertEqual(packFile.read(), expected)
+        os.remove(resumed.path)
+
+    def testNoResumeAfterTheLevelChanged(self):
+        interrupted = self.getPack(InterruptedPack)
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted.build()
+        resumed = self.getPack()
+        resumed.level = 9
+        self.assertTrue(resumed.build())
+        self.assertEqual(resumed.resumedMembers, 0)
+        os.remove(resumed.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
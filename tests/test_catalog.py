@@ -0,0 +1,68 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.judge import JudgeNotes, JudgesForExcel
+from containers.catalog import BatchCatalog, CatalogQuery
+
+fixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sets")
+
+
+class TestLineage(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.catalogPath = os.path.join(self.tempDir, "catalog.sqlite")
+        oldSetDir = os.path.join(self.tempDir, "OldBatch", "set1")
+        os.makedirs(oldSetDir)
+        with open(os.path.join(oldSetDir, "Tester_NotesSet1.txt"), 'w') as notesFile:
+            notesFile.write("[6/10] Maelstrom {Tut Tut Child} (Xiz)\n- first try\n"
+                            "[3/10] Winter Vale {Exias} (Someone Else)\n")
+        with BatchCatalog(self.catalogPath) as catalog:
+            catalog.loadJudgeNotes(JudgeNotes(os.path.join(oldSetDir, "Tester_NotesSet1.txt")), "OldBatch",
+                                   batchDate="2020-01-01")
+            catalog.loadSet(JudgesForExcel(os.path.join(fixtureDir, "set2")), "NewBatch", batchDate="2020-06-01")
+        self.query = CatalogQuery(self.catalogPath)
+
+    def tearDown(self):
+        self.query.close()
+        shutil.rmtree(self.tempDir)
+
+    def testResubmissionFollowsTheEarlierSubmission(self):
+        lineage = self.query.getSongLineage("Maelstrom")
+        self.assertEqual([(row['batch'], row['stepartist']) for row in lineage],
+                         [("OldBatch", "Xiz"), ("NewBatch", "Xiz")])
+        self.assertIsNone(lineage[0]['previousBatch'])
+        self.assertEqual(lineage[1]['previousBatch'], "OldBatch")
+        self.assertEqual(lineage[1]['previousAverage'], 6)
+        self.assertEqual(lineage[1]['better'], 1)
+        self.assertEqual(self.query.getSongLineage("[Resubmission] Maelstrom"), lineage)
+
+    def testSameSongByAnotherStepartistIsNotAResubmission(self):
+        lineage = self.query.getSongLineage("Winter Vale")
+        self.assertEqual([(row['batch'], row['stepartist'], row['previousBatch']) for row in lineage],
+                         [("OldBatch", "Someone Else", None), ("NewBatch", "Silvuh", None)])
+        history = self.query.getSubmissionHistory("Winter Vale", "Silvuh")
+        self.assertEqual([(row['batch'], row['stepartist']) for row in history],
+                         [("OldBatch", "Someone Else"), ("NewBatch", "Silvuh")])
+
+    def testSubmissionHistoryHasEveryRating(self):
+        history = self.query.getSubmissionHistory("Maelstrom", "xiz")
+        self.assertEqual([row['batch'] for row in history], ["OldBatch", "NewBatch"])
+        self.assertEqual(history[0]['allRatings'], "6")
+        self.assertEqual(sorted(history[1]['allRatings'].split(" ")), ["$", "5", "8", "9"])
+
+    def testLoadingABatchAgainKeepsTheLinks(self):
+        with BatchCatalog(self.catalogPath) as catalog:
+            catalog.loadSet(JudgesForExcel(os.path.join(fixtureDir, "set2")), "NewBatch", batchDate="2020-06-01")
+            catalog.rebuildLineage()
+        lineage = self.query.getSongLineage("Maelstrom")
+        self.assertEqual([row['previousBatch'] for row in lineage], [None, "OldBatch"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.format import FormatNotes
+
+fixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sets")
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.notesDir = os.path.join(self.tempDir, "sets")
+        shutil.copytree(fixtureDir, self.notesDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def makePost(self, useCache=True):
+        formatNotes = FormatNotes(self.notesDir, postFormats=['bbcode', 'markdown'])
+        formatNotes.useCache = useCache
+        formatNotes.getSetJudgeInfo()
+        formatNotes.makeFormattedPost()
+        posts = []
+        for postFile in ["forum_post.txt", "forum_post.md"]:
+            with open(os.path.join(self.notesDir, postFile)) as post:
+                posts.append(post.read())
+        return formatNotes, posts
+
+    def testRerunReusesEveryFragment(self):
+        first, firstPosts = self.makePost()
+        self.assertEqual((first.renderedFragments, first.reusedFragments), (16, 0))
+        second, secondPosts = self.makePost()
+        self.assertEqual((second.renderedFragments, second.reusedFragments), (0, 16))
+        self.assertEqual(secondPosts, firstPosts)
+
+    def testOnlyTheChangedJudgeIsRenderedAgain(self):
+        self.makePost()
+        with open(os.path.join(self.notesDir, "set1", "bmah_NotesSet1.txt"), 'a') as notesFile:
+            notesFile.write("\n[7/10] Added Song {Artist} (Stepper)\n- new note\n")
+        rerun, rerunPosts = self.makePost()
+        self.assertEqual((rerun.renderedFragments, rerun.reusedFragments), (2, 14))
+        self.assertIn("Added Song", rerunPosts[0])
+        fresh, freshPosts = self.makePost(useCache=False)
+        self.assertEqual(fresh.reusedFragments, 0)
+        self.assertEqual(rerunPosts, freshPosts)
+
+    def testRemovedJudgeLeavesThePost(self):
+        first, firstPosts = self.makePost()
+        os.remove(os.path.join(self.notesDir, "set2", "jimerax_NotesSet2.txt"))
+        rerun, rerunPosts = self.makePost()
+        self.assertEqual((rerun.renderedFragments, rerun.reusedFragments), (0, 14))
+        self.assertIn("[8/10] [Resubmission] Maelstrom", firstPosts[0])
+        self.assertNotIn("[8/10] [Resubmission] Maelstrom", rerunPosts[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.judge import JudgeNotes, JudgesForExcel, RatingStats
+from containers.lint import getLineProblem
+
+fixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "judgenotes")
+setsDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sets")
+
+
+def writeNotes(path, lines):
+    with open(path, 'w', encoding="utf-8") as notesFile:
+        notesFile.write("\n".join(lines) + "\n")
+
+
+class TestLazyJudgeNotes(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.notesPath = os.path.join(self.tempDir, "Tester_NotesSet1.txt")
+        writeNotes(self.notesPath, ["[4/10] First {Artist} (Stepper)", "- notes",
+                                    "[6/10] Second {Artist} (Stepper)", "[PASS] Third {Artist} (Stepper)"])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def testValuesAreRecomputedWhenTheFileChanges(self):
+        judgeNotes = JudgeNotes(self.notesPath)
+        self.assertEqual(judgeNotes.numJudgedFiles, 2)
+        self.assertEqual(judgeNotes.average, 5)
+        self.assertEqual(judgeNotes.ratingsRaw, {'4': 1, '6': 1})
+        writeNotes(self.notesPath, ["[4/10] First {Artist} (Stepper)", "[6/10] Second {Artist} (Stepper)",
+                                    "[8/10] Fourth {Other Artist} (Stepper)"])
+        self.assertEqual(judgeNotes.numJudgedFiles, 3)
+        self.assertEqual(judgeNotes.average, 6)
+        self.assertEqual(judgeNotes.numSpecialFiles, 0)
+        self.assertEqual(judgeNotes.ratingsRaw, {'4': 1, '6': 1, '8': 1})
+
+    def testJudgeNameStaysCached(self):
+        judgeNotes = JudgeNotes(self.notesPath)
+        self.assertEqual(judgeNotes.judgeName, "Tester")
+        writeNotes(self.notesPath, ["[8/10] Fourth {Other Artist} (Stepper)"])
+        self.assertEqual(judgeNotes.judgeName, "Tester")
+
+    def testAddedRatingInvalidatesCountsAndAverage(self):
+        judgeNotes = JudgeNotes(self.notesPath)
+        self.assertEqual((judgeNotes.numJudgedFiles, judgeNotes.average, judgeNotes.numSpecialFiles), (2, 5, 1))
+        judgeNotes.getRatingWithInfo("[8/10] Fourth {Artist} (Stepper)")
+        judgeNotes.getRatingWithInfo("[$] Fifth {Artist} (Stepper)")
+        self.assertEqual(judgeNotes.numJudgedFiles, 3)
+        self.assertEqual(judgeNotes.average, 6)
+        self.assertEqual(judgeNotes.numSpecialFiles, 2)
+        self.assertEqual(judgeNotes.numTotalFiles, 5)
+        self.assertEqual(judgeNotes.ratingsRaw, {'4': 1, '6': 1, '8': 1})
+
+
+class TestRatingStats(unittest.TestCase):
+
+    def getStats(self, ratings, special=()):
+        stats = RatingStats()
+        for rating in ratings:
+            stats.add(rating)
+        for rating in special:
+            stats.add(rating, isSpecial=True)
+        return stats
+
+    def testMergeMatchesOneStatsOverEverything(self):
+        first = ['2', '4.5', '7', '10']
+        second = ['1', '3', '3', '8.5', '9']
+        merged = self.getStats(first, ['PASS'])
+        merged.merge(self.getStats(second, ['PASS', '$']))
+        values = [float(rating) for rating in first + second]
+        self.assertEqual(merged.count, len(values))
+        self.assertAlmostEqual(merged.ratingSum, sum(values))
+        self.assertAlmostEqual(merged.mean, statistics.mean(values))
+        self.assertAlmostEqual(merged.getVariance(), statistics.pvariance(values))
+        self.assertEqual(merged.histogram['3'], 2)
+        self.assertEqual(merged.specialCount, 3)
+        self.assertEqual(merged.specialHistogram, {'PASS': 2, '$': 1})
+
+    def testMergeWithEmptyStats(self):
+        stats = self.getStats(['4', '6'])
+        stats.merge(RatingStats())
+        self.assertEqual((stats.count, stats.mean, stats.getVariance()), (2, 5, 1))
+        empty = RatingStats()
+        empty.merge(self.getStats(['4', '6']))
+        self.assertEqual((empty.count, empty.mean, empty.getVariance()), (2, 5, 1))
+
+    def testStreamingStatsMatchJudgeNotes(self):
+        judgeNotes = JudgeNotes(os.path.join(fixtureDir, "Niala_Notes_OtherSymbols.txt"))
+        stats = judgeNotes.getStreamingStats()
+        self.assertEqual(stats.count, judgeNotes.numJudgedFiles)
+        self.assertEqual(stats.specialCount, judgeNotes.numSpecialFiles)
+        self.assertAlmostEqual(stats.mean, judgeNotes.average)
+
+
+class TestRatingCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.setDir = os.path.join(self.tempDir, "set2")
+        shutil.copytree(os.path.join(setsDir, "set2"), self.setDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def readCSV(self):
+        judgeSet = JudgesForExcel(self.setDir)
+        judgeSet.createRatingCSV()
+        with open(os.path.join(self.setDir, judgeSet.setCSV)) as csvFile:
+            return [line.rstrip("\n").split(",") for line in csvFile]
+
+    def testUnreadableJudgeOnlyLeavesItsOwnColumnEmpty(self):
+        expected = self.readCSV()
+        with open(os.path.join(self.setDir, "zed_NotesSet2.txt"), 'wb') as notesFile:
+            notesFile.write(b"[5/10] Winter Vale {Exias} (Silvuh)\n- \xff\xfe\n")
+        rows = self.readCSV()
+        self.assertEqual(rows[0], expected[0][:-1] + ["zed", "supp"])
+        self.assertEqual(len(rows), len(expected))
+        for row, expectedRow in zip(rows[1:], expected[1:]):
+            self.assertEqual(row, expectedRow + [""])
+
+
+class TestLintLineProblems(unittest.TestCase):
+
+    def testUsualLinesHaveNoProblem(self):
+        self.assertIsNone(getLineProblem("[7.5/10] Moonearth {DJ Sharpnel} (Tyler)"))
+        self.assertIsNone(getLineProblem("[PASS] Black {katoh} (someguy)"))
+        self.assertIsNone(getLineProblem("[5$/10] Song {Artist} (Stepper)"))
+
+    def testTitlesWithBracesAreNotProblems(self):
+        self.assertIsNone(getLineProblem("[<] {~-Zero-~} =PLANET KARMA= ^_^ [superultrabrutal] (yes) "
+                                         "endOfSongTitle {obscureArtist} (badStepper)"))
+        self.assertIsNone(getLineProblem("[#] [Snowman And Sunshine Girl] -Terror From Beyond- "
+                                         "(SuperRemix Gimmix) {expressive} {Digital Explosion} (Stepper)"))
+
+    def testColumnsPointAtTheProblem(self):
+        self.assertEqual(getLineProblem("[7.5] Song {Artist} (Stepper)"), (2, "missing /10 after the rating"))
+        self.assertEqual(getLineProblem("[11/10] Song {Artist} (Stepper)"), (2, "rating 11 is over 10"))
+        self.assertEqual(getLineProblem("[?] Song {Artist} (Stepper)"), (2, "unknown rating symbol '?'"))
+        self.assertEqual(getLineProblem("[7/10 Song {Artist} (Stepper)"), (1, "'[' is never closed"))
+        self.assertEqual(getLineProblem(" [7/10] Song {Artist} (Stepper)"),
+                         (1, "space before the rating, so the line isn't read"))
+        self.assertEqual(getLineProblem("[7/10] Song {Artist (Stepper)"), (13, "'{' is never closed"))
+        self.assertEqual(getLineProblem("[7/10] Song Artist} (Stepper)"), (19, "'}' has no '{'"))
+        self.assertEqual(getLineProblem("[7/10] Song {Artist} (Stepper"), (22, "'(' is never closed"))
+        self.assertEqual(getLineProblem("[7/10] Song {Artist} (Stepper) v2"), (32, "text after the (stepartist)"))
+
+    def testStepartistOnlyRequiredWhenAsked(self):
+        self.assertEqual(getLineProblem("[7/10] Song {Artist}"), (21, "no (stepartist) after the {artist}"))
+        self.assertIsNone(getLineProblem("[7/10] Song {Artist}", requireStepartist=False))
+        self.assertIsNone(getLineProblem("[<] {~-Zero-~} =PLANET KARMA= {obscureArtist}", requireStepartist=False))
+
+    def testFixtureNotesHaveNoBraceProblems(self):
+        for notesFile in ["DossarLX ODI_NotesMayBatch.txt", "Niala_Notes_OtherSymbols.txt"]:
+            with open(os.path.join(fixtureDir, notesFile), encoding="utf-8-sig") as notes:
+                for line in notes:
+                    if line.startswith("["):
+                        problem = getLineProblem(line, requireStepartist=False)
+                        self.assertFalse(problem is not None and "{" in problem[1], line)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.notestemplate import ArtistForNotes
+
+fixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "judgenotes", "artistadd")
+
+
+class TestArtistForNotes(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.setDir = os.path.join(self.tempDir, "set2")
+        shutil.copytree(fixtureDir, self.setDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def addSteppers(self):
+        artistAdd = ArtistForNotes(os.path.join(self.setDir, "set2.csv"), ['STEPARTIST'])
+        artistAdd.getFieldIndices()
+        artistAdd.getRelevantFields()
+        artistAdd.getJudgeFilesForAdd()
+        artistAdd.getAllJudgesInSet()
+        artistAdd.getAllSteppers()
+        artistAdd.addSteppersToFile()
+        return artistAdd
+
+    def getOutputStats(self):
+        return {fileName: os.stat(os.path.join(self.setDir, fileName))
+                for fileName in os.listdir(self.setDir) if fileName.endswith("_steppers.txt")}
+
+    def readOutput(self, fileName):
+        with open(os.path.join(self.setDir, fileName)) as outputFile:
+            return [line.rstrip("\n") for line in outputFile if line.startswith("[")]
+
+    def testStepartistsAddedInListingOrder(self):
+        artistAdd = self.addSteppers()
+        self.assertEqual(sorted(artistAdd.judgeNames), ["Fission", "choof", "psychoangel691"])
+        self.assertEqual(self.readOutput("Fission_NotesSet2_steppers.txt")[:4],
+                         ["[5/10] [Resubmission] Maelstrom {Tut Tut Child} (Xiz)",
+                          "[4/10] Guardians of Old {Step bouy} (M0nkeyz)",
+                          "[2/10] Science Party {The Consortium of Genius} (Coolgamer)",
+                          "[3/10] Winter Vale {Exias} (Silvuh)"])
+
+    def testManifestIsKeptOutOfTheSetFolder(self):
+        artistAdd = self.addSteppers()
+        manifestPath = os.path.join(self.tempDir, "set2_steppers_manifest.json")
+        self.assertEqual(artistAdd.getStepperManifestPath(), manifestPath)
+        with open(manifestPath) as manifestFile:
+            manifest = json.load(manifestFile)
+        self.assertEqual(sorted(manifest), sorted(artistAdd.judgeFiles))
+        self.assertEqual(sorted(fileName for fileName in os.listdir(self.setDir) if not fileName.endswith(".csv")),
+                         sorted(artistAdd.judgeFiles + [artistAdd.getStepperOutputFile(notesFile)
+                                                        for notesFile in artistAdd.judgeFiles]))
+
+    def testRerunOnlyWritesChangedFiles(self):
+        self.addSteppers()
+        firstStats = self.getOutputStats()
+        self.assertEqual(len(firstStats), 3)
+        self.addSteppers()
+        for fileName, fileStat in self.getOutputStats().items():
+            self.assertEqual((fileStat.st_ino, fileStat.st_mtime_ns),
+                             (firstStats[fileName].st_ino, firstStats[fileName].st_mtime_ns), fileName)
+
+        with open(os.path.join(self.setDir, "choof_NotesSet2.txt"), 'a') as notesFile:
+            notesFile.write("- one more note\n")
+        self.addSteppers()
+        for fileName, fileStat in self.getOutputStats().items():
+            unchanged = (fileStat.st_ino, fileStat.st_mtime_ns) == (firstStats[fileName].st_ino,
+                                                                   firstStats[fileName].st_mtime_ns)
+            self.assertEqual(unchanged, fileName != "choof_NotesSet2_steppers.txt", fileName)
+
+    def testRemovedOutputIsWrittenAgain(self):
+        self.addSteppers()
+        os.remove(os.path.join(self.setDir, "Fission_NotesSet2_steppers.txt"))
+        self.addSteppers()
+        self.assertTrue(os.path.exists(os.path.join(self.setDir, "Fission_NotesSet2_steppers.txt")))
+
+    def testStepperCopiesAreReadInsteadOfTheOriginals(self):
+        from containers.judge import JudgesForExcel
+        from containers.feedback import StepartistFeedback
+        self.addSteppers()
+        judgeSet = JudgesForExcel(self.setDir)
+        self.assertEqual(sorted(judgeSet.judgeToFileName.values()),
+                         ["Fission_NotesSet2_steppers.txt", "choof_NotesSet2_steppers.txt",
+                          "psychoangel691_NotesSet2_steppers.txt"])
+        self.assertEqual(sorted(os.path.basename(notesPath)
+                                for notesPath in StepartistFeedback(self.setDir).getNotesFiles()),
+                         sorted(judgeSet.judgeToFileName.values()))
+
+    def testOutputHasTheUsualPermissions(self):
+        oldUmask = os.umask(0o022)
+        try:
+            self.addSteppers()
+            outputPath = os.path.join(self.setDir, "Fission_NotesSet2_steppers.txt")
+            self.assertEqual(os.stat(outputPath).st_mode & 0o777, 0o644)
+            os.chmod(outputPath, 0o664)
+            with open(os.path.join(self.setDir, "Fission_NotesSet2.txt"), 'a') as notesFile:
+                notesFile.write("- one more note\n")
+            self.addSteppers()
+            self.assertEqual(os.stat(outputPath).st_mode & 0o777, 0o664)
+        finally:
+            os.umask(oldUmask)
+
+    def testFailedWriteLeavesTheOldFile(self):
+        artistAdd = self.addSteppers()
+        outputPath = os.path.join(self.setDir, "Fission_NotesSet2_steppers.txt")
+        with open(outputPath) as outputFile:
+            before = outputFile.read()
+        with self.assertRaises(TypeError):
+            artistAdd.writeAtomically(outputPath, None)
+        with open(outputPath) as outputFile:
+            self.assertEqual(outputFile.read(), before)
+        self.assertEqual([fileName for fileName in os.listdir(self.setDir) if fileName.startswith(".tmp_")], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
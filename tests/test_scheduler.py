@@ -0,0 +1,131 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.corpus import SyntheticCorpus
+from containers.normalize import getTitleKey
+from containers.scheduler import SetScheduler, getPersonKeys, readSchedule
+
+
+class TestSetScheduler(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        cls.corpus = SyntheticCorpus(os.path.join(cls.tempDir, "corpus"), songCount=40, setSize=10, judgeCount=3)
+        cls.corpus.write()
+        stepperSongs = collections.Counter(song['stepper'] for song in cls.corpus.songs)
+        cls.stepperJudges = [stepper for stepper, songCount in stepperSongs.most_common(3)]
+        cls.batch = SetScheduler(cls.corpus.getBatchDir(), None)
+        cls.batch.loadBatch()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def makeScheduler(self, roster, numSets=4, judgesPerSet=2):
+        rosterPath = os.path.join(self.tempDir, "roster.txt")
+        with open(rosterPath, 'w', encoding="utf-8") as rosterFile:
+            rosterFile.write("# judge, sets\n")
+            for judge, capacity in roster:
+                rosterFile.write(judge + ", " + str(capacity) + "\n")
+        scheduler = SetScheduler(self.corpus.getBatchDir(), rosterPath, outputDir=os.path.join(self.tempDir, "sets"),
+                                 numSets=numSets, judgesPerSet=judgesPerSet)
+        scheduler.loadRoster()
+        scheduler.header = self.batch.header
+        scheduler.songs = [dict(song) for song in self.batch.songs]
+        scheduler.getGroups()
+        scheduler.assignJudges()
+        scheduler.assignSongs()
+        return scheduler
+
+    def getStepperRoster(self):
+        # One set each, so the songs of any group can always go to a set none of its stepartists judge
+        return [(judge, 1) for judge in self.stepperJudges] + [("Judge A", 4), ("Judge B", 1)]
+
+    def getFolderToSet(self, scheduler):
+        return {song['folder']: scheduledSet['name'] for scheduledSet in scheduler.sets
+                for song in scheduledSet['songs']}
+
+    def testEverySongIsInOneSet(self):
+        scheduler = self.makeScheduler([("Judge A", 2), ("Judge B", 2), ("Judge C", 2), ("Judge D", 2)])
+        folders = [song['folder'] for scheduledSet in scheduler.sets for song in scheduledSet['songs']]
+        self.assertEqual(sorted(folders), sorted(song['folder'] for song in self.batch.songs))
+
+    def testSubmissionsOfTheSameSongStayTogether(self):
+        scheduler = self.makeScheduler(self.getStepperRoster())
+        folderToSet = self.getFolderToSet(scheduler)
+        titleToSets = {}
+        for song in self.batch.songs:
+            titleToSets.setdefault(getTitleKey(song['title']), set()).add(folderToSet[song['folder']])
+        self.assertGreater(len(self.batch.songs), len(titleToSets))  # The corpus has some
+        for titleKey, setNames in titleToSets.items():
+            self.assertEqual(len(setNames), 1, titleKey)
+
+    def testNoJudgeGetsTheirOwnSongs(self):
+        scheduler = self.makeScheduler(self.getStepperRoster())
+        self.assertEqual(scheduler.conflicts, [])
+        self.assertTrue(any(set(self.stepperJudges) & set(scheduledSet['judges']) for scheduledSet in scheduler.sets))
+        for scheduledSet in scheduler.sets:
+            for song in scheduledSet['songs']:
+                for judge in scheduledSet['judges']:
+                    self.assertFalse(getPersonKeys(judge) & getPersonKeys(song['stepartist']),
+                                     (scheduledSet['name'], song['folder'], judge))
+
+    def testUnavoidableConflictIsReported(self):
+        stepper = self.stepperJudges[0]
+        scheduler = self.makeScheduler([(stepper, 4), ("Judge A", 4)])
+        stepperFolders = sorted(song['folder'] for song in self.batch.songs
+                                if getPersonKeys(song['stepartist']) & getPersonKeys(stepper))
+        self.assertEqual(sorted(folder for setName, folder, judge in scheduler.conflicts), stepperFolders)
+        self.assertEqual(len(self.getFolderToSet(scheduler)), len(self.batch.songs))
+
+    def testJudgingTimeIsBalanced(self):
+        scheduler = self.makeScheduler([("Judge A", 4), ("Judge B", 4)])
+        setSeconds = [scheduledSet['seconds'] for scheduledSet in scheduler.sets]
+        longestGroup = max(sum(song['seconds'] for song in group) for group in scheduler.groups)
+        self.assertLessEqual(max(setSeconds) - min(setSeconds), longestGroup)
+        for scheduledSet in scheduler.sets:
+            self.assertAlmostEqual(scheduledSet['seconds'], sum(song['seconds'] for song in scheduledSet['songs']))
+
+    def testRosterCapacitiesAreRespected(self):
+        roster = [("Judge A", 3), ("Judge B", 1), ("Judge C", 1), ("Judge D", 2), ("Judge E", 1)]
+        scheduler = self.makeScheduler(roster)
+        judgeSets = collections.Counter(judge for scheduledSet in scheduler.sets for judge in scheduledSet['judges'])
+        for judge, capacity in roster:
+            self.assertLessEqual(judgeSets[judge], capacity, judge)
+        self.assertEqual([len(scheduledSet['judges']) for scheduledSet in scheduler.sets], [2, 2, 2, 2])
+        for scheduledSet in scheduler.sets:
+            self.assertEqual(len(set(scheduledSet['judges'])), len(scheduledSet['judges']))
+
+    def testShortRosterLeavesSetsShort(self):
+        scheduler = self.makeScheduler([("Judge A", 2), ("Judge B", 1)], judgesPerSet=2)
+        judgeCounts = [len(scheduledSet['judges']) for scheduledSet in scheduler.sets]
+        self.assertEqual(sum(judgeCounts), 3)
+        self.assertLessEqual(max(judgeCounts), 2)
+
+    def testScheduleWritesTheSetFolders(self):
+        roster = self.getStepperRoster()
+        rosterPath = os.path.join(self.tempDir, "roster.txt")
+        with open(rosterPath, 'w', encoding="utf-8") as rosterFile:
+            rosterFile.write("".join(judge + ", " + str(capacity) + "\n" for judge, capacity in roster))
+        outputDir = os.path.join(self.tempDir, "written")
+        scheduler = SetScheduler(self.corpus.getBatchDir(), rosterPath, outputDir=outputDir, numSets=4,
+                                 judgesPerSet=2)
+        self.assertTrue(scheduler.schedule())
+        self.assertEqual(readSchedule(os.path.join(outputDir, "schedule.txt")),
+                         {scheduledSet['name']: scheduledSet['judges'] for scheduledSet in scheduler.sets})
+        for scheduledSet in scheduler.sets:
+            setDir = os.path.join(outputDir, scheduledSet['name'])
+            with open(os.path.join(setDir, scheduledSet['name'] + ".csv")) as setCsv:
+                self.assertEqual(len(setCsv.readlines()), len(scheduledSet['songs']) + 1)
+            self.assertTrue(os.path.exists(os.path.join(setDir, "template_" + scheduledSet['name'] + ".txt")))
+
+
+if __name__ == '__main__':
+    unittest.main()
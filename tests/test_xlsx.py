@@ -0,0 +1,161 @@
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "batchapi"))
+
+from containers.xlsx import XlsxWriter, getColumnName
+from containers.judge import JudgesForExcel, BatchJudgesForExcel
+
+setsDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sets")
+
+MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+DOCUMENT_RELATIONSHIPS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+def readWorkbook(xlsxPath):
+    """
+    Returns a list of (sheet name, rows) in workbook order. Each row is a
+    dictionary with <column letters>:<value>, where numeric cells are floats
+    and inline text cells are strings.
+    """
+    with zipfile.ZipFile(xlsxPath) as xlsxZip:
+        assert xlsxZip.testzip() is None
+        contentTypes = ElementTree.fromstring(xlsxZip.read("[Content_Types].xml"))
+        workbook = ElementTree.fromstring(xlsxZip.read("xl/workbook.xml"))
+        relationships = ElementTree.fromstring(xlsxZip.read("xl/_rels/workbook.xml.rels"))
+        targets = {relationship.get("Id"): relationship.get("Target")
+                   for relationship in relationships.iter(RELATIONSHIPS + "Relationship")}
+        overrides = {override.get("PartName") for override in contentTypes}
+        sheets = []
+        for sheet in workbook.iter(MAIN + "sheet"):
+            sheetPart = "xl/" + targets[sheet.get(DOCUMENT_RELATIONSHIPS + "id")]
+            assert "/" + sheetPart in overrides
+            rows = []
+            for row in ElementTree.fromstring(xlsxZip.read(sheetPart)).iter(MAIN + "row"):
+                assert row.get("r") == str(len(rows) + 1)
+                cells = {}
+                for cell in row.iter(MAIN + "c"):
+                    column = cell.get("r")[:-len(row.get("r"))]
+                    if cell.get("t") == "inlineStr":
+                        cells[column] = cell.find(MAIN + "is/" + MAIN + "t").text or ""
+                    else:
+                        assert cell.get("t") is None
+                        cells[column] = float(cell.find(MAIN + "v").text)
+                rows.append(cells)
+            sheets.append((sheet.get("name"), rows))
+        return sheets
+
+
+class TestXlsxWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.xlsxPath = os.path.join(self.tempDir, "test.xlsx")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def testNumbersAreNumericCellsAndTheRestInlineText(self):
+        with XlsxWriter(self.xlsxPath) as workbook:
+            workbook.addSheet("Ratings")
+            workbook.writeRow(["Song", "Rating"], bold=True)
+            workbook.writeRow(["Tom & Jerry <3", 8, 8.5, "PASS", None, "*", True, " padded ", "bad\x01char"])
+        sheets = readWorkbook(self.xlsxPath)
+        self.assertEqual([name for name, rows in sheets], ["Ratings"])
+        header, row = sheets[0][1]
+        self.assertEqual(header, {'A': "Song", 'B': "Rating"})
+        self.assertEqual(row, {'A': "Tom & Jerry <3", 'B': 8.0, 'C': 8.5, 'D': "PASS", 'F': "*", 'G': "True",
+                               'H': " padded ", 'I': "badchar"})
+
+    def testSheetNamesAreSanitisedAndUnique(self):
+        longName = "A very long set name that goes past the limit"
+        with XlsxWriter(self.xlsxPath) as workbook:
+            givenNames = [workbook.addSheet(name) for name in ["set:1/[a]", "Set", "set", "SET", longName,
+                                                                longName, "'quoted'", ""]]
+        self.assertEqual(givenNames, ["set_1__a_", "Set", "set (2)", "SET (3)", longName[:31],
+                                      longName[:27] + " (2)", "quoted", "Sheet"])
+        self.assertEqual([name for name, rows in readWorkbook(self.xlsxPath)], givenNames)
+
+    def testWorkbookWithoutSheetsGetsOne(self):
+        XlsxWriter(self.xlsxPath).close()
+        self.assertEqual(readWorkbook(self.xlsxPath), [("Sheet1", [])])
+
+    def testColumnNames(self):
+        self.assertEqual([getColumnName(index) for index in [0, 25, 26, 51, 52, 701, 702]],
+                         ["A", "Z", "AA", "AZ", "BA", "ZZ", "AAA"])
+
+
+class TestRatingWorkbook(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.notesDir = os.path.join(self.tempDir, "sets")
+        shutil.copytree(setsDir, self.notesDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def checkSummary(self, summaryRows, setSheets):
+        """
+        Every song of every set sheet has a Summary row with the average
+        of its numeric ratings and its special ratings.
+        """
+        self.assertEqual(summaryRows[0], {'A': "Song", 'B': "Stepartist", 'C': "Set", 'D': "Average",
+                                          'E': "Ratings", 'F': "Special"})
+        expected = []
+        for name, rows in setSheets:
+            judgeColumns = [column for column, value in rows[0].items() if column not in "ABC" and value != "supp"]
+            for row in rows[1:]:
+                ratings = [row[column] for column in judgeColumns if column in row]
+                numbers = [rating for rating in ratings if isinstance(rating, float)]
+                summaryRow = {'A': row['A'], 'B': row['B'], 'C': row['C'], 'E': float(len(numbers))}
+                if numbers:
+                    summaryRow['D'] = round(sum(numbers) / len(numbers), 3)
+                special = [rating for rating in ratings if not isinstance(rating, float)]
+                if special:
+                    summaryRow['F'] = " ".join(special)
+                expected.append(summaryRow)
+        self.assertEqual(summaryRows[1:], expected)
+
+    def testSetWorkbookMatchesTheCSV(self):
+        judgeSet = JudgesForExcel(os.path.join(self.notesDir, "set2"))
+        judgments = judgeSet.getJudgments()
+        judgeSet.createRatingCSV(judgments)
+        judgeSet.createRatingXLSX(judgments)
+        sheets = readWorkbook(os.path.join(judgeSet.outputDir, judgeSet.setXLSX))
+        self.assertEqual([name for name, rows in sheets], ["Summary", "set2"])
+        with open(os.path.join(judgeSet.outputDir, judgeSet.setCSV)) as csvFile:
+            csvRows = [line.rstrip("\n").split(",") for line in csvFile]
+        setRows = sheets[1][1]
+        self.assertEqual(len(setRows), len(csvRows))
+        for row, csvRow in zip(setRows, csvRows):
+            for columnIndex, csvValue in enumerate(csvRow):
+                value = row.get(getColumnName(columnIndex))
+                if isinstance(value, float):
+                    self.assertEqual(value, float(csvValue))
+                else:
+                    self.assertEqual(value, csvValue or None)
+        self.assertIsInstance(setRows[1]['D'], float)  # [5/10]
+        self.assertEqual(setRows[1]['F'], "$")
+        self.checkSummary(sheets[0][1], sheets[1:])
+
+    def testBatchWorkbookHasEverySet(self):
+        batchJudges = BatchJudgesForExcel(self.notesDir)
+        batchJudges.getSetDirs()
+        batchJudges.parseAllSets()
+        batchJudges.createBatchXLSX()
+        sheets = readWorkbook(os.path.join(self.notesDir, batchJudges.batchXLSX))
+        self.assertEqual([name for name, rows in sheets],
+                         ["Summary"] + [judgeSet.setName for judgeSet in batchJudges.setJudgments])
+        self.assertGreater(len(sheets), 2)
+        self.checkSummary(sheets[0][1], sheets[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()